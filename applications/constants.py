@@ -32,3 +32,72 @@ If uncertain, choose the most inclusive diet (e.g., "cheese" -> "vegetarian", "s
 Return only a single-line valid JSON object, like:
 {"foods": ["sushi", "ramen", "ice cream"], "diet": "omnivore"}
 """
+
+BATCH_CLASSIFIER_PROMPT = """
+You are a dietary classification assistant. The user sends a JSON array of survey answers,
+each as an object with an "index" (integer) and an "answer" (string). For every answer:
+1. Extract exactly 3 foods from the answer as a list of strings.
+2. Classify the diet as one of "vegan", "vegetarian", or "omnivore".
+
+Use the following definitions:
+- "vegan": no animal products, including dairy, eggs, or honey.
+- "vegetarian": includes dairy and eggs but no meat or fish.
+- "omnivore": includes any animal product.
+
+If uncertain, choose the most inclusive diet (e.g., "cheese" -> "vegetarian", "shrimp" -> "omnivore").
+
+Return only a single-line valid JSON array with one object per answer, keeping each answer's index, like:
+[{"index": 0, "foods": ["sushi", "ramen", "ice cream"], "diet": "omnivore"}, {"index": 1, "foods": ["tofu", \
+"kale", "lentils"], "diet": "vegan"}]
+"""
+
+# Maximum number of answers sent to the classifier GPT in one batched request.
+DEFAULT_CLASSIFY_BATCH_SIZE = 20
+
+# Minimum confidence of the local lexicon classifier for its result to be used instead of the classifier GPT's.
+LOCAL_CLASSIFIER_MIN_CONFIDENCE = 1.0
+
+# Per-model OpenAI quotas used by the client-side rate limiter. Tune these to the organization's usage tier.
+MODEL_RATE_LIMITS = {
+    RESPONDENT_GPT_MODEL: {"requests_per_minute": 500, "tokens_per_minute": 200_000},
+    CLASSIFIER_GPT_MODEL: {"requests_per_minute": 3_500, "tokens_per_minute": 200_000},
+}
+DEFAULT_RATE_LIMIT = {"requests_per_minute": 500, "tokens_per_minute": 200_000}
+
+OPENAI_MAX_RETRIES = 5
+OPENAI_BACKOFF_BASE_SECONDS = 1.0
+OPENAI_BACKOFF_MAX_SECONDS = 60.0
+
+# Number of simulated conversations buffered before they are written with one bulk INSERT.
+DEFAULT_WRITE_BATCH_SIZE = 50
+
+# Page size of /api/insights/conversations when a page is requested without `limit`, and the largest `limit` accepted.
+DEFAULT_PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 1000
+
+# Number of rows fetched per database round trip when streaming conversations.
+STREAM_CHUNK_SIZE = 2000
+
+# Number of foods in the top foods lists of /api/insights/summary when `top` is not given, and the largest accepted.
+DEFAULT_TOP_FOODS = 10
+MAX_TOP_FOODS = 100
+
+# Number of conversations per batch of an export: one CSV write, one Arrow record batch or one Parquet row group.
+EXPORT_BATCH_SIZE = 20_000
+
+# Classifier workers: attempts before a classification job is dead-lettered, the backoff between attempts (doubling
+# from the base up to the maximum), and the seconds after which a job claimed by a silent worker is claimed again.
+CLASSIFICATION_JOB_MAX_ATTEMPTS = 5
+CLASSIFICATION_JOB_BACKOFF_SECONDS = 30.0
+CLASSIFICATION_JOB_BACKOFF_MAX_SECONDS = 3600.0
+CLASSIFICATION_JOB_LEASE_SECONDS = 300
+CLASSIFIER_WORKER_POLL_SECONDS = 5.0
+
+# Number of conversations read, classified and written per batch by the reclassify_conversations command.
+RECLASSIFY_BATCH_SIZE = 200
+
+# Number of fake conversations written per transaction by the seed_conversations command.
+SEED_BATCH_SIZE = 5_000
+
+# Upper bounds, in seconds, of the latency histogram buckets exposed on /metrics.
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
@@ -0,0 +1,21 @@
+""" Module to register the insights app's models in admin sites. """
+from django.contrib import admin
+
+from applications.insights.models import APIKey
+
+
+@admin.register(APIKey)
+class APIKeyAdmin(admin.ModelAdmin):
+    """
+    Table view for APIKey model in the admin page, to review and revoke keys. Keys are created with the
+    `create_api_key` command, which shows the key once; only its digest is stored.
+    """
+    list_display = ("name", "prefix", "user", "is_active", "created_at")
+    list_filter = ("is_active",)
+    search_fields = ("name", "prefix", "user__username")
+    readonly_fields = ("prefix", "created_at")
+    raw_id_fields = ("user",)
+    ordering = ("-created_at",)
+
+    def has_add_permission(self, request):
+        return False
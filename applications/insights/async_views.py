@@ -0,0 +1,178 @@
+"""
+Async variants of the insights endpoints, for deployments served by an ASGI server (entrypoint.sh starts uvicorn when
+the asgi extra is installed).
+
+They answer like their counterparts in insights/views.py, but await the database through Django's async ORM
+(aiterator, acount) instead of holding a worker thread per request. Under ASGI, a slow client or a long stream then
+only costs an idle coroutine, so one process serves many of them at once. They are plain Django views, since DRF
+views are synchronous: authentication goes through insights.authentication.aauthenticate, and responses are
+rendered with DRF's JSONRenderer so their bodies are identical to the sync endpoints'. Responses are not cached
+nor conditional; use the sync endpoints for ETags.
+"""
+from asgiref.sync import sync_to_async
+from django.http import (
+    HttpRequest,
+    HttpResponse,
+    StreamingHttpResponse,
+)
+from django.views import View
+from rest_framework import (
+    exceptions,
+    status,
+)
+from rest_framework.renderers import JSONRenderer
+
+from applications.constants import (
+    MAX_PAGE_LIMIT,
+    MAX_TOP_FOODS,
+    STREAM_CHUNK_SIZE,
+)
+from applications.insights.authentication import (
+    INSIGHTS_AUTHENTICATION_CLASSES,
+    aauthenticate,
+)
+from applications.insights.serializers import (
+    astream_json,
+    astream_ndjson,
+    fast_rows,
+    serialize_rows,
+)
+from applications.insights.services import (
+    apaginate_conversations,
+    get_conversations_by_diet,
+    parse_bucket_query_param,
+    parse_diet_query_param,
+    parse_food_query_param,
+    parse_limit_query_param,
+    parse_stream_query_param,
+    parse_top_query_param,
+    summarize_conversations,
+)
+from applications.logging import get_logger
+from applications.surveys.search import search_conversations
+
+
+logger = get_logger(__name__)
+
+DIET_ERROR = "Invalid diet types: '{}'. Expected one or more of: vegan, vegetarian, omnivore."
+
+
+def render_json(data, status_code: int = status.HTTP_200_OK) -> HttpResponse:
+    """ Returns a JSON response rendered like DRF's Response, so bodies match the sync endpoints byte for byte. """
+    return HttpResponse(JSONRenderer().render(data), content_type="application/json", status=status_code)
+
+
+class AsyncInsightsView(View):
+    """
+    Base of the async insights endpoints: authenticates the request like the DRF views, with API keys or Basic
+    credentials, and answers 401 Unauthorized without valid ones.
+    """
+
+    # Django calls dispatch without awaiting it and awaits the result, since the view's handlers are async.
+    async def dispatch(self, request: HttpRequest, *args, **kwargs):  # pylint: disable=invalid-overridden-method
+        try:
+            authenticated = await aauthenticate(request)
+        except exceptions.AuthenticationFailed as e:
+            return self._unauthorized(request, str(e.detail))
+        if authenticated is None:
+            return self._unauthorized(request, str(exceptions.NotAuthenticated.default_detail))
+
+        request.user, request.auth = authenticated
+        return await super().dispatch(request, *args, **kwargs)
+
+    @staticmethod
+    def _unauthorized(request: HttpRequest, detail: str) -> HttpResponse:
+        """ Returns the 401 response DRF sends, with the challenge of the first authentication class. """
+        response = render_json({"detail": detail}, status.HTTP_401_UNAUTHORIZED)
+        response["WWW-Authenticate"] = INSIGHTS_AUTHENTICATION_CLASSES[0]().authenticate_header(request)
+        return response
+
+
+class AsyncConversationInsightsView(AsyncInsightsView):
+    """
+    Async variant of ConversationInsightsView, with the same query parameters and responses, except for the ETag
+    and 304 Not Modified. Streamed responses also tell the number of conversations in an X-Total-Count header.
+    """
+
+    async def get(self, request: HttpRequest) -> HttpResponse | StreamingHttpResponse:
+        # pylint: disable=missing-function-docstring
+        diet_param = request.GET.get("diet", "")
+        try:
+            diet_list = parse_diet_query_param(diet_param)
+        except ValueError as e:
+            logger.warning("Invalid diet filter: %s - %s", diet_param, e)
+            return render_json({"error": DIET_ERROR.format(diet_param)}, status.HTTP_400_BAD_REQUEST)
+
+        food_list = parse_food_query_param(request.GET.get("food"))
+        search_query = " ".join(request.GET.get("q", "").split())
+        conversations = search_conversations(get_conversations_by_diet(diet_list, food_list), search_query)
+
+        try:
+            stream_format = parse_stream_query_param(request.GET.get("stream"))
+        except ValueError as e:
+            logger.warning("Invalid stream format: %s", e)
+            return render_json({"error": f"{e}. Expected one of: json, ndjson."}, status.HTTP_400_BAD_REQUEST)
+
+        if stream_format:
+            return await self._stream(conversations, stream_format)
+        if "limit" in request.GET or "cursor" in request.GET:
+            return await self._paginate(conversations, request)
+
+        rows = [row async for row in fast_rows(conversations).aiterator(chunk_size=STREAM_CHUNK_SIZE)]
+        return render_json(serialize_rows(rows))
+
+    @staticmethod
+    async def _paginate(conversations, request: HttpRequest) -> HttpResponse:
+        """ Returns one page of conversations with the cursor of the next page. """
+        try:
+            limit = parse_limit_query_param(request.GET.get("limit"))
+            page, next_cursor = await apaginate_conversations(
+                fast_rows(conversations), request.GET.get("cursor"), limit,
+            )
+        except ValueError as e:
+            logger.warning("Invalid pagination parameters: %s", e)
+            error = f"{e}. Expected a limit between 1 and {MAX_PAGE_LIMIT} and a cursor from a previous page."
+            return render_json({"error": error}, status.HTTP_400_BAD_REQUEST)
+        return render_json({"results": serialize_rows(page), "next_cursor": next_cursor})
+
+    @staticmethod
+    async def _stream(conversations, stream_format: str) -> StreamingHttpResponse:
+        """ Streams every matching conversation, fetching rows from the database in chunks, after counting them. """
+        total = await conversations.acount()
+        rows = fast_rows(conversations).aiterator(chunk_size=STREAM_CHUNK_SIZE)
+        if stream_format == "ndjson":
+            response = StreamingHttpResponse(astream_ndjson(rows), content_type="application/x-ndjson")
+        else:
+            response = StreamingHttpResponse(astream_json(rows), content_type="application/json")
+        response["X-Total-Count"] = str(total)
+        return response
+
+
+class AsyncInsightsSummaryView(AsyncInsightsView):
+    """
+    Async variant of InsightsSummaryView, with the same query parameters and responses. The aggregations run raw
+    SQL, which has no async API, so they run in a worker thread while the event loop serves other requests.
+    """
+
+    async def get(self, request: HttpRequest) -> HttpResponse:
+        # pylint: disable=missing-function-docstring
+        diet_param = request.GET.get("diet", "")
+        try:
+            diet_list = parse_diet_query_param(diet_param)
+        except ValueError as e:
+            logger.warning("Invalid diet filter: %s - %s", diet_param, e)
+            return render_json({"error": DIET_ERROR.format(diet_param)}, status.HTTP_400_BAD_REQUEST)
+
+        try:
+            top = parse_top_query_param(request.GET.get("top"))
+            bucket = parse_bucket_query_param(request.GET.get("bucket"))
+        except ValueError as e:
+            logger.warning("Invalid summary parameters: %s", e)
+            return render_json(
+                {"error": f"{e}. Expected a top between 1 and {MAX_TOP_FOODS} and a bucket of day, week or month."},
+                status.HTTP_400_BAD_REQUEST,
+            )
+
+        per_diet = request.GET.get("per_diet", "").strip().lower() in {"1", "true", "yes"}
+        summary = await sync_to_async(summarize_conversations)(diet_list, top=top, per_diet=per_diet, bucket=bucket)
+        return render_json(summary)
@@ -0,0 +1,161 @@
+"""
+Authentication of insights API calls, without paying a password hash on every request.
+
+BasicAuthentication runs Django's password check, PBKDF2 with hundreds of thousands of iterations, on every call,
+which costs hundreds of milliseconds of CPU and caps each worker's throughput. Instead:
+
+  - APIKeyAuthentication verifies `Authorization: Api-Key <key>` with one SHA-256 and an indexed lookup of the
+    key's digest (see insights/models.py APIKey).
+  - CachedBasicAuthentication keeps Basic credentials working, but only hashes a given username and password once
+    per CREDENTIAL_CACHE_TTL seconds.
+
+Both remember verified credentials in an in-process cache for CREDENTIAL_CACHE_TTL seconds, so a revoked key, a
+deactivated user or a changed password may still be accepted for that long by processes that verified them.
+"""
+import hashlib
+import hmac
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpRequest
+from rest_framework import exceptions
+from rest_framework.authentication import (
+    BaseAuthentication,
+    BasicAuthentication,
+    get_authorization_header,
+)
+
+from applications.insights.models import (
+    APIKey,
+    hash_api_key,
+)
+
+
+class CredentialCache:
+    """
+    In-process LRU cache of verified credentials, with a TTL. Credentials are stored under a keyed digest, never
+    in clear.
+
+    Params:
+      - size: Maximum number of credentials kept.
+      - ttl: Seconds a verified credential is trusted without verifying it again.
+    """
+
+    def __init__(self, size: int, ttl: float, clock: Callable[[], float] = time.monotonic):
+        self.size = size
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: OrderedDict[str, tuple[float, object]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(*parts: str) -> str:
+        """ Returns the cache key of a credential: its HMAC with SECRET_KEY, so a memory dump reveals nothing. """
+        return hmac.new(settings.SECRET_KEY.encode(), "\0".join(parts).encode(), hashlib.sha256).hexdigest()
+
+    def get(self, key: str):
+        """ Returns the user authenticated by the credential, or None if it was not verified recently. """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, user = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return user
+
+    def set(self, key: str, user) -> None:
+        """ Remembers that the credential authenticates the user, evicting the least recently used ones. """
+        if self.size <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl, user)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """ Forgets every credential, e.g. to revoke keys at once in this process. """
+        with self._lock:
+            self._entries.clear()
+
+
+credential_cache = CredentialCache(settings.CREDENTIAL_CACHE_SIZE, settings.CREDENTIAL_CACHE_TTL)
+
+
+class APIKeyAuthentication(BaseAuthentication):
+    """ Authenticates requests sending `Authorization: Api-Key <key>` as the user owning the key. """
+    keyword = "Api-Key"
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed("Invalid API key header. Expected: Api-Key <key>.")
+        try:
+            key = auth[1].decode()
+        except UnicodeError as e:
+            raise exceptions.AuthenticationFailed("Invalid API key.") from e
+        return self.authenticate_credentials(key)
+
+    def authenticate_credentials(self, key: str) -> tuple:
+        """ Returns the (user, api_key digest) pair of an active key owned by an active user. """
+        key_hash = hash_api_key(key)
+        cache_key = credential_cache.make_key(self.keyword, key_hash)
+        user = credential_cache.get(cache_key)
+        if user is None:
+            api_key = (
+                APIKey.objects
+                .select_related("user")
+                .filter(key_hash=key_hash, is_active=True, user__is_active=True)
+                .first()
+            )
+            if api_key is None:
+                raise exceptions.AuthenticationFailed("Invalid API key.")
+            user = api_key.user
+            credential_cache.set(cache_key, user)
+        return user, key_hash
+
+    def authenticate_header(self, request) -> str:
+        return self.keyword
+
+
+class CachedBasicAuthentication(BasicAuthentication):
+    """ BasicAuthentication that checks a given username and password once per CREDENTIAL_CACHE_TTL seconds. """
+
+    def authenticate_credentials(self, userid, password, request=None):
+        cache_key = credential_cache.make_key("Basic", userid, password)
+        user = credential_cache.get(cache_key)
+        if user is None:
+            user, _ = super().authenticate_credentials(userid, password, request)
+            credential_cache.set(cache_key, user)
+        return user, None
+
+
+# Authentication of the insights API views: Basic credentials or API keys, whichever the request sends. Basic comes
+# first since the first class' challenge is the one 401 responses send, and browsers only prompt for Basic.
+INSIGHTS_AUTHENTICATION_CLASSES: list[type[BaseAuthentication]] = [CachedBasicAuthentication, APIKeyAuthentication]
+
+
+async def aauthenticate(request: HttpRequest) -> tuple | None:
+    """
+    Authenticates a plain Django request with INSIGHTS_AUTHENTICATION_CLASSES, for async views outside DRF.
+
+    Returns:
+        The (user, auth) pair of the first scheme the request uses, or None if it sends no credentials.
+
+    Raises:
+        AuthenticationFailed: If the request sends invalid credentials
+    """
+    for authentication_class in INSIGHTS_AUTHENTICATION_CLASSES:
+        result = await sync_to_async(authentication_class().authenticate)(request)
+        if result is not None:
+            return result
+    return None
@@ -0,0 +1,85 @@
+"""
+Conditional responses and server-side response caching for the insights API.
+
+Every cacheable request gets an ETag built from:
+  - the normalized query (sorted diet and food filters, search query, page parameters),
+  - a cheap database validator for that query: the number of matching conversations and their latest created_at,
+    one aggregate answered from the (diet_type, created_at, id) index,
+  - the version of the ConversationsVersion row, incremented by every write to the conversations (bulk writes of the
+    surveys services, admin edits, plain ORM saves and deletes), read by the same aggregate.
+
+The validator notices rows inserted by any process; the version also covers classifications of existing rows, which
+change neither the count nor the latest created_at of an unfiltered query. Both live in the database, so writes made
+by workers and commands in other processes invalidate the ETags whatever cache backend each process uses.
+
+A request whose If-None-Match holds the current ETag gets a 304 without any serialization. Otherwise the JSON body
+is served from the cache under its ETag, or rendered and cached. Since the ETag changes with the data, stale entries
+are never served; they just expire.
+"""
+import hashlib
+from typing import Any
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import (
+    Count,
+    Max,
+    QuerySet,
+    Subquery,
+)
+
+from applications.logging import get_logger
+from applications.surveys.models import (
+    Conversation,
+    ConversationsVersion,
+)
+
+
+logger = get_logger(__name__)
+
+BODY_KEY_PREFIX = "insights:body"
+
+
+def get_cache():
+    """ The Django cache holding the response bodies. """
+    return caches[settings.INSIGHTS_CACHE_ALIAS]
+
+
+def get_generation() -> int:
+    """ Returns the current version of the conversations, starting at 1. """
+    return ConversationsVersion.objects.filter(pk=1).values_list("version", flat=True).first() or 1
+
+
+def compute_etag(conversations: QuerySet[Conversation], query: dict[str, Any]) -> str:
+    """
+    Returns the strong ETag of a response listing `conversations`, for the normalized `query` it answers.
+    Costs one aggregate query, which reads the conversations version along.
+    """
+    # Without matching rows the version aggregates to None, which is fine: the response is empty whatever it is.
+    version = ConversationsVersion.objects.filter(pk=1).values("version")
+    validator = conversations.order_by().aggregate(
+        count=Count("id"),
+        latest=Max("created_at"),
+        version=Max(Subquery(version)),
+    )
+    parts = [str(validator["version"]), str(validator["count"]), str(validator["latest"])]
+    parts.extend(f"{name}={value}" for name, value in sorted(query.items()))
+    return '"' + hashlib.sha256("\0".join(parts).encode()).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """ Whether an If-None-Match header value lists the ETag (or is "*"). """
+    if not if_none_match:
+        return False
+    candidates = {candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+def get_cached_body(etag: str) -> bytes | None:
+    """ Returns the cached JSON body of the response with this ETag, if any. """
+    return get_cache().get(f"{BODY_KEY_PREFIX}:{etag}")
+
+
+def cache_body(etag: str, body: bytes) -> None:
+    """ Caches the JSON body of the response with this ETag for INSIGHTS_CACHE_TTL seconds. """
+    get_cache().set(f"{BODY_KEY_PREFIX}:{etag}", body, timeout=settings.INSIGHTS_CACHE_TTL)
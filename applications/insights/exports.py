@@ -0,0 +1,198 @@
+"""
+Bulk exports of conversations as CSV, Parquet or Arrow files, for analysts loading them into dataframes.
+
+Rows are read with values_list().iterator(), which uses a server-side cursor on PostgreSQL, and encoded one batch at
+a time: each batch is handed on as bytes before the next one is fetched, so memory stays bounded by the batch size
+whatever the number of rows exported.
+
+CSV is always available. Parquet (zstd-compressed, one row group per batch) and Arrow IPC streams need the optional
+pyarrow package; without it, those formats are reported as unavailable.
+"""
+import csv
+import io
+import json
+from itertools import islice
+from typing import (
+    Iterable,
+    Iterator,
+)
+
+from django.db.models import QuerySet
+
+from applications.constants import (
+    EXPORT_BATCH_SIZE,
+    STREAM_CHUNK_SIZE,
+)
+from applications.surveys.models import Conversation
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover - depends on the environment
+    pyarrow = None
+
+
+EXPORT_FIELDS = ("id", "diet_type", "favorite_foods", "created_at")
+
+# Content type and file extension of each export format.
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+ARROW_FORMATS = {"parquet", "arrow"}
+
+
+def available_formats() -> list[str]:
+    """ Returns the export formats usable with the installed packages. """
+    return [name for name in EXPORT_FORMATS if pyarrow is not None or name not in ARROW_FORMATS]
+
+
+def parse_export_format(param: str | None) -> str:
+    """
+    Parses an export format name; empty means "csv".
+
+    Raises:
+        ValueError: If the format is unknown, or needs pyarrow and pyarrow is not installed
+    """
+    export_format = (param or "csv").strip().lower()
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Invalid export format: {param}")
+    if export_format not in available_formats():
+        raise ValueError(f"Export format {export_format} needs the pyarrow package, which is not installed")
+    return export_format
+
+
+def iter_batches(
+    conversations: QuerySet[Conversation],
+    batch_size: int = EXPORT_BATCH_SIZE,
+) -> Iterator[tuple[tuple, ...]]:
+    """ Yields the EXPORT_FIELDS of the conversations as batches of row tuples, reading the rows in chunks. """
+    rows = conversations.values_list(*EXPORT_FIELDS).iterator(chunk_size=STREAM_CHUNK_SIZE)
+    while batch := tuple(islice(rows, batch_size)):
+        yield batch
+
+
+def export_conversations(
+    conversations: QuerySet[Conversation],
+    export_format: str,
+    batch_size: int = EXPORT_BATCH_SIZE,
+) -> Iterator[bytes]:
+    """ Yields the export file of the conversations, in an export format from parse_export_format, piece by piece. """
+    return encode_batches(iter_batches(conversations, batch_size), export_format)
+
+
+def encode_batches(batches: Iterable[tuple[tuple, ...]], export_format: str) -> Iterator[bytes]:
+    """ Encodes batches from iter_batches into an export file, yielding its bytes after each batch. """
+    if export_format == "csv":
+        return _encode_csv(batches)
+    return _encode_arrow(batches, parquet=export_format == "parquet")
+
+
+def _encode_csv(batches: Iterable[tuple[tuple, ...]]) -> Iterator[bytes]:
+    """
+    Writes a header line, then one line per conversation: favorite_foods as a JSON array and created_at in
+    ISO 8601, so both read back losslessly.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(EXPORT_FIELDS)
+    for batch in batches:
+        writer.writerows(
+            (
+                conversation_id,
+                diet_type or "",
+                json.dumps(favorite_foods, ensure_ascii=False) if favorite_foods is not None else "",
+                created_at.isoformat() if created_at else "",
+            )
+            for conversation_id, diet_type, favorite_foods, created_at in batch
+        )
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _ChunkSink:
+    """
+    Write-only file object collecting what pyarrow writes until it is drained. Unlike a BytesIO emptied between
+    batches, it keeps counting the position, which the Parquet writer relies on for the offsets in its footer.
+    """
+    closed = False
+
+    def __init__(self) -> None:
+        self._chunks: list[bytes] = []
+        self._position = 0
+
+    def write(self, data) -> int:
+        """ Collects a piece of the file. """
+        chunk = bytes(data)
+        self._chunks.append(chunk)
+        self._position += len(chunk)
+        return len(chunk)
+
+    def tell(self) -> int:
+        """ Returns the number of bytes written so far. """
+        return self._position
+
+    def flush(self) -> None:
+        """ Nothing to flush: the data is kept until drained. """
+
+    def close(self) -> None:
+        """ Marks the sink closed. """
+        self.closed = True
+
+    def drain(self) -> bytes:
+        """ Returns and forgets the bytes written since the last drain. """
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _arrow_schema():
+    """ Returns the Arrow schema of the exported conversations. """
+    return pyarrow.schema([
+        ("id", pyarrow.string()),
+        ("diet_type", pyarrow.string()),
+        ("favorite_foods", pyarrow.list_(pyarrow.string())),
+        ("created_at", pyarrow.timestamp("us", tz="UTC")),
+    ])
+
+
+def _record_batch(batch: tuple[tuple, ...], schema):
+    """ Converts a batch of rows into an Arrow record batch, column by column. """
+    ids, diet_types, favorite_foods, created_ats = zip(*batch)
+    return pyarrow.record_batch(
+        [
+            pyarrow.array([str(conversation_id) for conversation_id in ids], pyarrow.string()),
+            pyarrow.array(diet_types, pyarrow.string()),
+            pyarrow.array(
+                [[str(food) for food in foods] if isinstance(foods, list) else None for foods in favorite_foods],
+                pyarrow.list_(pyarrow.string()),
+            ),
+            pyarrow.array(created_ats, pyarrow.timestamp("us", tz="UTC")),
+        ],
+        schema=schema,
+    )
+
+
+def _encode_arrow(batches: Iterable[tuple[tuple, ...]], parquet: bool) -> Iterator[bytes]:
+    """ Writes the batches as a Parquet file or an Arrow IPC stream, both zstd-compressed. """
+    schema = _arrow_schema()
+    sink = _ChunkSink()
+    output = pyarrow.PythonFile(sink, mode="w")
+    if parquet:
+        writer = pyarrow.parquet.ParquetWriter(output, schema, compression="zstd")
+    else:
+        writer = pyarrow.ipc.new_stream(output, schema, options=pyarrow.ipc.IpcWriteOptions(compression="zstd"))
+
+    with writer:
+        for batch in batches:
+            if parquet:
+                writer.write_batch(_record_batch(batch, schema), row_group_size=len(batch))
+            else:
+                writer.write_batch(_record_batch(batch, schema))
+            yield sink.drain()
+    yield sink.drain()
@@ -0,0 +1,31 @@
+""" Management command to create an API key for the insights API. """
+from django.contrib.auth import get_user_model
+from django.core.management.base import (
+    BaseCommand,
+    CommandError,
+)
+
+from applications.insights.models import APIKey
+
+
+class Command(BaseCommand):
+    # pylint: disable=missing-class-docstring
+    help = (
+        "Create an insights API key for a user and print it; it is shown only once. "
+        "Send it as the header `Authorization: Api-Key <key>`"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("username", help="User the key authenticates as")
+        parser.add_argument("--name", default="", help="Label telling the key apart, e.g. the client using it")
+
+    def handle(self, *args, **options):
+        user_model = get_user_model()
+        try:
+            user = user_model.objects.get(**{user_model.USERNAME_FIELD: options["username"]})
+        except user_model.DoesNotExist as e:
+            raise CommandError(f"No user named {options['username']}") from e
+
+        api_key, key = APIKey.create_key(user, options["name"] or options["username"])
+        self.stderr.write(f"Created API key {api_key} for {options['username']}")
+        self.stdout.write(key)
@@ -0,0 +1,90 @@
+""" Management command to export conversations as a CSV, Parquet or Arrow file. """
+import sys
+from typing import (
+    Iterable,
+    Iterator,
+)
+
+from django.core.management.base import (
+    BaseCommand,
+    CommandError,
+)
+
+from applications.constants import EXPORT_BATCH_SIZE
+from applications.insights.exports import (
+    EXPORT_FORMATS,
+    available_formats,
+    encode_batches,
+    iter_batches,
+    parse_export_format,
+)
+from applications.insights.services import (
+    get_conversations_by_diet,
+    parse_date_query_param,
+    parse_diet_query_param,
+    parse_food_query_param,
+)
+from applications.surveys.services import filter_by_created_at
+
+
+class Command(BaseCommand):
+    # pylint: disable=missing-class-docstring
+    help = "Export conversations, newest first, as a CSV, Parquet or Arrow file, in bounded memory"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--format",
+            dest="export_format",
+            choices=list(EXPORT_FORMATS),
+            default="csv",
+            help=f"File format; available here: {', '.join(available_formats())}",
+        )
+        parser.add_argument(
+            "--output",
+            default="-",
+            help="Path of the file to write, or - for standard output",
+        )
+        parser.add_argument("--diet", default="", help="Comma-separated diet types to include, e.g. vegan,vegetarian")
+        parser.add_argument("--food", default="", help="Comma-separated foods; keep conversations mentioning any")
+        parser.add_argument("--since", default="", help="First creation date (UTC) to include, as YYYY-MM-DD")
+        parser.add_argument("--until", default="", help="Last creation date (UTC) to include, as YYYY-MM-DD")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=EXPORT_BATCH_SIZE,
+            help="Number of conversations encoded at once: one Parquet row group or Arrow record batch",
+        )
+
+    def handle(self, *args, **options):
+        """ Writes the export piece by piece, so only one batch of conversations is held in memory at a time. """
+        try:
+            export_format = parse_export_format(options["export_format"])
+            diet_list = parse_diet_query_param(options["diet"])
+            since = parse_date_query_param(options["since"])
+            until = parse_date_query_param(options["until"])
+        except ValueError as e:
+            raise CommandError(str(e)) from e
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1")
+
+        conversations = filter_by_created_at(
+            get_conversations_by_diet(diet_list, parse_food_query_param(options["food"])), since, until,
+        )
+        exported = [0]
+
+        def counted(batches: Iterable[tuple[tuple, ...]]) -> Iterator[tuple[tuple, ...]]:
+            for batch in batches:
+                exported[0] += len(batch)
+                yield batch
+
+        pieces = encode_batches(counted(iter_batches(conversations, options["batch_size"])), export_format)
+        if options["output"] == "-":
+            for piece in pieces:
+                sys.stdout.buffer.write(piece)
+            sys.stdout.buffer.flush()
+            return
+
+        with open(options["output"], "wb") as output:
+            for piece in pieces:
+                output.write(piece)
+        self.stderr.write(self.style.SUCCESS(f"Exported {exported[0]} conversations to {options['output']}"))
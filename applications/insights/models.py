@@ -0,0 +1,58 @@
+""" Module to carry the models of the insights app. """
+import hashlib
+import secrets
+
+from django.conf import settings
+from django.db import models
+
+
+# Prefix of every API key, so leaked keys are easy to recognize, e.g. by secret scanners.
+API_KEY_PREFIX = "sg_"
+# Leading characters of a key stored in clear, to tell keys apart in the admin without storing them.
+API_KEY_VISIBLE_LENGTH = 8
+
+
+def hash_api_key(key: str) -> str:
+    """
+    Returns the SHA-256 digest of an API key. Keys are 256-bit random tokens, so a single fast hash is as safe as
+    a slow password hash against brute force, and lets a key be looked up by an indexed equality on its digest.
+    """
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+class APIKey(models.Model):
+    """
+    A key authenticating insights API calls as its user, sent as `Authorization: Api-Key <key>`.
+
+    Only the key's digest is stored: the key itself is shown once, when created with the `create_api_key` command.
+    Deactivate a key to revoke it; processes that verified it recently may accept it for up to the
+    CREDENTIAL_CACHE_TTL setting.
+    """
+    name = models.CharField(max_length=100)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="api_keys")
+    prefix = models.CharField(max_length=API_KEY_VISIBLE_LENGTH, editable=False)
+    # Unique, hence indexed: authentication looks keys up by digest.
+    key_hash = models.CharField(max_length=64, unique=True, editable=False)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # pylint: disable=missing-class-docstring, too-few-public-methods
+        verbose_name = "API key"
+
+    def __str__(self) -> str:
+        return f"{self.name} ({self.prefix}...)"
+
+    @classmethod
+    def create_key(cls, user, name: str) -> tuple["APIKey", str]:
+        """
+        Creates a key for the user.
+
+        Returns:
+            The stored APIKey, and the key itself, which cannot be recovered afterwards.
+        """
+        key = API_KEY_PREFIX + secrets.token_urlsafe(32)
+        api_key = cls.objects.create(
+            name=name, user=user, prefix=key[:API_KEY_VISIBLE_LENGTH], key_hash=hash_api_key(key),
+        )
+        return api_key, key
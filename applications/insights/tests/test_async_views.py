@@ -0,0 +1,130 @@
+"""
+Tests for insights/async_views.py
+Each async endpoint is compared with its sync counterpart, which must answer the same bodies.
+"""
+import asyncio
+import json
+import warnings
+
+import pytest
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from applications.insights.serializers import astream_json
+from applications.surveys.models import Conversation
+from applications.surveys.services import save_conversations
+
+
+@pytest.fixture(name="stored_conversations")
+def fixture_stored_conversations():
+    """ Conversations written through the surveys services, so the rollups are filled too. """
+    conversations = [
+        Conversation(answer_text="I love tofu", diet_type="vegan", favorite_foods=["tofu", "kale", "lentils"]),
+        Conversation(answer_text="Cheese!", diet_type="vegetarian", favorite_foods=["cheese", "eggs", "pasta"]),
+        Conversation(answer_text="Steak", diet_type="omnivore", favorite_foods=["steak", "tofu", "rice"]),
+    ]
+    save_conversations(conversations)
+    return conversations
+
+
+def read_stream(response) -> bytes:
+    """ Consumes a response streaming an async iterator, as a WSGI server would. """
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return b"".join(response)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("query", ["", "?diet=vegan,omnivore", "?food=tofu", "?limit=2", "?q=tofu"])
+def test_async_conversations__same_body_as_sync(authenticated_client, stored_conversations, query):
+    # pylint: disable=unused-argument
+    """ The async endpoint answers the same body as the sync one, with or without pagination. """
+    response = authenticated_client.get(reverse("async-conversation-insights") + query)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.content == authenticated_client.get(reverse("conversation-insights") + query).content
+
+
+@pytest.mark.django_db
+def test_async_conversations__next_page(authenticated_client, stored_conversations):
+    # pylint: disable=unused-argument
+    """ Cursors of the async endpoint lead to the same pages as those of the sync endpoint. """
+    first = authenticated_client.get(reverse("async-conversation-insights") + "?limit=2").json()
+    url = reverse("async-conversation-insights") + f"?limit=2&cursor={first['next_cursor']}"
+
+    second = authenticated_client.get(url).json()
+
+    assert len(second["results"]) == 1
+    assert second["next_cursor"] is None
+    assert {row["id"] for row in first["results"] + second["results"]} == {
+        str(conversation.id) for conversation in stored_conversations
+    }
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("stream_format", ["json", "ndjson"])
+def test_async_conversations__streams(authenticated_client, stored_conversations, stream_format):
+    # pylint: disable=unused-argument
+    """ Streams hold the same rows as the sync streams, and tell their number of rows. """
+    url = f"?diet=vegan,vegetarian&stream={stream_format}"
+    response = authenticated_client.get(reverse("async-conversation-insights") + url)
+
+    assert response.streaming
+    assert response.is_async
+    assert response["X-Total-Count"] == "2"
+    expected = read_stream(authenticated_client.get(reverse("conversation-insights") + url))
+    assert read_stream(response) == expected
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("query", ["?diet=paleo", "?stream=xml", "?limit=0", "?cursor=bogus"])
+def test_async_conversations__invalid_params(authenticated_client, query):
+    """ Invalid parameters get the same 400 errors as from the sync endpoint. """
+    response = authenticated_client.get(reverse("async-conversation-insights") + query)
+
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json() == authenticated_client.get(reverse("conversation-insights") + query).json()
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("query", ["", "?diet=vegan&top=1", "?per_diet=true&bucket=day", "?top=0"])
+def test_async_summary__same_body_as_sync(authenticated_client, stored_conversations, query):
+    # pylint: disable=unused-argument
+    """ The async summary answers the same body and status as the sync one. """
+    response = authenticated_client.get(reverse("async-insights-summary") + query)
+    expected = authenticated_client.get(reverse("insights-summary") + query)
+
+    assert response.status_code == expected.status_code
+    assert response.content == expected.content
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("header", [None, "Api-Key wrong", "Basic d3Jvbmc6d3Jvbmc="])
+def test_async_views__authentication_required(header):
+    """ Missing or invalid credentials get a 401 with the Basic challenge, like the sync endpoints. """
+    client = APIClient()
+    if header:
+        client.credentials(HTTP_AUTHORIZATION=header)
+
+    for name in ("async-conversation-insights", "async-insights-summary"):
+        response = client.get(reverse(name))
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+        assert response["WWW-Authenticate"] == 'Basic realm="api"'
+        assert "detail" in response.json()
+
+
+def test_astream_json__empty_and_rows():
+    """ The async JSON stream is a valid array, empty or not. """
+    async def rows(items):
+        for item in items:
+            yield item
+
+    async def collect(items):
+        return b"".join([chunk async for chunk in astream_json(rows(items))])
+
+    assert json.loads(asyncio.run(collect([]))) == []
+    row = ("a1", "vegan", ["tofu"], None)
+    assert json.loads(asyncio.run(collect([row, row]))) == [
+        {"id": "a1", "diet_type": "vegan", "favorite_foods": ["tofu"], "created_at": None},
+    ] * 2
@@ -0,0 +1,164 @@
+""" Unit tests for insights/authentication.py """
+import base64
+from io import StringIO
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from applications.insights.authentication import CredentialCache
+from applications.insights.models import (
+    API_KEY_PREFIX,
+    APIKey,
+    hash_api_key,
+)
+
+
+@pytest.fixture(name="user")
+def fixture_user():
+    """ Fixture providing the user owning the API keys. """
+    return User.objects.create_user(username="analyst", password="analystpass123")
+
+
+@pytest.fixture(name="api_key")
+def fixture_api_key(user):
+    """ Fixture providing an API key, as sent by clients. """
+    _, key = APIKey.create_key(user, "dashboard")
+    return key
+
+
+def get_insights(key: str) -> int:
+    """ Calls the insights API with the API key, returning the response status. """
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Api-Key {key}")
+    return client.get(reverse("conversation-insights")).status_code
+
+
+@pytest.mark.django_db
+def test_create_key__stores_digest_only(user):
+    """ Only the digest and a short prefix of a key are stored. """
+    api_key, key = APIKey.create_key(user, "dashboard")
+
+    assert key.startswith(API_KEY_PREFIX)
+    assert api_key.key_hash == hash_api_key(key)
+    assert api_key.prefix == key[:len(api_key.prefix)]
+    assert not APIKey.objects.filter(key_hash=key).exists()
+
+
+@pytest.mark.django_db
+def test_api_key__authenticates(api_key):
+    """ A valid key authenticates as its user. """
+    assert get_insights(api_key) == status.HTTP_200_OK
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("header", ["Api-Key sg_wrong", "Api-Key", "Api-Key a b"])
+def test_api_key__invalid_rejected(api_key, header):  # pylint: disable=unused-argument
+    """ Unknown keys and malformed headers get a 401 with the Basic challenge browsers prompt for. """
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=header)
+
+    response = client.get(reverse("conversation-insights"))
+
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    assert response["WWW-Authenticate"] == 'Basic realm="api"'
+
+
+@pytest.mark.django_db
+def test_no_credentials__basic_challenge():
+    """ Requests without credentials get the Basic challenge, so browsers still prompt for a username and password. """
+    response = APIClient().get(reverse("conversation-insights"))
+
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    assert response["WWW-Authenticate"] == 'Basic realm="api"'
+
+
+@pytest.mark.django_db
+def test_api_key__inactive_rejected(user):
+    """ A deactivated key is revoked. """
+    api_key, key = APIKey.create_key(user, "revoked")
+    api_key.is_active = False
+    api_key.save()
+
+    assert get_insights(key) == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.django_db
+def test_api_key__verified_once_per_ttl(api_key, django_assert_num_queries):
+    """ Once verified, a key is trusted from the process cache, without querying the database. """
+    assert get_insights(api_key) == status.HTTP_200_OK
+
+    APIKey.objects.update(is_active=False)
+    with django_assert_num_queries(0):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Api-Key {api_key}")
+        client.get(reverse("insights-summary"), {"diet": "nope"})
+
+
+@pytest.mark.django_db
+def test_basic_auth__password_checked_once_per_ttl(user, monkeypatch):
+    """ Basic credentials keep working, but the password is hashed only on the first request. """
+    checks = []
+    check_password = User.check_password
+    monkeypatch.setattr(User, "check_password", lambda self, raw: checks.append(raw) or check_password(self, raw))
+    client = APIClient()
+    credentials = base64.b64encode(f"{user.username}:analystpass123".encode()).decode("ascii")
+    client.credentials(HTTP_AUTHORIZATION=f"Basic {credentials}")
+
+    for _ in range(3):
+        assert client.get(reverse("conversation-insights")).status_code == status.HTTP_200_OK
+
+    assert checks == ["analystpass123"]
+
+
+@pytest.mark.django_db
+def test_basic_auth__wrong_password_not_cached(user):
+    """ Failed credentials are never cached, so they are rejected every time. """
+    client = APIClient()
+    credentials = base64.b64encode(f"{user.username}:wrong".encode()).decode("ascii")
+    client.credentials(HTTP_AUTHORIZATION=f"Basic {credentials}")
+
+    for _ in range(2):
+        assert client.get(reverse("conversation-insights")).status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_credential_cache__expires_and_evicts():
+    """ Entries expire after the TTL, and the least recently used are evicted beyond the size. """
+    now = [0.0]
+    cache = CredentialCache(size=2, ttl=10, clock=lambda: now[0])
+    cache.set("a", "alice")
+    cache.set("b", "bob")
+
+    assert cache.get("a") == "alice"
+    cache.set("c", "carol")
+    assert cache.get("b") is None  # least recently used
+
+    now[0] = 10.0
+    assert cache.get("a") is None
+    assert cache.get("c") is None
+
+
+def test_credential_cache__keys_are_keyed_digests():
+    """ Credentials are never kept in clear. """
+    key = CredentialCache.make_key("Basic", "analyst", "analystpass123")
+
+    assert "analystpass123" not in key
+    assert key != CredentialCache.make_key("Basic", "analyst", "other")
+
+
+@pytest.mark.django_db
+def test_create_api_key_command(user):
+    """ The command prints a working key, and fails for unknown users. """
+    stdout, stderr = StringIO(), StringIO()
+
+    call_command("create_api_key", user.username, "--name", "dashboard", stdout=stdout, stderr=stderr)
+
+    key = stdout.getvalue().strip()
+    assert APIKey.objects.get(key_hash=hash_api_key(key)).name == "dashboard"
+    assert get_insights(key) == status.HTTP_200_OK
+    with pytest.raises(CommandError):
+        call_command("create_api_key", "nobody", stdout=stdout, stderr=stderr)
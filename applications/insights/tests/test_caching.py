@@ -0,0 +1,150 @@
+""" Tests for insights/caching.py and the conditional responses of the conversations endpoint. """
+
+import pytest
+from django.core.cache.backends.locmem import LocMemCache
+from django.urls import reverse
+from rest_framework import status
+
+from applications.insights.caching import (
+    etag_matches,
+    get_generation,
+)
+from applications.surveys.models import Conversation
+from applications.surveys.services import (
+    save_classifications,
+    save_conversations,
+    save_reclassifications,
+)
+
+
+@pytest.fixture(name="stored_conversations")
+def fixture_stored_conversations():
+    """ Conversations written through the surveys services, one of them still unclassified. """
+    conversations = [
+        Conversation(answer_text="", diet_type="vegan", favorite_foods=["tofu", "kale", "lentils"]),
+        Conversation(answer_text=""),
+    ]
+    save_conversations(conversations)
+    return conversations
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, False),
+    ('"abc"', True),
+    ('"other", W/"abc"', True),
+    ("*", True),
+    ('"other"', False),
+])
+def test_etag_matches(header, expected):
+    """ If-None-Match may list several ETags, weak ones, or "*". """
+    assert etag_matches(header, '"abc"') is expected
+
+
+@pytest.mark.django_db
+def test_conversations__answers_304_while_unchanged(authenticated_client, stored_conversations):
+    # pylint: disable=unused-argument
+    """ A client sending back the ETag gets an empty 304 until the data changes. """
+    url = reverse("conversation-insights") + "?diet=vegan"
+    response = authenticated_client.get(url)
+    etag = response["ETag"]
+    assert response.status_code == status.HTTP_200_OK
+    assert "no-cache" in response["Cache-Control"]
+
+    response = authenticated_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response["ETag"] == etag
+    assert not response.content
+
+
+@pytest.mark.django_db
+def test_conversations__serves_cached_body(authenticated_client, stored_conversations, django_assert_num_queries):
+    # pylint: disable=unused-argument
+    """ Repeated requests get the cached body: only the validator query runs, the credentials being cached too. """
+    url = reverse("conversation-insights")
+    first = authenticated_client.get(url)
+
+    with django_assert_num_queries(1):
+        second = authenticated_client.get(url)
+
+    assert second.content == first.content
+    assert second["ETag"] == first["ETag"]
+
+
+@pytest.mark.django_db
+def test_conversations__invalidated_by_classification(authenticated_client, stored_conversations):
+    """ Classifying a stored conversation changes neither count nor latest created_at, but still changes the ETag. """
+    url = reverse("conversation-insights")
+    etag = authenticated_client.get(url)["ETag"]
+    generation = get_generation()
+
+    unclassified = stored_conversations[1]
+    unclassified.diet_type = "omnivore"
+    unclassified.favorite_foods = ["steak", "ham", "cod"]
+    save_classifications([unclassified])
+
+    assert get_generation() == generation + 1
+    response = authenticated_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_200_OK
+    assert response["ETag"] != etag
+    assert {result["diet_type"] for result in response.json()} == {"vegan", "omnivore"}
+
+
+@pytest.mark.django_db
+def test_conversations__invalidated_by_another_process(authenticated_client, stored_conversations, monkeypatch):
+    """ A reclassification made by a process with its own cache, like a worker's locmem cache, changes the ETag. """
+    url = reverse("conversation-insights")
+    etag = authenticated_client.get(url)["ETag"]
+
+    with monkeypatch.context() as other_process:
+        other_process.setattr("applications.insights.caching.get_cache", lambda: LocMemCache("other-process", {}))
+        save_reclassifications({stored_conversations[0].pk: {"foods": ["steak", "ham", "cod"], "diet": "omnivore"}})
+
+    response = authenticated_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_200_OK
+    assert response["ETag"] != etag
+    assert {result["diet_type"] for result in response.json()} == {"omnivore", None}
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("write", [
+    lambda conversation: Conversation.objects.filter(pk=conversation.pk).get().delete(),
+    lambda conversation: conversation.foods.clear(),
+])
+def test_conversations__invalidated_by_orm_writes(authenticated_client, stored_conversations, write):
+    """ Writes bypassing the surveys services, like admin edits and deletes, change the ETag too. """
+    url = reverse("conversation-insights")
+    etag = authenticated_client.get(url)["ETag"]
+    generation = get_generation()
+
+    write(stored_conversations[0])
+
+    assert get_generation() > generation
+    assert authenticated_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == status.HTTP_200_OK
+
+
+@pytest.mark.django_db
+def test_conversations__invalidated_by_orm_save(authenticated_client, stored_conversations):
+    """ A diet edited with save() changes the ETag, and the cached body is not served anymore. """
+    url = reverse("conversation-insights")
+    etag = authenticated_client.get(url)["ETag"]
+
+    conversation = Conversation.objects.get(pk=stored_conversations[0].pk)
+    conversation.diet_type = "omnivore"
+    conversation.save()
+
+    response = authenticated_client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == status.HTTP_200_OK
+    assert {result["diet_type"] for result in response.json()} == {"omnivore", None}
+
+
+@pytest.mark.django_db
+def test_conversations__etag_depends_on_query(authenticated_client, stored_conversations):
+    # pylint: disable=unused-argument
+    """ Equivalent filters share an ETag; different filters or pages do not. """
+    url = reverse("conversation-insights")
+    etags = [
+        authenticated_client.get(url + query)["ETag"]
+        for query in ("?diet=vegan,omnivore", "?diet=Omnivore, vegan", "?diet=vegan", "?diet=vegan&limit=1")
+    ]
+    assert etags[0] == etags[1]
+    assert len(set(etags)) == 3
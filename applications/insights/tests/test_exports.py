@@ -0,0 +1,143 @@
+""" Tests for insights/exports.py, the export_conversations command and the export endpoint. """
+# pylint: disable=missing-function-docstring
+import csv
+import io
+import json
+
+import pytest
+from django.core.management import (
+    CommandError,
+    call_command,
+)
+from django.urls import reverse
+from rest_framework import status
+
+from applications.insights import exports
+from applications.insights.exports import (
+    export_conversations,
+    parse_export_format,
+)
+from applications.surveys.models import Conversation
+
+
+@pytest.fixture(name="export_conversations_rows")
+def fixture_export_conversations_rows():
+    """ Five conversations over three days, one of them unclassified and without foods. """
+    rows = [
+        ("vegan", ["tofu", "Crème brûlée"], "2025-05-05T10:00:00+00:00"),
+        ("vegan", ["kale"], "2025-05-06T10:00:00+00:00"),
+        ("vegetarian", ["cheese", "eggs"], "2025-05-06T11:00:00+00:00"),
+        ("omnivore", ["steak"], "2025-05-07T10:00:00+00:00"),
+        (None, None, "2025-05-07T12:00:00+00:00"),
+    ]
+    conversations = []
+    for diet_type, favorite_foods, created_at in rows:
+        conversation = Conversation.objects.create(answer_text="", diet_type=diet_type, favorite_foods=favorite_foods)
+        Conversation.objects.filter(pk=conversation.pk).update(created_at=created_at)
+        conversations.append(conversation)
+    return conversations
+
+
+def read_csv(data: bytes) -> list[dict]:
+    return list(csv.DictReader(io.StringIO(data.decode())))
+
+
+def test_parse_export_format():
+    assert parse_export_format(None) == "csv"
+    assert parse_export_format(" CSV ") == "csv"
+    with pytest.raises(ValueError, match="Invalid export format"):
+        parse_export_format("xlsx")
+
+
+def test_parse_export_format__without_pyarrow(monkeypatch):
+    monkeypatch.setattr(exports, "pyarrow", None)
+    assert exports.available_formats() == ["csv"]
+    with pytest.raises(ValueError, match="needs the pyarrow package"):
+        parse_export_format("parquet")
+
+
+@pytest.mark.django_db
+def test_export_conversations__csv(export_conversations_rows):
+    data = b"".join(export_conversations(Conversation.objects.order_by("created_at"), "csv", batch_size=2))
+    rows = read_csv(data)
+
+    assert [row["id"] for row in rows] == [str(c.pk) for c in export_conversations_rows]
+    assert rows[0]["diet_type"] == "vegan"
+    assert json.loads(rows[0]["favorite_foods"]) == ["tofu", "Crème brûlée"]
+    assert rows[0]["created_at"] == "2025-05-05T10:00:00+00:00"
+    assert rows[-1]["diet_type"] == rows[-1]["favorite_foods"] == ""
+
+
+@pytest.mark.django_db
+def test_export_conversations__csv_header_only_when_empty():
+    data = b"".join(export_conversations(Conversation.objects.none(), "csv"))
+    assert data == b"id,diet_type,favorite_foods,created_at\n"
+
+
+@pytest.mark.django_db
+def test_export_conversations__yields_one_piece_per_batch(export_conversations_rows):
+    # pylint: disable=unused-argument
+    assert len(list(export_conversations(Conversation.objects.all(), "csv", batch_size=2))) == 3
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("export_format", ["parquet", "arrow"])
+def test_export_conversations__arrow_formats_round_trip(export_conversations_rows, export_format):
+    pyarrow = pytest.importorskip("pyarrow")
+    data = b"".join(export_conversations(Conversation.objects.order_by("created_at"), export_format, batch_size=2))
+
+    if export_format == "parquet":
+        parquet = pytest.importorskip("pyarrow.parquet")
+        assert parquet.ParquetFile(io.BytesIO(data)).num_row_groups == 3
+        table = parquet.read_table(io.BytesIO(data))
+    else:
+        table = pyarrow.ipc.open_stream(data).read_all()
+
+    rows = table.to_pylist()
+    assert [row["id"] for row in rows] == [str(c.pk) for c in export_conversations_rows]
+    assert rows[0]["favorite_foods"] == ["tofu", "Crème brûlée"]
+    assert rows[0]["created_at"].isoformat() == "2025-05-05T10:00:00+00:00"
+    assert rows[-1]["diet_type"] is None and rows[-1]["favorite_foods"] is None
+
+
+@pytest.mark.django_db
+def test_export_view__filters_and_attachment(authenticated_client, export_conversations_rows):
+    response = authenticated_client.get(
+        reverse("insights-export"), {"diet": "vegan,vegetarian", "since": "2025-05-06", "until": "2025-05-06"},
+    )
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response["Content-Type"] == "text/csv"
+    assert response["Content-Disposition"] == 'attachment; filename="conversations.csv"'
+    rows = read_csv(b"".join(response.streaming_content))
+    assert sorted(row["id"] for row in rows) == sorted(str(c.pk) for c in export_conversations_rows[1:3])
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("params", [{"output": "xlsx"}, {"since": "yesterday"}, {"diet": "meatarian"}])
+def test_export_view__invalid_parameters(authenticated_client, params):
+    response = authenticated_client.get(reverse("insights-export"), params)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_export_view__requires_authentication(client):
+    assert client.get(reverse("insights-export")).status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.django_db
+def test_export_conversations_command(export_conversations_rows, tmp_path):
+    output = tmp_path / "conversations.csv"
+    stderr = io.StringIO()
+
+    call_command("export_conversations", "--output", str(output), "--until", "2025-05-06", stderr=stderr)
+
+    rows = read_csv(output.read_bytes())
+    assert sorted(row["id"] for row in rows) == sorted(str(c.pk) for c in export_conversations_rows[:3])
+    assert "Exported 3 conversations" in stderr.getvalue()
+
+
+@pytest.mark.django_db
+def test_export_conversations_command__invalid_date():
+    with pytest.raises(CommandError, match="Invalid date"):
+        call_command("export_conversations", "--since", "May 5th")
@@ -0,0 +1,162 @@
+""" Tests for applications/metrics.py, and the /metrics endpoint. """
+import asyncio
+import os
+import subprocess
+import sys
+
+import pytest
+from django.test import AsyncClient
+from django.urls import reverse
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Histogram,
+)
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from applications.metrics import (
+    CONTENT_TYPE,
+    HTTP_REQUEST_SECONDS,
+    HTTP_REQUESTS,
+    clear_metrics,
+    counter_value,
+    format_summary,
+    observation_count,
+    observation_mean,
+    observation_quantile,
+    observe,
+)
+
+
+METRICS_TOKEN = "metrics-token"
+
+
+@pytest.fixture(name="empty_metrics", autouse=True)
+def fixture_empty_metrics(settings, monkeypatch):
+    """
+    Keeps the metrics recorded by one test out of another test's assertions, sets the metrics token, and reads the
+    metrics of this process only.
+    """
+    settings.METRICS_TOKEN = METRICS_TOKEN
+    monkeypatch.delenv("PROMETHEUS_MULTIPROC_DIR", raising=False)
+    clear_metrics()
+    yield
+    clear_metrics()
+
+
+def test_counter_value__sums_matching_series():
+    """ Counts are read per series, 0 for series never recorded, and labels must be the metric's. """
+    counter = Counter("test", "Test counter.", ("kind",), registry=CollectorRegistry())
+    counter.labels(kind="a").inc()
+    counter.labels(kind="b").inc(2.5)
+
+    assert counter_value(counter, kind="a") == 1
+    assert counter_value(counter, kind="b") == 2.5
+    assert counter_value(counter, kind="c") == 0
+    with pytest.raises(ValueError):
+        counter.labels(other="a")
+
+
+def test_histogram__counts_and_quantiles():
+    """ Histograms count observed values, and estimate quantiles from their buckets. """
+    histogram = Histogram("test_seconds", "Test histogram.", buckets=(0.1, 1.0), registry=CollectorRegistry())
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value)
+
+    assert observation_count(histogram) == 4
+    assert observation_quantile(histogram, 0.5) == pytest.approx(0.55)
+    assert observation_quantile(histogram, 0.99) == 1.0
+    assert observation_mean(histogram) == pytest.approx(1.5125)
+    assert observation_quantile(Histogram("empty", "Empty.", registry=CollectorRegistry()), 0.5) is None
+
+
+def test_observe__outcomes():
+    """ Blocks are timed whether they raise or not, and counted by outcome. """
+    histogram = Histogram("test_seconds", "Test histogram.", ("operation",), registry=CollectorRegistry())
+    counter = Counter("test", "Test counter.", ("operation", "outcome"), registry=CollectorRegistry())
+
+    with observe(histogram, counter, operation="op"):
+        pass
+    with pytest.raises(RuntimeError), observe(histogram, counter, operation="op"):
+        raise RuntimeError
+
+    assert observation_count(histogram, operation="op") == 2
+    assert counter_value(counter, operation="op", outcome="success") == 1
+    assert counter_value(counter, operation="op", outcome="failure") == 1
+
+
+def test_format_summary__empty():
+    """ Without any call recorded, the summary says so instead of printing an empty table. """
+    assert format_summary() == "No OpenAI calls nor database writes recorded"
+
+
+@pytest.mark.django_db
+def test_metrics_endpoint__exposes_insights_requests(authenticated_client):
+    """ Insights API calls are counted by view and status, and exposed in the Prometheus text format. """
+    authenticated_client.get(reverse("conversation-insights"))
+    authenticated_client.get(reverse("insights-summary"), {"top": "0"})
+
+    response = APIClient().get(reverse("metrics"), HTTP_AUTHORIZATION=f"Bearer {METRICS_TOKEN}")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response["Content-Type"] == CONTENT_TYPE
+    body = response.content.decode()
+    assert 'surveygorilla_http_requests_total{method="GET",status="200",view="conversation-insights"} 1.0' in body
+    assert 'surveygorilla_http_requests_total{method="GET",status="400",view="insights-summary"} 1.0' in body
+    assert "# TYPE surveygorilla_http_request_duration_seconds histogram" in body
+    assert "# TYPE surveygorilla_openai_requests_total counter" in body
+
+
+@pytest.mark.parametrize("authorization", [None, "Bearer wrong-token", f"Basic {METRICS_TOKEN}"])
+def test_metrics_endpoint__requires_token(authorization):
+    """ Requests without the metrics token get a 401 with a Bearer challenge, and no metrics. """
+    headers = {"HTTP_AUTHORIZATION": authorization} if authorization else {}
+
+    response = APIClient().get(reverse("metrics"), **headers)
+
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    assert response["WWW-Authenticate"] == 'Bearer realm="metrics"'
+    assert "# TYPE" not in response.content.decode()
+
+
+def test_metrics_endpoint__disabled_without_token(settings):
+    """ Without a configured token, even an empty bearer token is refused. """
+    settings.METRICS_TOKEN = ""
+
+    response = APIClient().get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer ")
+
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_metrics_middleware__asgi():
+    """ Requests served by the ASGI handler are recorded too. """
+    response = asyncio.run(AsyncClient().get(reverse("metrics"), headers={"Authorization": f"Bearer {METRICS_TOKEN}"}))
+
+    assert response.status_code == status.HTTP_200_OK
+    assert counter_value(HTTP_REQUESTS, view="metrics", method="GET", status="200") == 1
+    assert observation_count(HTTP_REQUEST_SECONDS, view="metrics", method="GET") == 1
+
+
+# Records one insights request, like a worker process serving it.
+WORKER_SCRIPT = """
+from applications.metrics import HTTP_REQUESTS
+HTTP_REQUESTS.labels(view="insights-summary", method="GET", status="200").inc()
+"""
+
+
+def test_metrics_endpoint__sums_worker_processes(monkeypatch, tmp_path):
+    """ With PROMETHEUS_MULTIPROC_DIR, /metrics sums the samples of every process, whichever one answers. """
+    for _ in range(2):
+        subprocess.run(
+            [sys.executable, "-c", WORKER_SCRIPT],
+            env={**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path)},
+            check=True,
+        )
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+
+    response = APIClient().get(reverse("metrics"), HTTP_AUTHORIZATION=f"Bearer {METRICS_TOKEN}")
+
+    assert response.status_code == status.HTTP_200_OK
+    body = response.content.decode()
+    assert 'surveygorilla_http_requests_total{method="GET",status="200",view="insights-summary"} 2.0' in body
@@ -0,0 +1,98 @@
+""" Tests for insights/serializers.py """
+import os
+import time
+import uuid
+from datetime import (
+    datetime,
+    timedelta,
+    timezone as dt_timezone,
+)
+from zoneinfo import ZoneInfo
+
+import pytest
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from applications.insights.serializers import (
+    CREATED_AT_FORMAT,
+    ConversationInsightSerializer,
+    fast_rows,
+    make_datetime_formatter,
+    serialize_rows,
+)
+from applications.surveys.models import Conversation
+
+
+BENCHMARK_ROWS = 100_000
+
+
+def make_conversations(count: int) -> list[Conversation]:
+    """ Unsaved conversations covering unclassified rows, empty and non-ASCII foods, and many timestamps. """
+    start = datetime(2025, 5, 30, 23, 59, 59, 999_999, tzinfo=dt_timezone.utc)
+    diets = [None, "vegan", "vegetarian", "omnivore"]
+    foods = [None, [], ["tofu", "kale", "lentils"], ["crème brûlée", "寿司", "jalapeño \"poppers\""]]
+    return [
+        Conversation(
+            id=uuid.uuid4(),
+            diet_type=diets[index % len(diets)],
+            favorite_foods=foods[index % len(foods)],
+            created_at=start - timedelta(minutes=7 * index, seconds=index),
+        )
+        for index in range(count)
+    ]
+
+
+def as_row(conversation: Conversation) -> tuple:
+    """ The fast path's row for a conversation, as read by fast_rows. """
+    return conversation.id, conversation.diet_type, conversation.favorite_foods, conversation.created_at
+
+
+def drf_bytes(conversations: list[Conversation]) -> bytes:
+    """ The JSON body rendered from ConversationInsightSerializer, as the endpoint used to return it. """
+    return JSONRenderer().render(ConversationInsightSerializer(conversations, many=True).data)
+
+
+@pytest.mark.parametrize("timezone_name", ["UTC", "Asia/Kolkata", "America/St_Johns"])
+def test_serialize_rows__renders_identical_bytes(timezone_name):
+    """ The fast path renders the same bytes as the DRF serializer, in any current timezone. """
+    conversations = make_conversations(500)
+    with timezone.override(ZoneInfo(timezone_name)):
+        assert JSONRenderer().render(serialize_rows(as_row(c) for c in conversations)) == drf_bytes(conversations)
+
+
+@pytest.mark.parametrize("output_format", [CREATED_AT_FORMAT, "%d/%m/%Y %H:%M:%S"])
+def test_make_datetime_formatter__matches_strftime(output_format):
+    """ The minute fast path and the strftime fallback agree with strftime after timezone conversion. """
+    tz = ZoneInfo("Europe/Helsinki")
+    value = datetime(2024, 3, 31, 0, 30, 59, tzinfo=dt_timezone.utc)
+    assert make_datetime_formatter(output_format, tz)(value) == value.astimezone(tz).strftime(output_format)
+    assert make_datetime_formatter(output_format, tz)(None) is None
+
+
+@pytest.mark.django_db
+def test_fast_rows__matches_serializer_for_stored_conversations():
+    """ Rows read from the database serialize like the model instances of the same query. """
+    Conversation.objects.bulk_create(make_conversations(50))
+    conversations = Conversation.objects.order_by("-created_at", "-id")
+
+    assert JSONRenderer().render(serialize_rows(fast_rows(conversations))) == drf_bytes(list(conversations))
+
+
+@pytest.mark.skipif(not os.environ.get("RUN_BENCHMARKS"), reason="Set RUN_BENCHMARKS=1 to run benchmarks")
+def test_serialize_rows__benchmark():
+    """ Serializes and renders 100k conversations with both paths, reporting timings; the fast path must win. """
+    conversations = make_conversations(BENCHMARK_ROWS)
+    rows = [as_row(conversation) for conversation in conversations]
+
+    started = time.perf_counter()
+    slow = drf_bytes(conversations)
+    drf_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    fast = JSONRenderer().render(serialize_rows(rows))
+    fast_seconds = time.perf_counter() - started
+
+    print(f"\n{BENCHMARK_ROWS} rows: DRF serializer {drf_seconds:.3f}s, fast path {fast_seconds:.3f}s "
+          f"({drf_seconds / fast_seconds:.1f}x)")
+    assert fast == slow
+    assert fast_seconds < drf_seconds / 2
@@ -1,12 +1,33 @@
 """ Unit tests for insights/services.py """
 # pylint: disable=missing-function-docstring
+from datetime import date
+
 import pytest
 from django.utils import timezone
+from applications.constants import (
+    DEFAULT_PAGE_LIMIT,
+    MAX_PAGE_LIMIT,
+    MAX_TOP_FOODS,
+)
 from applications.insights.services import (
+    count_diets,
+    decode_cursor,
     get_conversations_by_diet,
+    paginate_conversations,
+    parse_bucket_query_param,
+    parse_date_query_param,
     parse_diet_query_param,
+    parse_food_query_param,
+    parse_limit_query_param,
+    parse_stream_query_param,
+    parse_top_query_param,
+    summarize_conversations,
+    top_foods,
 )
+from applications.surveys.foods import link_foods
 from applications.surveys.models import Conversation
+from applications.surveys.rollups import rebuild_rollups
+from applications.surveys.services import filter_by_created_at
 
 
 def test_parse_diet_query_param__valid():
@@ -34,3 +55,188 @@ def test_get_conversations_by_diet():
     results = get_conversations_by_diet(["vegan"])
     assert len(results) == 1
     assert results[0].diet_type == "vegan"
+
+
+def test_parse_limit_query_param__defaults_when_empty():
+    assert parse_limit_query_param("") == DEFAULT_PAGE_LIMIT
+
+
+@pytest.mark.parametrize("param", ["0", "-1", "abc", str(MAX_PAGE_LIMIT + 1)])
+def test_parse_limit_query_param__invalid(param):
+    with pytest.raises(ValueError, match="Invalid limit"):
+        parse_limit_query_param(param)
+
+
+def test_parse_stream_query_param():
+    assert parse_stream_query_param(" NDJSON ") == "ndjson"
+    assert parse_stream_query_param(None) is None
+    with pytest.raises(ValueError, match="Invalid stream format"):
+        parse_stream_query_param("xml")
+
+
+def test_decode_cursor__invalid():
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        decode_cursor("not a cursor")
+
+
+@pytest.mark.django_db
+def test_paginate_conversations__walks_all_rows_once():
+    created_at = timezone.now()
+    conversations = Conversation.objects.bulk_create([
+        Conversation(answer_text=str(i), diet_type=Conversation.DietType.VEGAN, favorite_foods=[])
+        for i in range(7)
+    ])
+    # Rows sharing a timestamp are ordered by id, so no row is skipped or repeated across pages.
+    Conversation.objects.filter(pk__in=[c.pk for c in conversations[:4]]).update(created_at=created_at)
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        page, cursor = paginate_conversations(get_conversations_by_diet(["vegan"]), cursor, limit=3)
+        seen.extend(page)
+        pages += 1
+        if cursor is None:
+            break
+
+    assert pages == 3
+    assert len(seen) == len({c.pk for c in seen}) == 7
+    assert [(c.created_at, c.pk) for c in seen] == sorted(((c.created_at, c.pk) for c in seen), reverse=True)
+
+
+@pytest.fixture(name="summary_conversations")
+def fixture_summary_conversations():
+    """ Conversations over two weeks, with repeated foods in mixed case, and one unclassified conversation. """
+    rows = [
+        ("vegan", ["Tofu", "kale", "lentils"], "2025-05-05T10:00:00+00:00"),
+        ("vegan", ["tofu", "seitan", "kale"], "2025-05-06T10:00:00+00:00"),
+        ("vegetarian", ["cheese", "tofu", "eggs"], "2025-05-13T10:00:00+00:00"),
+        ("omnivore", ["steak", "tofu", "cheese"], "2025-05-13T11:00:00+00:00"),
+        (None, [], "2025-05-13T12:00:00+00:00"),
+    ]
+    conversations = Conversation.objects.bulk_create([
+        Conversation(answer_text="", diet_type=diet, favorite_foods=foods) for diet, foods, _ in rows
+    ])
+    for conversation, (_, _, created_at) in zip(conversations, rows):
+        Conversation.objects.filter(pk=conversation.pk).update(created_at=created_at)
+    link_foods(conversations)
+    rebuild_rollups()
+    return conversations
+
+
+@pytest.mark.django_db
+def test_count_diets(summary_conversations):  # pylint: disable=unused-argument
+    assert count_diets([]) == {None: 1, "omnivore": 1, "vegan": 2, "vegetarian": 1}
+    assert count_diets(["vegan"], bucket="week") == {"2025-05-05": {"vegan": 2}}
+
+
+@pytest.mark.django_db
+def test_top_foods__counts_case_insensitively(summary_conversations):  # pylint: disable=unused-argument
+    assert top_foods([], top=2) == [{"food": "tofu", "count": 4}, {"food": "cheese", "count": 2}]
+
+
+@pytest.mark.django_db
+def test_top_foods__ranks_per_diet_and_bucket(summary_conversations):  # pylint: disable=unused-argument
+    rows = top_foods(["vegan", "omnivore"], top=1, per_diet=True, bucket="week")
+    assert rows == [
+        {"bucket": "2025-05-05", "diet": "vegan", "food": "kale", "count": 2},
+        {"bucket": "2025-05-12", "diet": "omnivore", "food": "cheese", "count": 1},
+    ]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("diet_filters, per_diet, bucket", [
+    ([], False, None),
+    (["vegan", "omnivore"], True, "week"),
+    ([], True, "month"),
+])
+def test_top_foods__portable_fallback_ranks_like_sql(
+    summary_conversations, monkeypatch, diet_filters, per_diet, bucket,
+):  # pylint: disable=unused-argument
+    """ On databases without a ranking query, the ORM aggregation answers the same rows. """
+    expected = top_foods(diet_filters, top=2, per_diet=per_diet, bucket=bucket)
+    monkeypatch.setattr("applications.insights.services._BUCKET_SQL", {})
+
+    assert top_foods(diet_filters, top=2, per_diet=per_diet, bucket=bucket) == expected
+
+
+@pytest.mark.django_db
+def test_summarize_conversations(summary_conversations):  # pylint: disable=unused-argument
+    summary = summarize_conversations([], top=1, per_diet=True, bucket="month")
+    assert summary["total"] == 5
+    assert summary["diets"] == {"unclassified": 1, "omnivore": 1, "vegan": 2, "vegetarian": 1}
+    assert summary["top_foods"] == [{"food": "tofu", "count": 4}]
+    assert summary["top_foods_by_diet"]["vegan"] == [{"food": "kale", "count": 2}]
+    assert summary["buckets"] == [{
+        "bucket": "2025-05-01",
+        "diets": {"omnivore": 1, "vegan": 2, "vegetarian": 1},
+        "top_foods": [{"food": "tofu", "count": 4}],
+        "top_foods_by_diet": summary["top_foods_by_diet"],
+    }]
+
+
+@pytest.mark.parametrize("param", ["0", "abc", str(MAX_TOP_FOODS + 1)])
+def test_parse_top_query_param__invalid(param):
+    with pytest.raises(ValueError, match="Invalid top"):
+        parse_top_query_param(param)
+
+
+def test_parse_bucket_query_param():
+    assert parse_bucket_query_param("Week") == "week"
+    assert parse_bucket_query_param("") is None
+    with pytest.raises(ValueError, match="Invalid bucket"):
+        parse_bucket_query_param("year")
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("diet_filters", [[], ["vegan", "omnivore"]])
+def test_summarize_conversations__rollups_match_live_counts(summary_conversations, diet_filters):
+    # pylint: disable=unused-argument
+    from_rollups = summarize_conversations(diet_filters, top=3, per_diet=True, bucket="week")
+    live = summarize_conversations(diet_filters, top=3, per_diet=True, bucket="week", from_rollups=False)
+    for bucket in live["buckets"]:
+        bucket["diets"].pop(None, None)
+        bucket["diets"].pop("unclassified", None)
+    live["buckets"] = [bucket for bucket in live["buckets"] if bucket["diets"]]
+    assert from_rollups == live
+
+
+def test_parse_food_query_param():
+    assert parse_food_query_param(" Hummus, roasted Chickpeas,,") == ["hummus", "roasted chickpea"]
+    assert parse_food_query_param(None) == []
+
+
+@pytest.mark.django_db
+def test_get_conversations_by_diet__filters_by_food():
+    hummus_and_falafel = Conversation.objects.create(answer_text="", favorite_foods=["hummus", "falafel"])
+    hummus = Conversation.objects.create(answer_text="", favorite_foods=["Hummus"])
+    Conversation.objects.create(answer_text="", favorite_foods=["steak"])
+    link_foods(Conversation.objects.all())
+
+    results = get_conversations_by_diet([], parse_food_query_param("hummus,falafels"))
+
+    assert sorted(c.pk for c in results) == sorted([hummus_and_falafel.pk, hummus.pk])
+
+
+def test_parse_date_query_param():
+    assert parse_date_query_param(" 2025-05-30 ") == date(2025, 5, 30)
+    assert parse_date_query_param("") is None
+    with pytest.raises(ValueError, match="Invalid date"):
+        parse_date_query_param("30/05/2025")
+
+
+@pytest.mark.django_db
+def test_filter_by_created_at__includes_both_bounds():
+    created = {}
+    for label, created_at in [
+        ("before", "2025-05-04T23:59:59+00:00"),
+        ("first", "2025-05-05T00:00:00+00:00"),
+        ("last", "2025-05-06T23:59:59+00:00"),
+        ("after", "2025-05-07T00:00:00+00:00"),
+    ]:
+        conversation = Conversation.objects.create(answer_text=label)
+        Conversation.objects.filter(pk=conversation.pk).update(created_at=created_at)
+        created[label] = conversation.pk
+
+    results = filter_by_created_at(get_conversations_by_diet([]), date(2025, 5, 5), date(2025, 5, 6))
+
+    assert sorted(c.pk for c in results) == sorted([created["first"], created["last"]])
+    assert filter_by_created_at(get_conversations_by_diet([])).count() == 4
@@ -2,15 +2,17 @@
 Tests for insights/views.py
 These are more like end-to-end since they test logic of the models, serializers, views, and services.
 """
-import base64
+import json
 
 import pytest
 from rest_framework import status
 from rest_framework.test import APIClient
-from django.contrib.auth.models import User
 from django.urls import reverse
 
+from applications.surveys.foods import link_foods
 from applications.surveys.models import Conversation
+from applications.surveys.rollups import rebuild_rollups
+from applications.surveys.services import save_conversations
 
 
 @pytest.fixture(name="unauthenticated_client")
@@ -19,16 +21,6 @@ def fixture_unauthenticated_client():
     return APIClient()
 
 
-@pytest.fixture(name="authenticated_client")
-def fixture_authenticated_client():
-    """ Fixture that provides an authenticated API client. """
-    client = APIClient()
-    User.objects.create_user(username="testuser", password="testpass123")
-    credentials = base64.b64encode(b"testuser:testpass123").decode("ascii")
-    client.credentials(HTTP_AUTHORIZATION=f"Basic {credentials}")
-    return client
-
-
 @pytest.fixture(name="test_conversations")
 def fixture_sample_conversations():
     """Fixture to create sample conversations for testing"""
@@ -124,3 +116,117 @@ def test_invalid_diet_params(authenticated_client, invalid_param, caplog):
     assert response.status_code == status.HTTP_400_BAD_REQUEST
     assert "Invalid diet types" in response.json().get("error", "")
     assert any(record.levelname == "WARNING" for record in caplog.records)
+
+
+@pytest.mark.django_db
+def test_get_conversations_paginated(authenticated_client, test_conversations):
+    """ Test that following next_cursor returns every conversation once, newest first """
+    url = reverse("conversation-insights")
+    response = authenticated_client.get(url + "?limit=2")
+    assert response.status_code == status.HTTP_200_OK
+    first_page = response.json()
+    assert len(first_page["results"]) == 2
+    assert first_page["next_cursor"]
+
+    response = authenticated_client.get(url + f"?limit=2&cursor={first_page['next_cursor']}")
+    second_page = response.json()
+    assert len(second_page["results"]) == 1
+    assert second_page["next_cursor"] is None
+
+    ids = [result["id"] for result in first_page["results"] + second_page["results"]]
+    assert sorted(ids) == sorted(str(conversation.id) for conversation in test_conversations)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("query_param", ["?limit=0", "?limit=abc", "?cursor=bogus", "?stream=xml"])
+def test_invalid_pagination_params(authenticated_client, query_param):
+    """ Test handling of invalid limit, cursor and stream parameters """
+    response = authenticated_client.get(reverse("conversation-insights") + query_param)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert "Invalid" in response.json().get("error", "")
+
+
+@pytest.mark.django_db
+def test_stream_json_matches_unpaginated_response(authenticated_client, test_conversations):
+    # pylint: disable=unused-argument
+    """ Test that the streamed JSON array holds the same conversations as the regular response """
+    url = reverse("conversation-insights") + "?diet=vegan,omnivore"
+    response = authenticated_client.get(url + "&stream=json")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert response.streaming
+    assert response["Content-Type"] == "application/json"
+    assert json.loads(b"".join(response.streaming_content)) == authenticated_client.get(url).json()
+
+
+@pytest.mark.django_db
+def test_stream_ndjson(authenticated_client, test_conversations):
+    # pylint: disable=unused-argument
+    """ Test that NDJSON streaming emits one JSON object per line """
+    response = authenticated_client.get(reverse("conversation-insights") + "?stream=ndjson")
+
+    assert response["Content-Type"] == "application/x-ndjson"
+    lines = b"".join(response.streaming_content).decode().splitlines()
+    assert {json.loads(line)["diet_type"] for line in lines} == {"vegan", "vegetarian", "omnivore"}
+
+
+@pytest.mark.django_db
+def test_get_summary(authenticated_client, test_conversations):
+    # pylint: disable=unused-argument
+    """ Test that the summary counts diets and foods of the filtered conversations """
+    rebuild_rollups()
+    url = reverse("insights-summary") + "?diet=vegan,vegetarian&top=2&per_diet=true&bucket=day"
+    response = authenticated_client.get(url)
+
+    assert response.status_code == status.HTTP_200_OK
+    summary = response.json()
+    assert summary["total"] == 2
+    assert summary["diets"] == {"vegan": 1, "vegetarian": 1}
+    assert len(summary["top_foods"]) == 2
+    assert summary["top_foods_by_diet"]["vegan"] == [{"food": "kale", "count": 1}, {"food": "lentil", "count": 1}]
+    assert len(summary["buckets"]) == 1
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("query_param", ["?diet=carnivore", "?top=0", "?bucket=year"])
+def test_get_summary__invalid_params(authenticated_client, query_param):
+    """ Test handling of invalid summary parameters """
+    response = authenticated_client.get(reverse("insights-summary") + query_param)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert "Invalid" in response.json().get("error", "")
+
+
+@pytest.mark.django_db
+def test_get_summary__requires_authentication(unauthenticated_client):
+    """ Test that the summary requires authentication """
+    response = unauthenticated_client.get(reverse("insights-summary"))
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("query_param, expected_diets", [
+    ("?food=Tofu", ["vegan"]),
+    ("?food=mushroom,steak", ["vegetarian", "omnivore"]),
+    ("?food=tofu&diet=omnivore", []),
+])
+def test_get_conversations_with_food_filters(authenticated_client, test_conversations, query_param, expected_diets):
+    """ Test filtering by canonical food names, alone and together with diets """
+    link_foods(test_conversations)
+    response = authenticated_client.get(reverse("conversation-insights") + query_param)
+
+    assert response.status_code == status.HTTP_200_OK
+    assert sorted(result["diet_type"] for result in response.json()) == sorted(expected_diets)
+
+
+@pytest.mark.django_db
+def test_get_conversations_with_search_query(authenticated_client):
+    """ Test that ?q= keeps the conversations whose answer matches the search """
+    save_conversations([
+        Conversation(answer_text="Hummus, falafel, and halloumi.", diet_type="vegetarian"),
+        Conversation(answer_text="Steak, ribs, and chicken wings.", diet_type="omnivore"),
+    ])
+
+    response = authenticated_client.get(reverse("conversation-insights") + "?q=falafel")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert [result["diet_type"] for result in response.json()] == ["vegetarian"]
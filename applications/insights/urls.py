@@ -1,8 +1,25 @@
 """ URL configuration for the insights application. """
 from django.urls import path
 
-from applications.insights.views import ConversationInsightsView
+from applications.insights.async_views import (
+    AsyncConversationInsightsView,
+    AsyncInsightsSummaryView,
+)
+from applications.insights.views import (
+    ConversationExportView,
+    ConversationInsightsView,
+    InsightsSummaryView,
+)
 
 urlpatterns = [
     path('insights/conversations', ConversationInsightsView.as_view(), name='conversation-insights'),
+    path('insights/summary', InsightsSummaryView.as_view(), name='insights-summary'),
+    path('insights/export', ConversationExportView.as_view(), name='insights-export'),
+    # Async variants, for ASGI deployments (see insights/async_views.py).
+    path(
+        'insights/async/conversations',
+        AsyncConversationInsightsView.as_view(),
+        name='async-conversation-insights',
+    ),
+    path('insights/async/summary', AsyncInsightsSummaryView.as_view(), name='async-insights-summary'),
 ]
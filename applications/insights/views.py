@@ -2,19 +2,60 @@
 The views module of the insights application.
 Defines API endpoints for querying insights from survey conversations.
 """
+from typing import Callable
+
+from django.http import (
+    HttpResponse,
+    HttpResponseNotModified,
+    StreamingHttpResponse,
+)
+from django.utils.cache import patch_cache_control
 from rest_framework import status
-from rest_framework.authentication import BasicAuthentication
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from applications.insights.serializers import ConversationInsightSerializer
+from applications.constants import (
+    MAX_PAGE_LIMIT,
+    MAX_TOP_FOODS,
+    STREAM_CHUNK_SIZE,
+)
+from applications.insights.authentication import INSIGHTS_AUTHENTICATION_CLASSES
+from applications.insights.caching import (
+    cache_body,
+    compute_etag,
+    etag_matches,
+    get_cached_body,
+)
+from applications.insights.exports import (
+    EXPORT_FORMATS,
+    available_formats,
+    export_conversations,
+    parse_export_format,
+)
+from applications.insights.serializers import (
+    fast_rows,
+    serialize_rows,
+    stream_json,
+    stream_ndjson,
+)
 from applications.insights.services import (
     get_conversations_by_diet,
+    paginate_conversations,
+    parse_bucket_query_param,
+    parse_date_query_param,
     parse_diet_query_param,
+    parse_food_query_param,
+    parse_limit_query_param,
+    parse_stream_query_param,
+    parse_top_query_param,
+    summarize_conversations,
 )
 from applications.logging import get_logger
+from applications.surveys.search import search_conversations
+from applications.surveys.services import filter_by_created_at
 
 
 logger = get_logger(__name__)
@@ -22,18 +63,149 @@ logger = get_logger(__name__)
 
 class ConversationInsightsView(APIView):
     """
-    API endpoint that returns conversations filtered by diet type.
+    API endpoint that returns conversations filtered by diet type, newest first.
 
     Query Parameters:
         diet (str): Comma-separated list of diet types to include. Valid values:
             "vegan", "vegetarian", "omnivore".
             Example: ?diet=vegetarian,vegan
+        food (str): Comma-separated list of foods; only conversations mentioning at least one of them are returned.
+            Matching ignores case and plurals. Example: ?food=hummus,falafels
+        q (str): Full-text search over the answers, in web search syntax. Example: ?q=tofu -kale
+        limit (int): Page size, up to MAX_PAGE_LIMIT. Giving `limit` or `cursor` switches to paginated responses.
+        cursor (str): The `next_cursor` of the previous page.
+            Example: ?diet=vegan&limit=100&cursor=MjAyNS0wNS0zMFQwMzoyMT...
+        stream (str): "json" or "ndjson" to stream all matching conversations unpaginated, in constant memory.
 
     Returns:
-        200 OK: List of serialized Conversation objects matching the filter.
-        400 Bad Request: If any provided diet type is invalid.
+        200 OK: List of serialized Conversation objects matching the filter; with pagination, an object with the
+            page in "results" and the cursor of the next page in "next_cursor" (null on the last page).
+        304 Not Modified: If the If-None-Match header holds the ETag of the current result (not for streams).
+        400 Bad Request: If any provided diet type, limit, cursor or stream format is invalid.
     """
-    authentication_classes = [BasicAuthentication]
+    authentication_classes = INSIGHTS_AUTHENTICATION_CLASSES
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request: Request) -> Response | HttpResponse | StreamingHttpResponse:
+        # pylint: disable=missing-function-docstring
+        diet_param = request.query_params.get("diet", "")
+
+        try:
+            diet_list = parse_diet_query_param(diet_param)
+        except ValueError as e:
+            logger.warning("Invalid diet filter: %s - %s",  diet_param, e)
+            return Response(
+                {
+                    "error": f"Invalid diet types: '{diet_param}'. "
+                             f"Expected one or more of: vegan, vegetarian, omnivore."
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        food_list = parse_food_query_param(request.query_params.get("food"))
+        search_query = " ".join(request.query_params.get("q", "").split())
+        conversations = search_conversations(get_conversations_by_diet(diet_list, food_list), search_query)
+
+        try:
+            stream_format = parse_stream_query_param(request.query_params.get("stream"))
+        except ValueError as e:
+            logger.warning("Invalid stream format: %s", e)
+            return Response(
+                {"error": f"{e}. Expected one of: json, ndjson."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if stream_format:
+            return self._stream(conversations, stream_format)
+
+        query = {"diet": ",".join(sorted(diet_list)), "food": ",".join(food_list), "q": search_query}
+        if "limit" in request.query_params or "cursor" in request.query_params:
+            query.update(limit=request.query_params.get("limit", ""), cursor=request.query_params.get("cursor", ""))
+            return self._conditional(request, conversations, query, lambda: self._paginate(conversations, request))
+
+        return self._conditional(
+            request,
+            conversations,
+            query,
+            lambda: Response(serialize_rows(fast_rows(conversations))),
+        )
+
+    @staticmethod
+    def _conditional(
+        request: Request,
+        conversations,
+        query: dict,
+        build: Callable[[], Response],
+    ) -> Response | HttpResponse:
+        """
+        Answers with 304 Not Modified when the client's If-None-Match holds the current ETag of the query, else with
+        the JSON body cached under that ETag, else with the response of `build`, caching its JSON body.
+        Responses negotiated to another renderer, such as the browsable API, get the ETag but bypass the cache.
+        """
+        etag = compute_etag(conversations, query)
+        response: Response | HttpResponse
+        if etag_matches(request.headers.get("If-None-Match"), etag):
+            response = HttpResponseNotModified()
+        elif not isinstance(request.accepted_renderer, JSONRenderer):
+            response = build()
+        else:
+            body = get_cached_body(etag)
+            if body is None:
+                built = build()
+                if built.status_code != status.HTTP_200_OK:
+                    return built
+                body = JSONRenderer().render(built.data)
+                cache_body(etag, body)
+            response = HttpResponse(body, content_type="application/json")
+
+        if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response["ETag"] = etag
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    @staticmethod
+    def _paginate(conversations, request: Request) -> Response:
+        """ Returns one page of conversations with the cursor of the next page. """
+        try:
+            limit = parse_limit_query_param(request.query_params.get("limit"))
+            page, next_cursor = paginate_conversations(
+                fast_rows(conversations), request.query_params.get("cursor"), limit,
+            )
+        except ValueError as e:
+            logger.warning("Invalid pagination parameters: %s", e)
+            return Response(
+                {"error": f"{e}. Expected a limit between 1 and {MAX_PAGE_LIMIT} and a cursor from a previous page."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        return Response({"results": serialize_rows(page), "next_cursor": next_cursor})
+
+    @staticmethod
+    def _stream(conversations, stream_format: str) -> StreamingHttpResponse:
+        """ Streams every matching conversation, fetching rows from the database in chunks. """
+        rows = fast_rows(conversations).iterator(chunk_size=STREAM_CHUNK_SIZE)
+        if stream_format == "ndjson":
+            return StreamingHttpResponse(stream_ndjson(rows), content_type="application/x-ndjson")
+        return StreamingHttpResponse(stream_json(rows), content_type="application/json")
+
+
+class InsightsSummaryView(APIView):
+    """
+    API endpoint that returns aggregated insights: conversation counts per diet type and the most named foods.
+    All counting happens in the database, so the response time does not grow with the number of rows returned.
+
+    Query Parameters:
+        diet (str): Comma-separated list of diet types to include, as for the conversations endpoint.
+        top (int): Number of foods in each top foods list, up to MAX_TOP_FOODS. Defaults to 10.
+        per_diet (bool): "true" to also rank foods separately for each diet type.
+        bucket (str): "day", "week" or "month" to also break the counts down by creation time (UTC).
+            Example: ?diet=vegan,vegetarian&top=5&per_diet=true&bucket=week
+
+    Returns:
+        200 OK: {"total", "diets", "top_foods"}, plus "top_foods_by_diet" and "buckets" when requested.
+        400 Bad Request: If any provided diet type, top or bucket is invalid.
+    """
+    authentication_classes = INSIGHTS_AUTHENTICATION_CLASSES
     permission_classes = [IsAuthenticated]
 
     def get(self, request: Request) -> Response:
@@ -52,6 +224,72 @@ class ConversationInsightsView(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        conversations = get_conversations_by_diet(diet_list)
-        serializer = ConversationInsightSerializer(conversations, many=True)
-        return Response(serializer.data)
+        try:
+            top = parse_top_query_param(request.query_params.get("top"))
+            bucket = parse_bucket_query_param(request.query_params.get("bucket"))
+        except ValueError as e:
+            logger.warning("Invalid summary parameters: %s", e)
+            return Response(
+                {"error": f"{e}. Expected a top between 1 and {MAX_TOP_FOODS} and a bucket of day, week or month."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        per_diet = request.query_params.get("per_diet", "").strip().lower() in {"1", "true", "yes"}
+        return Response(summarize_conversations(diet_list, top=top, per_diet=per_diet, bucket=bucket))
+
+
+class ConversationExportView(APIView):
+    """
+    API endpoint that downloads conversations as a file, for analysis in spreadsheets and dataframes. The file is
+    streamed while the rows are read from the database in batches, so exports of any size run in bounded memory.
+
+    Query Parameters:
+        output (str): "csv" (default), or "parquet" / "arrow" (an Arrow IPC stream) when pyarrow is installed.
+            The name avoids DRF's `format` parameter, which selects a renderer.
+        diet, food, q (str): Filters, as for the conversations endpoint.
+        since, until (str): ISO 8601 dates (UTC) bounding created_at, both included. Example: ?since=2025-05-01
+
+    Returns:
+        200 OK: The export file, as an attachment; favorite_foods is a JSON array in CSV files.
+        400 Bad Request: If any provided diet type, date or output format is invalid or unavailable.
+    """
+    authentication_classes = INSIGHTS_AUTHENTICATION_CLASSES
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request: Request) -> Response | StreamingHttpResponse:
+        # pylint: disable=missing-function-docstring
+        diet_param = request.query_params.get("diet", "")
+
+        try:
+            diet_list = parse_diet_query_param(diet_param)
+        except ValueError as e:
+            logger.warning("Invalid diet filter: %s - %s",  diet_param, e)
+            return Response(
+                {
+                    "error": f"Invalid diet types: '{diet_param}'. "
+                             f"Expected one or more of: vegan, vegetarian, omnivore."
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            export_format = parse_export_format(request.query_params.get("output"))
+            since = parse_date_query_param(request.query_params.get("since"))
+            until = parse_date_query_param(request.query_params.get("until"))
+        except ValueError as e:
+            logger.warning("Invalid export parameters: %s", e)
+            return Response(
+                {"error": f"{e}. Expected an output of {', '.join(available_formats())} and dates as YYYY-MM-DD."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        food_list = parse_food_query_param(request.query_params.get("food"))
+        search_query = " ".join(request.query_params.get("q", "").split())
+        conversations = filter_by_created_at(
+            search_conversations(get_conversations_by_diet(diet_list, food_list), search_query), since, until,
+        )
+
+        content_type, extension = EXPORT_FORMATS[export_format]
+        response = StreamingHttpResponse(export_conversations(conversations, export_format), content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="conversations.{extension}"'
+        return response
@@ -0,0 +1,310 @@
+"""
+Metrics of the hot paths, recorded with prometheus_client and exposed on /metrics in the Prometheus text format.
+
+OpenAI calls (ask_question, classify_diet and classify_diets, sync and async) record their latency, including rate
+limiting waits and retries, their outcome, the tokens reported in `resp.usage`, and each retry. Database writes of
+conversations and classifications record their latency, outcome and rows, and every HTTP request, among which the
+insights API calls, its latency and status, through metrics_middleware.
+
+With several processes, like gunicorn or uvicorn workers and classifier workers, set PROMETHEUS_MULTIPROC_DIR to a
+directory they share, emptied before they start (entrypoint.sh does both): prometheus_client then keeps every
+process' samples in files there, and /metrics sums those of all processes, whichever worker answers the scrape.
+Without it, metrics live in the memory of the process, and /metrics only covers the worker that answers it.
+Commands print the metrics they recorded with format_summary when they finish.
+
+Scrapers authenticate with `Authorization: Bearer <METRICS_TOKEN>`; without a METRICS_TOKEN setting, /metrics
+answers 401 to every request.
+"""
+import hmac
+import math
+import os
+import time
+from contextlib import contextmanager
+from typing import (
+    Any,
+    Iterator,
+)
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.http import (
+    HttpRequest,
+    HttpResponse,
+)
+from django.utils.decorators import sync_and_async_middleware
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+from applications.constants import METRICS_LATENCY_BUCKETS
+
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+# The metrics of this process; in multiprocess mode, /metrics reads the files of every process instead.
+registry = CollectorRegistry()
+
+OPENAI_REQUEST_SECONDS = Histogram(
+    "surveygorilla_openai_request_duration_seconds",
+    "Seconds per OpenAI call, including rate limiting waits and retries.",
+    ("operation", "model"),
+    buckets=METRICS_LATENCY_BUCKETS,
+    registry=registry,
+)
+OPENAI_REQUESTS = Counter(
+    "surveygorilla_openai_requests_total",
+    "OpenAI calls by outcome: success, or failure once retries are exhausted.",
+    ("operation", "model", "outcome"),
+    registry=registry,
+)
+OPENAI_RETRIES = Counter(
+    "surveygorilla_openai_retries_total",
+    "OpenAI calls retried by the rate limiter, by the error retried.",
+    ("model", "error"),
+    registry=registry,
+)
+OPENAI_TOKENS = Counter(
+    "surveygorilla_openai_tokens_total",
+    "Tokens reported in the usage of OpenAI responses.",
+    ("operation", "model", "kind"),
+    registry=registry,
+)
+INVALID_CLASSIFICATIONS = Counter(
+    "surveygorilla_invalid_classifications_total",
+    "Classifier GPT results that failed parsing or validation.",
+    ("mode",),
+    registry=registry,
+)
+DB_WRITE_SECONDS = Histogram(
+    "surveygorilla_db_write_duration_seconds",
+    "Seconds per database write transaction.",
+    ("operation",),
+    buckets=METRICS_LATENCY_BUCKETS,
+    registry=registry,
+)
+DB_WRITES = Counter(
+    "surveygorilla_db_writes_total",
+    "Database write transactions by outcome.",
+    ("operation", "outcome"),
+    registry=registry,
+)
+DB_ROWS_WRITTEN = Counter(
+    "surveygorilla_db_rows_written_total",
+    "Conversations written by committed transactions.",
+    ("operation",),
+    registry=registry,
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "surveygorilla_http_request_duration_seconds",
+    "Seconds to build each HTTP response, until its first byte for streamed ones.",
+    ("view", "method"),
+    buckets=METRICS_LATENCY_BUCKETS,
+    registry=registry,
+)
+HTTP_REQUESTS = Counter(
+    "surveygorilla_http_requests_total",
+    "HTTP requests by view, method and response status.",
+    ("view", "method", "status"),
+    registry=registry,
+)
+
+METRICS: tuple[Counter | Histogram, ...] = (
+    OPENAI_REQUEST_SECONDS, OPENAI_REQUESTS, OPENAI_RETRIES, OPENAI_TOKENS, INVALID_CLASSIFICATIONS,
+    DB_WRITE_SECONDS, DB_WRITES, DB_ROWS_WRITTEN, HTTP_REQUEST_SECONDS, HTTP_REQUESTS,
+)
+
+
+def clear_metrics() -> None:
+    """ Drops every series recorded by this process, e.g. between tests. """
+    for metric in METRICS:
+        metric.clear()
+
+
+def _samples(metric: Counter | Histogram, suffix: str, labels: dict[str, Any]) -> list:
+    """ Returns the samples named `<metric name><suffix>` recorded by this process for series matching `labels`. """
+    wanted = {label: str(value) for label, value in labels.items()}
+    return [
+        sample
+        for family in metric.collect()
+        for sample in family.samples
+        if sample.name == family.name + suffix and wanted.items() <= sample.labels.items()
+    ]
+
+
+def counter_value(counter: Counter, **labels) -> float:
+    """ Returns the count of the series of the labels recorded by this process, 0 if none. """
+    return sum(sample.value for sample in _samples(counter, "_total", labels))
+
+
+def observation_count(histogram: Histogram, **labels) -> int:
+    """ Returns the number of values observed in the series of the labels by this process. """
+    return int(sum(sample.value for sample in _samples(histogram, "_count", labels)))
+
+
+def observation_mean(histogram: Histogram, **labels) -> float | None:
+    """ Returns the mean of the values observed in the series of the labels by this process, if any. """
+    count = observation_count(histogram, **labels)
+    total = sum(sample.value for sample in _samples(histogram, "_sum", labels))
+    return total / count if count else None
+
+
+def observation_quantile(histogram: Histogram, q: float, **labels) -> float | None:
+    """
+    Estimates a quantile of the series of the labels recorded by this process from its buckets, interpolating
+    linearly within the bucket holding it, as Prometheus' histogram_quantile does. Values beyond the last finite
+    bucket are reported as its upper bound.
+    """
+    buckets = sorted((float(sample.labels["le"]), sample.value) for sample in _samples(histogram, "_bucket", labels))
+    total = buckets[-1][1] if buckets else 0
+    if not total:
+        return None
+
+    rank = q * total
+    lower, below = 0.0, 0.0
+    for upper, cumulative in buckets:
+        if cumulative > below and cumulative >= rank:
+            if math.isinf(upper):
+                return lower
+            return lower + (upper - lower) * (rank - below) / (cumulative - below)
+        lower, below = upper, cumulative
+    return None
+
+
+def _label_values(histogram: Histogram) -> list[dict[str, str]]:
+    """ Returns the labels of every series of the histogram recorded by this process. """
+    return [sample.labels for sample in _samples(histogram, "_count", {})]
+
+
+def render_metrics() -> bytes:
+    """
+    Returns the metrics in the Prometheus text format: those of every process sharing PROMETHEUS_MULTIPROC_DIR if it
+    is set, else those of this process.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        processes = CollectorRegistry()
+        multiprocess.MultiProcessCollector(processes)
+        return generate_latest(processes)
+    return generate_latest(registry)
+
+
+@contextmanager
+def observe(histogram: Histogram, counter: Counter, **labels) -> Iterator[None]:
+    """ Times the block in `histogram`, and counts it in `counter` with an outcome of success or failure. """
+    outcome = "failure"
+    try:
+        with histogram.labels(**labels).time():
+            yield
+        outcome = "success"
+    finally:
+        counter.labels(outcome=outcome, **labels).inc()
+
+
+def record_token_usage(operation: str, model: str, response: Any) -> None:
+    """ Counts the prompt and completion tokens of a chat completion response, when it reports them. """
+    usage = getattr(response, "usage", None)
+    for kind in ("prompt", "completion"):
+        tokens = getattr(usage, f"{kind}_tokens", None)
+        if isinstance(tokens, int):
+            OPENAI_TOKENS.labels(operation=operation, model=model, kind=kind).inc(tokens)
+
+
+def metrics_view(request: HttpRequest) -> HttpResponse:
+    """ Exposes the metrics in the Prometheus text format, to requests bearing METRICS_TOKEN. """
+    token = settings.METRICS_TOKEN
+    scheme, _, credentials = request.headers.get("Authorization", "").partition(" ")
+    if not token or scheme.lower() != "bearer" or not hmac.compare_digest(credentials.strip(), token):
+        response = HttpResponse("Authentication credentials were not provided or are invalid.", status=401)
+        response["WWW-Authenticate"] = 'Bearer realm="metrics"'
+        return response
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE)
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    """ Times every request and counts it by view, method and status, under WSGI and ASGI alike. """
+
+    def record(request: HttpRequest, response: HttpResponse, start: float) -> None:
+        match = request.resolver_match
+        view = (match.url_name or match.view_name) if match else "unmatched"
+        HTTP_REQUEST_SECONDS.labels(view=view, method=request.method).observe(time.perf_counter() - start)
+        HTTP_REQUESTS.labels(view=view, method=request.method, status=response.status_code).inc()
+
+    if iscoroutinefunction(get_response):
+        async def amiddleware(request: HttpRequest) -> HttpResponse:
+            start = time.perf_counter()
+            response = await get_response(request)
+            record(request, response, start)
+            return response
+        return amiddleware
+
+    def middleware(request: HttpRequest) -> HttpResponse:
+        start = time.perf_counter()
+        response = get_response(request)
+        record(request, response, start)
+        return response
+    return middleware
+
+
+def _format_seconds(value: float | None) -> str:
+    return "-" if value is None else f"{value:.3f}"
+
+
+def _format_table(headers: list[str], rows: list[list[str]]) -> str:
+    """ Returns rows aligned under their headers: text left, numbers right. """
+    widths = [max(len(str(row[index])) for row in [headers, *rows]) for index in range(len(headers))]
+    lines = []
+    for row in [headers, *rows]:
+        cells = [
+            str(cell).ljust(width) if index < 2 else str(cell).rjust(width)
+            for index, (cell, width) in enumerate(zip(row, widths))
+        ]
+        lines.append("  ".join(cells).rstrip())
+    return "\n".join(lines)
+
+
+def format_summary() -> str:
+    """ Returns a table of the OpenAI calls and database writes recorded by this process, for commands to print. """
+    rows = []
+    for labels in sorted(_label_values(OPENAI_REQUEST_SECONDS), key=lambda labels: tuple(labels.values())):
+        operation, model = labels["operation"], labels["model"]
+        rows.append([
+            operation,
+            model,
+            str(observation_count(OPENAI_REQUEST_SECONDS, **labels)),
+            str(int(counter_value(OPENAI_REQUESTS, operation=operation, model=model, outcome="failure"))),
+            _format_seconds(observation_quantile(OPENAI_REQUEST_SECONDS, 0.5, **labels)),
+            _format_seconds(observation_quantile(OPENAI_REQUEST_SECONDS, 0.95, **labels)),
+            _format_seconds(observation_mean(OPENAI_REQUEST_SECONDS, **labels)),
+            str(int(counter_value(OPENAI_TOKENS, operation=operation, model=model, kind="prompt"))),
+            str(int(counter_value(OPENAI_TOKENS, operation=operation, model=model, kind="completion"))),
+        ])
+    for labels in sorted(_label_values(DB_WRITE_SECONDS), key=lambda labels: labels["operation"]):
+        operation = labels["operation"]
+        rows.append([
+            operation,
+            "database",
+            str(observation_count(DB_WRITE_SECONDS, **labels)),
+            str(int(counter_value(DB_WRITES, operation=operation, outcome="failure"))),
+            _format_seconds(observation_quantile(DB_WRITE_SECONDS, 0.5, **labels)),
+            _format_seconds(observation_quantile(DB_WRITE_SECONDS, 0.95, **labels)),
+            _format_seconds(observation_mean(DB_WRITE_SECONDS, **labels)),
+            "-",
+            "-",
+        ])
+    if not rows:
+        return "No OpenAI calls nor database writes recorded"
+
+    table = _format_table(
+        ["Operation", "Target", "Calls", "Failed", "p50 (s)", "p95 (s)", "Mean (s)", "Prompt tok", "Completion tok"],
+        rows,
+    )
+    retries = [
+        f"{sample.labels['model']} {int(sample.value)} x {sample.labels['error']}"
+        for sample in sorted(_samples(OPENAI_RETRIES, "_total", {}), key=lambda sample: tuple(sample.labels.values()))
+    ]
+    return table + "\nRetries: " + (", ".join(retries) if retries else "none")
@@ -1,13 +1,86 @@
 """ Module to register the survey apps' models in admin sites. """
 from django.contrib import admin
+from django.db import transaction
 
-from applications.surveys.models import Conversation
+from applications.surveys.foods import link_foods
+from applications.surveys.models import (
+    ClassificationJob,
+    Conversation,
+    ConversationFood,
+    SimulationRun,
+)
+from applications.surveys.rollups import (
+    record_classifications,
+    retract_classifications,
+)
+from applications.surveys.search import (
+    search_conversations,
+    supports_full_text_search,
+    update_search_vectors,
+)
 
 
 @admin.register(Conversation)
 class ConversationAdmin(admin.ModelAdmin):
-    """ Table view for Conversation model in the admin page. """
+    """
+    Table view for Conversation model in the admin page.
+    On PostgreSQL, the search box runs a full-text search over the answers, served by their GIN index.
+    """
     list_display = ("id", "answer_text", "favorite_foods", "diet_type", "created_at")
-    search_fields = ("answer_text", "favorite_foods")
+    search_fields = ("answer_text", "foods__name")
     list_filter = ("diet_type", "created_at")
     ordering = ("-created_at",)
+
+    def get_search_results(self, request, queryset, search_term):
+        """ Uses full-text search where the database supports it, else the substring search of search_fields. """
+        if not supports_full_text_search():
+            return super().get_search_results(request, queryset, search_term)
+        return search_conversations(queryset, search_term), False
+
+    def save_model(self, request, obj, form, change):
+        """
+        Saves the conversation and refreshes its search vector and food links, in case its answer or foods were
+        edited. Like save_reclassifications, the stored row is locked and retracted from the diet and food rollups
+        first, and the saved one recorded in them.
+        """
+        with transaction.atomic():
+            if change:
+                retract_classifications(Conversation.objects.select_for_update().filter(pk=obj.pk))
+                ConversationFood.objects.filter(conversation=obj).delete()
+            super().save_model(request, obj, form, change)
+            record_classifications([obj])
+            update_search_vectors([obj.pk])
+            link_foods([obj])
+
+    def delete_model(self, request, obj):
+        """ Deletes the conversation and retracts it from the diet and food rollups. """
+        with transaction.atomic():
+            retract_classifications(Conversation.objects.select_for_update().filter(pk=obj.pk))
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        """ Deletes the selected conversations and retracts them from the diet and food rollups. """
+        with transaction.atomic():
+            retract_classifications(
+                Conversation.objects.select_for_update().filter(pk__in=list(queryset.values_list("pk", flat=True)))
+                .order_by("pk")
+            )
+            super().delete_queryset(request, queryset)
+
+
+@admin.register(SimulationRun)
+class SimulationRunAdmin(admin.ModelAdmin):
+    """ Table view for SimulationRun model in the admin page, to follow long runs and find the ID to resume. """
+    list_display = ("id", "status", "target_count", "succeeded", "failed", "created_at", "updated_at")
+    list_filter = ("status",)
+    readonly_fields = ("succeeded", "failed", "created_at", "updated_at", "finished_at")
+    ordering = ("-created_at",)
+
+
+@admin.register(ClassificationJob)
+class ClassificationJobAdmin(admin.ModelAdmin):
+    """ Table view for ClassificationJob model in the admin page, to inspect retried and dead-lettered jobs. """
+    list_display = ("conversation", "status", "attempts", "available_at", "locked_by", "last_error")
+    list_filter = ("status",)
+    raw_id_fields = ("conversation",)
+    ordering = ("available_at",)
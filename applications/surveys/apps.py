@@ -8,3 +8,7 @@ class SurveysConfig(AppConfig):
     label = 'surveys'
     verbose_name = "Survey Conversations"
     default_auto_field = 'django.db.models.BigAutoField'
+
+    def ready(self):
+        # Connects the receivers keeping the conversations version in step with writes.
+        from applications.surveys import signals  # noqa: F401  # pylint: disable=import-outside-toplevel,unused-import
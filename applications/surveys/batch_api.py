@@ -0,0 +1,359 @@
+"""
+Offline simulation runs through the OpenAI Batch API.
+
+Instead of one request-response round trip per call, a run writes all respondent requests to a JSONL file,
+submits it as a batch, and ingests the answers once the batch completes; the classifier requests for those answers
+then go through a second batch, except those the local lexicon classifier already resolves. Batch requests cost
+less and need no process held open per request.
+
+Every request carries a `custom_id`, which is the ID of the Conversation it belongs to. Ingestion is therefore
+idempotent: respondent results only create conversations that do not exist yet, and classifier results only fill
+conversations that are still unclassified. A run interrupted after submission can be resumed from any batch ID.
+
+Every run is recorded as a SimulationRun, which its respondent batches name in their metadata: stored conversations
+are tagged with it and checkpointed in its `succeeded` counter, and once all of its respondent batches have ended,
+the run is settled, counting the requests that errored or got no answer as failed (see surveys/runs.py).
+
+Conversations are queued for the classifier workers as soon as they are stored, with jobs deferred past the classifier
+batch's completion window, so none is lost if the run stops before its classifier batch is ingested. Ingested
+classifications drop their jobs, and the conversations a classifier batch failed, expired or gave no valid result for
+are handed to the workers right away.
+"""
+import json
+import time
+import uuid
+from datetime import timedelta
+from typing import (
+    Callable,
+    Final,
+)
+
+from django.db import transaction
+from django.utils import timezone
+from openai import OpenAI
+from openai.types import Batch
+
+from applications.constants import (
+    CLASSIFIER_GPT_MODEL,
+    CLASSIFIER_PROMPT,
+    LOCAL_CLASSIFIER_MIN_CONFIDENCE,
+    QUESTION,
+    RESPONDENT_GPT_MODEL,
+    RESPONDENT_PROMPT,
+)
+from applications.logging import get_logger
+from applications.surveys.jobs import (
+    drop_jobs,
+    enqueue_classifications,
+    release_deferred,
+)
+from applications.surveys.local_classifier import classify_locally
+from applications.surveys.models import (
+    Conversation,
+    SimulationRun,
+)
+from applications.surveys.runs import (
+    record_progress,
+    settle_run,
+    start_run,
+)
+from applications.surveys.services import (
+    parse_classification,
+    save_classifications,
+    save_conversations,
+)
+
+
+logger = get_logger(__name__)
+
+CHAT_COMPLETIONS_ENDPOINT: Final = "/v1/chat/completions"
+RESPONDENT_STAGE = "respondent"
+CLASSIFIER_STAGE = "classifier"
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+# OpenAI accepts at most 50,000 requests per batch.
+MAX_REQUESTS_PER_BATCH = 50_000
+DEFAULT_POLL_INTERVAL_SECONDS = 30.0
+# Batches complete within 24 hours; the workers only pick up conversations still unclassified an hour later.
+DEFERRED_JOB_DELAY = timedelta(hours=25)
+
+
+def build_request(custom_id: str, model: str, system_prompt: str, user_message: str, temperature: float) -> dict:
+    """ Builds one line of a Batch API input file for a chat completion. """
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": CHAT_COMPLETIONS_ENDPOINT,
+        "body": {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_message},
+            ],
+            "temperature": temperature,
+        },
+    }
+
+
+def to_jsonl(requests: list[dict]) -> bytes:
+    """ Serializes batch requests into the JSONL format expected by the Files API. """
+    return "\n".join(json.dumps(request) for request in requests).encode()
+
+
+def parse_batch_output(content: str) -> dict[str, str | None]:
+    """
+    Maps each custom_id of a batch output file to the assistant's message content.
+    Requests that errored or returned a non-200 status map to None.
+    """
+    results: dict[str, str | None] = {}
+    for line in content.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        response = record.get("response") or {}
+        if record.get("error") or response.get("status_code") != 200:
+            logger.warning("Batch request %s failed: %s", record.get("custom_id"), record.get("error"))
+            results[record["custom_id"]] = None
+            continue
+        results[record["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+    return results
+
+
+class BatchSimulation:
+    """
+    Runs and resumes simulations through the OpenAI Batch API.
+
+    Params:
+      - openai_client: Client used for the Files and Batch endpoints.
+      - poll_interval: Seconds between batch status polls.
+      - log: Callable receiving progress messages, e.g. a management command's stdout.write.
+    """
+
+    def __init__(
+        self,
+        openai_client: OpenAI,
+        poll_interval: float = DEFAULT_POLL_INTERVAL_SECONDS,
+        log: Callable[[str], None] | None = None,
+    ):
+        self.client = openai_client
+        self.poll_interval = poll_interval
+        self.log = log or (lambda message: logger.info("%s", message))
+
+    def run(self, count: int) -> tuple[int, int]:
+        """
+        Simulates `count` conversations, recorded as a new SimulationRun: one respondent stage, then one classifier
+        stage.
+
+        Returns:
+            (succeeded, failed) counts of the run, where succeeded conversations are stored, classified or not.
+        """
+        run = start_run(count, {"openai_batch": True})
+        self.log(f"Started simulation run {run.id}; if interrupted, continue it with --resume-batch <batch ID>")
+        custom_ids = [str(uuid.uuid4()) for _ in range(count)]
+        requests = [
+            build_request(custom_id, RESPONDENT_GPT_MODEL, RESPONDENT_PROMPT, QUESTION, temperature=1.2)
+            for custom_id in custom_ids
+        ]
+        batches = [self.wait(batch_id) for batch_id in self.submit(RESPONDENT_STAGE, requests, run=run)]
+        self._ingest_answers_and_classify(batches, run=run)
+        return self._settle(run)
+
+    def resume(self, batch_id: str) -> tuple[int, int]:
+        """
+        Waits for an already submitted batch and ingests it, continuing with the classifier stage when the batch
+        holds respondent requests. The other respondent batches of the batch's run are waited for and ingested too,
+        and the run is settled.
+
+        Returns:
+            (succeeded, failed) counts of the run; for a batch without a run, of the batch's requests. For a classifier
+            batch, the requests whose conversation is classified succeeded, the others were handed to the workers.
+        """
+        batch = self.wait(batch_id)
+        metadata = batch.metadata or {}
+        total = batch.request_counts.total if batch.request_counts else 0
+        if metadata.get("stage") == CLASSIFIER_STAGE:
+            results = self.download(batch)
+            self.ingest_classifications(results)
+            conversation_ids = [uuid.UUID(custom_id) for custom_id in results]
+            conversations = list(Conversation.objects.filter(id__in=conversation_ids).only("id", "diet_type"))
+            # The batch has ended, so the conversations it left unclassified go to the workers without waiting.
+            unclassified = self.queue_for_workers(conversations)
+            classified = len(conversations) - unclassified
+            return classified, max(total, len(results)) - classified
+
+        run = SimulationRun.objects.filter(pk=metadata["run"]).first() if metadata.get("run") else None
+        if run is None:
+            stored = self._ingest_answers_and_classify([batch])
+            return stored, max(total - stored, 0)
+
+        batches = [batch] + [
+            self.wait(other_id) for other_id in run.config.get("respondent_batches", []) if other_id != batch.id
+        ]
+        self._ingest_answers_and_classify(batches, run=run)
+        return self._settle(run)
+
+    def submit(self, stage: str, requests: list[dict], run: SimulationRun | None = None) -> list[str]:
+        """
+        Uploads the requests as JSONL files and creates one batch per MAX_REQUESTS_PER_BATCH requests. With a run,
+        the batches are named in its config and name it in their metadata.
+        """
+        metadata = {"stage": stage} if run is None else {"stage": stage, "run": str(run.id)}
+        batch_ids = []
+        for start in range(0, len(requests), MAX_REQUESTS_PER_BATCH):
+            chunk = requests[start:start + MAX_REQUESTS_PER_BATCH]
+            input_file = self.client.files.create(
+                file=(f"{stage}-{start}.jsonl", to_jsonl(chunk)),
+                purpose="batch",
+            )
+            batch = self.client.batches.create(
+                input_file_id=input_file.id,
+                endpoint=CHAT_COMPLETIONS_ENDPOINT,
+                completion_window="24h",
+                metadata=metadata,
+            )
+            self.log(f"Submitted {stage} batch {batch.id} with {len(chunk)} requests")
+            batch_ids.append(batch.id)
+            if run is not None:
+                run.config[f"{stage}_batches"] = batch_ids
+                run.save(update_fields=["config", "updated_at"])
+        return batch_ids
+
+    def wait(self, batch_id: str) -> Batch:
+        """ Polls the batch until it reaches a terminal status, and returns it. """
+        while True:
+            batch = self.client.batches.retrieve(batch_id)
+            if batch.status in TERMINAL_STATUSES:
+                if batch.status != "completed":
+                    logger.warning("Batch %s ended with status %s", batch_id, batch.status)
+                return batch
+            time.sleep(self.poll_interval)
+
+    def download(self, batch: Batch) -> dict[str, str | None]:
+        """ Returns the results of a finished batch by custom_id; empty when it produced no output. """
+        if not batch.output_file_id:
+            return {}
+        return parse_batch_output(self.client.files.content(batch.output_file_id).text)
+
+    def ingest_answers(self, results: dict[str, str | None], run: SimulationRun | None = None) -> list[Conversation]:
+        """
+        Stores a conversation for every answered respondent request whose conversation does not exist yet, tagged
+        with `run` and checkpointed in its `succeeded` counter.
+
+        Returns:
+            The stored conversations of the results, including those stored by an earlier ingestion.
+        """
+        answers = {uuid.UUID(custom_id): answer for custom_id, answer in results.items() if answer}
+        existing = Conversation.objects.in_bulk(list(answers))
+        new_conversations = [
+            Conversation(id=conversation_id, question_text=QUESTION, answer_text=answer.strip(), run=run)
+            for conversation_id, answer in answers.items()
+            if conversation_id not in existing
+        ]
+        # Their classification is requested by the classifier stage; the workers only get them if it does not deliver.
+        with transaction.atomic():
+            save_conversations(new_conversations, enqueue=False)
+            enqueue_classifications(new_conversations, available_at=timezone.now() + DEFERRED_JOB_DELAY)
+            if run is not None:
+                record_progress(run, succeeded=len(new_conversations))
+        return list(existing.values()) + new_conversations
+
+    def ingest_classifications(self, results: dict[str, str | None]) -> int:
+        """
+        Fills in favorite foods and diet of still unclassified conversations from classifier results, dropping
+        their jobs. Invalid classifications are logged, and their conversations handed to the classifier workers.
+
+        Returns:
+            The number of conversations classified.
+        """
+        conversations = Conversation.objects.filter(
+            id__in=[uuid.UUID(custom_id) for custom_id in results],
+            diet_type__isnull=True,
+        )
+        classified, failed = [], []
+        for conversation in conversations:
+            try:
+                result = parse_classification(results[str(conversation.id)])
+            except (json.JSONDecodeError, ValueError) as e:
+                logger.warning("Classification failed for conversation ID %s: %s", conversation.id, e)
+                failed.append(conversation)
+                continue
+            conversation.favorite_foods = result["foods"]
+            conversation.diet_type = result["diet"]
+            classified.append(conversation)
+        with transaction.atomic():
+            save_classifications(classified)
+            drop_jobs(classified)
+        self.queue_for_workers(failed)
+        return len(classified)
+
+    @staticmethod
+    def queue_for_workers(conversations: list[Conversation]) -> int:
+        """
+        Queues the unclassified conversations among `conversations` for the classifier workers, available right
+        away, including those whose job was deferred while waiting for a classifier batch.
+
+        Returns:
+            The number of unclassified conversations among `conversations`.
+        """
+        with transaction.atomic():
+            queued = enqueue_classifications(conversations)
+            release_deferred(conversations)
+        return queued
+
+    @staticmethod
+    def classify_locally(conversations: list[Conversation]) -> int:
+        """
+        Classifies and saves the conversations the local lexicon classifier resolves with enough confidence,
+        so they need no classifier request.
+
+        Returns:
+            The number of conversations classified.
+        """
+        classified = []
+        for conversation in conversations:
+            local = classify_locally(conversation.answer_text)
+            if local.confidence >= LOCAL_CLASSIFIER_MIN_CONFIDENCE:
+                conversation.favorite_foods = list(local.foods)
+                conversation.diet_type = local.diet
+                classified.append(conversation)
+        with transaction.atomic():
+            save_classifications(classified)
+            drop_jobs(classified)
+        return len(classified)
+
+    def _ingest_answers_and_classify(self, respondent_batches: list[Batch], run: SimulationRun | None = None) -> int:
+        """ Ingests respondent batches, then classifies the unclassified conversations among them. """
+        conversations = []
+        for batch in respondent_batches:
+            conversations.extend(self.ingest_answers(self.download(batch), run=run))
+
+        unclassified = [conversation for conversation in conversations if conversation.diet_type is None]
+        locally_classified = self.classify_locally(unclassified)
+        requests = [
+            build_request(str(conversation.id), CLASSIFIER_GPT_MODEL, CLASSIFIER_PROMPT, conversation.answer_text,
+                          temperature=0)
+            for conversation in unclassified
+            if conversation.diet_type is None
+        ]
+        self.log(f"Classified {locally_classified} conversations locally, {len(requests)} left for the classifier GPT")
+        if requests:
+            for batch_id in self.submit(CLASSIFIER_STAGE, requests):
+                classified = self.ingest_classifications(self.download(self.wait(batch_id)))
+                self.log(f"Classified {classified} conversations from batch {batch_id}")
+            # Covers conversations missing from the output of a failed, expired or partial classifier batch.
+            remaining = Conversation.objects.filter(
+                pk__in=[conversation.pk for conversation in unclassified], diet_type__isnull=True,
+            ).only("id", "diet_type")
+            queued = self.queue_for_workers(list(remaining))
+            if queued:
+                self.log(f"Queued {queued} conversations left unclassified for the classifier workers")
+        return len(conversations)
+
+    def _settle(self, run: SimulationRun) -> tuple[int, int]:
+        """ Settles a run whose respondent batches have all ended, and returns its (succeeded, failed) counts. """
+        run = settle_run(run)
+        self.log(
+            f"Simulation run {run.id}: {run.succeeded} succeeded and {run.failed} failed "
+            f"of {run.target_count} conversations, {run.status}"
+        )
+        return run.succeeded, run.failed
@@ -0,0 +1,159 @@
+"""
+Content-addressed cache for classifier GPT results.
+
+Answers that are identical once normalized (case, whitespace, punctuation) get the same classification from the
+same model and prompt, so the result is stored under hash(model, prompt, normalized answer) and reused instead of
+re-sending the answer to the classifier.
+
+Lookups go through two tiers: a small in-process LRU with a TTL, then Django's cache framework (the CACHES alias
+named by the CLASSIFICATION_CACHE_ALIAS setting, by default a database cache table shared by all processes and kept
+across restarts). A per-process backend such as locmem is logged as a warning on first use, since every worker and
+every restart would then pay for the same classifications again.
+"""
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+from applications.logging import get_logger
+
+
+logger = get_logger(__name__)
+
+KEY_PREFIX = "classification"
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+
+def normalize_answer(answer: str) -> str:
+    """ Lowercases an answer, drops punctuation and collapses whitespace. """
+    return " ".join(_PUNCTUATION.sub(" ", answer.lower()).split())
+
+
+def make_key(model: str, prompt: str, answer: str) -> str:
+    """ Returns the cache key of a classification request. """
+    digest = hashlib.sha256("\0".join((model, prompt, normalize_answer(answer))).encode()).hexdigest()
+    return f"{KEY_PREFIX}:{digest}"
+
+
+class ClassificationCache:  # pylint: disable=too-many-instance-attributes
+    """
+    Two-tier cache of classification results, with hit and miss counters.
+
+    Params:
+      - local_size: Maximum number of entries kept in the in-process LRU tier.
+      - ttl: Seconds an entry stays valid, in both tiers.
+      - alias: Name of the Django cache backing the shared tier.
+    """
+
+    def __init__(self, local_size: int, ttl: int, alias: str, clock: Callable[[], float] = time.monotonic):
+        self.local_size = local_size
+        self.ttl = ttl
+        self.alias = alias
+        self._clock = clock
+        self._local: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._checked_backend = False
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    @property
+    def shared(self):
+        """ The Django cache backing the shared tier. """
+        cache = caches[self.alias]
+        if not self._checked_backend:
+            self._checked_backend = True
+            if isinstance(cache, LocMemCache):
+                logger.warning(
+                    "Classification cache alias %r is local to each process: classifier results are neither shared "
+                    "between processes nor kept across restarts; set CLASSIFICATION_CACHE_URL to a shared cache",
+                    self.alias,
+                )
+        return cache
+
+    def get(self, model: str, prompt: str, answer: str) -> dict | None:
+        """ Returns the cached classification of the answer, or None on a miss. """
+        key = make_key(model, prompt, answer)
+        result = self._get_local(key)
+        if result is not None:
+            return result
+
+        result = self.shared.get(key)
+        self._record_shared_lookup(key, result)
+        return result
+
+    async def aget(self, model: str, prompt: str, answer: str) -> dict | None:
+        """ Async counterpart of get. """
+        key = make_key(model, prompt, answer)
+        result = self._get_local(key)
+        if result is not None:
+            return result
+
+        result = await self.shared.aget(key)
+        self._record_shared_lookup(key, result)
+        return result
+
+    def set(self, model: str, prompt: str, answer: str, result: dict) -> None:
+        """ Stores a classification in both tiers. """
+        key = make_key(model, prompt, answer)
+        self._set_local(key, result)
+        self.shared.set(key, result, timeout=self.ttl)
+
+    async def aset(self, model: str, prompt: str, answer: str, result: dict) -> None:
+        """ Async counterpart of set. """
+        key = make_key(model, prompt, answer)
+        self._set_local(key, result)
+        await self.shared.aset(key, result, timeout=self.ttl)
+
+    def clear(self) -> None:
+        """ Empties the in-process tier and resets the counters; the shared tier keeps its entries. """
+        with self._lock:
+            self._local.clear()
+            self.local_hits = self.shared_hits = self.misses = 0
+
+    def stats(self) -> dict[str, int]:
+        """ Returns the hit and miss counters. """
+        return {"local_hits": self.local_hits, "shared_hits": self.shared_hits, "misses": self.misses}
+
+    def _get_local(self, key: str) -> dict | None:
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None
+            expires_at, result = entry
+            if expires_at <= self._clock():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            self.local_hits += 1
+            return dict(result)
+
+    def _set_local(self, key: str, result: dict) -> None:
+        with self._lock:
+            self._local[key] = (self._clock() + self.ttl, dict(result))
+            self._local.move_to_end(key)
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+
+    def _record_shared_lookup(self, key: str, result: dict | None) -> None:
+        if result is None:
+            with self._lock:
+                self.misses += 1
+            return
+        with self._lock:
+            self.shared_hits += 1
+        self._set_local(key, result)
+
+
+classification_cache = ClassificationCache(
+    local_size=settings.CLASSIFICATION_CACHE_LOCAL_SIZE,
+    ttl=settings.CLASSIFICATION_CACHE_TTL,
+    alias=settings.CLASSIFICATION_CACHE_ALIAS,
+)
@@ -0,0 +1,126 @@
+"""
+Classifier workers: processes draining the classification job queue (see surveys/jobs.py).
+
+Each worker loops: claim a batch of jobs, classify their answers (locally where confident, else with one batched
+classifier request), save the classifications and drop the finished jobs in one transaction, and release the
+failed jobs for a retry or the dead letter. Workers share nothing but the database, so they scale out by running
+`run_classifier_workers` with more processes, on as many machines as needed.
+"""
+import json
+import os
+import socket
+import time
+from collections import Counter
+from typing import Callable
+
+from django.db import transaction
+from openai import OpenAIError
+
+from applications.constants import (
+    BATCH_CLASSIFIER_PROMPT,
+    CLASSIFICATION_JOB_LEASE_SECONDS,
+    CLASSIFICATION_JOB_MAX_ATTEMPTS,
+    CLASSIFIER_GPT_MODEL,
+    CLASSIFIER_WORKER_POLL_SECONDS,
+    DEFAULT_CLASSIFY_BATCH_SIZE,
+)
+from applications.logging import get_logger
+from applications.surveys.jobs import (
+    claim_jobs,
+    complete_jobs,
+    fail_jobs,
+)
+from applications.surveys.models import (
+    ClassificationJob,
+    Conversation,
+)
+from applications.surveys.services import (
+    classify_diets_with_fallback,
+    save_classifications,
+)
+
+
+logger = get_logger(__name__)
+
+
+def make_worker_id() -> str:
+    """ Returns an ID telling the worker process apart from all others, on any machine. """
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def process_jobs(
+    worker_id: str,
+    jobs: list[ClassificationJob],
+    max_attempts: int = CLASSIFICATION_JOB_MAX_ATTEMPTS,
+) -> Counter:
+    """
+    Classifies the conversations of the jobs claimed by a worker. Conversations classified in the meantime, e.g. by
+    an OpenAI batch, are not classified again.
+
+    Returns:
+        Counts of jobs "classified", "retried" and "dead".
+    """
+    pending = [job for job in jobs if job.conversation.diet_type is None]
+    answers = [job.conversation.answer_text for job in pending]
+    try:
+        results = classify_diets_with_fallback(CLASSIFIER_GPT_MODEL, BATCH_CLASSIFIER_PROMPT, answers)
+        error = "No valid classification"
+    except (OpenAIError, json.JSONDecodeError, ValueError) as e:
+        logger.warning("Classifier request failed for %d jobs: %s", len(pending), e)
+        results, error = [None] * len(pending), f"{type(e).__name__}: {e}"
+
+    classified: list[Conversation] = []
+    failures: list[tuple[ClassificationJob, str]] = []
+    for job, result in zip(pending, results):
+        if result is None:
+            failures.append((job, error))
+            continue
+        job.conversation.favorite_foods = result["foods"]
+        job.conversation.diet_type = result["diet"]
+        classified.append(job.conversation)
+
+    failed_ids = {job.pk for job, _ in failures}
+    with transaction.atomic():
+        # Locks the conversations, so a concurrent classification cannot count them twice in the rollups.
+        still_unclassified = set(
+            Conversation.objects
+            .select_for_update()
+            .filter(pk__in=[conversation.pk for conversation in classified], diet_type__isnull=True)
+            .values_list("pk", flat=True)
+        )
+        save_classifications([conversation for conversation in classified if conversation.pk in still_unclassified])
+        complete_jobs(worker_id, [job for job in jobs if job.pk not in failed_ids])
+    dead = fail_jobs(worker_id, failures, max_attempts) if failures else 0
+
+    return Counter(classified=len(jobs) - len(failures), retried=len(failures) - dead, dead=dead)
+
+
+def run_worker(  # pylint: disable=too-many-arguments
+    worker_id: str | None = None,
+    *,
+    batch_size: int = DEFAULT_CLASSIFY_BATCH_SIZE,
+    poll_interval: float = CLASSIFIER_WORKER_POLL_SECONDS,
+    max_attempts: int = CLASSIFICATION_JOB_MAX_ATTEMPTS,
+    lease_seconds: int = CLASSIFICATION_JOB_LEASE_SECONDS,
+    once: bool = False,
+    should_stop: Callable[[], bool] = lambda: False,
+) -> Counter:
+    """
+    Processes batches of `batch_size` jobs until `should_stop` returns True, sleeping `poll_interval` seconds
+    whenever no job is available. With `once`, it returns as soon as no job is available instead.
+
+    Returns:
+        Counts of jobs "classified", "retried" and "dead" by this worker.
+    """
+    worker_id = worker_id or make_worker_id()
+    totals: Counter = Counter(classified=0, retried=0, dead=0)
+    while not should_stop():
+        jobs = claim_jobs(worker_id, batch_size, lease_seconds)
+        if not jobs:
+            if once:
+                break
+            time.sleep(poll_interval)
+            continue
+        totals.update(process_jobs(worker_id, jobs, max_attempts))
+    logger.info("Classifier worker %s stopping: %s", worker_id, dict(totals))
+    return totals
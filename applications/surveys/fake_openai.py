@@ -0,0 +1,492 @@
+"""
+A local stand-in for the parts of the OpenAI API used by the surveys app.
+
+It serves the chat completions endpoint, and the Files and Batch endpoints used by the Batch API mode of
+`simulate_conversations`, so simulations can be exercised end to end with the real OpenAI client and no network
+access or API spend:
+
+    server = FakeOpenAIServer()
+    server.start()
+    client = OpenAI(api_key="fake", base_url=server.base_url)
+    ...
+    server.stop()
+
+Batches are executed in memory when they are created, and become "completed" after a configurable number of
+status polls. Chat completion requests, on their own or inside a batch, are answered by `responder`, a callable
+taking the request body and returning the assistant's message content.
+
+To load-test retries and concurrency offline, chat completion requests can also be slowed down and failed the
+ways the real API fails, as set by `Faults`: latency drawn from a distribution, 429s with Retry-After (at random or
+past a requests-per-minute quota), timeouts, 500s, and classifier JSON cut short. The `run_fake_openai` command
+serves it on a fixed port, for `simulate_conversations --openai-base-url`.
+"""
+import itertools
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from collections import (
+    Counter,
+    deque,
+)
+from email.message import EmailMessage
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import (
+    BaseHTTPRequestHandler,
+    ThreadingHTTPServer,
+)
+from typing import (
+    Callable,
+    NamedTuple,
+)
+
+
+# The first answers are resolved by surveys/local_classifier.py on its own; the last ones name foods it does not know
+# or cannot settle, so simulations against this server also go through the classifier GPT.
+SAMPLE_ANSWERS = (
+    ("I really love hummus, falafel, and halloumi.", ["hummus", "falafel", "halloumi"], "vegetarian"),
+    ("My top 3 favorites are lamb stew, grilled chicken, and mooncake.",
+     ["lamb stew", "grilled chicken", "mooncake"], "omnivore"),
+    ("Tofu, seitan, and kale are definitely my go-tos.", ["tofu", "seitan", "kale"], "vegan"),
+    ("Paneer tikka, spinach lasagna, and mango lassi.", ["paneer tikka", "spinach lasagna", "mango lassi"],
+     "vegetarian"),
+    ("Beef pho, shrimp tacos, and tiramisu.", ["beef pho", "shrimp tacos", "tiramisu"], "omnivore"),
+    ("Lentil curry, falafel wraps, and roasted chickpeas.", ["lentil curry", "falafel wraps", "roasted chickpeas"],
+     "vegan"),
+    ("Sushi, pad thai, and dumplings.", ["sushi", "pad thai", "dumplings"], "omnivore"),
+    ("Cashew cheese pizza, jackfruit tacos, and miso ramen.",
+     ["cashew cheese pizza", "jackfruit tacos", "miso ramen"], "vegan"),
+    ("Veggie burgers, pasta, and fried rice.", ["veggie burgers", "pasta", "fried rice"], "vegetarian"),
+)
+_CLASSIFICATIONS = {answer: {"foods": foods, "diet": diet} for answer, foods, diet in SAMPLE_ANSWERS}
+
+Responder = Callable[[dict], str]
+# Draws a latency in seconds, from the server's random generator.
+Latency = Callable[[random.Random], float]
+
+# Outcomes of a chat completion request, as counted in FakeOpenAIServer.stats.
+OK = "ok"
+RATE_LIMITED = "rate_limited"
+TIMEOUT = "timeout"
+SERVER_ERROR = "server_error"
+MALFORMED = "malformed"
+
+
+def no_latency(rng: random.Random) -> float:  # pylint: disable=unused-argument
+    """ Answers at once. """
+    return 0.0
+
+
+def parse_latency(spec: str) -> Latency:
+    """
+    Parses a latency distribution in seconds, such as:
+
+      - "0.2" or "fixed:0.2": always 200 ms.
+      - "uniform:0.1,0.5": between 100 and 500 ms.
+      - "normal:0.3,0.1": around 300 ms, with a standard deviation of 100 ms, never negative.
+      - "lognormal:0.8,0.5": a median of 800 ms with a long tail (sigma 0.5), like real completions.
+
+    Raises:
+        ValueError: If the spec is not one of these
+    """
+    kind, _, params = spec.strip().partition(":")
+    if not params:
+        kind, params = "fixed", kind
+    try:
+        values = [float(value) for value in params.split(",")]
+    except ValueError as e:
+        raise ValueError(f"Invalid latency: '{spec}'") from e
+    if any(value < 0 or math.isnan(value) for value in values):
+        raise ValueError(f"Invalid latency: '{spec}'. Values must not be negative")
+
+    if kind == "fixed" and len(values) == 1:
+        return lambda rng: values[0]
+    if kind == "uniform" and len(values) == 2:
+        low, high = values
+        return lambda rng: rng.uniform(low, high)
+    if kind == "normal" and len(values) == 2:
+        mean, deviation = values
+        return lambda rng: max(0.0, rng.gauss(mean, deviation))
+    if kind == "lognormal" and len(values) == 2 and values[0] > 0:
+        median, sigma = values
+        return lambda rng: rng.lognormvariate(math.log(median), sigma)
+    raise ValueError(f"Invalid latency: '{spec}'. Expected fixed:S, uniform:LOW,HIGH, normal:MEAN,STDDEV or "
+                     "lognormal:MEDIAN,SIGMA")
+
+
+class Faults(NamedTuple):
+    """
+    How chat completion requests are slowed down and failed. Rates are probabilities per request, drawn once, so
+    their sum must not exceed 1.
+
+    Attributes:
+      - latency: Draws the seconds waited before answering; see parse_latency.
+      - rate_limit_rate: Share of requests answered 429, with a Retry-After of `retry_after` seconds.
+      - retry_after: Seconds sent in the Retry-After headers of random 429s.
+      - requests_per_minute: Quota of requests over any 60 seconds, beyond which requests are answered 429 with
+        the Retry-After and `x-ratelimit-*` headers OpenAI sends; 0 for none.
+      - timeout_rate: Share of requests never answered: the connection is dropped after `timeout_seconds`, which
+        clients with a shorter read timeout see as a timeout.
+      - timeout_seconds: Seconds a timed out request hangs before its connection is dropped.
+      - server_error_rate: Share of requests answered 500.
+      - malformed_rate: Share of classifier requests answered with their JSON cut in half.
+    """
+    latency: Latency = no_latency
+    rate_limit_rate: float = 0.0
+    retry_after: float = 1.0
+    requests_per_minute: int = 0
+    timeout_rate: float = 0.0
+    timeout_seconds: float = 120.0
+    server_error_rate: float = 0.0
+    malformed_rate: float = 0.0
+
+
+def default_responder(body: dict) -> str:
+    """
+    Answers like the respondent GPT for the survey question, and like the classifier GPT for a known answer.
+
+    A request counts as a classification when its last message is one of the sample answers, and as a batched
+    classification when it is a JSON array of {"index", "answer"} objects; unknown answers are left out of the
+    batched results, as a classifier GPT skipping items would.
+    """
+    user_message = body["messages"][-1]["content"]
+    if user_message in _CLASSIFICATIONS:
+        return json.dumps(_CLASSIFICATIONS[user_message])
+    items = _parse_batch_items(user_message)
+    if items is not None:
+        return json.dumps([
+            {"index": item["index"], **_CLASSIFICATIONS[item["answer"]]}
+            for item in items if item.get("answer") in _CLASSIFICATIONS
+        ])
+    return random.choice(SAMPLE_ANSWERS)[0]
+
+
+def _parse_batch_items(content: str) -> list[dict] | None:
+    """ Returns the items of a batched classification request, or None for any other message. """
+    if not content.startswith("["):
+        return None
+    try:
+        items = json.loads(content)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(items, list) or not all(isinstance(item, dict) and "index" in item for item in items):
+        return None
+    return items
+
+
+def chat_completion(body: dict, content: str) -> dict:
+    """ Wraps message content in a chat completion object, as returned by the chat completions endpoint. """
+    prompt_tokens = sum(len(message.get("content") or "") for message in body.get("messages", [])) // 4
+    completion_tokens = len(content) // 4
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "fake-model"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def retry_after_headers(seconds: float) -> dict[str, str]:
+    """ Returns the headers OpenAI sends with 429s, asking to wait `seconds` before retrying. """
+    return {"retry-after": str(math.ceil(seconds)), "retry-after-ms": str(math.ceil(seconds * 1000))}
+
+
+def ratelimit_headers(limit: int, remaining: int, reset: float) -> dict[str, str]:
+    """ Returns OpenAI's `x-ratelimit-*` headers for requests, `reset` being the seconds until the quota refills. """
+    return {
+        "x-ratelimit-limit-requests": str(limit),
+        "x-ratelimit-remaining-requests": str(remaining),
+        "x-ratelimit-reset-requests": f"{max(0, math.ceil(reset * 1000))}ms",
+    }
+
+
+class FakeOpenAIServer:  # pylint: disable=too-many-instance-attributes
+    """
+    Threaded HTTP server emulating the OpenAI chat completions, Files and Batch endpoints.
+
+    Params:
+      - responder: Produces the assistant message content for each chat completion request.
+      - polls_until_complete: Number of status polls a batch reports "in_progress" before "completed".
+      - faults: Latency and errors injected into chat completion requests; none by default.
+      - seed: Seed of the random draws of latencies and faults, to replay the same run.
+      - host, port: Address to listen on; by default, a free port of the loopback interface.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        responder: Responder = default_responder,
+        polls_until_complete: int = 1,
+        faults: Faults = Faults(),
+        *,
+        seed: int | None = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.responder = responder
+        self.polls_until_complete = polls_until_complete
+        self.faults = faults
+        self.files: dict[str, dict] = {}
+        self.batches: dict[str, dict] = {}
+        self.stats: Counter[str] = Counter()
+        self._polls: dict[str, int] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self._request_times: deque[float] = deque()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        """ Base URL to configure the OpenAI client with. """
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host!s}:{port}/v1"
+
+    def start(self) -> None:
+        """ Serves requests from a daemon thread. """
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """ Stops serving and releases the socket. """
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self) -> "FakeOpenAIServer":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def _next_id(self, prefix: str) -> str:
+        with self._lock:
+            return f"{prefix}-{next(self._ids)}"
+
+    def create_file(self, filename: str, purpose: str, content: bytes) -> dict:
+        """ Stores an uploaded file and returns its file object. """
+        file_id = self._next_id("file")
+        file_object = {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+        }
+        self.files[file_id] = {"object": file_object, "content": content}
+        return file_object
+
+    def create_batch(self, payload: dict) -> dict:
+        """ Runs every request of the input file and returns the batch object, still "validating". """
+        batch_id = self._next_id("batch")
+        input_lines = self.files[payload["input_file_id"]]["content"].decode().splitlines()
+        output_lines = [json.dumps(self._run_batch_request(json.loads(line))) for line in input_lines if line.strip()]
+        output_file = self.create_file(f"{batch_id}_output.jsonl", "batch_output", "\n".join(output_lines).encode())
+
+        batch = {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": payload["endpoint"],
+            "input_file_id": payload["input_file_id"],
+            "completion_window": payload["completion_window"],
+            "status": "validating",
+            "created_at": int(time.time()),
+            "metadata": payload.get("metadata"),
+            "request_counts": {"total": len(output_lines), "completed": len(output_lines), "failed": 0},
+        }
+        self.batches[batch_id] = {"object": batch, "output_file_id": output_file["id"]}
+        self._polls[batch_id] = 0
+        return batch
+
+    def retrieve_batch(self, batch_id: str) -> dict:
+        """ Returns the batch object, completing the batch after `polls_until_complete` polls. """
+        batch = self.batches[batch_id]
+        with self._lock:
+            self._polls[batch_id] += 1
+            polls = self._polls[batch_id]
+        if polls > self.polls_until_complete:
+            batch["object"].update(status="completed", output_file_id=batch["output_file_id"])
+        else:
+            batch["object"]["status"] = "in_progress"
+        return batch["object"]
+
+    def draw_outcome(self) -> tuple[str, float, dict[str, str]]:
+        """
+        Decides how to answer the next chat completion request, according to the faults.
+
+        Returns:
+            The outcome, the latency in seconds before answering, and the headers to answer with.
+        """
+        faults = self.faults
+        now = time.monotonic()
+        with self._lock:
+            headers = self._admit(now)
+            if "retry-after" in headers:
+                return RATE_LIMITED, 0.0, headers
+            latency = faults.latency(self._rng)
+            roll = self._rng.random()
+
+        for outcome, rate in (
+            (RATE_LIMITED, faults.rate_limit_rate),
+            (TIMEOUT, faults.timeout_rate),
+            (SERVER_ERROR, faults.server_error_rate),
+            (MALFORMED, faults.malformed_rate),
+        ):
+            if roll < rate:
+                if outcome == RATE_LIMITED:
+                    headers = {**headers, **retry_after_headers(faults.retry_after)}
+                    latency = 0.0
+                return outcome, latency, headers
+            roll -= rate
+        return OK, latency, headers
+
+    def _admit(self, now: float) -> dict[str, str]:
+        """
+        Counts a request against the requests-per-minute quota, if any, over a sliding window of 60 seconds.
+        Returns the `x-ratelimit-*` headers, with Retry-After once the quota is spent. Called with the lock held.
+        """
+        limit = self.faults.requests_per_minute
+        if limit <= 0:
+            return {}
+        while self._request_times and self._request_times[0] <= now - 60:
+            self._request_times.popleft()
+        if len(self._request_times) >= limit:
+            reset = self._request_times[0] + 60 - now
+            return {**ratelimit_headers(limit, 0, reset), **retry_after_headers(reset)}
+        self._request_times.append(now)
+        reset = self._request_times[0] + 60 - now
+        return ratelimit_headers(limit, limit - len(self._request_times), reset)
+
+    def record(self, outcome: str) -> None:
+        """ Counts a chat completion request by outcome in `stats`. """
+        with self._lock:
+            self.stats["requests"] += 1
+            self.stats[outcome] += 1
+
+    def answer_chat_completion(self, body: dict) -> tuple[dict, int, dict[str, str]] | None:
+        """
+        Answers a chat completion request, or fails it, as drawn by draw_outcome, after the drawn latency.
+
+        Returns:
+            The response payload, status and headers, or None for a timed out request, left unanswered.
+        """
+        outcome, latency, headers = self.draw_outcome()
+        time.sleep(latency)
+        answer: tuple[dict, int, dict[str, str]] | None
+        if outcome == RATE_LIMITED:
+            error = {"message": "Rate limit reached for requests", "type": "requests", "code": "rate_limit_exceeded"}
+            answer = {"error": error}, 429, headers
+        elif outcome == TIMEOUT:
+            time.sleep(self.faults.timeout_seconds)
+            answer = None
+        elif outcome == SERVER_ERROR:
+            error = {"message": "The server had an error while processing your request.", "type": "server_error"}
+            answer = {"error": error}, 500, headers
+        else:
+            content = self.responder(body)
+            if outcome == MALFORMED:
+                if content.startswith(("{", "[")):
+                    content = content[:len(content) // 2]
+                else:
+                    outcome = OK
+            answer = chat_completion(body, content), 200, headers
+        self.record(outcome)
+        return answer
+
+    def _run_batch_request(self, request: dict) -> dict:
+        body = request["body"]
+        return {
+            "id": f"batch_req_{uuid.uuid4().hex}",
+            "custom_id": request["custom_id"],
+            "response": {
+                "status_code": 200,
+                "request_id": uuid.uuid4().hex,
+                "body": chat_completion(body, self.responder(body)),
+            },
+            "error": None,
+        }
+
+    def _handler_class(self) -> type[BaseHTTPRequestHandler]:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """ Routes the emulated endpoints to the owning FakeOpenAIServer. """
+
+            def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+                """ Keeps test output quiet. """
+
+            def _send_json(self, payload: dict, status: int = 200, headers: dict[str, str] | None = None) -> None:
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _read_body(self) -> bytes:
+                return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+            def do_POST(self):  # pylint: disable=invalid-name
+                """ Handles chat completions, file uploads and batch creation. """
+                if self.path == "/v1/chat/completions":
+                    answer = server.answer_chat_completion(json.loads(self._read_body()))
+                    if answer is None:
+                        self.close_connection = True  # pylint: disable=attribute-defined-outside-init
+                    else:
+                        self._send_json(*answer)
+                elif self.path == "/v1/files":
+                    self._send_json(self._upload_file())
+                elif self.path == "/v1/batches":
+                    self._send_json(server.create_batch(json.loads(self._read_body())))
+                else:
+                    self._send_json({"error": {"message": f"Unknown path {self.path}"}}, status=404)
+
+            def do_GET(self):  # pylint: disable=invalid-name
+                """ Handles batch retrieval and file content downloads. """
+                parts = self.path.strip("/").split("/")
+                if len(parts) == 3 and parts[:2] == ["v1", "batches"] and parts[2] in server.batches:
+                    self._send_json(server.retrieve_batch(parts[2]))
+                elif len(parts) == 4 and parts[:2] == ["v1", "files"] and parts[3] == "content" \
+                        and parts[2] in server.files:
+                    content = server.files[parts[2]]["content"]
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/octet-stream")
+                    self.send_header("Content-Length", str(len(content)))
+                    self.end_headers()
+                    self.wfile.write(content)
+                else:
+                    self._send_json({"error": {"message": f"Unknown path {self.path}"}}, status=404)
+
+            def _upload_file(self) -> dict:
+                """ Parses the multipart upload sent by the OpenAI client's files.create. """
+                raw = b"Content-Type: " + self.headers["Content-Type"].encode() + b"\r\n\r\n" + self._read_body()
+                message = BytesParser(EmailMessage, policy=default_policy).parsebytes(raw)
+                fields: dict[str, bytes] = {}
+                filename = "upload.jsonl"
+                for part in message.iter_parts():
+                    name = str(part.get_param("name", header="content-disposition"))
+                    content = part.get_content()
+                    fields[name] = content.encode() if isinstance(content, str) else content
+                    filename = part.get_filename() or filename
+                return server.create_file(filename, fields["purpose"].decode(), fields["file"])
+
+        return Handler
@@ -0,0 +1,51 @@
+"""
+Keeps the canonical Food table and its ConversationFood links in sync with the conversations' favorite_foods.
+
+favorite_foods stays the verbatim list returned by the classifier; the links index the same foods under their
+canonical names, so "which conversations mention hummus" is an index lookup instead of a scan over JSON.
+save_conversations, save_classifications, save_reclassifications and the Conversation admin call link_foods in the
+same transaction as their writes.
+"""
+from typing import Iterable
+
+from django.db import transaction
+
+from applications.surveys.local_classifier import canonicalize_food
+from applications.surveys.models import (
+    Conversation,
+    ConversationFood,
+    Food,
+)
+
+
+def canonical_foods(foods: Iterable) -> set[str]:
+    """ Returns the distinct canonical names of a favorite_foods list, skipping blank entries. """
+    return {canonicalize_food(str(food)) for food in foods if str(food).strip()}
+
+
+def link_foods(conversations: Iterable[Conversation], batch_size: int | None = None) -> int:
+    """
+    Creates the Food rows missing for the conversations' favorite foods and links each conversation to its foods.
+    Existing foods and links are left as they are, so calling it again for the same conversations is harmless.
+
+    Returns:
+        The number of links written, including those that already existed.
+    """
+    names_by_conversation = {
+        conversation.pk: canonical_foods(conversation.favorite_foods or []) for conversation in conversations
+    }
+    names = set().union(*names_by_conversation.values())
+    if not names:
+        return 0
+
+    with transaction.atomic(savepoint=False):
+        Food.objects.bulk_create([Food(name=name) for name in sorted(names)], ignore_conflicts=True,
+                                 batch_size=batch_size)
+        food_ids = dict(Food.objects.filter(name__in=names).values_list("name", "id"))
+        links = [
+            ConversationFood(conversation_id=conversation_id, food_id=food_ids[name])
+            for conversation_id, conversation_names in names_by_conversation.items()
+            for name in sorted(conversation_names)
+        ]
+        ConversationFood.objects.bulk_create(links, ignore_conflicts=True, batch_size=batch_size)
+    return len(links)
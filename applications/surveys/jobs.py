@@ -0,0 +1,218 @@
+"""
+Durable queue of conversations waiting for classification, stored in the ClassificationJob table.
+
+save_conversations enqueues every conversation it stores unclassified, e.g. after a classifier error, in the same
+transaction; the classifier workers (see surveys/classifier_workers.py) then claim and classify them. Batch API runs
+queue theirs for later instead, in case their classifier batch does not deliver (see surveys/batch_api.py).
+
+Workers claim jobs with
+
+    SELECT ... FOR UPDATE SKIP LOCKED
+
+on PostgreSQL, so any number of workers on any number of machines take disjoint jobs without waiting on each
+other. The claim itself is a conditional UPDATE that only takes jobs still claimable, which also keeps workers from
+sharing jobs on databases without row locks, such as SQLite. A claimed job holds a lease: if its worker dies, the
+job is claimed again once the lease expires.
+"""
+from datetime import (
+    datetime,
+    timedelta,
+)
+from typing import Iterable
+
+from django.db import transaction
+from django.db.models import (
+    Count,
+    F,
+    Q,
+)
+from django.utils import timezone
+
+from applications.constants import (
+    CLASSIFICATION_JOB_BACKOFF_MAX_SECONDS,
+    CLASSIFICATION_JOB_BACKOFF_SECONDS,
+    CLASSIFICATION_JOB_LEASE_SECONDS,
+    CLASSIFICATION_JOB_MAX_ATTEMPTS,
+    STREAM_CHUNK_SIZE,
+)
+from applications.logging import get_logger
+from applications.surveys.models import (
+    ClassificationJob,
+    Conversation,
+)
+
+
+logger = get_logger(__name__)
+
+
+def enqueue_classifications(conversations: Iterable[Conversation], available_at: datetime | None = None) -> int:
+    """
+    Queues the unclassified conversations among `conversations` for the classifier workers, available to them from
+    `available_at` (by default right away). Conversations that already have a job keep it.
+
+    Returns:
+        The number of unclassified conversations among `conversations`.
+    """
+    available_at = available_at or timezone.now()
+    jobs = [ClassificationJob(conversation_id=conversation.pk, available_at=available_at)
+            for conversation in conversations if conversation.diet_type is None]
+    if jobs:
+        ClassificationJob.objects.bulk_create(jobs, ignore_conflicts=True)
+    return len(jobs)
+
+
+def release_deferred(conversations: Iterable[Conversation]) -> int:
+    """
+    Makes the jobs of `conversations` that were queued for later and never attempted available right away, e.g.
+    once the OpenAI batch expected to classify them failed.
+
+    Returns:
+        The number of jobs released.
+    """
+    now = timezone.now()
+    return ClassificationJob.objects.filter(
+        conversation__in=[conversation.pk for conversation in conversations],
+        status=ClassificationJob.Status.PENDING,
+        attempts=0,
+        available_at__gt=now,
+    ).update(available_at=now)
+
+
+def drop_jobs(conversations: Iterable[Conversation]) -> None:
+    """ Removes the jobs of conversations classified without the workers, e.g. by an OpenAI batch. """
+    ClassificationJob.objects.filter(conversation__in=[conversation.pk for conversation in conversations]).delete()
+
+
+def enqueue_unclassified(chunk_size: int = STREAM_CHUNK_SIZE) -> int:
+    """
+    Queues every stored unclassified conversation that has no job yet, e.g. those stored before the queue existed.
+
+    Returns:
+        The number of conversations queued.
+    """
+    conversations = (
+        Conversation.objects
+        .filter(diet_type__isnull=True, classification_job__isnull=True)
+        .only("id", "diet_type")
+        .iterator(chunk_size=chunk_size)
+    )
+    queued = 0
+    batch: list[Conversation] = []
+    for conversation in conversations:
+        batch.append(conversation)
+        if len(batch) >= chunk_size:
+            queued += enqueue_classifications(batch)
+            batch = []
+    return queued + enqueue_classifications(batch)
+
+
+def requeue_dead() -> int:
+    """ Gives every dead-lettered job a fresh set of attempts. Returns the number of jobs requeued. """
+    return ClassificationJob.objects.filter(status=ClassificationJob.Status.DEAD).update(
+        status=ClassificationJob.Status.PENDING,
+        attempts=0,
+        available_at=timezone.now(),
+        locked_by="",
+        locked_at=None,
+    )
+
+
+def claim_jobs(
+    worker_id: str,
+    limit: int,
+    lease_seconds: int = CLASSIFICATION_JOB_LEASE_SECONDS,
+) -> list[ClassificationJob]:
+    """
+    Claims up to `limit` available jobs for a worker, oldest first, counting an attempt for each: pending jobs past
+    their backoff, and running jobs whose lease expired.
+
+    Returns:
+        The claimed jobs, with their conversations.
+    """
+    now = timezone.now()
+    claimable = (
+        Q(status=ClassificationJob.Status.PENDING, available_at__lte=now)
+        | Q(status=ClassificationJob.Status.RUNNING, locked_at__lt=now - timedelta(seconds=lease_seconds))
+    )
+    with transaction.atomic():
+        job_ids = list(
+            ClassificationJob.objects
+            .select_for_update(skip_locked=True)
+            .filter(claimable)
+            .order_by("available_at")
+            .values_list("id", flat=True)[:limit]
+        )
+        if not job_ids:
+            return []
+        ClassificationJob.objects.filter(claimable, pk__in=job_ids).update(
+            status=ClassificationJob.Status.RUNNING,
+            locked_by=worker_id,
+            locked_at=now,
+            attempts=F("attempts") + 1,
+        )
+    return list(
+        ClassificationJob.objects
+        .filter(pk__in=job_ids, status=ClassificationJob.Status.RUNNING, locked_by=worker_id, locked_at=now)
+        .select_related("conversation")
+    )
+
+
+def complete_jobs(worker_id: str, jobs: Iterable[ClassificationJob]) -> None:
+    """
+    Removes the jobs of classified conversations from the queue, unless their lease expired and another worker
+    claimed them since: that worker finds their conversations classified and completes them.
+    """
+    ClassificationJob.objects.filter(pk__in=[job.pk for job in jobs], locked_by=worker_id).delete()
+
+
+def backoff_seconds(attempts: int) -> float:
+    """ Returns the delay before a job that failed `attempts` times is available again. """
+    return min(CLASSIFICATION_JOB_BACKOFF_MAX_SECONDS, CLASSIFICATION_JOB_BACKOFF_SECONDS * 2 ** max(0, attempts - 1))
+
+
+def fail_jobs(
+    worker_id: str,
+    failures: list[tuple[ClassificationJob, str]],
+    max_attempts: int = CLASSIFICATION_JOB_MAX_ATTEMPTS,
+) -> int:
+    """
+    Releases failed jobs with their error: back to PENDING after a backoff, or to DEAD once they used
+    `max_attempts` attempts. Jobs another worker claimed since their lease expired are left to that worker.
+
+    Returns:
+        The number of jobs dead-lettered.
+    """
+    now = timezone.now()
+    dead = 0
+    with transaction.atomic():
+        owned = set(
+            ClassificationJob.objects
+            .select_for_update()
+            .filter(pk__in=[job.pk for job, _ in failures], locked_by=worker_id)
+            .values_list("id", flat=True)
+        )
+        failures = [(job, error) for job, error in failures if job.pk in owned]
+        for job, error in failures:
+            job.last_error = error
+            job.locked_by = ""
+            job.locked_at = None
+            if job.attempts >= max_attempts:
+                job.status = ClassificationJob.Status.DEAD
+                dead += 1
+                logger.error(
+                    "Classification of conversation %s dead-lettered after %d attempts: %s",
+                    job.conversation_id, job.attempts, error,
+                )
+            else:
+                job.status = ClassificationJob.Status.PENDING
+                job.available_at = now + timedelta(seconds=backoff_seconds(job.attempts))
+        ClassificationJob.objects.bulk_update(
+            [job for job, _ in failures], ["status", "available_at", "locked_by", "locked_at", "last_error"],
+        )
+    return dead
+
+
+def queue_stats() -> dict[str, int]:
+    """ Returns the number of jobs per status. """
+    counts = dict(ClassificationJob.objects.values_list("status").annotate(count=Count("id")).order_by())
+    return {status: counts.get(status, 0) for status in ClassificationJob.Status.values}
@@ -0,0 +1,257 @@
+"""
+Deterministic, lexicon-based diet classifier used as a fast path in front of the classifier GPT.
+
+Most survey answers are plain lists of well-known foods ("Tofu, seitan, and kale are definitely my go-tos."),
+which can be classified without a network round trip. The classifier extracts the listed foods, looks each one up
+in a food-to-diet lexicon, and reports how confident it is. Callers only fall back to the GPT classifier when the
+confidence is too low, e.g. for unknown dishes or answers that are not a list of three foods.
+
+Lookups go through plain dicts built once at import, and results are memoized per normalized answer, so a
+classification takes microseconds.
+"""
+import hashlib
+import re
+from functools import lru_cache
+from typing import NamedTuple
+
+from applications.surveys.models import Conversation
+
+
+VEGAN = str(Conversation.DietType.VEGAN)
+VEGETARIAN = str(Conversation.DietType.VEGETARIAN)
+OMNIVORE = str(Conversation.DietType.OMNIVORE)
+
+# Diets ordered from most strict to most inclusive; an answer gets the most inclusive diet of its foods.
+DIET_RANK = {VEGAN: 0, VEGETARIAN: 1, OMNIVORE: 2}
+
+VEGAN_FOODS = {
+    "tofu", "seitan", "tempeh", "edamame", "kale", "spinach", "lentil", "lentil soup", "lentil curry", "dal",
+    "chickpea", "roasted chickpea", "hummus", "falafel", "falafel wrap", "tabbouleh", "baba ganoush", "bean",
+    "black bean", "kidney bean", "rice and beans", "rice", "brown rice", "quinoa", "couscous", "bulgur", "oat",
+    "oatmeal", "avocado", "guacamole", "avocado toast", "broccoli", "cauliflower", "carrot", "potato",
+    "sweet potato", "french fry", "fry", "tomato", "cucumber", "pepper", "eggplant", "zucchini", "mushroom",
+    "asparagus", "pea", "corn", "onion", "garlic", "cabbage", "kimchi", "sauerkraut", "beet", "salad",
+    "green salad", "fruit salad", "apple", "banana", "mango", "pineapple", "strawberry", "blueberry", "grape",
+    "orange", "peach", "watermelon", "cherry", "coconut", "almond", "cashew", "walnut", "peanut", "peanut butter",
+    "chana masala", "aloo gobi", "vegetable curry", "vegetable stir fry", "stir fry tofu", "miso soup", "seaweed",
+    "jackfruit", "vegan burger", "bread", "sourdough", "baguette", "pita", "tortilla chip",
+    "salsa", "popcorn", "dark chocolate", "sorbet", "ratatouille", "gazpacho", "minestrone", "dolma",
+    "mujadara", "pad thai with tofu", "vegan pizza", "oat milk", "soy milk", "almond milk", "plantain",
+    "tofu scramble", "buddha bowl", "poke bowl with tofu", "spring roll", "vegetable dumpling", "injera",
+    "misir wot", "pho chay", "bibimbap with tofu", "arepa", "polenta", "risotto with mushroom",
+}
+
+VEGETARIAN_FOODS = {
+    "cheese", "halloumi", "paneer", "paneer tikka", "palak paneer", "feta", "mozzarella", "parmesan", "cheddar",
+    "brie", "ricotta", "goat cheese", "mac and cheese", "macaroni and cheese", "grilled cheese", "cheese pizza",
+    "margherita pizza", "pizza margherita", "quesadilla", "cheese quesadilla", "egg", "omelette", "omelet",
+    "scrambled egg", "boiled egg", "frittata", "shakshuka", "quiche", "egg fried rice", "milk", "yogurt",
+    "greek yogurt", "butter", "cream", "ice cream", "gelato", "cheesecake", "tiramisu", "custard", "pancake",
+    "waffle", "french toast", "croissant", "brownie", "cake", "chocolate cake", "carrot cake", "cookie",
+    "milk chocolate", "chocolate", "honey", "lassi", "mango lassi", "spanakopita", "caprese salad",
+    "spinach lasagna", "vegetable lasagna", "eggplant parmesan", "gnocchi", "pesto pasta", "saag paneer",
+    "malai kofta", "khachapuri", "pierogi", "blintz", "flan", "baklava", "cannoli", "creme brulee", "mooncake",
+}
+
+OMNIVORE_FOODS = {
+    "chicken", "beef", "pork", "lamb", "mutton", "goat", "veal", "venison", "duck", "turkey", "goose", "rabbit",
+    "bacon", "ham", "sausage", "salami", "pepperoni", "prosciutto", "chorizo", "steak", "meat", "meatball",
+    "burger", "hamburger", "cheeseburger", "hot dog", "ribs", "brisket", "jerky", "fish", "salmon", "tuna",
+    "cod", "trout", "sardine", "anchovy", "mackerel", "tilapia", "halibut", "shrimp", "prawn", "crab", "lobster",
+    "oyster", "clam", "mussel", "scallop", "squid", "calamari", "octopus", "caviar", "eel", "sashimi",
+    "fish and chips", "fried chicken", "chicken tikka masala", "butter chicken", "chicken curry", "lamb stew",
+    "beef stew", "pulled pork", "carnitas", "barbacoa", "shawarma", "gyro", "kebab", "doner", "bolognese",
+    "spaghetti bolognese", "lasagna bolognese", "carbonara", "paella", "ceviche", "bouillabaisse", "tonkatsu",
+    "bulgogi", "galbi", "peking duck", "foie gras", "pâté", "pate", "liver", "gelatin", "jello", "chicken wing",
+    "wing", "nugget", "schnitzel", "meatloaf", "pot roast", "roast beef", "chili con carne", "jambalaya", "gumbo",
+    "haggis", "biltong", "lardo", "pho bo", "tom yum", "laksa", "adobo", "sisig", "lechon", "birria", "asado",
+}
+
+# Words that change how a dish is prepared, not its diet; they are ignored when a dish is not in the lexicon.
+PREPARATION_WORDS = {
+    "grilled", "roasted", "fried", "baked", "steamed", "boiled", "smoked", "spicy", "fresh", "homemade", "raw",
+    "crispy", "stir", "sauteed", "braised", "stuffed", "mashed", "toasted", "creamy", "sweet", "sour", "hot",
+    "cold", "warm", "mixed", "seasonal", "simple", "classic", "traditional", "authentic", "mom's", "my", "with",
+    "of", "in", "on", "style", "bowl", "plate", "dish",
+}
+
+# Words stating the diet of a dish outright ("vegan cheese", "vegetarian sausage"); they override its ingredients.
+EXPLICIT_DIETS = {"vegan": VEGAN, "plant-based": VEGAN, "vegetarian": VEGETARIAN}
+
+# Words marking a meat or fish name as an imitation ("black bean burger", "mock duck", "Impossible burger"). The
+# dish is left to the classifier GPT, since it may still hold eggs or dairy.
+PLANT_BASED_QUALIFIERS = {
+    "vegan", "vegetarian", "plant-based", "mock", "faux", "veggie", "bean", "tofu", "seitan", "impossible", "beyond",
+}
+
+# Meat words also naming the shape of plant dishes ("cauliflower wings", "mushroom steak", "lentil meatballs").
+MEAT_FORM_WORDS = {"burger", "wing", "nugget", "sausage", "steak", "meatball", "meat", "bacon", "jerky"}
+
+# Dairy and egg words also naming plant-based analogues ("cashew cheese", "coconut milk", "almond butter"). After a
+# plant word, the dish may or may not hold dairy or eggs, so it is left to the classifier GPT.
+DAIRY_AND_EGG_WORDS = {"cheese", "milk", "butter", "cream", "yogurt", "egg"}
+
+# Dishes containing "and", protected from being split into two foods.
+COMPOUND_DISHES = sorted(
+    (food for food in VEGAN_FOODS | VEGETARIAN_FOODS | OMNIVORE_FOODS if " and " in food),
+    key=len,
+    reverse=True,
+)
+
+_LEAD_IN = re.compile(
+    r"^(?:(?:well|honestly|hmm+|oh|ok(?:ay)?|so)\W+)*"
+    r"(?:i(?:'d| would)? (?:say|guess)\s*(?:that\s*)?)?"
+    r"(?:i (?:really |absolutely |just |truly )?(?:love|like|enjoy|adore|crave)|"
+    r"my (?:top (?:3|three) )?(?:all[- ]time )?(?:favou?rite)s?(?: foods?)?(?: would be| are| include)?|"
+    r"(?:top|favou?rite)s?(?: foods?)?(?: are)?)?\W*",
+)
+_TRAIL = re.compile(
+    r"\s+(?:are|would be|is)\s+(?:definitely |absolutely |probably |always )?"
+    r"(?:my |the )?(?:go[- ]tos?|favou?rites?|top (?:3|three)|best)\b.*$",
+)
+_SEPARATOR = re.compile(r"\s*,\s*(?:and\s+|&\s+)?|\s+(?:and|&)\s+")
+_ARTICLE = re.compile(r"^(?:a|an|the|some|lots of)\s+")
+_NON_WORD = re.compile(r"[^\w\s'-]")
+
+
+class LocalClassification(NamedTuple):
+    """ Result of the lexicon classifier; `confidence` is between 0 (no idea) and 1 (fully resolved). """
+    foods: tuple[str, ...]
+    diet: str | None
+    confidence: float
+
+    def as_result(self) -> dict:
+        """ Returns the classification in classify_diet's format: {'foods': list[str], 'diet': str}. """
+        return {"foods": list(self.foods), "diet": self.diet}
+
+
+def singularize(word: str) -> str:
+    """ Naive English singularization, good enough for lexicon lookups ("tomatoes" -> "tomato"). """
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith("oes"):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def canonicalize_food(food: str) -> str:
+    """ Lowercases a food name and singularizes each of its words. """
+    return " ".join(singularize(word) for word in food.lower().split())
+
+
+# The lexicon index, keyed by canonical food name.
+FOOD_DIETS: dict[str, str] = {
+    **{canonicalize_food(food): VEGAN for food in VEGAN_FOODS},
+    **{canonicalize_food(food): VEGETARIAN for food in VEGETARIAN_FOODS},
+    **{canonicalize_food(food): OMNIVORE for food in OMNIVORE_FOODS},
+}
+
+
+def extract_foods(answer: str) -> list[str]:
+    """
+    Extracts the list of foods from a free-text answer, e.g.
+    "My top 3 favorites are lamb stew, grilled chicken, and mooncake." -> ["lamb stew", "grilled chicken", "mooncake"]
+    """
+    text = answer.strip().lower().rstrip(".!?")
+    text = _LEAD_IN.sub("", text)
+    text = _TRAIL.sub("", text)
+    for dish in COMPOUND_DISHES:
+        text = text.replace(dish, dish.replace(" and ", "_and_"))
+
+    foods = []
+    for item in _SEPARATOR.split(text):
+        item = _ARTICLE.sub("", _NON_WORD.sub("", item).strip()).replace("_and_", " and ")
+        if item:
+            foods.append(item)
+    return foods
+
+
+def food_diet(food: str) -> str | None:
+    """
+    Returns the diet of a single food, or None when it cannot be resolved from the lexicon.
+
+    Known dishes are looked up whole. Otherwise a diet stated outright decides ("vegan cheese"), then a meat or fish
+    word decides ("shrimp tacos") unless the dish looks like an imitation of it: qualified as plant-based ("black
+    bean burger", "mock duck"), or named after a meat shape and made of plants ("cauliflower wings"). A dish made
+    only of known ingredients and preparation words gets the most inclusive diet among them, unless it names dairy or
+    eggs after a plant ("cashew cheese", "almond butter"), which may be an imitation too. Imitations are ambiguous and
+    left to the classifier GPT.
+    """
+    canonical = canonicalize_food(food)
+    if canonical in FOOD_DIETS:
+        return FOOD_DIETS[canonical]
+
+    words = [word for word in canonical.split() if word not in PREPARATION_WORDS]
+    explicit = {EXPLICIT_DIETS[word] for word in words if word in EXPLICIT_DIETS}
+    if explicit:
+        return explicit.pop() if len(explicit) == 1 else None
+
+    diets = [FOOD_DIETS[word] for word in words if word in FOOD_DIETS]
+    meat_words = [word for word in words if FOOD_DIETS.get(word) == OMNIVORE]
+    if meat_words:
+        return None if _imitates_meat(words, meat_words) else OMNIVORE
+    if diets and len(diets) == len(words) and not _imitates_dairy_or_eggs(words):
+        return max(diets, key=DIET_RANK.__getitem__)
+    return None
+
+
+def _imitates_meat(words: list[str], meat_words: list[str]) -> bool:
+    """ Returns whether a dish named with meat words may be a plant-based imitation of it. """
+    if any(word in PLANT_BASED_QUALIFIERS for word in words):
+        return True
+    plant_words = [word for word in words if FOOD_DIETS.get(word) in (VEGAN, VEGETARIAN)]
+    return bool(plant_words) and all(word in MEAT_FORM_WORDS for word in meat_words)
+
+
+def _imitates_dairy_or_eggs(words: list[str]) -> bool:
+    """ Returns whether a dish names dairy or eggs right after a plant word or a plant-based qualifier. """
+    return any(
+        word in DAIRY_AND_EGG_WORDS and (previous in PLANT_BASED_QUALIFIERS or FOOD_DIETS.get(previous) == VEGAN)
+        for previous, word in zip(words, words[1:])
+    )
+
+
+def lexicon_digest() -> str:
+    """
+    Returns a digest of the lexicon and word lists deciding the local classifications, so classifications made with
+    another lexicon can be told apart (see CLASSIFIER_VERSION in surveys/services.py).
+    """
+    parts = [
+        *(f"{food}={diet}" for food, diet in sorted(FOOD_DIETS.items())),
+        *(f"{word}={diet}" for word, diet in sorted(EXPLICIT_DIETS.items())),
+        *(
+            " ".join(sorted(words))
+            for words in (PREPARATION_WORDS, PLANT_BASED_QUALIFIERS, MEAT_FORM_WORDS, DAIRY_AND_EGG_WORDS)
+        ),
+    ]
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()[:12]
+
+
+def classify_locally(answer: str) -> LocalClassification:
+    """
+    Classifies an answer from the lexicon alone.
+
+    Confidence is the share of the three expected foods that could be resolved, or 1 as soon as one of them is
+    meat or fish, since that decides the diet. Ambiguous foods, such as meat imitations, are left unresolved, so
+    answers holding them fall below full confidence and go to the classifier GPT unless another food is meat.
+    Answers that do not list exactly three foods get 0.
+    """
+    return _classify_normalized(" ".join(answer.lower().split()))
+
+
+@lru_cache(maxsize=65_536)
+def _classify_normalized(answer: str) -> LocalClassification:
+    foods = tuple(extract_foods(answer))
+    if len(foods) != 3:
+        return LocalClassification(foods, None, 0.0)
+
+    diets = [food_diet(food) for food in foods]
+    resolved = [diet for diet in diets if diet is not None]
+    if OMNIVORE in resolved:
+        return LocalClassification(foods, OMNIVORE, 1.0)
+    if not resolved:
+        return LocalClassification(foods, None, 0.0)
+    diet = max(resolved, key=DIET_RANK.__getitem__)
+    return LocalClassification(foods, diet, len(resolved) / len(foods))
@@ -0,0 +1,68 @@
+""" Management command to benchmark the local lexicon classifier against stored GPT classifications. """
+import time
+
+from django.core.management.base import BaseCommand
+
+from applications.constants import LOCAL_CLASSIFIER_MIN_CONFIDENCE
+from applications.surveys.local_classifier import (
+    canonicalize_food,
+    classify_locally,
+)
+from applications.surveys.models import Conversation
+
+
+class Command(BaseCommand):
+    # pylint: disable=missing-class-docstring
+    help = (
+        "Run the local lexicon classifier over conversations already classified by the classifier GPT, "
+        "and report its hit rate, its agreement with the GPT and its speed"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=None,
+            help="Evaluate at most this many of the most recent classified conversations",
+        )
+        parser.add_argument(
+            "--min-confidence",
+            type=float,
+            default=LOCAL_CLASSIFIER_MIN_CONFIDENCE,
+            help="Confidence from which a local classification counts as a hit",
+        )
+
+    def handle(self, *args, **options):
+        """
+        A hit is an answer the local classifier would have classified instead of the GPT. Agreement is measured
+        on hits only: same diet, and same foods after canonicalization.
+        """
+        rows = list(
+            Conversation.objects.filter(diet_type__isnull=False)
+            .order_by("-created_at")
+            .values_list("answer_text", "diet_type", "favorite_foods")[:options["limit"]]
+        )
+        if not rows:
+            self.stdout.write("No classified conversations to evaluate against.")
+            return
+
+        started = time.perf_counter()
+        local_results = [classify_locally(answer) for answer, _, _ in rows]
+        elapsed = time.perf_counter() - started
+
+        hits = diet_agreements = food_agreements = 0
+        for (_, gpt_diet, gpt_foods), local in zip(rows, local_results):
+            if local.confidence < options["min_confidence"]:
+                continue
+            hits += 1
+            diet_agreements += local.diet == gpt_diet
+            food_agreements += sorted(map(canonicalize_food, local.foods)) == sorted(
+                map(canonicalize_food, gpt_foods or [])
+            )
+
+        self.stdout.write(f"Evaluated: {len(rows)} conversations")
+        self.stdout.write(f"Hit rate: {hits / len(rows):.1%} ({hits} answers classified locally)")
+        if hits:
+            self.stdout.write(f"Diet agreement with GPT: {diet_agreements / hits:.1%}")
+            self.stdout.write(f"Food agreement with GPT: {food_agreements / hits:.1%}")
+        self.stdout.write(f"Mean local classification time: {elapsed / len(rows) * 1_000_000:.1f} µs")
@@ -0,0 +1,29 @@
+""" Management command to recompute the diet and food rollups from the stored conversations. """
+from django.core.management.base import BaseCommand
+
+from applications.constants import STREAM_CHUNK_SIZE
+from applications.surveys.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    # pylint: disable=missing-class-docstring
+    help = (
+        "Recompute the DietDailyRollup and FoodCount tables from all classified conversations; "
+        "run it once after upgrading to backfill them, or after editing conversations outside the app"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=STREAM_CHUNK_SIZE,
+            help="Number of conversations read, and rollup rows written, per database round trip",
+        )
+
+    def handle(self, *args, **options):
+        """
+        The conversations are streamed, so memory grows with the number of rollup rows, not of conversations.
+        Conversations classified while the command runs may be missed; run it when no simulation is writing.
+        """
+        diet_rows, food_rows = rebuild_rollups(chunk_size=options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rollups: {diet_rows} diet rows, {food_rows} food rows"))
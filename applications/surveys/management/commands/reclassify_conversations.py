@@ -0,0 +1,102 @@
+""" Management command to classify again unclassified conversations, or those classified by another classifier. """
+import asyncio
+from datetime import date
+
+from django.core.management.base import (
+    BaseCommand,
+    CommandError,
+)
+from django.db.models import Count
+
+from applications.constants import (
+    DEFAULT_CLASSIFY_BATCH_SIZE,
+    RECLASSIFY_BATCH_SIZE,
+)
+from applications.surveys.reclassification import (
+    areclassify_conversations,
+    select_conversations,
+)
+from applications.surveys.services import CLASSIFIER_VERSION
+
+
+class Command(BaseCommand):
+    # pylint: disable=missing-class-docstring
+    help = (
+        "Classify again the conversations left unclassified, or classified by another classifier model or prompt "
+        f"than the current one ({CLASSIFIER_VERSION})"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--unclassified", action="store_true", help="Select conversations without a diet")
+        parser.add_argument(
+            "--stale",
+            action="store_true",
+            help="Select conversations classified by another classifier version than the current one",
+        )
+        parser.add_argument(
+            "--classifier-version",
+            metavar="VERSION",
+            help="Select conversations classified by VERSION, e.g. one listed by a --dry-run",
+        )
+        parser.add_argument("--since", type=date.fromisoformat, help="First creation date (UTC), as YYYY-MM-DD")
+        parser.add_argument("--until", type=date.fromisoformat, help="Last creation date (UTC), as YYYY-MM-DD")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=RECLASSIFY_BATCH_SIZE,
+            help="Number of conversations read and written per batch",
+        )
+        parser.add_argument(
+            "--classify-batch-size",
+            type=int,
+            default=DEFAULT_CLASSIFY_BATCH_SIZE,
+            help="Number of answers classified per classifier request",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=4,
+            help="Maximum number of classifier requests in flight at once",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only count the selected conversations, per classifier version",
+        )
+
+    def handle(self, *args, **options):
+        """
+        Without --unclassified, --stale or --classifier-version, both unclassified and stale conversations are selected.
+        The classifier requests go through the same cache and rate limiter as simulations.
+        """
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1")
+
+        selectors = ("unclassified", "stale", "classifier_version")
+        if not any(options[selector] for selector in selectors):
+            options.update(unclassified=True, stale=True)
+        conversations = select_conversations(
+            unclassified=options["unclassified"],
+            stale=options["stale"],
+            version=options["classifier_version"],
+            since=options["since"],
+            until=options["until"],
+        )
+
+        if options["dry_run"]:
+            versions = conversations.values_list("classifier_version").annotate(count=Count("id")).order_by()
+            self.stdout.write(f"{sum(count for _, count in versions)} conversations selected for reclassification")
+            for version, count in sorted(versions):
+                self.stdout.write(f"  {version or '(none)'}: {count}")
+            return
+
+        totals = asyncio.run(areclassify_conversations(
+            conversations,
+            batch_size=options["batch_size"],
+            classify_batch_size=options["classify_batch_size"],
+            concurrency=options["concurrency"],
+        ))
+        self.stdout.write(self.style.SUCCESS(
+            f"Reclassified {totals['reclassified']} conversations ({totals['changed']} changed), "
+            f"{totals['failed']} failed, with classifier {CLASSIFIER_VERSION}"
+        ))
@@ -0,0 +1,174 @@
+""" Management command to run classifier worker processes draining the classification job queue. """
+import multiprocessing
+import os
+import signal
+import time
+from collections import Counter
+from multiprocessing.connection import wait
+
+from django.core.management.base import (
+    BaseCommand,
+    CommandError,
+)
+from django.db import connections
+
+from applications.constants import (
+    CLASSIFICATION_JOB_LEASE_SECONDS,
+    CLASSIFICATION_JOB_MAX_ATTEMPTS,
+    CLASSIFIER_WORKER_POLL_SECONDS,
+    DEFAULT_CLASSIFY_BATCH_SIZE,
+)
+from applications.logging import get_logger
+from applications.surveys.classifier_workers import run_worker
+from applications.surveys.jobs import (
+    enqueue_unclassified,
+    queue_stats,
+    requeue_dead,
+)
+
+logger = get_logger(__name__)
+
+# Seconds to wait for the counts of a worker process that exited cleanly.
+RESULT_TIMEOUT_SECONDS = 5
+# Seconds worker processes get to finish their current batch once stopped, before they are killed.
+SHUTDOWN_TIMEOUT_SECONDS = 60
+
+
+def _work(worker_options: dict, results) -> None:
+    """ Entry point of a worker process: runs a worker until SIGTERM or SIGINT, and reports its counts. """
+    stopping = []
+
+    def stop(signum, frame):  # pylint: disable=unused-argument
+        stopping.append(signum)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    results.put(dict(run_worker(**worker_options, should_stop=lambda: bool(stopping))))
+
+
+class Command(BaseCommand):
+    # pylint: disable=missing-class-docstring
+    help = (
+        "Classify queued conversations with worker processes; run it on several machines to scale out. "
+        "Each process rate-limits its own OpenAI calls, so divide the quotas between processes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=1, help="Number of worker processes")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=DEFAULT_CLASSIFY_BATCH_SIZE,
+            help="Number of jobs claimed, and answers sent in one classifier request, at a time",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=CLASSIFIER_WORKER_POLL_SECONDS,
+            help="Seconds a worker waits before looking for jobs again when the queue is empty",
+        )
+        parser.add_argument(
+            "--max-attempts",
+            type=int,
+            default=CLASSIFICATION_JOB_MAX_ATTEMPTS,
+            help="Attempts before a job is dead-lettered",
+        )
+        parser.add_argument(
+            "--lease",
+            type=int,
+            default=CLASSIFICATION_JOB_LEASE_SECONDS,
+            help="Seconds after which a job claimed by a worker that did not finish it is claimed again",
+        )
+        parser.add_argument("--once", action="store_true", help="Exit once no job is available, instead of polling")
+        parser.add_argument(
+            "--enqueue-unclassified",
+            action="store_true",
+            help="First queue the stored unclassified conversations that have no job, e.g. from older runs",
+        )
+        parser.add_argument(
+            "--requeue-dead",
+            action="store_true",
+            help="First give the dead-lettered jobs a fresh set of attempts",
+        )
+
+    def handle(self, *args, **options):
+        """
+        Runs the workers until they are stopped with SIGINT or SIGTERM, each finishing its current batch first;
+        with --once, until the queue has no available job. A worker killed mid-batch loses nothing: its jobs are
+        claimed again once their lease expires.
+        """
+        if options["processes"] < 1 or options["batch_size"] < 1 or options["max_attempts"] < 1:
+            raise CommandError("--processes, --batch-size and --max-attempts must be at least 1")
+
+        if options["enqueue_unclassified"]:
+            self.stdout.write(f"Queued {enqueue_unclassified()} unclassified conversations")
+        if options["requeue_dead"]:
+            self.stdout.write(f"Requeued {requeue_dead()} dead-lettered jobs")
+
+        worker_options = {
+            "batch_size": options["batch_size"],
+            "poll_interval": options["poll_interval"],
+            "max_attempts": options["max_attempts"],
+            "lease_seconds": options["lease"],
+            "once": options["once"],
+        }
+        if options["processes"] == 1:
+            totals = run_worker(**worker_options)
+        else:
+            totals = self._run_processes(options["processes"], worker_options)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Classifier workers finished: {totals['classified']} classified, {totals['retried']} to retry, "
+            f"{totals['dead']} dead-lettered"
+        ))
+        stats = queue_stats()
+        self.stdout.write(", ".join(f"{count} {status}" for status, count in stats.items()) + " jobs left in queue")
+
+    @staticmethod
+    def _run_processes(
+        processes: int,
+        worker_options: dict,
+        shutdown_timeout: float = SHUTDOWN_TIMEOUT_SECONDS,
+    ) -> Counter:
+        """
+        Forks the worker processes, waits for all of them, and sums their counts. SIGTERM and SIGINT are forwarded
+        to the workers, which then get `shutdown_timeout` seconds to finish their batch before being killed; the
+        jobs of killed workers are claimed again once their lease expires.
+        """
+        # Forked children must open their own database connections instead of sharing the parent's.
+        connections.close_all()
+        context = multiprocessing.get_context("fork")
+        results = context.Queue()
+        workers = [context.Process(target=_work, args=(worker_options, results)) for _ in range(processes)]
+        for worker in workers:
+            worker.start()
+
+        stopped_at: list[float] = []
+
+        def forward(signum, frame):  # pylint: disable=unused-argument
+            stopped_at.append(time.monotonic())
+            for worker in workers:
+                if worker.is_alive():
+                    os.kill(worker.pid, signum)
+
+        handlers = {signum: signal.signal(signum, forward) for signum in (signal.SIGTERM, signal.SIGINT)}
+        try:
+            while any(worker.is_alive() for worker in workers):
+                if stopped_at and time.monotonic() - stopped_at[0] > shutdown_timeout:
+                    for worker in workers:
+                        if worker.is_alive():
+                            logger.warning("Killing classifier worker %d, still busy after stopping", worker.pid)
+                            worker.kill()
+                    break
+                wait([worker.sentinel for worker in workers if worker.is_alive()], 1)
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+        for worker in workers:
+            worker.join()
+
+        totals: Counter = Counter(classified=0, retried=0, dead=0)
+        for worker in workers:
+            if worker.exitcode == 0:
+                totals.update(results.get(timeout=RESULT_TIMEOUT_SECONDS))
+        return totals
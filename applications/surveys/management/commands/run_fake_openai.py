@@ -0,0 +1,91 @@
+""" Management command to serve the local fake OpenAI API, with injected latency and errors, for load tests. """
+import signal
+import threading
+
+from django.core.management.base import (
+    BaseCommand,
+    CommandError,
+)
+
+from applications.surveys.fake_openai import (
+    FakeOpenAIServer,
+    Faults,
+    parse_latency,
+)
+
+
+class Command(BaseCommand):
+    # pylint: disable=missing-class-docstring
+    help = (
+        "Serve a local stand-in for the OpenAI chat completions API, answering like the respondent and classifier "
+        "GPTs, with configurable latency, 429s, timeouts, 500s and malformed JSON. Point simulations at it with "
+        "simulate_conversations --openai-base-url"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on")
+        parser.add_argument("--port", type=int, default=8765, help="Port to listen on")
+        parser.add_argument(
+            "--latency",
+            default="0",
+            help="Latency distribution in seconds: S, uniform:LOW,HIGH, normal:MEAN,STDDEV or lognormal:MEDIAN,SIGMA",
+        )
+        parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of requests answered 429")
+        parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds of random 429s")
+        parser.add_argument(
+            "--requests-per-minute",
+            type=int,
+            default=0,
+            help="Quota of requests per minute, beyond which requests are answered 429; 0 for none",
+        )
+        parser.add_argument("--timeout-rate", type=float, default=0.0, help="Share of requests never answered")
+        parser.add_argument(
+            "--timeout-seconds",
+            type=float,
+            default=120.0,
+            help="Seconds an unanswered request hangs before its connection is dropped",
+        )
+        parser.add_argument("--server-error-rate", type=float, default=0.0, help="Share of requests answered 500")
+        parser.add_argument(
+            "--malformed-rate",
+            type=float,
+            default=0.0,
+            help="Share of classifier requests answered with invalid JSON",
+        )
+        parser.add_argument("--seed", type=int, default=None, help="Random seed, to replay the same faults")
+
+    def handle(self, *args, **options):
+        """ Serves until interrupted or terminated, then prints the number of requests per outcome. """
+        try:
+            faults = Faults(
+                latency=parse_latency(options["latency"]),
+                rate_limit_rate=options["rate_limit_rate"],
+                retry_after=options["retry_after"],
+                requests_per_minute=options["requests_per_minute"],
+                timeout_rate=options["timeout_rate"],
+                timeout_seconds=options["timeout_seconds"],
+                server_error_rate=options["server_error_rate"],
+                malformed_rate=options["malformed_rate"],
+            )
+        except ValueError as e:
+            raise CommandError(str(e)) from e
+        rates = (faults.rate_limit_rate, faults.timeout_rate, faults.server_error_rate, faults.malformed_rate)
+        if any(rate < 0 for rate in rates) or sum(rates) > 1:
+            raise CommandError("Fault rates must not be negative, and must add up to at most 1")
+
+        server = FakeOpenAIServer(faults=faults, seed=options["seed"], host=options["host"], port=options["port"])
+        server.start()
+        self.stdout.write(self.style.SUCCESS(
+            f"Fake OpenAI API listening on {server.base_url}; run simulations with "
+            f"--openai-base-url {server.base_url}. Press Ctrl+C to stop."
+        ))
+        stopped = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: stopped.set())
+        try:
+            while not stopped.wait(1):
+                pass
+        finally:
+            server.stop()
+        stats = ", ".join(f"{count} {outcome}" for outcome, count in sorted(server.stats.items())) or "no requests"
+        self.stdout.write(f"Chat completion requests: {stats}")
@@ -0,0 +1,42 @@
+""" Management command to store fake classified conversations quickly, e.g. for benchmarks and load tests. """
+import time
+
+from django.core.management.base import (
+    BaseCommand,
+    CommandError,
+)
+
+from applications.constants import SEED_BATCH_SIZE
+from applications.surveys.seeding import seed_conversations
+
+
+class Command(BaseCommand):
+    # pylint: disable=missing-class-docstring
+    help = (
+        "Store fake classified conversations without calling OpenAI, with their food links and rollups, "
+        "to load-test the insights API on a realistic amount of data"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("count", type=int, help="Number of conversations to store")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=SEED_BATCH_SIZE,
+            help="Number of conversations written per transaction",
+        )
+        parser.add_argument("--days", type=int, default=30, help="Spread created_at over this many past days")
+        parser.add_argument("--seed", type=int, default=None, help="Random seed, to generate the same rows again")
+
+    def handle(self, *args, **options):
+        if options["count"] < 0 or options["batch_size"] < 1:
+            raise CommandError("count must not be negative, and --batch-size must be at least 1")
+
+        start = time.perf_counter()
+        stored = seed_conversations(
+            options["count"], batch_size=options["batch_size"], days=options["days"], seed=options["seed"],
+        )
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {stored} conversations in {elapsed:.1f}s ({stored / elapsed if elapsed else 0:.0f}/s)"
+        ))
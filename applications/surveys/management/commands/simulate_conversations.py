@@ -1,14 +1,45 @@
 """ Management command to simulate a number of conversations. """
-import time
-from django.core.management.base import BaseCommand
-from django.db import transaction
+import asyncio
+from collections.abc import Iterator
+
+from django.core.management.base import (
+    BaseCommand,
+    CommandError,
+)
 from openai import (
     APIError,
     APITimeoutError,
     RateLimitError,
 )
 
-from applications.surveys.services import simulate_conversation
+from applications.constants import (
+    DEFAULT_CLASSIFY_BATCH_SIZE,
+    DEFAULT_WRITE_BATCH_SIZE,
+)
+from applications.metrics import format_summary
+from applications.surveys.batch_api import (
+    DEFAULT_POLL_INTERVAL_SECONDS,
+    BatchSimulation,
+)
+from applications.surveys.classification_cache import classification_cache
+from applications.surveys.models import SimulationRun
+from applications.surveys.runs import (
+    finish_run,
+    remaining_count,
+    resume_run,
+    start_run,
+)
+from applications.surveys.openai_clients import (
+    configure_clients,
+    get_client,
+)
+from applications.surveys.services import (
+    ConversationWriter,
+    asimulate_conversation,
+    asimulate_conversation_batch,
+    simulate_conversation,
+    simulate_conversation_batch,
+)
 from applications.logging import get_logger
 
 logger = get_logger(__name__)
@@ -26,35 +57,258 @@ class Command(BaseCommand):
             default=100,
             help="Number of conversations to simulate",
         )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=1,
+            help="Maximum number of conversations in flight at once; values above 1 use the async OpenAI client",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=DEFAULT_WRITE_BATCH_SIZE,
+            help="Number of finished conversations written to the database per bulk INSERT and commit",
+        )
+        parser.add_argument(
+            "--classify-batch-size",
+            type=int,
+            default=1,
+            help=(
+                "Number of answers classified per classifier request; "
+                f"values above 1 use the batched classifier (e.g. {DEFAULT_CLASSIFY_BATCH_SIZE})"
+            ),
+        )
+        parser.add_argument(
+            "--resume",
+            metavar="RUN_ID",
+            help="Continue an interrupted simulation run, simulating only the conversations it has not finished",
+        )
+        parser.add_argument(
+            "--openai-batch",
+            action="store_true",
+            help="Submit the requests through the OpenAI Batch API and ingest the results when the batches complete",
+        )
+        parser.add_argument(
+            "--resume-batch",
+            metavar="BATCH_ID",
+            help="Wait for and ingest an already submitted OpenAI batch, continuing the run it belongs to",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=DEFAULT_POLL_INTERVAL_SECONDS,
+            help="Seconds between OpenAI batch status polls",
+        )
+        parser.add_argument(
+            "--openai-base-url",
+            help="Call this OpenAI-compatible API instead of OPENAI_BASE_URL, e.g. the run_fake_openai server",
+        )
 
     def handle(self, *args, **options):
         """
         Runs the simulation for a given number of conversations,
         with rate limiting and specific exception handling.
+
+        OpenAI calls are throttled per model by the shared rate limiter, which also retries 429s and transient
+        errors; only errors that persist through those retries count as failed simulations.
+
+        With --classify-batch-size above 1, conversations are simulated in groups whose answers are classified
+        by a single batched request; an error in a group counts all of its conversations as failed.
+
+        Finished conversations are written in batches; conversations lost to a failed batch write
+        are moved from the succeeded to the failed count.
+
+        Every run is recorded as a SimulationRun, checkpointed with each batch written; with --resume, an
+        interrupted run continues where its last checkpoint left it, and the count argument is ignored.
+
+        With --openai-batch or --resume-batch, the run goes through the OpenAI Batch API instead; it is recorded as a
+        SimulationRun too, settled once its batches have ended, and resumed from any of its batches with --resume-batch.
+
+        With --openai-base-url, every OpenAI call of the run goes to that API, e.g. a local fake server.
+
+        The run ends with a table of the latency, failures and token usage of its OpenAI calls and database writes.
         """
-        total_conversations = options["count"]
+        if not options["openai_base_url"]:
+            self._simulate(options)
+            return
+        configure_clients(options["openai_base_url"])
+        try:
+            self._simulate(options)
+        finally:
+            configure_clients()
+
+    def _simulate(self, options: dict) -> None:
+        """ Runs the simulation, through the OpenAI Batch API or conversation by conversation. """
+        if options["resume"] and (options["openai_batch"] or options["resume_batch"]):
+            raise CommandError("--resume continues a simulation run; use --resume-batch for OpenAI batches")
+
+        if options["openai_batch"] or options["resume_batch"]:
+            batch_simulation = BatchSimulation(
+                get_client(), poll_interval=options["poll_interval"], log=self.stdout.write,
+            )
+            if options["resume_batch"]:
+                successful_simulations, failed_simulations = batch_simulation.resume(options["resume_batch"])
+            else:
+                successful_simulations, failed_simulations = batch_simulation.run(options["count"])
+            self.stdout.write(self.style.SUCCESS(
+                f"Finished simulations: {successful_simulations} succeeded, {failed_simulations} failed"
+            ))
+            self.stdout.write(format_summary())
+            return
+
+        run = self._start_or_resume_run(options)
+        total_conversations = remaining_count(run)
+        concurrency = options["concurrency"]
+        units = self._split_into_units(total_conversations, options["classify_batch_size"])
+        writer = ConversationWriter(batch_size=options["batch_size"], run=run)
+
+        if concurrency > 1:
+            successful_simulations, failed_simulations = asyncio.run(
+                self._simulate_concurrently(units, total_conversations, concurrency, writer)
+            )
+        else:
+            successful_simulations, failed_simulations = self._simulate_sequentially(
+                units, total_conversations, writer
+            )
+
+        successful_simulations -= writer.failed
+        failed_simulations += writer.failed
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Finished simulations: {successful_simulations} succeeded, {failed_simulations} failed")
+        )
+        run = finish_run(run)
+        self.stdout.write(
+            f"Simulation run {run.id}: {run.succeeded} succeeded and {run.failed} failed "
+            f"of {run.target_count} conversations, {run.status}"
+        )
+        stats = classification_cache.stats()
+        self.stdout.write(
+            f"Classification cache: {stats['local_hits']} local hits, {stats['shared_hits']} shared hits, "
+            f"{stats['misses']} misses"
+        )
+        self.stdout.write(format_summary())
+
+    def _start_or_resume_run(self, options: dict) -> SimulationRun:
+        """ Loads the run given with --resume, or records a new run of `count` conversations. """
+        if options["resume"]:
+            try:
+                run = resume_run(options["resume"])
+            except ValueError as e:
+                raise CommandError(str(e)) from e
+            self.stdout.write(
+                f"Resuming simulation run {run.id}: {run.succeeded} succeeded, {run.failed} failed, "
+                f"{remaining_count(run)} of {run.target_count} conversations left"
+            )
+            return run
+
+        run = start_run(options["count"], {
+            "concurrency": options["concurrency"],
+            "batch_size": options["batch_size"],
+            "classify_batch_size": options["classify_batch_size"],
+        })
+        self.stdout.write(f"Started simulation run {run.id}; if interrupted, continue it with --resume {run.id}")
+        return run
+
+    @staticmethod
+    def _split_into_units(total_conversations: int, classify_batch_size: int) -> Iterator[tuple[int, int]]:
+        """
+        Splits the run into units of work, as (first conversation number, number of conversations) pairs, lazily so
+        large runs don't hold them all in memory.
+        """
+        size = max(1, classify_batch_size)
+        return (
+            (first, min(size, total_conversations - first + 1))
+            for first in range(1, total_conversations + 1, size)
+        )
+
+    @staticmethod
+    def _describe_unit(first: int, size: int) -> str:
+        if size == 1:
+            return f"conversation number {first}"
+        return f"conversation numbers {first}-{first + size - 1}"
+
+    def _report_progress(self, processed: int, size: int, total_conversations: int) -> None:
+        """ Reports progress every 10 conversations, given the number processed after a unit of `size`. """
+        if processed // 10 > (processed - size) // 10:
+            self.stdout.write(f"Processed {processed}/{total_conversations} conversations")
+
+    def _simulate_sequentially(
+        self,
+        units: Iterator[tuple[int, int]],
+        total_conversations: int,
+        writer: ConversationWriter,
+    ) -> tuple[int, int]:
+        """ Simulates the units one at a time. Returns (succeeded, failed) counts. """
         successful_simulations = 0
         failed_simulations = 0
 
-        for current_conversation in range(1, total_conversations + 1):
+        for first, size in units:
             try:
-                with transaction.atomic():
-                    simulate_conversation()
-                successful_simulations += 1
+                dropped = 0
+                if size == 1:
+                    simulate_conversation(writer=writer)
+                else:
+                    dropped = simulate_conversation_batch(size, writer=writer)
+                successful_simulations += size - dropped
+                failed_simulations += dropped
+                if dropped:
+                    writer.record_failures(dropped)
 
             except (RateLimitError, APIError, APITimeoutError) as error:
-                logger.warning("OpenAI API error on conversation number %d: %s", current_conversation, error)
-                failed_simulations += 1
+                logger.warning("OpenAI API error on %s: %s", self._describe_unit(first, size), error)
+                failed_simulations += size
+                writer.record_failures(size)
 
             except Exception as error:  # pylint: disable=broad-exception-caught
-                logger.error("Unexpected error on conversation number %d: %s", current_conversation, error)
-                failed_simulations += 1
+                logger.error("Unexpected error on %s: %s", self._describe_unit(first, size), error)
+                failed_simulations += size
+                writer.record_failures(size)
 
-            if current_conversation % 10 == 0:
-                self.stdout.write(f"Processed {current_conversation}/{total_conversations} conversations")
+            self._report_progress(successful_simulations + failed_simulations, size, total_conversations)
 
-            time.sleep(0.5)
+        writer.flush()
+        return successful_simulations, failed_simulations
 
-        self.stdout.write(
-            self.style.SUCCESS(f"Finished simulations: {successful_simulations} succeeded, {failed_simulations} failed")
-        )
+    async def _simulate_concurrently(
+        self,
+        units: Iterator[tuple[int, int]],
+        total_conversations: int,
+        concurrency: int,
+        writer: ConversationWriter,
+    ) -> tuple[int, int]:
+        """
+        Simulates the units on one event loop with a fixed pool of `concurrency` workers, each pulling the next unit
+        from `units` once done with its own. Returns (succeeded, failed) counts.
+        """
+        counts = {"succeeded": 0, "failed": 0}
+
+        async def worker() -> None:
+            # The workers share one event loop, so pulling from the same iterator never hands a unit out twice.
+            for first, size in units:
+                try:
+                    dropped = 0
+                    if size == 1:
+                        await asimulate_conversation(writer=writer)
+                    else:
+                        dropped = await asimulate_conversation_batch(size, writer=writer)
+                    counts["succeeded"] += size - dropped
+                    counts["failed"] += dropped
+                    if dropped:
+                        await writer.arecord_failures(dropped)
+
+                except (RateLimitError, APIError, APITimeoutError) as error:
+                    logger.warning("OpenAI API error on %s: %s", self._describe_unit(first, size), error)
+                    counts["failed"] += size
+                    await writer.arecord_failures(size)
+
+                except Exception as error:  # pylint: disable=broad-exception-caught
+                    logger.error("Unexpected error on %s: %s", self._describe_unit(first, size), error)
+                    counts["failed"] += size
+                    await writer.arecord_failures(size)
+
+                self._report_progress(counts["succeeded"] + counts["failed"], size, total_conversations)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        await writer.aflush()
+        return counts["succeeded"], counts["failed"]
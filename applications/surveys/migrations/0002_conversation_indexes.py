@@ -0,0 +1,21 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['diet_type', 'created_at', 'id'], name='conversation_diet_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(condition=models.Q(('diet_type__isnull', False)), fields=['created_at', 'id'], name='conversation_classified_idx'),
+        ),
+    ]
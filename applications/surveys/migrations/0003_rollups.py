@@ -0,0 +1,39 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0002_conversation_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DietDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('diet_type', models.CharField(choices=[('vegan', 'Vegan'), ('vegetarian', 'Vegetarian'), ('omnivore', 'Omnivore')], max_length=20)),
+                ('count', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'diet_type'), name='diet_daily_rollup_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='FoodCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('diet_type', models.CharField(choices=[('vegan', 'Vegan'), ('vegetarian', 'Vegetarian'), ('omnivore', 'Omnivore')], max_length=20)),
+                ('food', models.CharField(max_length=255)),
+                ('count', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['diet_type', 'day'], name='food_count_diet_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('day', 'diet_type', 'food'), name='food_count_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0003_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Food',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ConversationFood',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('conversation', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='conversation_foods', to='surveys.conversation')),
+                ('food', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='conversation_foods', to='surveys.food')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='foods',
+            field=models.ManyToManyField(blank=True, related_name='conversations', through='surveys.ConversationFood', to='surveys.food'),
+        ),
+        migrations.AddIndex(
+            model_name='conversationfood',
+            index=models.Index(fields=['food', 'conversation'], name='conversation_food_food_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='conversationfood',
+            constraint=models.UniqueConstraint(fields=('conversation', 'food'), name='conversation_food_unique'),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:35
+
+from django.db import migrations
+
+
+CHUNK_SIZE = 2000
+
+
+# Frozen copies of surveys/local_classifier.py's singularize and canonicalize_food as of this migration, so it keeps
+# writing the same food names whatever later changes the live code.
+def singularize(word):
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith("oes"):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def canonicalize_food(food):
+    return " ".join(singularize(word) for word in food.lower().split())
+
+
+def link_existing_foods(apps, schema_editor):
+    """ Creates the canonical foods of every stored conversation's favorite_foods, and links them, chunk by chunk. """
+    Conversation = apps.get_model("surveys", "Conversation")
+    ConversationFood = apps.get_model("surveys", "ConversationFood")
+    Food = apps.get_model("surveys", "Food")
+
+    def link(chunk):
+        names_by_conversation = {
+            conversation_id: {canonicalize_food(str(food)) for food in foods or [] if str(food).strip()}
+            for conversation_id, foods in chunk
+        }
+        names = set().union(*names_by_conversation.values())
+        Food.objects.bulk_create([Food(name=name) for name in sorted(names)], ignore_conflicts=True)
+        food_ids = dict(Food.objects.filter(name__in=names).values_list("name", "id"))
+        ConversationFood.objects.bulk_create(
+            [
+                ConversationFood(conversation_id=conversation_id, food_id=food_ids[name])
+                for conversation_id, conversation_names in names_by_conversation.items()
+                for name in conversation_names
+            ],
+            ignore_conflicts=True,
+        )
+
+    chunk = []
+    for row in Conversation.objects.values_list("id", "favorite_foods").iterator(chunk_size=CHUNK_SIZE):
+        chunk.append(row)
+        if len(chunk) == CHUNK_SIZE:
+            link(chunk)
+            chunk = []
+    if chunk:
+        link(chunk)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0004_foods'),
+    ]
+
+    operations = [
+        migrations.RunPython(link_existing_foods, migrations.RunPython.noop),
+    ]
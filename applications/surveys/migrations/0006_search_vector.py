@@ -0,0 +1,50 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:36
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+SEARCH_INDEX = django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='conversation_search_idx')
+
+
+def add_search_index(apps, schema_editor):
+    """ Fills the search vectors of existing conversations and indexes them, on PostgreSQL only. """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Conversation = apps.get_model('surveys', 'Conversation')
+    Conversation.objects.update(
+        search_vector=django.contrib.postgres.search.SearchVector('answer_text', config='english'),
+    )
+    schema_editor.add_index(Conversation, SEARCH_INDEX)
+
+
+def remove_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.remove_index(apps.get_model('surveys', 'Conversation'), SEARCH_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0005_link_foods'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(blank=True, editable=False, null=True),
+        ),
+        # GIN indexes only exist on PostgreSQL: the index is part of the model state everywhere,
+        # but only created in PostgreSQL databases.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name='conversation', index=SEARCH_INDEX),
+            ],
+            database_operations=[
+                migrations.RunPython(add_search_index, remove_search_index),
+            ],
+        ),
+    ]
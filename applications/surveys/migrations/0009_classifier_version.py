@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0008_classification_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='classifier_version',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
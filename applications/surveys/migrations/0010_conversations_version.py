@@ -0,0 +1,26 @@
+# Generated by Django 5.2.1 on 2026-10-18 11:59
+
+from django.db import migrations, models
+
+
+def create_version(apps, schema_editor):
+    """ Creates the single row counting conversation writes. """
+    apps.get_model("surveys", "ConversationsVersion").objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0009_classifier_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversationsVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(default=1)),
+            ],
+        ),
+        migrations.RunPython(create_version, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:40
+
+from collections import Counter
+from datetime import UTC
+from importlib import import_module
+
+from django.db import migrations
+
+
+CHUNK_SIZE = 2000
+
+
+# The frozen canonicalization of 0005_link_foods, so the rollups name foods exactly like the Food rows it created.
+canonicalize_food = import_module("applications.surveys.migrations.0005_link_foods").canonicalize_food
+
+
+def backfill_rollups(apps, schema_editor):
+    """
+    Recomputes DietDailyRollup and FoodCount from the classified conversations: the tables were created empty by
+    0003_rollups, and their food names are now canonical, like the Food rows.
+    """
+    Conversation = apps.get_model("surveys", "Conversation")
+    DietDailyRollup = apps.get_model("surveys", "DietDailyRollup")
+    FoodCount = apps.get_model("surveys", "FoodCount")
+
+    diet_counts = Counter()
+    food_counts = Counter()
+    conversations = (
+        Conversation.objects
+        .filter(diet_type__isnull=False)
+        .values_list("created_at", "diet_type", "favorite_foods")
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    for created_at, diet_type, foods in conversations:
+        day = created_at.astimezone(UTC).date()
+        diet_counts[day, diet_type] += 1
+        names = {canonicalize_food(str(food)) for food in foods or [] if str(food).strip()}
+        food_counts.update((day, diet_type, name) for name in names)
+
+    DietDailyRollup.objects.all().delete()
+    FoodCount.objects.all().delete()
+    DietDailyRollup.objects.bulk_create(
+        (DietDailyRollup(day=day, diet_type=diet, count=count) for (day, diet), count in diet_counts.items()),
+        batch_size=CHUNK_SIZE,
+    )
+    FoodCount.objects.bulk_create(
+        (FoodCount(day=day, diet_type=diet, food=food, count=count) for (day, diet, food), count in food_counts.items()),
+        batch_size=CHUNK_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('surveys', '0010_conversations_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,10 @@
 """ Module to carry the models of the surveys app. """
 import uuid
 
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 
@@ -28,3 +31,167 @@ class Conversation(models.Model):
     favorite_foods = models.JSONField(default=list, null=True, blank=True)
     diet_type = models.CharField(max_length=20, choices=DietType, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Version of the classifier (model and prompts) that produced diet_type and favorite_foods, empty if unknown;
+    # see surveys/services.py CLASSIFIER_VERSION and the reclassify_conversations command.
+    classifier_version = models.CharField(max_length=64, blank=True, default="")
+    # Canonical counterpart of favorite_foods, for indexed lookups by food; kept in sync by surveys/foods.py.
+    foods = models.ManyToManyField("Food", through="ConversationFood", related_name="conversations", blank=True)
+    # tsvector of answer_text for full-text search on PostgreSQL; empty on other databases (see surveys/search.py).
+    search_vector = SearchVectorField(null=True, blank=True, editable=False)
+    # The simulate_conversations run that produced the conversation, if any.
+    run = models.ForeignKey(
+        "SimulationRun", on_delete=models.SET_NULL, null=True, blank=True, related_name="conversations",
+    )
+
+    class Meta:
+        # pylint: disable=missing-class-docstring, too-few-public-methods
+        indexes = [
+            # Serves diet-filtered listings ordered by (created_at, id), e.g. the insights API's keyset pages.
+            models.Index(fields=["diet_type", "created_at", "id"], name="conversation_diet_created_idx"),
+            # Serves listings of classified conversations of any diet, skipping rows still awaiting a classifier.
+            models.Index(
+                fields=["created_at", "id"],
+                name="conversation_classified_idx",
+                condition=models.Q(diet_type__isnull=False),
+            ),
+            # Created on PostgreSQL only, by migration 0006.
+            GinIndex(fields=["search_vector"], name="conversation_search_idx"),
+        ]
+
+
+class SimulationRun(models.Model):
+    """
+    One `simulate_conversations` run, checkpointed so it can be resumed with `--resume <id>` after a crash or a
+    deploy instead of starting over.
+
+    `succeeded` counts the run's stored conversations and is updated in the transaction writing them; `failed`
+    counts the conversations given up on. Conversations still buffered when the process dies are in neither, so a
+    resumed run simulates exactly those again. `config` records the models, prompts and options of the run.
+    """
+    class Status(models.TextChoices):
+        """ A run stays RUNNING until all of its conversations succeeded or failed, including after a crash. """
+        RUNNING = 'running', _('Running')
+        COMPLETED = 'completed', _('Completed')
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    target_count = models.PositiveIntegerField()
+    succeeded = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=Status, default=Status.RUNNING)
+    config = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self) -> str:
+        return f"{self.id} ({self.succeeded + self.failed}/{self.target_count}, {self.status})"
+
+
+class ClassificationJob(models.Model):
+    """
+    A stored conversation waiting for the classifier workers (see surveys/jobs.py).
+
+    Jobs are PENDING until a worker claims them (RUNNING), and deleted once their conversation is classified. A
+    failed attempt puts the job back to PENDING, available again after a backoff; after too many attempts it is
+    dead-lettered (DEAD), keeping the last error, until requeued with `run_classifier_workers --requeue-dead`.
+    """
+    class Status(models.TextChoices):
+        """ RUNNING jobs whose worker died are claimed again once their lease expires. """
+        PENDING = 'pending', _('Pending')
+        RUNNING = 'running', _('Running')
+        DEAD = 'dead', _('Dead')
+
+    conversation = models.OneToOneField(Conversation, on_delete=models.CASCADE, related_name="classification_job")
+    status = models.CharField(max_length=20, choices=Status, default=Status.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=255, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # pylint: disable=missing-class-docstring, too-few-public-methods
+        indexes = [
+            # Serves the workers' claim query: the oldest available jobs of a status.
+            models.Index(fields=["status", "available_at"], name="classification_job_claim_idx"),
+        ]
+
+
+class Food(models.Model):
+    """
+    A food named in favorite foods, stored once under its canonical name: lowercased, with single spaces and each
+    word singularized ("Roasted  Chickpeas" -> "roasted chickpea").
+    """
+    name = models.CharField(max_length=255, unique=True)
+
+    def __str__(self) -> str:
+        return str(self.name)
+
+
+class ConversationFood(models.Model):
+    """ Links a conversation to each canonical food among its favorite foods. """
+    # Both foreign keys are covered by the composite indexes below, so they get no index of their own.
+    conversation = models.ForeignKey(
+        Conversation, on_delete=models.CASCADE, related_name="conversation_foods", db_index=False,
+    )
+    food = models.ForeignKey(Food, on_delete=models.CASCADE, related_name="conversation_foods", db_index=False)
+
+    class Meta:
+        # pylint: disable=missing-class-docstring, too-few-public-methods
+        constraints = [
+            models.UniqueConstraint(fields=["conversation", "food"], name="conversation_food_unique"),
+        ]
+        indexes = [
+            # Serves "conversations mentioning a food"; the unique constraint serves the other direction.
+            models.Index(fields=["food", "conversation"], name="conversation_food_food_idx"),
+        ]
+
+
+class DietDailyRollup(models.Model):
+    """
+    Number of classified conversations per diet type and day (UTC) of creation.
+
+    Maintained incrementally whenever conversations are classified (see surveys/rollups.py), so aggregate insights
+    read a few rows per day instead of scanning the conversations. Rebuild with `manage.py rebuild_rollups`.
+    """
+    day = models.DateField()
+    diet_type = models.CharField(max_length=20, choices=Conversation.DietType)
+    count = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        # pylint: disable=missing-class-docstring, too-few-public-methods
+        constraints = [
+            models.UniqueConstraint(fields=["day", "diet_type"], name="diet_daily_rollup_unique"),
+        ]
+
+
+class FoodCount(models.Model):
+    """
+    Number of classified conversations naming a food, per diet type and day (UTC) of creation.
+    Food names are stored canonical, like Food names (see surveys/foods.py); maintained like DietDailyRollup.
+    """
+    day = models.DateField()
+    diet_type = models.CharField(max_length=20, choices=Conversation.DietType)
+    food = models.CharField(max_length=255)
+    count = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        # pylint: disable=missing-class-docstring, too-few-public-methods
+        constraints = [
+            models.UniqueConstraint(fields=["day", "diet_type", "food"], name="food_count_unique"),
+        ]
+        indexes = [
+            models.Index(fields=["diet_type", "day"], name="food_count_diet_day_idx"),
+        ]
+
+
+class ConversationsVersion(models.Model):
+    """
+    Single row (pk=1) whose version is incremented by every write to the conversations, in the same transaction: once
+    per bulk write of the surveys services, once per row saved or deleted otherwise (see surveys/signals.py).
+
+    Insights ETags include it, so classifications made by any process invalidate them, whatever cache that process
+    uses. Writers serialize on this row until they commit, which their bulk writes can afford.
+    """
+    version = models.PositiveBigIntegerField(default=1)
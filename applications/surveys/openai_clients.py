@@ -0,0 +1,127 @@
+"""
+Shared OpenAI clients, configured from settings.
+
+Every OpenAI call in the project goes through get_client or get_async_client, so concurrent conversations, workers
+and commands reuse the same pooled keep-alive connections instead of paying a TCP and TLS handshake per request.
+The pool size, keep-alive expiry, HTTP/2 and the connect and read timeouts come from the OPENAI_* settings.
+
+The sync client is shared by all threads of a process; a forked process builds its own, since sockets must not be
+shared across processes. The async client is shared by all tasks of an event loop; each loop gets its own, since
+connections opened on one loop cannot be used from another.
+
+The clients call OPENAI_BASE_URL, or the official API when it is unset; configure_clients points them elsewhere at
+runtime, e.g. at a local fake server for load tests. Every response they receive passes its `x-ratelimit-*` headers
+to the rate limiter of its model (see surveys/rate_limiting.py).
+"""
+import asyncio
+import importlib.util
+import os
+import threading
+import weakref
+
+import httpx
+from django.conf import settings
+from openai import (
+    AsyncOpenAI,
+    DefaultAsyncHttpxClient,
+    DefaultHttpxClient,
+    OpenAI,
+)
+
+from applications.logging import get_logger
+from applications.surveys.rate_limiting import (
+    aupdate_from_response,
+    update_from_response,
+)
+
+
+logger = get_logger(__name__)
+
+_lock = threading.Lock()
+_client: tuple[int, OpenAI] | None = None
+_async_clients: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI] = weakref.WeakKeyDictionary()
+_base_url: str | None = None
+
+
+def http2_enabled() -> bool:
+    """ Returns whether to negotiate HTTP/2: when OPENAI_HTTP2 is set, and the optional h2 package is installed. """
+    if not settings.OPENAI_HTTP2:
+        return False
+    if importlib.util.find_spec("h2") is None:
+        logger.warning("OPENAI_HTTP2 is set but the h2 package is not installed; falling back to HTTP/1.1")
+        return False
+    return True
+
+
+def get_http_options() -> dict:
+    """ Returns the httpx client options built from settings: connection limits, timeouts and HTTP/2. """
+    return {
+        "limits": httpx.Limits(
+            max_connections=settings.OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.OPENAI_KEEPALIVE_EXPIRY,
+        ),
+        "timeout": httpx.Timeout(settings.OPENAI_READ_TIMEOUT, connect=settings.OPENAI_CONNECT_TIMEOUT),
+        "http2": http2_enabled(),
+    }
+
+
+def get_client_options() -> dict:
+    """ Returns the OpenAI client options built from settings. """
+    return {
+        "api_key": settings.OPENAI_API_KEY,
+        "base_url": _base_url or settings.OPENAI_BASE_URL,
+        # Retries are owned by the rate limiter, which shares backoff state across all concurrent calls.
+        "max_retries": 0,
+        "timeout": httpx.Timeout(settings.OPENAI_READ_TIMEOUT, connect=settings.OPENAI_CONNECT_TIMEOUT),
+    }
+
+
+def get_client() -> OpenAI:
+    """ Returns the process's shared sync OpenAI client, building it on first use. """
+    global _client  # pylint: disable=global-statement
+    pid = os.getpid()
+    with _lock:
+        if _client is None or _client[0] != pid:
+            http_client = DefaultHttpxClient(**get_http_options(), event_hooks={"response": [update_from_response]})
+            _client = (pid, OpenAI(**get_client_options(), http_client=http_client))
+        return _client[1]
+
+
+def get_async_client() -> AsyncOpenAI:
+    """
+    Returns the running event loop's shared async OpenAI client, building it on first use.
+
+    Raises:
+        RuntimeError: If no event loop is running
+    """
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _async_clients.get(loop)
+        if client is None:
+            http_client = DefaultAsyncHttpxClient(
+                **get_http_options(), event_hooks={"response": [aupdate_from_response]},
+            )
+            client = AsyncOpenAI(**get_client_options(), http_client=http_client)
+            _async_clients[loop] = client
+        return client
+
+
+def reset_clients() -> None:
+    """ Drops the shared clients, so the next calls build new ones, e.g. after the settings changed. """
+    global _client  # pylint: disable=global-statement
+    with _lock:
+        client, _client = _client, None
+        _async_clients.clear()
+    if client is not None and client[0] == os.getpid():
+        client[1].close()
+
+
+def configure_clients(base_url: str | None = None) -> None:
+    """
+    Points the clients built from now on at `base_url` instead of OPENAI_BASE_URL, and drops the shared ones.
+    Without a base URL, goes back to OPENAI_BASE_URL.
+    """
+    global _base_url  # pylint: disable=global-statement
+    _base_url = base_url
+    reset_clients()
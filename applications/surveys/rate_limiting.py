@@ -0,0 +1,342 @@
+"""
+Client-side rate limiting for OpenAI calls.
+
+Each model gets a limiter made of two token buckets, one for requests and one for tokens per minute, shared by
+every thread and task in the process. Calls reserve capacity before they are sent, so large runs go as fast as
+the quota allows instead of running into 429s; calls failing before they reach OpenAI give their reservation back.
+The limiter adopts the `x-ratelimit-*` headers of every OpenAI response, successful or not, through the response
+hooks the shared clients install (see surveys/openai_clients.py). When OpenAI answers with a retryable error, the
+limiter pauses all callers for `Retry-After` when given, and retries with jittered exponential backoff.
+"""
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Mapping,
+    TypeVar,
+)
+
+import httpx
+from openai import (
+    APIConnectionError,
+    APIStatusError,
+    APITimeoutError,
+    InternalServerError,
+    RateLimitError,
+)
+
+from applications.constants import (
+    DEFAULT_RATE_LIMIT,
+    MODEL_RATE_LIMITS,
+    OPENAI_BACKOFF_BASE_SECONDS,
+    OPENAI_BACKOFF_MAX_SECONDS,
+    OPENAI_MAX_RETRIES,
+)
+from applications.logging import get_logger
+from applications.metrics import OPENAI_RETRIES
+
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+# APITimeoutError is a subclass of APIConnectionError, so timeouts are retried as well.
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, InternalServerError)
+
+# Rough characters-per-token ratio and completion allowance used to reserve tokens before a call is sent.
+CHARS_PER_TOKEN = 4
+COMPLETION_TOKENS_ALLOWANCE = 100
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+
+
+def parse_reset_duration(value: str | None) -> float | None:
+    """
+    Parses the duration format of OpenAI's `x-ratelimit-reset-*` headers into seconds.
+
+    Example:
+        # >>> parse_reset_duration("6m0.5s")
+        # 360.5
+    """
+    if not value:
+        return None
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def parse_retry_after(headers: Mapping[str, str]) -> float | None:
+    """ Returns the server-requested wait in seconds from `retry-after-ms` or `retry-after`, if any. """
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            return None
+    return None
+
+
+def estimate_tokens(messages: list[dict]) -> int:
+    """ Cheap upper-bound estimate of the tokens a chat completion will consume, used for reservations. """
+    prompt_chars = sum(len(message.get("content") or "") for message in messages)
+    return prompt_chars // CHARS_PER_TOKEN + COMPLETION_TOKENS_ALLOWANCE
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at `capacity` units per minute.
+
+    Reservations may drive the balance negative: the caller is told how long to wait until its reservation is
+    covered, which keeps the ordering fair between concurrent callers without a queue.
+    """
+
+    def __init__(self, per_minute: int, clock: Callable[[], float] = time.monotonic):
+        self.capacity = float(per_minute)
+        self.available = float(per_minute)
+        self._clock = clock
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+
+    @property
+    def refill_rate(self) -> float:
+        """ Units regained per second. """
+        return self.capacity / 60
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self.available = min(self.capacity, self.available + (now - self._updated_at) * self.refill_rate)
+        self._updated_at = now
+
+    def reserve(self, amount: float) -> float:
+        """ Takes `amount` units from the bucket and returns the seconds to wait before using them. """
+        with self._lock:
+            self._refill()
+            self.available -= amount
+            if self.available >= 0:
+                return 0.0
+            return -self.available / self.refill_rate
+
+    def adjust(self, amount: float) -> None:
+        """ Gives back (positive) or takes (negative) units, e.g. to reconcile a reservation with actual usage. """
+        with self._lock:
+            self._refill()
+            self.available = min(self.capacity, self.available + amount)
+
+    def sync(self, limit: int | None, remaining: int | None, reset_seconds: float | None) -> None:
+        """
+        Adopts the server's view of the quota: the limit becomes the capacity, and the balance never stays
+        above what the server reports as remaining. When the server's window resets later than our refill
+        rate would suggest, the balance is lowered further so it reaches `remaining` only after the reset.
+        """
+        with self._lock:
+            self._refill()
+            if limit:
+                self.capacity = float(limit)
+            if remaining is not None:
+                self.available = min(self.available, float(remaining))
+                if reset_seconds and remaining <= 0:
+                    self.available = min(self.available, -reset_seconds * self.refill_rate)
+
+
+class ModelRateLimiter:
+    """ Requests-per-minute and tokens-per-minute buckets for one model, plus a shared cooldown. """
+
+    def __init__(
+        self,
+        requests_per_minute: int,
+        tokens_per_minute: int,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.requests = TokenBucket(requests_per_minute, clock)
+        self.tokens = TokenBucket(tokens_per_minute, clock)
+        self._clock = clock
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: int) -> float:
+        """ Reserves one request and `tokens` tokens and returns the seconds to wait before sending. """
+        request_wait = self.requests.reserve(1)
+        token_wait = self.tokens.reserve(tokens)
+        with self._lock:
+            cooldown = max(0.0, self._paused_until - self._clock())
+        return max(request_wait, token_wait, cooldown)
+
+    def acquire(self, tokens: int) -> None:
+        """ Blocks the current thread until the reservation is covered. """
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: int) -> None:
+        """ Suspends the current task until the reservation is covered. """
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def release(self, tokens: int) -> None:
+        """ Gives back a reservation of one request and `tokens` tokens that OpenAI never received. """
+        self.requests.adjust(1)
+        self.tokens.adjust(tokens)
+
+    def pause(self, seconds: float) -> None:
+        """ Holds back every caller of this model for `seconds`, e.g. after a 429 with Retry-After. """
+        with self._lock:
+            self._paused_until = max(self._paused_until, self._clock() + seconds)
+
+    def record_usage(self, response: Any, reserved_tokens: int) -> None:
+        """ Reconciles the token reservation with the `usage` reported in a chat completion response. """
+        total_tokens = getattr(getattr(response, "usage", None), "total_tokens", None)
+        if isinstance(total_tokens, int):
+            self.tokens.adjust(reserved_tokens - total_tokens)
+
+    def update_from_headers(self, headers: Mapping[str, str]) -> None:
+        """ Adopts the `x-ratelimit-*` headers OpenAI sends with its responses. """
+        for kind, bucket in (("requests", self.requests), ("tokens", self.tokens)):
+            bucket.sync(
+                limit=_parse_int(headers.get(f"x-ratelimit-limit-{kind}")),
+                remaining=_parse_int(headers.get(f"x-ratelimit-remaining-{kind}")),
+                reset_seconds=parse_reset_duration(headers.get(f"x-ratelimit-reset-{kind}")),
+            )
+
+    def backoff_delay(self, error: Exception, attempt: int) -> float:
+        """
+        Returns how long to wait before retrying after `error` on the given (zero-based) attempt.
+
+        Honors Retry-After when the server sends it, pausing every caller of the model for that long.
+        Otherwise, uses exponential backoff with full jitter.
+        """
+        if isinstance(error, APIStatusError):
+            headers = error.response.headers
+            self.update_from_headers(headers)
+            retry_after = parse_retry_after(headers)
+            if retry_after is not None:
+                self.pause(retry_after)
+                return retry_after
+        ceiling = min(OPENAI_BACKOFF_MAX_SECONDS, OPENAI_BACKOFF_BASE_SECONDS * 2 ** attempt)
+        return random.uniform(0, ceiling)
+
+
+def reached_openai(error: Exception) -> bool:
+    """
+    Whether the request of a failed call may have counted against the quota: OpenAI answered it, or the client
+    gave up waiting for the answer. Other connection errors mean it was never received.
+    """
+    return isinstance(error, (APIStatusError, APITimeoutError))
+
+
+def _parse_int(value: str | None) -> int | None:
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+_limiters: dict[str, ModelRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(model: str) -> ModelRateLimiter:
+    """ Returns the process-wide limiter for `model`, creating it from MODEL_RATE_LIMITS on first use. """
+    with _limiters_lock:
+        if model not in _limiters:
+            limits = MODEL_RATE_LIMITS.get(model, DEFAULT_RATE_LIMIT)
+            _limiters[model] = ModelRateLimiter(limits["requests_per_minute"], limits["tokens_per_minute"])
+        return _limiters[model]
+
+
+def reset_rate_limiters() -> None:
+    """ Drops all limiters, so the next calls start with full buckets. """
+    with _limiters_lock:
+        _limiters.clear()
+
+
+def update_from_response(response: httpx.Response) -> None:
+    """
+    httpx response hook: passes the `x-ratelimit-*` headers of an OpenAI response to the limiter of the model named
+    in its request. Responses without such headers, or to requests without a model, are ignored.
+    """
+    if not any(f"x-ratelimit-remaining-{kind}" in response.headers for kind in ("requests", "tokens")):
+        return
+    try:
+        model = json.loads(response.request.content)["model"]
+    except (ValueError, KeyError, TypeError, httpx.RequestNotRead):
+        return
+    get_rate_limiter(model).update_from_headers(response.headers)
+
+
+async def aupdate_from_response(response: httpx.Response) -> None:
+    """ Async counterpart of update_from_response, for the async clients' response hooks. """
+    update_from_response(response)
+
+
+def call_with_rate_limit(model_name: str, estimated_tokens: int, func: Callable[..., T], /, *args, **kwargs) -> T:
+    """
+    Calls `func(*args, **kwargs)` within the rate limits of `model_name`, retrying retryable OpenAI errors.
+
+    Raises:
+        The last error once OPENAI_MAX_RETRIES retries are exhausted, and non-retryable errors immediately.
+    """
+    limiter = get_rate_limiter(model_name)
+    attempt = 0
+    while True:
+        limiter.acquire(estimated_tokens)
+        try:
+            response = func(*args, **kwargs)
+        except RETRYABLE_ERRORS as error:
+            if not reached_openai(error):
+                limiter.release(estimated_tokens)
+            if attempt >= OPENAI_MAX_RETRIES:
+                raise
+            delay = limiter.backoff_delay(error, attempt)
+            attempt += 1
+            OPENAI_RETRIES.labels(model=model_name, error=type(error).__name__).inc()
+            logger.warning("Retrying %s call in %.2fs (attempt %d): %s", model_name, delay, attempt, error)
+            time.sleep(delay)
+            continue
+        limiter.record_usage(response, estimated_tokens)
+        return response
+
+
+async def acall_with_rate_limit(
+    model_name: str,
+    estimated_tokens: int,
+    func: Callable[..., Awaitable[T]],
+    /,
+    *args,
+    **kwargs,
+) -> T:
+    """ Async counterpart of call_with_rate_limit. """
+    limiter = get_rate_limiter(model_name)
+    attempt = 0
+    while True:
+        await limiter.aacquire(estimated_tokens)
+        try:
+            response = await func(*args, **kwargs)
+        except RETRYABLE_ERRORS as error:
+            if not reached_openai(error):
+                limiter.release(estimated_tokens)
+            if attempt >= OPENAI_MAX_RETRIES:
+                raise
+            delay = limiter.backoff_delay(error, attempt)
+            attempt += 1
+            OPENAI_RETRIES.labels(model=model_name, error=type(error).__name__).inc()
+            logger.warning("Retrying %s call in %.2fs (attempt %d): %s", model_name, delay, attempt, error)
+            await asyncio.sleep(delay)
+            continue
+        limiter.record_usage(response, estimated_tokens)
+        return response
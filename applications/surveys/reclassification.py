@@ -0,0 +1,148 @@
+"""
+Reclassification of stored conversations: those left unclassified, and those classified by another classifier
+version, i.e. another CLASSIFIER_GPT_MODEL, prompt or local classifier lexicon (see CLASSIFIER_VERSION in
+surveys/services.py).
+
+Target rows are read in keyset batches ordered by (created_at, id): each batch is an index range scan starting right
+after the previous one, so no OFFSET is paid and rows that leave the selection once reclassified never shift the
+next batch. The answers of a batch are classified by concurrent batched classifier requests, and the results
+written with one bulk UPDATE by save_reclassifications, which also keeps the rollups and food links in sync.
+"""
+import asyncio
+import json
+from collections import Counter
+from datetime import date
+
+from asgiref.sync import sync_to_async
+from django.db.models import (
+    Q,
+    QuerySet,
+)
+from openai import OpenAIError
+
+from applications.constants import (
+    BATCH_CLASSIFIER_PROMPT,
+    CLASSIFIER_GPT_MODEL,
+    DEFAULT_CLASSIFY_BATCH_SIZE,
+    RECLASSIFY_BATCH_SIZE,
+)
+from applications.logging import get_logger
+from applications.surveys.models import Conversation
+from applications.surveys.services import (
+    CLASSIFIER_VERSION,
+    aclassify_diets_with_fallback,
+    filter_by_created_at,
+    save_reclassifications,
+)
+
+
+logger = get_logger(__name__)
+
+
+def select_conversations(  # pylint: disable=too-many-arguments
+    *,
+    unclassified: bool = False,
+    stale: bool = False,
+    version: str | None = None,
+    since: date | None = None,
+    until: date | None = None,
+) -> QuerySet[Conversation]:
+    """
+    Selects conversations to reclassify: the union of the unclassified ones, the `stale` ones (classified by another
+    version than CLASSIFIER_VERSION, or by an unknown one), and those classified by `version`, narrowed to the ones
+    created from the start of `since` to the end of `until` (UTC).
+
+    Raises:
+        ValueError: If no selection is given
+    """
+    selection = Q()
+    if unclassified:
+        selection |= Q(diet_type__isnull=True)
+    if stale:
+        selection |= Q(diet_type__isnull=False) & ~Q(classifier_version=CLASSIFIER_VERSION)
+    if version is not None:
+        selection |= Q(diet_type__isnull=False, classifier_version=version)
+    if not selection:
+        raise ValueError("Select unclassified, stale or version conversations to reclassify")
+
+    return filter_by_created_at(Conversation.objects.filter(selection), since, until)
+
+
+def fetch_batch(
+    conversations: QuerySet[Conversation],
+    after: Conversation | None,
+    batch_size: int,
+) -> list[Conversation]:
+    """ Returns the next `batch_size` conversations in (created_at, id) order, after the conversation `after`. """
+    batch = conversations.order_by("created_at", "id").only(
+        "id", "created_at", "answer_text", "diet_type", "favorite_foods",
+    )
+    if after is not None:
+        batch = batch.filter(
+            Q(created_at__gt=after.created_at) | Q(created_at=after.created_at, id__gt=after.id)
+        )
+    return list(batch[:batch_size])
+
+
+async def aclassify_answers(
+    answers: list[str],
+    classify_batch_size: int,
+    semaphore: asyncio.Semaphore,
+) -> list[dict | None]:
+    """
+    Classifies answers with one batched classifier request per `classify_batch_size` answers, as many in flight as
+    the semaphore allows. Returns the results aligned with `answers`; None for answers that failed, including
+    all answers of a request that failed after its retries.
+    """
+    async def classify_chunk(chunk: list[str]) -> list[dict | None]:
+        async with semaphore:
+            try:
+                return await aclassify_diets_with_fallback(CLASSIFIER_GPT_MODEL, BATCH_CLASSIFIER_PROMPT, chunk)
+            except (OpenAIError, json.JSONDecodeError, ValueError) as e:
+                logger.warning("Reclassification request failed for %d answers: %s", len(chunk), e)
+                return [None] * len(chunk)
+
+    size = max(1, classify_batch_size)
+    chunks = await asyncio.gather(*(
+        classify_chunk(answers[start:start + size]) for start in range(0, len(answers), size)
+    ))
+    return [result for chunk in chunks for result in chunk]
+
+
+async def areclassify_conversations(
+    conversations: QuerySet[Conversation],
+    batch_size: int = RECLASSIFY_BATCH_SIZE,
+    classify_batch_size: int = DEFAULT_CLASSIFY_BATCH_SIZE,
+    concurrency: int = 1,
+) -> Counter:
+    """
+    Reclassifies the conversations batch by batch. Conversations whose classification fails keep their current
+    one, and are counted as failed.
+
+    Returns:
+        Counts of conversations "reclassified" (of which "changed" got another diet or foods) and "failed".
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    totals: Counter = Counter(reclassified=0, changed=0, failed=0)
+    after = None
+    while batch := await sync_to_async(fetch_batch)(conversations, after, batch_size):
+        after = batch[-1]
+        results = await aclassify_answers(
+            [conversation.answer_text for conversation in batch], classify_batch_size, semaphore,
+        )
+        succeeded = {
+            conversation.pk: result for conversation, result in zip(batch, results) if result is not None
+        }
+        if succeeded:
+            await sync_to_async(save_reclassifications)(succeeded)
+        totals["reclassified"] += len(succeeded)
+        totals["failed"] += len(batch) - len(succeeded)
+        totals["changed"] += sum(
+            1 for conversation in batch
+            if conversation.pk in succeeded and (
+                succeeded[conversation.pk]["diet"] != conversation.diet_type
+                or succeeded[conversation.pk]["foods"] != conversation.favorite_foods
+            )
+        )
+        logger.info("Reclassified up to %s: %s", after.created_at, dict(totals))
+    return totals
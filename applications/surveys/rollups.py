@@ -0,0 +1,148 @@
+"""
+Incrementally maintained rollups of classified conversations: DietDailyRollup and FoodCount.
+
+Every write that classifies conversations (save_conversations for conversations classified before they are stored,
+save_classifications for stored ones classified later) calls record_classifications in the same transaction. It
+adds the new conversations to the per-day counters with one upsert per table,
+
+    INSERT ... ON CONFLICT (...) DO UPDATE SET count = count + excluded.count
+
+which PostgreSQL and SQLite both support, so concurrent writers never lose increments. Callers must only pass
+conversations that were not counted before, i.e. newly classified ones; conversations whose classification is
+replaced are first subtracted with retract_classifications.
+
+rebuild_rollups recomputes both tables from the conversations, for backfills and after bulk edits.
+"""
+from collections import Counter
+from datetime import (
+    UTC,
+    date,
+)
+from typing import Iterable
+
+from django.db import (
+    connection,
+    transaction,
+)
+from django.db.models import Model
+
+from applications.constants import STREAM_CHUNK_SIZE
+from applications.logging import get_logger
+from applications.surveys.foods import canonical_foods
+from applications.surveys.models import (
+    Conversation,
+    DietDailyRollup,
+    FoodCount,
+)
+
+
+logger = get_logger(__name__)
+
+
+def count_classifications(conversations: Iterable[Conversation]) -> tuple[Counter, Counter]:
+    """
+    Counts classified conversations per (day, diet type), and per (day, diet type, food).
+    Unclassified conversations are skipped, and foods are counted under their canonical names, like the Food rows, a
+    food named twice in one conversation counting once.
+    """
+    diet_counts: Counter[tuple[date, str]] = Counter()
+    food_counts: Counter[tuple[date, str, str]] = Counter()
+    for conversation in conversations:
+        if not conversation.diet_type:
+            continue
+        day = conversation.created_at.astimezone(UTC).date()
+        diet_counts[day, conversation.diet_type] += 1
+        foods = canonical_foods(conversation.favorite_foods or [])
+        food_counts.update((day, conversation.diet_type, food) for food in foods)
+    return diet_counts, food_counts
+
+
+def record_classifications(conversations: Iterable[Conversation]) -> None:
+    """ Adds newly classified, already stored conversations to the rollups. """
+    diet_counts, food_counts = count_classifications(conversations)
+    with transaction.atomic(savepoint=False):
+        _increment(DietDailyRollup, ["day", "diet_type"], diet_counts)
+        _increment(FoodCount, ["day", "diet_type", "food"], food_counts)
+
+
+def retract_classifications(conversations: Iterable[Conversation]) -> None:
+    """
+    Subtracts stored conversations from the rollups, before their classification is replaced. Counters never go
+    below zero, even for conversations the rollups missed, and rows reaching zero are deleted, so replaced foods do
+    not linger in top foods lists.
+    """
+    diet_counts, food_counts = count_classifications(conversations)
+    with transaction.atomic(savepoint=False):
+        _decrement(DietDailyRollup, ["day", "diet_type"], diet_counts)
+        _decrement(FoodCount, ["day", "diet_type", "food"], food_counts)
+
+
+def rebuild_rollups(chunk_size: int = STREAM_CHUNK_SIZE) -> tuple[int, int]:
+    """
+    Recomputes the rollups from all classified conversations, replacing their current content in one transaction.
+
+    Returns:
+        The number of DietDailyRollup and FoodCount rows written.
+    """
+    conversations = (
+        Conversation.objects
+        .filter(diet_type__isnull=False)
+        .only("created_at", "diet_type", "favorite_foods")
+        .iterator(chunk_size=chunk_size)
+    )
+    diet_counts, food_counts = count_classifications(conversations)
+
+    with transaction.atomic():
+        DietDailyRollup.objects.all().delete()
+        FoodCount.objects.all().delete()
+        DietDailyRollup.objects.bulk_create(
+            (DietDailyRollup(day=day, diet_type=diet, count=count) for (day, diet), count in diet_counts.items()),
+            batch_size=chunk_size,
+        )
+        FoodCount.objects.bulk_create(
+            (
+                FoodCount(day=day, diet_type=diet, food=food, count=count)
+                for (day, diet, food), count in food_counts.items()
+            ),
+            batch_size=chunk_size,
+        )
+    logger.info("Rebuilt rollups: %d diet rows, %d food rows", len(diet_counts), len(food_counts))
+    return len(diet_counts), len(food_counts)
+
+
+def _increment(model: type[Model], key_fields: list[str], counts: Counter) -> None:
+    """ Adds `counts` to the rows of `model` with the given keys, creating missing rows, with one upsert. """
+    if not counts:
+        return
+
+    table = connection.ops.quote_name(model._meta.db_table)  # pylint: disable=protected-access
+    columns = ", ".join(key_fields)
+    placeholders = ", ".join(["%s"] * (len(key_fields) + 1))
+    sql = (
+        f"INSERT INTO {table} ({columns}, count) VALUES ({placeholders}) "
+        f"ON CONFLICT ({columns}) DO UPDATE SET count = {table}.count + excluded.count"
+    )
+    # Sorted keys make concurrent writers lock rows in the same order, avoiding deadlocks.
+    rows = [
+        (connection.ops.adapt_datefield_value(day), *rest, count)
+        for (day, *rest), count in sorted(counts.items())
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def _decrement(model: type[Model], key_fields: list[str], counts: Counter) -> None:
+    """ Subtracts `counts` from the rows of `model` with the given keys, down to zero, and drops empty rows. """
+    if not counts:
+        return
+
+    table = connection.ops.quote_name(model._meta.db_table)  # pylint: disable=protected-access
+    conditions = " AND ".join(f"{field} = %s" for field in key_fields)
+    sql = f"UPDATE {table} SET count = CASE WHEN count > %s THEN count - %s ELSE 0 END WHERE {conditions}"
+    rows = [
+        (count, count, connection.ops.adapt_datefield_value(day), *rest)
+        for (day, *rest), count in sorted(counts.items())
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+    model.objects.filter(day__in={day for day, *_ in counts}, count=0).delete()
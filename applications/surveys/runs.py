@@ -0,0 +1,118 @@
+"""
+Checkpoints of simulate_conversations runs, so an interrupted run can be resumed without redoing paid API calls.
+
+A run is a SimulationRun row. ConversationWriter tags every conversation it writes with the run and, in the same
+transaction, adds the batch to the run's `succeeded` counter; failed conversations are added to `failed` as soon as
+they are given up on. A resumed run therefore only simulates the conversations that are in neither counter.
+
+Runs through the OpenAI Batch API (surveys/batch_api.py) tag their conversations the same way, but are resumed from
+their batches with `--resume-batch`, and settled from their stored conversations once every batch has ended.
+"""
+import uuid
+
+from django.db.models import F
+from django.utils import timezone
+
+from applications.constants import (
+    BATCH_CLASSIFIER_PROMPT,
+    CLASSIFIER_GPT_MODEL,
+    CLASSIFIER_PROMPT,
+    QUESTION,
+    RESPONDENT_GPT_MODEL,
+    RESPONDENT_PROMPT,
+)
+from applications.logging import get_logger
+from applications.surveys.models import SimulationRun
+
+
+logger = get_logger(__name__)
+
+# Settings that change what a run's conversations look like; a run is only resumed with the same values.
+GENERATION_CONFIG = {
+    "question": QUESTION,
+    "respondent_model": RESPONDENT_GPT_MODEL,
+    "respondent_prompt": RESPONDENT_PROMPT,
+    "classifier_model": CLASSIFIER_GPT_MODEL,
+    "classifier_prompt": CLASSIFIER_PROMPT,
+    "batch_classifier_prompt": BATCH_CLASSIFIER_PROMPT,
+}
+
+
+def start_run(target_count: int, options: dict | None = None) -> SimulationRun:
+    """ Records a new run of `target_count` conversations, with the generation config and the command's options. """
+    return SimulationRun.objects.create(target_count=target_count, config={**GENERATION_CONFIG, **(options or {})})
+
+
+def resume_run(run_id: str) -> SimulationRun:
+    """
+    Loads a run to resume it. Its `succeeded` counter is resynced with its stored conversations first, in case some
+    were deleted since.
+
+    Raises:
+        ValueError: If the run does not exist, is already completed, goes through the OpenAI Batch API, or was started
+            with other models or prompts
+    """
+    try:
+        run = SimulationRun.objects.get(pk=uuid.UUID(str(run_id)))
+    except (ValueError, SimulationRun.DoesNotExist) as e:
+        raise ValueError(f"No simulation run with ID {run_id}") from e
+
+    if run.status == SimulationRun.Status.COMPLETED:
+        raise ValueError(f"Simulation run {run.id} is already completed")
+    if run.config.get("openai_batch"):
+        raise ValueError(f"Simulation run {run.id} goes through the OpenAI Batch API; resume it with --resume-batch")
+
+    changed = sorted(key for key, value in GENERATION_CONFIG.items() if run.config.get(key, value) != value)
+    if changed:
+        raise ValueError(f"Simulation run {run.id} was started with a different {', '.join(changed)}")
+
+    stored = run.conversations.count()
+    if stored != run.succeeded:
+        logger.warning("Simulation run %s counted %d conversations but has %d", run.id, run.succeeded, stored)
+        SimulationRun.objects.filter(pk=run.pk).update(succeeded=stored, updated_at=timezone.now())
+        run.succeeded = stored
+    return run
+
+
+def remaining_count(run: SimulationRun) -> int:
+    """ Returns the number of conversations the run has yet to simulate. """
+    return max(0, run.target_count - run.succeeded - run.failed)
+
+
+def record_progress(run: SimulationRun, succeeded: int = 0, failed: int = 0) -> None:
+    """
+    Adds to the run's counters with one atomic UPDATE, which is safe from concurrent writers. Call it in the
+    transaction writing the succeeded conversations, so the checkpoint commits with them.
+    """
+    SimulationRun.objects.filter(pk=run.pk).update(
+        succeeded=F("succeeded") + succeeded,
+        failed=F("failed") + failed,
+        updated_at=timezone.now(),
+    )
+
+
+def finish_run(run: SimulationRun) -> SimulationRun:
+    """
+    Reloads the run's counters and marks it completed once every conversation succeeded or failed. Returns the
+    reloaded run.
+    """
+    run.refresh_from_db()
+    if run.status == SimulationRun.Status.RUNNING and not remaining_count(run):
+        run.status = SimulationRun.Status.COMPLETED
+        run.finished_at = timezone.now()
+        run.save(update_fields=["status", "finished_at", "updated_at"])
+    return run
+
+
+def settle_run(run: SimulationRun) -> SimulationRun:
+    """
+    Sets the counters of a run none of whose requests is pending anymore from its stored conversations: the
+    conversations it did not store failed. Idempotent, unlike record_progress. Returns the reloaded, completed run.
+    """
+    stored = run.conversations.count()
+    SimulationRun.objects.filter(pk=run.pk).update(
+        succeeded=stored,
+        failed=max(run.target_count - stored, 0),
+        updated_at=timezone.now(),
+    )
+    return finish_run(run)
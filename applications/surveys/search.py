@@ -0,0 +1,53 @@
+"""
+Full-text search over conversations' answers.
+
+On PostgreSQL, each conversation stores the tsvector of its answer_text in `search_vector`, covered by a GIN
+index, and queries are matched against it with websearch syntax ("tofu -kale", "\"ice cream\"", "tofu or tempeh").
+save_conversations fills the vector of new conversations in the same transaction, and the admin refreshes it when
+an answer is edited.
+
+Other databases, such as the SQLite used by local tests, have no tsvector type: the column stays empty and search
+falls back to a case-insensitive substring match of every word of the query.
+"""
+from typing import Iterable
+
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchVector,
+)
+from django.db import connection
+from django.db.models import QuerySet
+
+from applications.surveys.models import Conversation
+
+
+# Text search configuration used to build and query the vectors; must match the one in migration 0006.
+SEARCH_CONFIG = "english"
+
+
+def supports_full_text_search() -> bool:
+    """ Whether the database has native full-text search (PostgreSQL), rather than the substring fallback. """
+    return connection.vendor == "postgresql"
+
+
+def update_search_vectors(conversation_ids: Iterable) -> None:
+    """ Recomputes the search vectors of the given conversations in the database; a no-op without full-text search. """
+    ids = list(conversation_ids)
+    if not ids or not supports_full_text_search():
+        return
+    Conversation.objects.filter(pk__in=ids).update(search_vector=SearchVector("answer_text", config=SEARCH_CONFIG))
+
+
+def search_conversations(conversations: QuerySet[Conversation], query: str) -> QuerySet[Conversation]:
+    """ Keeps the conversations whose answer matches the search query; a blank query keeps them all. """
+    if not query.strip():
+        return conversations
+
+    if supports_full_text_search():
+        return conversations.filter(
+            search_vector=SearchQuery(query, config=SEARCH_CONFIG, search_type="websearch")
+        )
+
+    for word in query.split():
+        conversations = conversations.filter(answer_text__icontains=word)
+    return conversations
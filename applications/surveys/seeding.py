@@ -0,0 +1,111 @@
+"""
+Fast generation of fake classified conversations, e.g. to load-test the insights API (see benchmarks/).
+
+Rows are written with bulk INSERTs and no API call, then linked to their canonical foods; the rollups are rebuilt
+once at the end rather than per batch. created_at is spread over the last `days` days; as auto_now_add overwrites
+it on insert, each batch restores it with a bulk UPDATE right after.
+"""
+import random
+from datetime import timedelta
+from typing import Iterator
+
+from django.db import transaction
+from django.utils import timezone
+
+from applications.constants import (
+    QUESTION,
+    SEED_BATCH_SIZE,
+)
+from applications.logging import get_logger
+from applications.surveys.foods import link_foods
+from applications.surveys.models import Conversation
+from applications.surveys.rollups import rebuild_rollups
+from applications.surveys.search import update_search_vectors
+from applications.surveys.services import CLASSIFIER_VERSION
+from applications.surveys.signals import bump_conversations_version
+
+
+logger = get_logger(__name__)
+
+# Foods each diet's seeded respondents pick their favorites from.
+SEED_FOODS = {
+    Conversation.DietType.VEGAN: (
+        "tofu", "tempeh", "seitan", "kale", "lentil curry", "falafel", "hummus", "roasted chickpeas", "quinoa",
+        "avocado toast", "mango", "dark chocolate",
+    ),
+    Conversation.DietType.VEGETARIAN: (
+        "paneer tikka", "margherita pizza", "halloumi", "spinach lasagna", "mac and cheese", "omelette",
+        "greek salad", "mango lassi", "cheesecake", "falafel", "hummus", "tofu",
+    ),
+    Conversation.DietType.OMNIVORE: (
+        "steak", "sushi", "grilled chicken", "beef pho", "shrimp tacos", "lamb stew", "ramen", "burger",
+        "fish and chips", "tiramisu", "pizza", "ice cream",
+    ),
+}
+# Share of each diet among seeded conversations.
+SEED_DIET_WEIGHTS = {
+    Conversation.DietType.VEGAN: 0.2,
+    Conversation.DietType.VEGETARIAN: 0.3,
+    Conversation.DietType.OMNIVORE: 0.5,
+}
+
+
+def generate_conversations(count: int, days: int = 30, seed: int | None = None) -> Iterator[Conversation]:
+    """ Yields `count` unsaved classified conversations with plausible answers, created over the last `days` days. """
+    rng = random.Random(seed)
+    diets = list(SEED_DIET_WEIGHTS)
+    weights = list(SEED_DIET_WEIGHTS.values())
+    now = timezone.now()
+    span = max(1, days) * 24 * 60 * 60
+    for _ in range(count):
+        diet = rng.choices(diets, weights)[0]
+        foods = rng.sample(SEED_FOODS[diet], 3)
+        yield Conversation(
+            question_text=QUESTION,
+            answer_text=f"My top 3 favorite foods are {foods[0]}, {foods[1]}, and {foods[2]}.",
+            favorite_foods=foods,
+            diet_type=diet,
+            classifier_version=CLASSIFIER_VERSION,
+            created_at=now - timedelta(seconds=rng.uniform(0, span)),
+        )
+
+
+def seed_conversations(
+    count: int,
+    batch_size: int = SEED_BATCH_SIZE,
+    days: int = 30,
+    seed: int | None = None,
+) -> int:
+    """
+    Stores `count` generated conversations batch by batch, each in one transaction, then rebuilds the rollups.
+
+    Returns:
+        The number of conversations stored.
+    """
+    stored = 0
+    batch: list[Conversation] = []
+    for conversation in generate_conversations(count, days, seed):
+        batch.append(conversation)
+        if len(batch) >= batch_size:
+            stored += _store(batch)
+            batch = []
+            logger.info("Seeded %d/%d conversations", stored, count)
+    stored += _store(batch)
+    rebuild_rollups()
+    bump_conversations_version()
+    return stored
+
+
+def _store(batch: list[Conversation]) -> int:
+    """ Inserts a batch, restores its created_at values, and indexes and links it. Returns its size. """
+    if not batch:
+        return 0
+    created_at = [conversation.created_at for conversation in batch]
+    with transaction.atomic():
+        Conversation.objects.bulk_create(batch)
+        for conversation, value in zip(batch, created_at):
+            conversation.created_at = value
+        Conversation.objects.bulk_update(batch, ["created_at"])
+        update_search_vectors(conversation.pk for conversation in batch)
+        link_foods(batch)
+    return len(batch)
@@ -1,24 +1,140 @@
 """ Module to carry the survey app's business logic. """
+import asyncio
+import hashlib
 import json
+from contextlib import contextmanager
+from datetime import (
+    UTC,
+    date,
+    datetime,
+    time,
+    timedelta,
+)
+from typing import Iterator
 
-from openai import OpenAI
-from django.conf import settings
+from asgiref.sync import sync_to_async
+from django.db import (
+    DatabaseError,
+    transaction,
+)
+from django.db.models import QuerySet
+from openai import APIError
 
 from applications.constants import (
+    BATCH_CLASSIFIER_PROMPT,
     CLASSIFIER_GPT_MODEL,
     CLASSIFIER_PROMPT,
+    DEFAULT_WRITE_BATCH_SIZE,
+    LOCAL_CLASSIFIER_MIN_CONFIDENCE,
     QUESTION,
     RESPONDENT_GPT_MODEL,
     RESPONDENT_PROMPT,
 )
 from applications.logging import get_logger
-from applications.surveys.models import Conversation
+from applications.metrics import (
+    DB_ROWS_WRITTEN,
+    DB_WRITE_SECONDS,
+    DB_WRITES,
+    INVALID_CLASSIFICATIONS,
+    OPENAI_REQUEST_SECONDS,
+    OPENAI_REQUESTS,
+    observe,
+    record_token_usage,
+)
+from applications.surveys.classification_cache import classification_cache
+from applications.surveys.foods import link_foods
+from applications.surveys.jobs import enqueue_classifications
+from applications.surveys.local_classifier import (
+    classify_locally,
+    lexicon_digest,
+)
+from applications.surveys.models import (
+    ClassificationJob,
+    Conversation,
+    ConversationFood,
+    SimulationRun,
+)
+from applications.surveys.openai_clients import (
+    get_async_client,
+    get_client,
+)
+from applications.surveys.rate_limiting import (
+    acall_with_rate_limit,
+    call_with_rate_limit,
+    estimate_tokens,
+)
+from applications.surveys.rollups import (
+    record_classifications,
+    retract_classifications,
+)
+from applications.surveys.runs import record_progress
+from applications.surveys.search import update_search_vectors
+from applications.surveys.signals import bump_conversations_version
 
 
-client = OpenAI(api_key=settings.OPENAI_API_KEY)
 logger = get_logger(__name__)
 
 
+def get_classifier_version(
+    classifier_gpt_model: str = CLASSIFIER_GPT_MODEL,
+    prompts: tuple[str, ...] = (CLASSIFIER_PROMPT, BATCH_CLASSIFIER_PROMPT),
+    min_confidence: float = LOCAL_CLASSIFIER_MIN_CONFIDENCE,
+    lexicon: str | None = None,
+) -> str:
+    """
+    Returns the version of a classifier configuration: its model, and a digest of its prompts, threshold and local
+    classifier lexicon (by default the current one's digest).
+    """
+    lexicon = lexicon_digest() if lexicon is None else lexicon
+    digest = hashlib.sha256("\0".join((*prompts, str(min_confidence), lexicon)).encode()).hexdigest()[:12]
+    return f"{classifier_gpt_model}:{digest}"
+
+
+# Version stamped on every classification written by this code; rows with another one are stale.
+CLASSIFIER_VERSION = get_classifier_version()
+
+
+def _create_chat_completion(operation: str, model: str, messages: list[dict], **kwargs):
+    """
+    Sends a chat completion request within the model's rate limits, retrying retryable errors. Its latency,
+    outcome and token usage are recorded under `operation`.
+    """
+    with observe(OPENAI_REQUEST_SECONDS, OPENAI_REQUESTS, operation=operation, model=model):
+        resp = call_with_rate_limit(
+            model,
+            estimate_tokens(messages),
+            get_client().chat.completions.create,
+            model=model,
+            messages=messages,
+            **kwargs,
+        )
+    record_token_usage(operation, model, resp)
+    return resp
+
+
+async def _acreate_chat_completion(operation: str, model: str, messages: list[dict], **kwargs):
+    """ Async counterpart of _create_chat_completion. """
+    with observe(OPENAI_REQUEST_SECONDS, OPENAI_REQUESTS, operation=operation, model=model):
+        resp = await acall_with_rate_limit(
+            model,
+            estimate_tokens(messages),
+            get_async_client().chat.completions.create,
+            model=model,
+            messages=messages,
+            **kwargs,
+        )
+    record_token_usage(operation, model, resp)
+    return resp
+
+
+@contextmanager
+def _observe_write(operation: str, rows: int) -> Iterator[None]:
+    """ Records the latency and outcome of a database write, and its rows once it succeeded. """
+    with observe(DB_WRITE_SECONDS, DB_WRITES, operation=operation):
+        yield
+    DB_ROWS_WRITTEN.labels(operation=operation).inc(rows)
+
+
 def ask_question(respondent_gpt_model: str, respondent_prompt: str, question: str) -> str:
     """
     Ask a question and return its raw answer text.
@@ -32,19 +148,103 @@ def ask_question(respondent_gpt_model: str, respondent_prompt: str, question: st
     Return:
       - A string containing respondent's answer.
     """
-    resp = client.chat.completions.create(
+    resp = _create_chat_completion(
+        "ask_question",
         model=respondent_gpt_model,
         messages=[
             {"role": "system", "content": respondent_prompt},
             {"role": "user", "content": question},
         ],
         temperature=1.2,
-        timeout=30,
     )
     content = resp.choices[0].message.content
     return content.strip() if content else ""
 
 
+def parse_classification(content: str | None) -> dict:
+    """
+    Parse and validate the classifier GPT's raw message content.
+
+    Raises:
+      - json.JSONDecodeError if the content is not valid JSON.
+      - ValueError for an empty response, an unexpected 'foods' format or an unsupported diet.
+    """
+    try:
+        if not content:
+            raise ValueError("Empty response from GPT")
+
+        try:
+            parsed = json.loads(content)
+        except json.JSONDecodeError as e:
+            raise json.JSONDecodeError(f"Invalid JSON from GPT: {content}", content, e.pos)
+
+        return _validate_classification(parsed)
+    except ValueError:
+        INVALID_CLASSIFICATIONS.labels(mode="single").inc()
+        raise
+
+
+def _validate_classification(parsed: object) -> dict:
+    """ Validate one parsed classification object; raises ValueError if it is not usable. """
+    if not isinstance(parsed, dict):
+        raise ValueError(f"Invalid classification format: {parsed}")
+
+    # Validate structure
+    foods = parsed.get("foods")
+    diet = parsed.get("diet")
+
+    if not isinstance(foods, list) or len(foods) != 3 or not all(isinstance(f, str) for f in foods):
+        raise ValueError(f"Invalid 'foods' format: {foods}")
+
+    if diet not in {
+        Conversation.DietType.VEGAN,
+        Conversation.DietType.VEGETARIAN,
+        Conversation.DietType.OMNIVORE,
+    }:
+        raise ValueError(f"Invalid diet classification: {diet}")
+
+    return {"foods": foods, "diet": diet}
+
+
+def _parse_batch_classification(content: str | None, size: int) -> list[dict | None]:
+    """
+    Parse the batch classifier GPT's JSON array into per-answer results, ordered by answer index.
+
+    Items that are missing, duplicated, out of range or fail validation are left as None,
+    so they can be retried individually.
+    """
+    results: list[dict | None] = [None] * size
+    try:
+        parsed = json.loads(content) if content else None
+    except json.JSONDecodeError:
+        logger.warning("Invalid JSON from batch classifier GPT: %s", content)
+        return results
+
+    if not isinstance(parsed, list):
+        logger.warning("Batch classifier GPT did not return a JSON array: %s", content)
+        return results
+
+    for item in parsed:
+        index = item.get("index") if isinstance(item, dict) else None
+        if not isinstance(index, int) or not 0 <= index < size or results[index] is not None:
+            continue
+        try:
+            results[index] = _validate_classification(item)
+        except ValueError as e:
+            logger.warning("Invalid batch classification for answer %d: %s", index, e)
+
+    return results
+
+
+def _batch_classifier_messages(classifier_prompt: str, answers: list[str]) -> list[dict]:
+    """ Builds the chat messages asking the batch classifier GPT to classify all answers at once. """
+    payload = json.dumps([{"index": index, "answer": answer} for index, answer in enumerate(answers)])
+    return [
+        {"role": "system", "content": classifier_prompt},
+        {"role": "user", "content": payload},
+    ]
+
+
 def classify_diet(classifier_gpt_model: str, classifier_prompt: str,  answer: str) -> dict:
     """
     Classify the diet and extract foods from an answer via ChatGPT. Includes parsing and validation.
@@ -59,6 +259,9 @@ def classify_diet(classifier_gpt_model: str, classifier_prompt: str,  answer: st
       - Raises ValueError for any unexpected response format.
       - Raises ValueError if diet classification is invalid (unsupported in our system).
 
+    Caching:
+      - Valid results are cached by model, prompt and normalized answer, and reused without calling ChatGPT.
+
     Return:
       - A dict with keys 'foods' (list[str]) and 'diet' (str).
 
@@ -67,7 +270,12 @@ def classify_diet(classifier_gpt_model: str, classifier_prompt: str,  answer: st
       - answer: "I love sushi, ramen, and ice cream."
       - output: {"foods": ["sushi", "ramen", "ice cream"], "diet": "omnivore"}
     """
-    resp = client.chat.completions.create(
+    cached = classification_cache.get(classifier_gpt_model, classifier_prompt, answer)
+    if cached is not None:
+        return cached
+
+    resp = _create_chat_completion(
+        "classify_diet",
         model=classifier_gpt_model,
         messages=[
             {"role": "system", "content": classifier_prompt},
@@ -75,66 +283,565 @@ def classify_diet(classifier_gpt_model: str, classifier_prompt: str,  answer: st
         ],
         temperature=0,
     )
+    result = parse_classification(resp.choices[0].message.content)
+    classification_cache.set(classifier_gpt_model, classifier_prompt, answer, result)
+    return result
+
+
+def classify_diets(
+    classifier_gpt_model: str,
+    classifier_prompt: str,
+    answers: list[str],
+    fallback_prompt: str = CLASSIFIER_PROMPT,
+) -> list[dict | None]:
+    """
+    Classify the diets and extract foods from many answers with a single ChatGPT request.
+
+    The system prompt is sent once for the whole batch instead of once per answer, which cuts classifier
+    requests and prompt tokens by roughly the batch size. Each item goes through the same validation as
+    classify_diet; items that fail it are retried one by one with classify_diet and `fallback_prompt`. Answers with
+    a cached classification are left out of the request.
+
+    Params:
+      - classifier_gpt_model (str): The GPT model for classifying diets.
+      - classifier_prompt (str): The system prompt asking for a JSON array of {"index", "foods", "diet"}
+          objects, one per answer.
+      - answers (list[str]): Respondents' text answers containing favorite foods.
+      - fallback_prompt (str): The single-answer system prompt used for the individual retries.
+
+    Return:
+      - A list aligned with `answers`, holding dicts with keys 'foods' (list[str]) and 'diet' (str),
+          or None for answers that could not be classified even individually.
+    """
+    results: list[dict | None] = [
+        classification_cache.get(classifier_gpt_model, classifier_prompt, answer) for answer in answers
+    ]
+    uncached = [index for index, result in enumerate(results) if result is None]
+    if not uncached:
+        return results
+
+    resp = _create_chat_completion(
+        "classify_diets",
+        model=classifier_gpt_model,
+        messages=_batch_classifier_messages(classifier_prompt, [answers[index] for index in uncached]),
+        temperature=0,
+    )
+    batch_results = _parse_batch_classification(resp.choices[0].message.content, len(uncached))
+    INVALID_CLASSIFICATIONS.labels(mode="batch").inc(batch_results.count(None))
+
+    for index, result in zip(uncached, batch_results):
+        answer = answers[index]
+        if result is not None:
+            results[index] = result
+            classification_cache.set(classifier_gpt_model, classifier_prompt, answer, result)
+            continue
+        try:
+            results[index] = classify_diet(classifier_gpt_model, fallback_prompt, answer)
+        except (json.JSONDecodeError, ValueError) as e:
+            logger.warning("Single-answer classification fallback failed for answer %d: %s", index, e)
+
+    return results
+
+
+def classify_diet_with_fallback(
+    classifier_gpt_model: str,
+    classifier_prompt: str,
+    answer: str,
+    min_confidence: float = LOCAL_CLASSIFIER_MIN_CONFIDENCE,
+) -> dict:
+    """
+    Classify an answer with the local lexicon classifier, calling classify_diet only when its confidence is below
+    `min_confidence`. Returns and raises like classify_diet.
+    """
+    local = classify_locally(answer)
+    if local.confidence >= min_confidence:
+        return local.as_result()
+    return classify_diet(classifier_gpt_model, classifier_prompt, answer)
+
+
+def classify_diets_with_fallback(
+    classifier_gpt_model: str,
+    classifier_prompt: str,
+    answers: list[str],
+    min_confidence: float = LOCAL_CLASSIFIER_MIN_CONFIDENCE,
+) -> list[dict | None]:
+    """ Batch counterpart of classify_diet_with_fallback: only low-confidence answers go to classify_diets. """
+    results, pending = _classify_locally_where_confident(answers, min_confidence)
+    gpt_results = classify_diets(classifier_gpt_model, classifier_prompt, [answers[index] for index in pending])
+    for index, result in zip(pending, gpt_results):
+        results[index] = result
+    return results
+
+
+def _classify_locally_where_confident(answers: list[str], min_confidence: float) -> tuple[list, list[int]]:
+    """ Returns the local results of confident answers (None elsewhere) and the indexes left for the GPT. """
+    results: list[dict | None] = [None] * len(answers)
+    pending = []
+    for index, answer in enumerate(answers):
+        local = classify_locally(answer)
+        if local.confidence >= min_confidence:
+            results[index] = local.as_result()
+        else:
+            pending.append(index)
+    return results, pending
+
+
+async def aask_question(respondent_gpt_model: str, respondent_prompt: str, question: str) -> str:
+    """ Async counterpart of ask_question, using the async OpenAI client. """
+    resp = await _acreate_chat_completion(
+        "ask_question",
+        model=respondent_gpt_model,
+        messages=[
+            {"role": "system", "content": respondent_prompt},
+            {"role": "user", "content": question},
+        ],
+        temperature=1.2,
+    )
     content = resp.choices[0].message.content
-    if not content:
-        raise ValueError("Empty response from GPT")
+    return content.strip() if content else ""
 
-    try:
-        parsed = json.loads(content)
-    except json.JSONDecodeError as e:
-        raise json.JSONDecodeError(f"Invalid JSON from GPT: {content}", content, e.pos)
 
-    # Validate structure
-    foods = parsed.get("foods")
-    diet = parsed.get("diet")
+async def aclassify_diet(classifier_gpt_model: str, classifier_prompt: str, answer: str) -> dict:
+    """ Async counterpart of classify_diet, with the same parsing, validation and caching. """
+    cached = await classification_cache.aget(classifier_gpt_model, classifier_prompt, answer)
+    if cached is not None:
+        return cached
 
-    if not isinstance(foods, list) or len(foods) != 3 or not all(isinstance(f, str) for f in foods):
-        raise ValueError(f"Invalid 'foods' format: {foods}")
+    resp = await _acreate_chat_completion(
+        "classify_diet",
+        model=classifier_gpt_model,
+        messages=[
+            {"role": "system", "content": classifier_prompt},
+            {"role": "user", "content": answer},
+        ],
+        temperature=0,
+    )
+    result = parse_classification(resp.choices[0].message.content)
+    await classification_cache.aset(classifier_gpt_model, classifier_prompt, answer, result)
+    return result
 
-    if diet not in {
-        Conversation.DietType.VEGAN,
-        Conversation.DietType.VEGETARIAN,
-        Conversation.DietType.OMNIVORE,
-    }:
-        raise ValueError(f"Invalid diet classification: {diet}")
 
-    return {"foods": foods, "diet": diet}
+async def aclassify_diets(
+    classifier_gpt_model: str,
+    classifier_prompt: str,
+    answers: list[str],
+    fallback_prompt: str = CLASSIFIER_PROMPT,
+) -> list[dict | None]:
+    """ Async counterpart of classify_diets; the single-answer fallbacks run concurrently. """
+    results: list[dict | None] = [
+        await classification_cache.aget(classifier_gpt_model, classifier_prompt, answer) for answer in answers
+    ]
+    uncached = [index for index, result in enumerate(results) if result is None]
+    if not uncached:
+        return results
+
+    resp = await _acreate_chat_completion(
+        "classify_diets",
+        model=classifier_gpt_model,
+        messages=_batch_classifier_messages(classifier_prompt, [answers[index] for index in uncached]),
+        temperature=0,
+    )
+    batch_results = _parse_batch_classification(resp.choices[0].message.content, len(uncached))
+    INVALID_CLASSIFICATIONS.labels(mode="batch").inc(batch_results.count(None))
+    for index, result in zip(uncached, batch_results):
+        if result is not None:
+            results[index] = result
+            await classification_cache.aset(classifier_gpt_model, classifier_prompt, answers[index], result)
+
+    async def fallback(index: int) -> None:
+        try:
+            results[index] = await aclassify_diet(classifier_gpt_model, fallback_prompt, answers[index])
+        except (json.JSONDecodeError, ValueError) as e:
+            logger.warning("Single-answer classification fallback failed for answer %d: %s", index, e)
+
+    await asyncio.gather(*(fallback(index) for index, result in enumerate(results) if result is None))
+    return results
+
+
+async def aclassify_diet_with_fallback(
+    classifier_gpt_model: str,
+    classifier_prompt: str,
+    answer: str,
+    min_confidence: float = LOCAL_CLASSIFIER_MIN_CONFIDENCE,
+) -> dict:
+    """ Async counterpart of classify_diet_with_fallback. """
+    local = classify_locally(answer)
+    if local.confidence >= min_confidence:
+        return local.as_result()
+    return await aclassify_diet(classifier_gpt_model, classifier_prompt, answer)
 
 
-def simulate_conversation() -> None:
+async def aclassify_diets_with_fallback(
+    classifier_gpt_model: str,
+    classifier_prompt: str,
+    answers: list[str],
+    min_confidence: float = LOCAL_CLASSIFIER_MIN_CONFIDENCE,
+) -> list[dict | None]:
+    """ Async counterpart of classify_diets_with_fallback. """
+    results, pending = _classify_locally_where_confident(answers, min_confidence)
+    gpt_results = await aclassify_diets(classifier_gpt_model, classifier_prompt, [answers[index] for index in pending])
+    for index, result in zip(pending, gpt_results):
+        results[index] = result
+    return results
+
+
+class ConversationWriter:
     """
-    Simulate and process a single food preference conversation between two chatbots:
+    Buffers finished conversations and writes them with bulk_create, one transaction per batch.
+
+    This spreads the cost of database round trips and commits over many conversations. A batch that fails to
+    write is logged and counted in `failed`, so callers can report lost conversations without aborting the run.
+
+    With a `run`, conversations are tagged with it, and each batch is added to the run's progress in the
+    transaction writing it; failures reported through record_failures are added right away.
+    """
+
+    def __init__(self, batch_size: int = DEFAULT_WRITE_BATCH_SIZE, run: SimulationRun | None = None):
+        self.batch_size = batch_size
+        self.run = run
+        self.pending: list[Conversation] = []
+        self.written = 0
+        self.failed = 0
+
+    def add(self, conversation: Conversation) -> None:
+        """ Buffers a conversation, writing the buffer once it holds `batch_size` conversations. """
+        if self.run is not None:
+            conversation.run = self.run
+        self.pending.append(conversation)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """ Writes all buffered conversations in a single transaction. """
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        try:
+            if self.run is None:
+                save_conversations(batch)
+            else:
+                with transaction.atomic():
+                    save_conversations(batch)
+                    record_progress(self.run, succeeded=len(batch))
+        except DatabaseError as e:
+            logger.error("Failed to write a batch of %d conversations: %s", len(batch), e)
+            self.failed += len(batch)
+            self.record_failures(len(batch))
+        else:
+            self.written += len(batch)
+
+    def record_failures(self, count: int) -> None:
+        """ Adds conversations given up on to the run's progress, if there is a run. """
+        if self.run is None or not count:
+            return
+        try:
+            record_progress(self.run, failed=count)
+        except DatabaseError as e:
+            logger.error("Failed to record %d failed conversations of run %s: %s", count, self.run.pk, e)
+
+    async def aadd(self, conversation: Conversation) -> None:
+        """ Async counterpart of add; the write itself runs in Django's sync thread. """
+        if self.run is not None:
+            conversation.run = self.run
+        self.pending.append(conversation)
+        if len(self.pending) >= self.batch_size:
+            await self.aflush()
+
+    async def aflush(self) -> None:
+        """ Async counterpart of flush. """
+        await sync_to_async(self.flush)()
+
+    async def arecord_failures(self, count: int) -> None:
+        """ Async counterpart of record_failures. """
+        await sync_to_async(self.record_failures)(count)
+
+
+def save_conversations(conversations: list[Conversation], enqueue: bool = True) -> None:
+    """
+    Inserts the given conversations with one bulk INSERT, in one transaction; classified ones are stamped with
+    CLASSIFIER_VERSION. In the same transaction, their answers are indexed for full-text search, those already
+    classified are linked to their canonical foods and added to the diet and food rollups, unless `enqueue` is False
+    the others are queued for the classifier workers, and the conversations version is incremented.
+    """
+    _stamp_classifier_version(conversations)
+    with _observe_write("save_conversations", len(conversations)), transaction.atomic():
+        Conversation.objects.bulk_create(conversations)
+        update_search_vectors(conversation.pk for conversation in conversations)
+        link_foods(conversations)
+        record_classifications(conversations)
+        if enqueue:
+            enqueue_classifications(conversations)
+        bump_conversations_version()
+
+
+def save_classifications(conversations: list[Conversation]) -> None:
+    """
+    Writes the classification results, stamped with CLASSIFIER_VERSION, of already stored, so far unclassified
+    conversations with one bulk UPDATE, links them to their canonical foods, and adds them to the diet and food
+    rollups in the same transaction, which also increments the conversations version.
+    """
+    _stamp_classifier_version(conversations)
+    with _observe_write("save_classifications", len(conversations)), transaction.atomic():
+        Conversation.objects.bulk_update(conversations, ["favorite_foods", "diet_type", "classifier_version"])
+        link_foods(conversations)
+        record_classifications(conversations)
+        bump_conversations_version()
+
+
+def save_reclassifications(results: dict, classifier_version: str = CLASSIFIER_VERSION) -> list[Conversation]:
+    """
+    Replaces the classification of stored conversations, classified or not, with new results, in one transaction.
+
+    The conversations are locked and read again first, so their previous classification is retracted from the diet
+    and food rollups exactly once, even if it changed since it was read; then the new results are written with one
+    bulk UPDATE, their food links rebuilt, the rollups incremented, their classification jobs dropped and the
+    conversations version incremented.
+
+    Params:
+      - results (dict): Maps conversation IDs to classification dicts with keys 'foods' and 'diet'.
+      - classifier_version (str): Version of the classifier that produced the results.
+
+    Return:
+      - The updated conversations.
+    """
+    with _observe_write("save_reclassifications", len(results)), transaction.atomic():
+        previous = list(Conversation.objects.select_for_update().filter(pk__in=list(results)).order_by("pk"))
+        retract_classifications(previous)
+        conversations = []
+        for old in previous:
+            result = results[old.pk]
+            conversations.append(Conversation(
+                id=old.pk,
+                created_at=old.created_at,
+                favorite_foods=result["foods"],
+                diet_type=result["diet"],
+                classifier_version=classifier_version,
+            ))
+        Conversation.objects.bulk_update(conversations, ["favorite_foods", "diet_type", "classifier_version"])
+        ConversationFood.objects.filter(conversation__in=previous).delete()
+        link_foods(conversations)
+        record_classifications(conversations)
+        ClassificationJob.objects.filter(conversation__in=previous).delete()
+        bump_conversations_version()
+    return conversations
+
+
+def filter_by_created_at(
+    conversations: QuerySet[Conversation],
+    since: date | None = None,
+    until: date | None = None,
+) -> QuerySet[Conversation]:
+    """
+    Keeps the conversations created from the start of `since` to the end of `until`, both included, in UTC.
+    The bounds are datetimes rather than a __date lookup, so the created_at indexes still apply.
+    """
+    if since:
+        conversations = conversations.filter(created_at__gte=datetime.combine(since, time.min, tzinfo=UTC))
+    if until:
+        conversations = conversations.filter(
+            created_at__lt=datetime.combine(until + timedelta(days=1), time.min, tzinfo=UTC),
+        )
+    return conversations
+
+
+def _stamp_classifier_version(conversations: list[Conversation]) -> None:
+    """ Marks classified conversations without a classifier version as classified by the current one. """
+    for conversation in conversations:
+        if conversation.diet_type and not conversation.classifier_version:
+            conversation.classifier_version = CLASSIFIER_VERSION
+
+
+def generate_conversation() -> Conversation:
+    """
+    Carry out a single food preference conversation between two chatbots, without saving it:
       - Survey conductor bot asking a respondent bot a standard question, simulating a real-life survey question.
       - Respondent bot answers something "random" to simulate a real life survey respondent.
       - Survey conductor takes the answer and classifies the diet of respondent,
-          simulating insight extraction from the survey.
+          simulating insight extraction from the survey. Answers the local lexicon classifier resolves
+          with enough confidence skip the classifier GPT.
 
-    Performs these operations in sequence:
-      - Generates a randomized answer to the food preference question.
-      - Creates a base Conversation record with the raw answer.
-      - Attempts to classify the diet type and extract food items.
-      - Updates the record with classification results if successful.
-      - Logs the failure and conversation ID if not successful.
+    If the classification fails, the failure is logged with the answer, since the conversation has no row yet, and
+    the returned conversation keeps its raw answer with an empty diet, so it is still stored, and queued for the
+    classifier workers.
+
+    Return:
+      - An unsaved Conversation instance.
     """
     answer = ask_question(
         respondent_gpt_model=RESPONDENT_GPT_MODEL,
         respondent_prompt=RESPONDENT_PROMPT,
         question=QUESTION,
     )
+    conversation = Conversation(question_text=QUESTION, answer_text=answer)
+
+    try:
+        result = classify_diet_with_fallback(
+            classifier_gpt_model=CLASSIFIER_GPT_MODEL,
+            classifier_prompt=CLASSIFIER_PROMPT,
+            answer=answer,
+        )
+        conversation.favorite_foods = result["foods"]
+        conversation.diet_type = result["diet"]
+    except (json.JSONDecodeError, ValueError) as e:
+        logger.warning("Classification failed for answer %r: %s", answer, e)
 
-    conversation = Conversation.objects.create(
-        question_text=QUESTION,
-        answer_text=answer,
+    return conversation
+
+
+async def agenerate_conversation() -> Conversation:
+    """ Async counterpart of generate_conversation. """
+    answer = await aask_question(
+        respondent_gpt_model=RESPONDENT_GPT_MODEL,
+        respondent_prompt=RESPONDENT_PROMPT,
+        question=QUESTION,
     )
+    conversation = Conversation(question_text=QUESTION, answer_text=answer)
 
     try:
-        result = classify_diet(
+        result = await aclassify_diet_with_fallback(
             classifier_gpt_model=CLASSIFIER_GPT_MODEL,
             classifier_prompt=CLASSIFIER_PROMPT,
             answer=answer,
         )
         conversation.favorite_foods = result["foods"]
         conversation.diet_type = result["diet"]
-        conversation.save()
     except (json.JSONDecodeError, ValueError) as e:
-        logger.warning("Classification failed for conversation ID %s: %s", conversation.id, e)
+        logger.warning("Classification failed for answer %r: %s", answer, e)
+
+    return conversation
+
+
+def simulate_conversation(writer: ConversationWriter | None = None) -> None:
+    """
+    Simulate and process a single food preference conversation between two chatbots.
+
+    Performs these operations in sequence:
+      - Generates a randomized answer to the food preference question.
+      - Attempts to classify the diet type and extract food items; logs the failure and the answer
+          if not successful.
+      - Stores the Conversation record, with classification results if successful.
+
+    Params:
+      - writer (ConversationWriter | None): Buffer to hand the conversation to for a batched write.
+          Without one, the conversation is written immediately.
+    """
+    conversation = generate_conversation()
+    if writer is None:
+        save_conversations([conversation])
+    else:
+        writer.add(conversation)
+
+
+async def asimulate_conversation(writer: ConversationWriter | None = None) -> None:
+    """
+    Async counterpart of simulate_conversation.
+
+    Awaits the OpenAI calls instead of blocking on them, so many conversations can be in flight at once
+    from a single event loop.
+    """
+    conversation = await agenerate_conversation()
+    if writer is None:
+        await sync_to_async(save_conversations)([conversation])
+    else:
+        await writer.aadd(conversation)
+
+
+def _apply_batch_classifications(conversations: list[Conversation], results: list[dict | None]) -> None:
+    """ Copies batch classification results onto their conversations, logging the ones left unclassified. """
+    for conversation, result in zip(conversations, results):
+        if result is None:
+            logger.warning("Classification failed for answer %r: no valid classification", conversation.answer_text)
+            continue
+        conversation.favorite_foods = result["foods"]
+        conversation.diet_type = result["diet"]
+
+
+def _keep_answers(outcomes: list) -> list[str]:
+    """
+    Returns the answers of the respondent calls that succeeded, in order, and logs the errors of the others: OpenAI
+    API errors as warnings, any other error as an error.
+    """
+    answers = []
+    for outcome in outcomes:
+        if isinstance(outcome, APIError):
+            logger.warning("Respondent call failed, its conversation is dropped: %s", outcome)
+        elif isinstance(outcome, Exception):
+            logger.error("Unexpected error on a respondent call, its conversation is dropped: %s", outcome)
+        elif isinstance(outcome, BaseException):
+            raise outcome
+        else:
+            answers.append(outcome)
+    return answers
+
+
+def simulate_conversation_batch(size: int, writer: ConversationWriter | None = None) -> int:
+    """
+    Simulate `size` conversations, classifying all of their answers with one batched classifier request.
+
+    A failed respondent call only drops its own conversation: the answers already received are still classified and
+    stored. Answers that cannot be classified are stored with an empty diet, as in simulate_conversation.
+
+    Return:
+      - The number of conversations dropped because their respondent call failed.
+    """
+    outcomes: list = []
+    for _ in range(size):
+        try:
+            outcomes.append(ask_question(
+                respondent_gpt_model=RESPONDENT_GPT_MODEL,
+                respondent_prompt=RESPONDENT_PROMPT,
+                question=QUESTION,
+            ))
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            outcomes.append(error)
+    answers = _keep_answers(outcomes)
+    if not answers:
+        return size
+
+    conversations = [Conversation(question_text=QUESTION, answer_text=answer) for answer in answers]
+    results = classify_diets_with_fallback(
+        classifier_gpt_model=CLASSIFIER_GPT_MODEL,
+        classifier_prompt=BATCH_CLASSIFIER_PROMPT,
+        answers=answers,
+    )
+    _apply_batch_classifications(conversations, results)
+
+    if writer is None:
+        save_conversations(conversations)
+    else:
+        for conversation in conversations:
+            writer.add(conversation)
+    return size - len(answers)
+
+
+async def asimulate_conversation_batch(size: int, writer: ConversationWriter | None = None) -> int:
+    """ Async counterpart of simulate_conversation_batch; the respondent questions are asked concurrently. """
+    outcomes = await asyncio.gather(
+        *(
+            aask_question(
+                respondent_gpt_model=RESPONDENT_GPT_MODEL,
+                respondent_prompt=RESPONDENT_PROMPT,
+                question=QUESTION,
+            )
+            for _ in range(size)
+        ),
+        return_exceptions=True,
+    )
+    answers = _keep_answers(outcomes)
+    if not answers:
+        return size
+
+    conversations = [Conversation(question_text=QUESTION, answer_text=answer) for answer in answers]
+    results = await aclassify_diets_with_fallback(
+        classifier_gpt_model=CLASSIFIER_GPT_MODEL,
+        classifier_prompt=BATCH_CLASSIFIER_PROMPT,
+        answers=answers,
+    )
+    _apply_batch_classifications(conversations, results)
+
+    if writer is None:
+        await sync_to_async(save_conversations)(conversations)
+    else:
+        for conversation in conversations:
+            await writer.aadd(conversation)
+    return size - len(answers)
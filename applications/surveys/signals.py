@@ -0,0 +1,42 @@
+"""
+Keeps the ConversationsVersion row in step with every write to the conversations.
+
+The surveys services write conversations with bulk queries, which send no model signals, so they call
+bump_conversations_version themselves, once per transaction. Any other write (admin edits and deletes, plain ORM
+save() and delete() calls, food links added or removed through Conversation.foods) bumps it from the receivers below.
+"""
+from django.db.models import F
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+)
+from django.dispatch import receiver
+
+from applications.surveys.models import (
+    Conversation,
+    ConversationsVersion,
+)
+
+
+def bump_conversations_version() -> None:
+    """
+    Increments the ConversationsVersion row within the current transaction, so every process sees the change once it
+    commits.
+    """
+    if not ConversationsVersion.objects.filter(pk=1).update(version=F("version") + 1):
+        ConversationsVersion.objects.get_or_create(pk=1, defaults={"version": 2})
+
+
+@receiver(post_save, sender=Conversation, dispatch_uid="surveys_conversation_saved")
+@receiver(post_delete, sender=Conversation, dispatch_uid="surveys_conversation_deleted")
+def conversation_written(**kwargs) -> None:  # pylint: disable=unused-argument
+    """ Bumps the conversations version when a conversation is saved or deleted one at a time. """
+    bump_conversations_version()
+
+
+@receiver(m2m_changed, sender=Conversation.foods.through, dispatch_uid="surveys_conversation_foods_changed")
+def conversation_foods_changed(action: str, **kwargs) -> None:  # pylint: disable=unused-argument
+    """ Bumps the conversations version when food links change through Conversation.foods, e.g. foods.set(). """
+    if action in {"post_add", "post_remove", "post_clear"}:
+        bump_conversations_version()
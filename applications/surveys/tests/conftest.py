@@ -0,0 +1,19 @@
+""" Shared fixtures for the surveys app tests. """
+import pytest
+from django.core.cache import caches
+
+from applications.surveys.classification_cache import classification_cache
+
+
+@pytest.fixture(name="empty_classification_cache", autouse=True)
+def fixture_empty_classification_cache(monkeypatch):
+    """
+    Keeps classifier results cached by one test from answering another test's requests, and keeps tests that do not
+    use the database off the database cache, by backing the shared tier with the locmem default cache.
+    """
+    monkeypatch.setattr(classification_cache, "alias", "default")
+    classification_cache.clear()
+    caches[classification_cache.alias].clear()
+    yield classification_cache
+    classification_cache.clear()
+    caches[classification_cache.alias].clear()
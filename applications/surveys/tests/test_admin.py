@@ -0,0 +1,87 @@
+""" Tests for the admin pages of surveys/admin.py. """
+import json
+
+import pytest
+from django.urls import reverse
+
+from applications.insights.services import summarize_conversations
+from applications.surveys.models import Conversation
+from applications.surveys.services import save_conversations
+
+
+@pytest.fixture(name="vegan_conversation")
+def fixture_vegan_conversation():
+    """ A classified conversation written through the surveys services, so the rollups count it. """
+    conversation = Conversation(
+        question_text="What are your top 3 favorite foods?",
+        answer_text="Tofu, kale and lentils",
+        diet_type="vegan",
+        favorite_foods=["tofu", "kale", "lentils"],
+    )
+    save_conversations([conversation])
+    return conversation
+
+
+def change_form(conversation: Conversation, **changes) -> dict:
+    """ Returns the POST data of the admin change form of `conversation`, with the given fields changed. """
+    data = {
+        "question_text": conversation.question_text,
+        "answer_text": conversation.answer_text,
+        "favorite_foods": json.dumps(conversation.favorite_foods),
+        "diet_type": conversation.diet_type,
+        "classifier_version": conversation.classifier_version,
+        "run": "",
+    }
+    data.update(changes)
+    return data
+
+
+@pytest.mark.django_db
+def test_change__updates_rollups(admin_client, vegan_conversation):
+    """ A diet edited in the admin moves the conversation from one diet's rollups to the other's. """
+    url = reverse("admin:surveys_conversation_change", args=[vegan_conversation.pk])
+
+    response = admin_client.post(url, change_form(
+        vegan_conversation, diet_type="omnivore", favorite_foods=json.dumps(["steak", "ham", "cod"]),
+    ))
+
+    assert response.status_code == 302
+    summary = summarize_conversations([])
+    assert summary["diets"] == {"omnivore": 1}
+    assert {food["food"] for food in summary["top_foods"]} == {"steak", "ham", "cod"}
+
+
+@pytest.mark.django_db
+def test_change__relinks_foods(admin_client, vegan_conversation):
+    """ Foods edited in the admin replace the conversation's food links, which serve the food filters. """
+    url = reverse("admin:surveys_conversation_change", args=[vegan_conversation.pk])
+
+    admin_client.post(url, change_form(vegan_conversation, favorite_foods=json.dumps(["Tofu", "Tempeh"])))
+
+    assert set(vegan_conversation.foods.values_list("name", flat=True)) == {"tofu", "tempeh"}
+
+
+@pytest.mark.django_db
+def test_add__updates_rollups(admin_client, vegan_conversation):
+    """ A classified conversation added in the admin is counted in the rollups. """
+    response = admin_client.post(reverse("admin:surveys_conversation_add"), change_form(vegan_conversation))
+
+    assert response.status_code == 302
+    assert summarize_conversations([])["diets"] == {"vegan": 2}
+
+
+@pytest.mark.django_db
+def test_delete__updates_rollups(admin_client, vegan_conversation):
+    """ Conversations deleted from their page or the list's action are retracted from the rollups. """
+    save_conversations([Conversation(answer_text="Steak", diet_type="omnivore", favorite_foods=["steak"])])
+
+    admin_client.post(reverse("admin:surveys_conversation_delete", args=[vegan_conversation.pk]), {"post": "yes"})
+    assert summarize_conversations([])["diets"] == {"omnivore": 1}
+
+    admin_client.post(reverse("admin:surveys_conversation_changelist"), {
+        "action": "delete_selected",
+        "_selected_action": list(Conversation.objects.values_list("pk", flat=True)),
+        "post": "yes",
+    })
+    assert not Conversation.objects.exists()
+    assert summarize_conversations([])["diets"] == {}
@@ -0,0 +1,254 @@
+""" Tests for surveys/batch_api.py, run against the local fake OpenAI server. """
+import json
+from datetime import timedelta
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+from openai import OpenAI
+
+from applications.constants import (
+    BATCH_CLASSIFIER_PROMPT,
+    CLASSIFIER_PROMPT,
+)
+from applications.surveys.batch_api import (
+    CLASSIFIER_STAGE,
+    RESPONDENT_STAGE,
+    BatchSimulation,
+    build_request,
+    parse_batch_output,
+)
+from applications.surveys.fake_openai import (
+    SAMPLE_ANSWERS,
+    FakeOpenAIServer,
+)
+from applications.surveys.jobs import claim_jobs
+from applications.surveys.models import (
+    ClassificationJob,
+    Conversation,
+    SimulationRun,
+)
+from applications.surveys.runs import start_run
+from applications.surveys.services import (
+    ask_question,
+    classify_diet,
+    classify_diets,
+)
+
+
+@pytest.fixture(name="fake_server")
+def fixture_fake_server():
+    """ Fixture running a fake OpenAI server for the duration of a test. """
+    with FakeOpenAIServer(polls_until_complete=1) as server:
+        yield server
+
+
+@pytest.fixture(name="fake_client")
+def fixture_fake_client(fake_server):
+    """ Fixture providing a real OpenAI client pointed at the fake server. """
+    return OpenAI(api_key="fake", base_url=fake_server.base_url, max_retries=0)
+
+
+@pytest.fixture(name="batch_simulation")
+def fixture_batch_simulation(fake_client):
+    """ Fixture providing a batch simulation that polls without waiting. """
+    return BatchSimulation(fake_client, poll_interval=0)
+
+
+def test_parse_batch_output__maps_custom_ids_and_failures():
+    """ Successful requests map to their content, failed ones to None. """
+    content = "\n".join([
+        json.dumps({"custom_id": "a", "response": {"status_code": 200, "body": {
+            "choices": [{"message": {"content": "hello"}}]
+        }}, "error": None}),
+        json.dumps({"custom_id": "b", "response": {"status_code": 429, "body": {}}, "error": None}),
+        json.dumps({"custom_id": "c", "response": None, "error": {"code": "server_error"}}),
+    ])
+    assert parse_batch_output(content) == {"a": "hello", "b": None, "c": None}
+
+
+@pytest.mark.django_db
+def test_batch_simulation__run_stores_classified_conversations(batch_simulation, fake_server):
+    """ A run goes through a respondent batch and a classifier batch, storing classified conversations. """
+    succeeded, failed = batch_simulation.run(5)
+
+    assert (succeeded, failed) == (5, 0)
+    # Answers the local classifier resolves on its own are left out of the classifier batch, if one is needed.
+    assert len(fake_server.batches) in {1, 2}
+    assert Conversation.objects.count() == 5
+    diets = {answer: diet for answer, _, diet in SAMPLE_ANSWERS}
+    assert all(diets[conversation.answer_text] == conversation.diet_type for conversation in Conversation.objects.all())
+    run = SimulationRun.objects.get()
+    assert (run.succeeded, run.failed, run.status) == (5, 0, SimulationRun.Status.COMPLETED)
+    assert run.conversations.count() == 5
+    assert run.config["respondent_batches"] == [next(iter(fake_server.batches))]
+
+
+@pytest.mark.django_db
+def test_batch_simulation__run_counts_errored_answers_as_failed(batch_simulation, monkeypatch):
+    """ Respondent requests that errored in the batch output count as failed, in the run too. """
+    download = batch_simulation.download
+
+    def download_with_error(batch):
+        results = download(batch)
+        if batch.metadata["stage"] == RESPONDENT_STAGE:
+            results[sorted(results)[0]] = None
+        return results
+
+    monkeypatch.setattr(batch_simulation, "download", download_with_error)
+
+    assert batch_simulation.run(3) == (2, 1)
+    run = SimulationRun.objects.get()
+    assert (run.succeeded, run.failed, run.status) == (2, 1, SimulationRun.Status.COMPLETED)
+
+
+@pytest.mark.django_db
+def test_batch_simulation__invalid_classifications_stay_unclassified(fake_server, batch_simulation):
+    """ A conversation whose classifier result is invalid is stored with a null diet. """
+    def responder(body):
+        if body["messages"][0]["content"] == CLASSIFIER_PROMPT:
+            return "NOT_JSON"
+        return "Sushi, ramen, and gyoza."
+
+    fake_server.responder = responder
+    succeeded, _ = batch_simulation.run(2)
+
+    assert succeeded == 2
+    assert len(fake_server.batches) == 2
+    assert Conversation.objects.filter(diet_type__isnull=True).count() == 2
+    assert len(claim_jobs("worker-1", limit=10)) == 2
+
+
+@pytest.mark.django_db
+def test_batch_simulation__partial_classifier_output_goes_to_workers(fake_server, batch_simulation, monkeypatch):
+    """ Conversations missing from the output of a classifier batch are queued for the workers right away. """
+    fake_server.responder = lambda body: (
+        '{"foods": ["sushi", "ramen", "gyoza"], "diet": "omnivore"}'
+        if body["messages"][0]["content"] == CLASSIFIER_PROMPT else "Sushi, ramen, and gyoza."
+    )
+    download = batch_simulation.download
+
+    def partial_download(batch):
+        results = download(batch)
+        if batch.metadata["stage"] == CLASSIFIER_STAGE:
+            results.pop(sorted(results)[0])
+        return results
+
+    monkeypatch.setattr(batch_simulation, "download", partial_download)
+    succeeded, _ = batch_simulation.run(3)
+
+    assert succeeded == 3
+    [missing] = Conversation.objects.filter(diet_type__isnull=True)
+    assert [job.conversation_id for job in claim_jobs("worker-1", limit=10)] == [missing.pk]
+    assert ClassificationJob.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_batch_simulation__answers_queued_for_later_until_classified(fake_server, batch_simulation):
+    """ Stored answers are queued at once, but only for after the classifier batch's completion window. """
+    fake_server.responder = lambda body: "Sushi, ramen, and gyoza."
+    requests = [
+        build_request(f"00000000-0000-0000-0000-00000000000{i}", "model", "prompt", "question", temperature=1)
+        for i in range(2)
+    ]
+    [batch_id] = batch_simulation.submit(RESPONDENT_STAGE, requests)
+
+    batch_simulation.ingest_answers(batch_simulation.download(batch_simulation.wait(batch_id)))
+
+    assert ClassificationJob.objects.count() == 2
+    assert ClassificationJob.objects.filter(available_at__gt=timezone.now() + timedelta(hours=24)).count() == 2
+    assert not claim_jobs("worker-1", limit=10)
+
+
+@pytest.mark.django_db
+def test_batch_simulation__resume_is_idempotent(batch_simulation, fake_server):
+    """ Resuming a respondent batch twice stores each conversation once and classifies it once. """
+    classification = '{"foods": ["sushi", "ramen", "gyoza"], "diet": "omnivore"}'
+    fake_server.responder = lambda body: (
+        classification if body["messages"][0]["content"] == CLASSIFIER_PROMPT else "Sushi, ramen, and gyoza."
+    )
+    requests = [
+        build_request(f"00000000-0000-0000-0000-00000000000{i}", "model", "prompt", "question", temperature=1)
+        for i in range(3)
+    ]
+    [batch_id] = batch_simulation.submit("respondent", requests)
+
+    assert batch_simulation.resume(batch_id) == (3, 0)
+    assert batch_simulation.resume(batch_id) == (3, 0)
+
+    assert Conversation.objects.count() == 3
+    assert not Conversation.objects.filter(diet_type__isnull=True).exists()
+    # The second resume found everything classified and submitted no new classifier batch.
+    assert len(fake_server.batches) == 2
+
+
+@pytest.mark.django_db
+def test_batch_simulation__resume_settles_run(batch_simulation, fake_server):
+    """ Resuming a respondent batch of an interrupted run stores its conversations in the run and settles it. """
+    fake_server.responder = lambda body: "Sushi, ramen, and gyoza."
+    run = start_run(3, {"openai_batch": True})
+    requests = [
+        build_request(f"00000000-0000-0000-0000-00000000000{i}", "model", "prompt", "question", temperature=1)
+        for i in range(3)
+    ]
+    [batch_id] = batch_simulation.submit(RESPONDENT_STAGE, requests, run=run)
+
+    assert batch_simulation.resume(batch_id) == (3, 0)
+    assert batch_simulation.resume(batch_id) == (3, 0)
+
+    run.refresh_from_db()
+    assert (run.succeeded, run.failed, run.status) == (3, 0, SimulationRun.Status.COMPLETED)
+    assert run.conversations.count() == 3
+
+
+@pytest.mark.django_db
+def test_batch_simulation__resume_classifier_batch_counts_classified(batch_simulation, fake_server):
+    """ Resuming a classifier batch counts the conversations it classified; the others go to the workers. """
+    fake_server.responder = lambda body: (
+        '{"foods": ["sushi", "ramen", "gyoza"], "diet": "omnivore"}'
+        if body["messages"][-1]["content"] == "Sushi, ramen, and gyoza." else "NOT_JSON"
+    )
+    conversations = batch_simulation.ingest_answers({
+        "00000000-0000-0000-0000-000000000001": "Sushi, ramen, and gyoza.",
+        "00000000-0000-0000-0000-000000000002": "Ramen",
+    })
+    requests = [
+        build_request(str(conversation.id), "model", CLASSIFIER_PROMPT, conversation.answer_text, temperature=0)
+        for conversation in conversations
+    ]
+    [batch_id] = batch_simulation.submit(CLASSIFIER_STAGE, requests)
+
+    assert batch_simulation.resume(batch_id) == (1, 1)
+    [job] = claim_jobs("worker-1", limit=10)
+    assert job.conversation.answer_text == "Ramen"
+
+
+@pytest.mark.django_db
+def test_simulate_command__openai_batch(fake_client, monkeypatch, capsys):
+    """ The command's --openai-batch mode runs through the Batch API. """
+    monkeypatch.setattr(
+        "applications.surveys.management.commands.simulate_conversations.get_client", lambda: fake_client,
+    )
+    call_command("simulate_conversations", "4", "--openai-batch", "--poll-interval", "0")
+
+    output = capsys.readouterr().out
+    assert "Submitted respondent batch" in output
+    assert "Finished simulations: 4 succeeded, 0 failed" in output
+    assert Conversation.objects.count() == 4
+    assert SimulationRun.objects.get().conversations.count() == 4
+
+
+def test_fake_server__chat_completions(fake_client, monkeypatch):
+    """ The fake server answers chat completions, including batched classifications of known answers. """
+    monkeypatch.setattr("applications.surveys.services.get_client", lambda: fake_client)
+    answers = [answer for answer, _, _ in SAMPLE_ANSWERS[:3]]
+
+    assert ask_question("model", "prompt", "What are your top 3 favorite foods?") in {
+        answer for answer, _, _ in SAMPLE_ANSWERS
+    }
+    assert classify_diet("model", CLASSIFIER_PROMPT, answers[0]) == {
+        "foods": SAMPLE_ANSWERS[0][1], "diet": SAMPLE_ANSWERS[0][2],
+    }
+    assert classify_diets("model", BATCH_CLASSIFIER_PROMPT, answers) == [
+        {"foods": foods, "diet": diet} for _, foods, diet in SAMPLE_ANSWERS[:3]
+    ]
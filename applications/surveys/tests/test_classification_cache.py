@@ -0,0 +1,159 @@
+""" Unit tests for surveys/classification_cache.py """
+from unittest.mock import MagicMock
+
+import pytest
+from django.conf import settings
+from django.core.cache.backends.db import DatabaseCache
+
+from applications.surveys.classification_cache import (
+    ClassificationCache,
+    make_key,
+    normalize_answer,
+)
+from applications.surveys.services import (
+    classify_diet,
+    classify_diets,
+)
+
+
+RESULT = {"foods": ["tofu", "seitan", "kale"], "diet": "vegan"}
+
+
+@pytest.fixture(name="mock_openai")
+def fixture_mock_openai(monkeypatch):
+    """ Fixture to patch OpenAI client and return controllable responses. """
+    mock_client = MagicMock()
+    monkeypatch.setattr('applications.surveys.services.get_client', lambda: mock_client)
+    return mock_client
+
+
+def test_normalize_answer__ignores_case_whitespace_and_punctuation():
+    """ Answers differing only in case, spacing and punctuation normalize identically. """
+    assert normalize_answer("  Tofu, seitan,   and KALE! ") == normalize_answer("tofu seitan and kale")
+
+
+def test_make_key__depends_on_model_and_prompt():
+    """ The same answer gets different keys for different models or prompts. """
+    key = make_key("model", "prompt", "Tofu, seitan, and kale.")
+    assert key == make_key("model", "prompt", "tofu seitan and kale")
+    assert key != make_key("other model", "prompt", "Tofu, seitan, and kale.")
+    assert key != make_key("model", "other prompt", "Tofu, seitan, and kale.")
+
+
+def test_classification_cache__counts_local_and_shared_hits():
+    """ A fresh instance finds entries in the shared tier, then serves them from its own LRU. """
+    ClassificationCache(local_size=10, ttl=60, alias="default").set("model", "prompt", "Tofu.", RESULT)
+    cache = ClassificationCache(local_size=10, ttl=60, alias="default")
+
+    assert cache.get("model", "prompt", "unknown") is None
+    assert cache.get("model", "prompt", "tofu") == RESULT
+    assert cache.get("model", "prompt", "TOFU") == RESULT
+    assert cache.stats() == {"local_hits": 1, "shared_hits": 1, "misses": 1}
+
+
+def test_classification_cache__evicts_least_recently_used():
+    """ The local tier keeps at most `local_size` entries, dropping the least recently used one. """
+    cache = ClassificationCache(local_size=2, ttl=60, alias="default")
+    cache.set("model", "prompt", "a", RESULT)
+    cache.set("model", "prompt", "b", RESULT)
+    cache.get("model", "prompt", "a")
+    cache.set("model", "prompt", "c", RESULT)
+    cache.shared.clear()
+
+    assert cache.get("model", "prompt", "a") == RESULT
+    assert cache.get("model", "prompt", "b") is None
+    assert cache.get("model", "prompt", "c") == RESULT
+
+
+def test_classification_cache__expires_local_entries():
+    """ Local entries stop being served once their TTL has passed. """
+    now = [0.0]
+    cache = ClassificationCache(local_size=10, ttl=60, alias="default", clock=lambda: now[0])
+    cache.set("model", "prompt", "a", RESULT)
+    cache.shared.clear()
+
+    now[0] = 59
+    assert cache.get("model", "prompt", "a") == RESULT
+    now[0] = 60
+    assert cache.get("model", "prompt", "a") is None
+
+
+def test_classification_cache__returns_copies():
+    """ Mutating a returned result does not change the cached entry. """
+    cache = ClassificationCache(local_size=10, ttl=60, alias="default")
+    cache.set("model", "prompt", "a", RESULT)
+    cache.get("model", "prompt", "a")["diet"] = "omnivore"
+    assert cache.get("model", "prompt", "a")["diet"] == "vegan"
+
+
+@pytest.mark.django_db
+def test_classification_cache__configured_alias_is_shared_by_processes(caplog):
+    """
+    The configured shared tier is a database table: an instance with an empty LRU, like another process, finds
+    entries there, and no warning is logged.
+    """
+    ClassificationCache(local_size=10, ttl=60, alias=settings.CLASSIFICATION_CACHE_ALIAS).set(
+        "model", "prompt", "Tofu.", RESULT,
+    )
+    cache = ClassificationCache(local_size=10, ttl=60, alias=settings.CLASSIFICATION_CACHE_ALIAS)
+
+    assert isinstance(cache.shared, DatabaseCache)
+    assert cache.get("model", "prompt", "tofu") == RESULT
+    assert "local to each process" not in caplog.text
+
+
+def test_classification_cache__warns_about_process_local_alias(caplog):
+    """ A locmem shared tier is logged as a warning once. """
+    cache = ClassificationCache(local_size=10, ttl=60, alias="default")
+    cache.get("model", "prompt", "a")
+    cache.get("model", "prompt", "b")
+
+    assert caplog.text.count("Classification cache alias 'default' is local to each process") == 1
+
+
+@pytest.mark.django_db
+def test_classify_diet__reuses_cached_result(mock_openai):
+    """ An answer already classified, up to normalization, is not sent to ChatGPT again. """
+    mock_openai.chat.completions.create.return_value = MagicMock(
+        choices=[MagicMock(message=MagicMock(content='{"foods": ["tofu", "seitan", "kale"], "diet": "vegan"}'))]
+    )
+
+    first = classify_diet("mock model", "mock prompt", "Tofu, seitan, and kale.")
+    second = classify_diet("mock model", "mock prompt", "tofu seitan and kale")
+
+    assert first == second == RESULT
+    assert mock_openai.chat.completions.create.call_count == 1
+
+
+@pytest.mark.django_db
+def test_classify_diet__does_not_cache_invalid_results(mock_openai):
+    """ A classification that fails validation is requested again next time. """
+    mock_openai.chat.completions.create.return_value = MagicMock(
+        choices=[MagicMock(message=MagicMock(content="INVALID JSON"))]
+    )
+
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            classify_diet("mock model", "mock prompt", "mock answer")
+    assert mock_openai.chat.completions.create.call_count == 2
+
+
+@pytest.mark.django_db
+def test_classify_diets__sends_only_uncached_answers(mock_openai):
+    """ Cached answers are left out of the batched request, and results keep the order of the answers. """
+    mock_openai.chat.completions.create.return_value = MagicMock(
+        choices=[MagicMock(message=MagicMock(content='{"foods": ["tofu", "seitan", "kale"], "diet": "vegan"}'))]
+    )
+    classify_diet("mock model", "batch prompt", "Tofu, seitan, and kale.")
+    mock_openai.chat.completions.create.return_value = MagicMock(
+        choices=[MagicMock(message=MagicMock(
+            content='[{"index": 0, "foods": ["steak", "ham", "cod"], "diet": "omnivore"}]'
+        ))]
+    )
+
+    results = classify_diets("mock model", "batch prompt", ["tofu, seitan and kale", "Steak, ham, and cod."])
+
+    assert results == [RESULT, {"foods": ["steak", "ham", "cod"], "diet": "omnivore"}]
+    batch_request = mock_openai.chat.completions.create.call_args.kwargs["messages"][-1]["content"]
+    assert "Steak" in batch_request
+    assert "seitan" not in batch_request
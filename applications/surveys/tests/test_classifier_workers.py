@@ -0,0 +1,175 @@
+""" Tests for surveys/classifier_workers.py and the run_classifier_workers command. """
+# pylint: disable=missing-function-docstring
+import json
+import os
+import signal
+import threading
+import time
+from collections import Counter
+from unittest.mock import MagicMock
+
+import pytest
+from django.core.management import call_command
+from openai import APITimeoutError
+
+from applications.surveys import rate_limiting
+from applications.surveys.classifier_workers import (
+    process_jobs,
+    run_worker,
+)
+from applications.surveys.jobs import (
+    claim_jobs,
+    enqueue_classifications,
+)
+from applications.surveys.management.commands.run_classifier_workers import Command
+from applications.surveys.models import (
+    ClassificationJob,
+    Conversation,
+    DietDailyRollup,
+)
+
+
+@pytest.fixture(name="mock_openai")
+def fixture_mock_openai(monkeypatch):
+    """ Fixture to patch the OpenAI client used by the classifier. """
+    mock_client = MagicMock()
+    monkeypatch.setattr("applications.surveys.services.get_client", lambda: mock_client)
+    return mock_client
+
+
+def make_completion(content: str) -> MagicMock:
+    return MagicMock(choices=[MagicMock(message=MagicMock(content=content))])
+
+
+def batch_classification(*diets: str) -> MagicMock:
+    return make_completion(json.dumps([
+        {"index": index, "foods": ["zorblax", "quux", "flump"], "diet": diet} for index, diet in enumerate(diets)
+    ]))
+
+
+@pytest.fixture(name="queued_conversations")
+def fixture_queued_conversations():
+    """ Three stored, unclassified conversations the local classifier cannot resolve, queued for the workers. """
+    conversations = Conversation.objects.bulk_create(
+        [Conversation(answer_text=f"I like zorblax number {i}") for i in range(3)]
+    )
+    enqueue_classifications(conversations)
+    return conversations
+
+
+@pytest.mark.django_db
+def test_run_worker__classifies_queue_in_batches(mock_openai, queued_conversations):
+    mock_openai.chat.completions.create.side_effect = [
+        batch_classification("vegan", "omnivore"),
+        batch_classification("vegetarian"),
+    ]
+
+    totals = run_worker("worker-1", batch_size=2, once=True)
+
+    assert totals == Counter(classified=3, retried=0, dead=0)
+    assert mock_openai.chat.completions.create.call_count == 2
+    assert not ClassificationJob.objects.exists()
+    assert sorted(Conversation.objects.values_list("diet_type", flat=True)) == ["omnivore", "vegan", "vegetarian"]
+    assert sum(DietDailyRollup.objects.values_list("count", flat=True)) == len(queued_conversations)
+
+
+@pytest.mark.django_db
+def test_process_jobs__retries_failures_then_dead_letters(mock_openai, queued_conversations, monkeypatch):
+    monkeypatch.setattr(rate_limiting.time, "sleep", lambda seconds: None)
+    mock_openai.chat.completions.create.side_effect = APITimeoutError(request=MagicMock())
+
+    counts = process_jobs("worker-1", claim_jobs("worker-1", limit=3), max_attempts=2)
+    assert counts == Counter(classified=0, retried=3, dead=0)
+    job = ClassificationJob.objects.get(conversation=queued_conversations[0])
+    assert job.status == ClassificationJob.Status.PENDING
+    assert job.last_error.startswith("APITimeoutError")
+
+    ClassificationJob.objects.update(available_at=job.created_at)
+    counts = process_jobs("worker-1", claim_jobs("worker-1", limit=3), max_attempts=2)
+    assert counts == Counter(classified=0, retried=0, dead=3)
+    assert set(ClassificationJob.objects.values_list("status", flat=True)) == {ClassificationJob.Status.DEAD}
+    assert not Conversation.objects.filter(diet_type__isnull=False).exists()
+
+
+@pytest.mark.django_db
+def test_process_jobs__invalid_items_fail_alone(mock_openai, queued_conversations):
+    mock_openai.chat.completions.create.side_effect = [
+        make_completion(json.dumps([{"index": 0, "foods": ["zorblax", "quux", "flump"], "diet": "vegan"}])),
+        make_completion("not JSON"),
+        make_completion("not JSON"),
+    ]
+
+    counts = process_jobs("worker-1", claim_jobs("worker-1", limit=3))
+
+    assert counts == Counter(classified=1, retried=2, dead=0)
+    assert Conversation.objects.get(pk=queued_conversations[0].pk).diet_type == "vegan"
+    assert ClassificationJob.objects.filter(status=ClassificationJob.Status.PENDING).count() == 2
+
+
+@pytest.mark.django_db
+def test_process_jobs__skips_conversations_classified_meanwhile(mock_openai, queued_conversations):
+    # pylint: disable=unused-argument
+    jobs = claim_jobs("worker-1", limit=3)
+    for job in jobs:
+        job.conversation.diet_type = "vegan"
+
+    assert process_jobs("worker-1", jobs) == Counter(classified=3, retried=0, dead=0)
+    mock_openai.chat.completions.create.assert_not_called()
+    assert not ClassificationJob.objects.exists()
+
+
+@pytest.mark.django_db
+def test_run_classifier_workers_command(mock_openai, capsys):
+    Conversation.objects.create(answer_text="I like zorblax")
+    mock_openai.chat.completions.create.return_value = batch_classification("vegan")
+
+    call_command("run_classifier_workers", "--once", "--enqueue-unclassified")
+
+    output = capsys.readouterr().out
+    assert "Queued 1 unclassified conversations" in output
+    assert "1 classified, 0 to retry, 0 dead-lettered" in output
+    assert "0 pending, 0 running, 0 dead jobs left in queue" in output
+
+
+def test_run_processes__sums_worker_counts(monkeypatch):
+    monkeypatch.setattr(
+        "applications.surveys.management.commands.run_classifier_workers.run_worker",
+        lambda **options: Counter(classified=options["batch_size"], retried=1, dead=0),
+    )
+
+    totals = Command._run_processes(3, {"batch_size": 2})  # pylint: disable=protected-access
+
+    assert totals == Counter(classified=6, retried=3, dead=0)
+
+
+def test_run_processes__forwards_stop_signals(monkeypatch):
+    def run_until_stopped(should_stop, **options):
+        while not should_stop():
+            time.sleep(0.01)
+        return Counter(classified=options["batch_size"], retried=0, dead=0)
+
+    monkeypatch.setattr(
+        "applications.surveys.management.commands.run_classifier_workers.run_worker", run_until_stopped,
+    )
+    previous = signal.getsignal(signal.SIGTERM)
+    threading.Timer(0.5, os.kill, (os.getpid(), signal.SIGTERM)).start()
+
+    totals = Command._run_processes(2, {"batch_size": 2})  # pylint: disable=protected-access
+
+    assert totals == Counter(classified=4, retried=0, dead=0)
+    assert signal.getsignal(signal.SIGTERM) is previous
+
+
+def test_run_processes__kills_workers_busy_past_the_shutdown_timeout(monkeypatch):
+    def run_forever(should_stop, **options):  # pylint: disable=unused-argument
+        while True:
+            time.sleep(0.01)
+
+    monkeypatch.setattr("applications.surveys.management.commands.run_classifier_workers.run_worker", run_forever)
+    threading.Timer(0.5, os.kill, (os.getpid(), signal.SIGINT)).start()
+    start = time.monotonic()
+
+    totals = Command._run_processes(2, {}, shutdown_timeout=0.5)  # pylint: disable=protected-access
+
+    assert totals == Counter(classified=0, retried=0, dead=0)
+    assert time.monotonic() - start < 5
@@ -0,0 +1,173 @@
+""" Tests for the fault injection of surveys/fake_openai.py, and simulations run against it. """
+import json
+import random
+import time
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from openai import (
+    APITimeoutError,
+    InternalServerError,
+    OpenAI,
+    RateLimitError,
+)
+
+from applications.constants import (
+    BATCH_CLASSIFIER_PROMPT,
+    CLASSIFIER_PROMPT,
+)
+from applications.surveys import openai_clients
+from applications.surveys.fake_openai import (
+    SAMPLE_ANSWERS,
+    FakeOpenAIServer,
+    Faults,
+    parse_latency,
+)
+from applications.surveys.models import Conversation
+from applications.surveys.rate_limiting import (
+    parse_reset_duration,
+    parse_retry_after,
+    reset_rate_limiters,
+)
+from applications.surveys.services import (
+    ask_question,
+    classify_diet,
+    classify_diets_with_fallback,
+)
+
+MESSAGES = [{"role": "user", "content": "What are your top 3 favorite foods?"}]
+
+
+def make_client(server: FakeOpenAIServer, timeout: float = 5.0) -> OpenAI:
+    """ Returns an OpenAI client calling the fake server, without retries. """
+    return OpenAI(api_key="fake", base_url=server.base_url, max_retries=0, timeout=timeout)
+
+
+@pytest.mark.parametrize("spec, low, high", [
+    ("0.2", 0.2, 0.2),
+    ("fixed:0", 0.0, 0.0),
+    ("uniform:0.1,0.5", 0.1, 0.5),
+    ("normal:0.3,0.1", 0.0, 1.0),
+    ("lognormal:0.5,0.5", 0.0, 10.0),
+])
+def test_parse_latency__draws_within_bounds(spec, low, high):
+    """ Latencies are drawn from the given distribution, and never negative. """
+    latency = parse_latency(spec)
+    rng = random.Random(0)
+
+    assert all(low <= latency(rng) <= high for _ in range(100))
+
+
+@pytest.mark.parametrize("spec", ["", "fast", "uniform:0.1", "normal:-1,0.1", "lognormal:0,1", "gamma:1,2"])
+def test_parse_latency__invalid(spec):
+    """ Unknown distributions, wrong numbers of parameters and negative values are rejected. """
+    with pytest.raises(ValueError):
+        parse_latency(spec)
+
+
+def test_fake_server__latency():
+    """ Responses wait for the drawn latency. """
+    with FakeOpenAIServer(faults=Faults(latency=parse_latency("0.2"))) as server:
+        start = time.perf_counter()
+        make_client(server).chat.completions.create(model="model", messages=MESSAGES)
+
+        assert time.perf_counter() - start >= 0.2
+
+
+def test_fake_server__random_rate_limits():
+    """ Rate limited requests get a 429 with the Retry-After headers the rate limiter honors. """
+    with FakeOpenAIServer(faults=Faults(rate_limit_rate=1.0, retry_after=0.25)) as server:
+        with pytest.raises(RateLimitError) as error:
+            make_client(server).chat.completions.create(model="model", messages=MESSAGES)
+
+        assert parse_retry_after(error.value.response.headers) == 0.25
+        assert server.stats == {"requests": 1, "rate_limited": 1}
+
+
+def test_fake_server__requests_per_minute():
+    """ Past the quota, requests get 429s; every response tells the remaining quota like OpenAI does. """
+    with FakeOpenAIServer(faults=Faults(requests_per_minute=2)) as server:
+        client = make_client(server)
+        remaining = [
+            client.chat.completions.with_raw_response.create(model="model", messages=MESSAGES)
+            .headers["x-ratelimit-remaining-requests"]
+            for _ in range(2)
+        ]
+        with pytest.raises(RateLimitError) as error:
+            client.chat.completions.create(model="model", messages=MESSAGES)
+
+        headers = error.value.response.headers
+        assert remaining == ["1", "0"]
+        assert headers["x-ratelimit-limit-requests"] == "2"
+        assert 0 < parse_reset_duration(headers["x-ratelimit-reset-requests"]) <= 60
+        assert 0 < parse_retry_after(headers) <= 60
+
+
+def test_fake_server__timeouts_and_server_errors():
+    """ Hanging requests time out on the client, and server errors are answered 500. """
+    with FakeOpenAIServer(faults=Faults(timeout_rate=1.0, timeout_seconds=1.0)) as server:
+        with pytest.raises(APITimeoutError):
+            make_client(server, timeout=0.2).chat.completions.create(model="model", messages=MESSAGES)
+
+    with FakeOpenAIServer(faults=Faults(server_error_rate=1.0)) as server:
+        with pytest.raises(InternalServerError):
+            make_client(server).chat.completions.create(model="model", messages=MESSAGES)
+
+
+def test_fake_server__malformed_classifications(monkeypatch):
+    """ Classifier JSON is cut short, while respondent answers are left whole. """
+    with FakeOpenAIServer(faults=Faults(malformed_rate=1.0)) as server:
+        monkeypatch.setattr("applications.surveys.services.get_client", lambda: make_client(server))
+
+        assert ask_question("model", "prompt", MESSAGES[0]["content"]) in {answer for answer, _, _ in SAMPLE_ANSWERS}
+        with pytest.raises(json.JSONDecodeError):
+            classify_diet("model", CLASSIFIER_PROMPT, SAMPLE_ANSWERS[0][0])
+        assert server.stats == {"requests": 2, "ok": 1, "malformed": 1}
+
+
+def test_fake_server__sample_answers_reach_the_classifier_gpt(monkeypatch):
+    """ The sample answers the local classifier cannot settle are classified by the server, in one batched call. """
+    with FakeOpenAIServer() as server:
+        monkeypatch.setattr("applications.surveys.services.get_client", lambda: make_client(server))
+        answers = [answer for answer, _, _ in SAMPLE_ANSWERS]
+        results = classify_diets_with_fallback("model", BATCH_CLASSIFIER_PROMPT, answers)
+
+        assert [result["diet"] for result in results] == [diet for _, _, diet in SAMPLE_ANSWERS]
+        assert server.stats == {"requests": 1, "ok": 1}
+
+
+def test_fake_server__seeded_faults_replay():
+    """ The same seed draws the same outcomes. """
+    faults = Faults(rate_limit_rate=0.3, server_error_rate=0.3, latency=parse_latency("uniform:0,1"))
+    draws = []
+    for _ in range(2):
+        with FakeOpenAIServer(faults=faults, seed=7) as server:
+            draws.append([server.draw_outcome()[:2] for _ in range(20)])
+
+    assert draws[0] == draws[1]
+    assert {outcome for outcome, _ in draws[0]} == {"ok", "rate_limited", "server_error"}
+
+
+@pytest.mark.django_db
+def test_simulate_command__openai_base_url():
+    """ Simulations run against the fake server, retrying its 429s, then go back to the configured API. """
+    reset_rate_limiters()
+    with FakeOpenAIServer(faults=Faults(rate_limit_rate=0.3, retry_after=0.01), seed=1) as server:
+        stdout = StringIO()
+        call_command("simulate_conversations", "5", "--openai-base-url", server.base_url, stdout=stdout)
+
+        assert "5 succeeded, 0 failed" in stdout.getvalue()
+        assert server.stats["rate_limited"] > 0
+    assert Conversation.objects.filter(diet_type__isnull=False).count() == 5
+    assert openai_clients.get_client_options()["base_url"] is None
+    reset_rate_limiters()
+
+
+def test_run_fake_openai_command__invalid_faults():
+    """ Invalid latencies and fault rates adding up to more than 1 are rejected before serving. """
+    with pytest.raises(CommandError):
+        call_command("run_fake_openai", "--latency", "gamma:1,2")
+    with pytest.raises(CommandError):
+        call_command("run_fake_openai", "--rate-limit-rate", "0.6", "--timeout-rate", "0.6")
@@ -0,0 +1,57 @@
+""" Unit tests for surveys/foods.py and the migration linking existing conversations to their foods. """
+import importlib
+
+import pytest
+from django.apps import apps
+
+from applications.surveys.foods import (
+    canonical_foods,
+    link_foods,
+)
+from applications.surveys.models import (
+    Conversation,
+    ConversationFood,
+    Food,
+)
+from applications.surveys.services import save_conversations
+
+
+def test_canonical_foods__lowercases_and_singularizes():
+    """ Names differing in case, spacing or plural collapse into one canonical name; blanks are skipped. """
+    assert canonical_foods(["Roasted  Chickpeas", "roasted chickpea", " ", "Hummus"]) == {"roasted chickpea", "hummus"}
+
+
+@pytest.mark.django_db
+def test_link_foods__is_idempotent():
+    """ Each canonical food is stored once, and linking again adds nothing. """
+    conversations = [
+        Conversation.objects.create(answer_text="", favorite_foods=["Tofu", "kale", "tofu"]),
+        Conversation.objects.create(answer_text="", favorite_foods=["tofu", "Falafels"]),
+    ]
+
+    assert link_foods(conversations) == 4
+    link_foods(conversations)
+
+    assert set(Food.objects.values_list("name", flat=True)) == {"tofu", "kale", "falafel"}
+    assert ConversationFood.objects.count() == 4
+    assert set(Food.objects.get(name="tofu").conversations.all()) == set(conversations)
+
+
+@pytest.mark.django_db
+def test_save_conversations__links_foods():
+    """ Conversations written through save_conversations are linked to their canonical foods. """
+    conversation = Conversation(answer_text="", diet_type="vegan", favorite_foods=["Lentils", "kale"])
+    save_conversations([conversation, Conversation(answer_text="")])
+
+    assert set(conversation.foods.values_list("name", flat=True)) == {"lentil", "kale"}
+
+
+@pytest.mark.django_db
+def test_link_foods_migration__links_existing_conversations():
+    """ The data migration links conversations stored before the food tables existed. """
+    conversation = Conversation.objects.create(answer_text="", favorite_foods=["Steaks", "eggs", "steak"])
+    migration = importlib.import_module("applications.surveys.migrations.0005_link_foods")
+
+    migration.link_existing_foods(apps, None)
+
+    assert set(conversation.foods.values_list("name", flat=True)) == {"steak", "egg"}
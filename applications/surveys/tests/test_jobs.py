@@ -0,0 +1,135 @@
+""" Tests for surveys/jobs.py, the classification job queue. """
+# pylint: disable=missing-function-docstring
+from datetime import timedelta
+
+import pytest
+from django.utils import timezone
+
+from applications.constants import CLASSIFICATION_JOB_BACKOFF_SECONDS
+from applications.surveys.jobs import (
+    backoff_seconds,
+    claim_jobs,
+    complete_jobs,
+    enqueue_classifications,
+    enqueue_unclassified,
+    fail_jobs,
+    queue_stats,
+    requeue_dead,
+)
+from applications.surveys.models import (
+    ClassificationJob,
+    Conversation,
+)
+from applications.surveys.services import save_conversations
+
+
+def make_conversations(count: int, diet_type: str | None = None) -> list[Conversation]:
+    return Conversation.objects.bulk_create(
+        [Conversation(answer_text=f"answer {i}", diet_type=diet_type) for i in range(count)]
+    )
+
+
+@pytest.mark.django_db
+def test_save_conversations__queues_unclassified_conversations():
+    unclassified = Conversation(answer_text="I like zorblax")
+    save_conversations([unclassified, Conversation(answer_text="tofu", diet_type="vegan", favorite_foods=["tofu"])])
+
+    assert list(ClassificationJob.objects.values_list("conversation_id", flat=True)) == [unclassified.pk]
+
+
+@pytest.mark.django_db
+def test_save_conversations__without_enqueue():
+    save_conversations([Conversation(answer_text="I like zorblax")], enqueue=False)
+    assert not ClassificationJob.objects.exists()
+
+
+@pytest.mark.django_db
+def test_enqueue_classifications__keeps_existing_jobs():
+    conversations = make_conversations(2)
+    enqueue_classifications(conversations[:1])
+    ClassificationJob.objects.update(attempts=3)
+
+    assert enqueue_classifications(conversations) == 2
+    assert sorted(ClassificationJob.objects.values_list("attempts", flat=True)) == [0, 3]
+
+
+@pytest.mark.django_db
+def test_enqueue_unclassified__backfills_missing_jobs():
+    conversations = make_conversations(3)
+    make_conversations(2, diet_type="vegan")
+    enqueue_classifications(conversations[:1])
+
+    assert enqueue_unclassified(chunk_size=1) == 2
+    assert ClassificationJob.objects.count() == 3
+
+
+@pytest.mark.django_db
+def test_claim_jobs__claims_each_job_once():
+    enqueue_classifications(make_conversations(5))
+
+    first = claim_jobs("worker-1", limit=3)
+    second = claim_jobs("worker-2", limit=3)
+
+    assert len(first) == 3 and len(second) == 2
+    assert not {job.pk for job in first} & {job.pk for job in second}
+    assert all(job.status == ClassificationJob.Status.RUNNING and job.attempts == 1 for job in first + second)
+    assert {job.locked_by for job in second} == {"worker-2"}
+    assert not claim_jobs("worker-3", limit=3)
+
+
+@pytest.mark.django_db
+def test_claim_jobs__skips_backoff_and_reclaims_expired_leases():
+    waiting, abandoned = make_conversations(2)
+    enqueue_classifications([waiting, abandoned])
+    ClassificationJob.objects.filter(conversation=waiting).update(available_at=timezone.now() + timedelta(minutes=1))
+    ClassificationJob.objects.filter(conversation=abandoned).update(
+        status=ClassificationJob.Status.RUNNING, locked_by="dead-worker", locked_at=timezone.now() - timedelta(hours=1),
+    )
+
+    claimed = claim_jobs("worker-1", limit=10, lease_seconds=60)
+
+    assert [job.conversation_id for job in claimed] == [abandoned.pk]
+    assert claimed[0].locked_by == "worker-1"
+
+
+@pytest.mark.django_db
+def test_fail_jobs__retries_then_dead_letters():
+    enqueue_classifications(make_conversations(2))
+    retried, dead = claim_jobs("worker-1", limit=2)  # pylint: disable=unbalanced-tuple-unpacking
+    ClassificationJob.objects.filter(pk=dead.pk).update(attempts=3)
+    dead.refresh_from_db()
+
+    assert fail_jobs("worker-1", [(retried, "timeout"), (dead, "invalid JSON")], max_attempts=3) == 1
+
+    retried.refresh_from_db()
+    dead.refresh_from_db()
+    assert retried.status == ClassificationJob.Status.PENDING
+    assert retried.available_at > timezone.now() + timedelta(seconds=CLASSIFICATION_JOB_BACKOFF_SECONDS - 5)
+    assert (retried.last_error, retried.locked_by) == ("timeout", "")
+    assert (dead.status, dead.last_error) == (ClassificationJob.Status.DEAD, "invalid JSON")
+    assert queue_stats() == {"pending": 1, "running": 0, "dead": 1}
+
+    assert requeue_dead() == 1
+    dead.refresh_from_db()
+    assert (dead.status, dead.attempts) == (ClassificationJob.Status.PENDING, 0)
+
+
+@pytest.mark.django_db
+def test_complete_and_fail_jobs__leave_jobs_reclaimed_by_another_worker():
+    enqueue_classifications(make_conversations(2))
+    completed, failed = claim_jobs("worker-1", limit=2)  # pylint: disable=unbalanced-tuple-unpacking
+    ClassificationJob.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+    reclaimed = claim_jobs("worker-2", limit=2, lease_seconds=60)
+
+    complete_jobs("worker-1", [completed])
+    assert fail_jobs("worker-1", [(failed, "timeout")], max_attempts=1) == 0
+
+    assert set(ClassificationJob.objects.values_list("status", "locked_by", "attempts")) == {("running", "worker-2", 2)}
+    complete_jobs("worker-2", reclaimed)
+    assert not ClassificationJob.objects.exists()
+
+
+def test_backoff_seconds__doubles_up_to_the_maximum():
+    assert backoff_seconds(1) == CLASSIFICATION_JOB_BACKOFF_SECONDS
+    assert backoff_seconds(2) == 2 * CLASSIFICATION_JOB_BACKOFF_SECONDS
+    assert backoff_seconds(100) == backoff_seconds(101)
@@ -0,0 +1,106 @@
+""" Unit tests for surveys/local_classifier.py and the evaluate_local_classifier command. """
+# pylint: disable=missing-function-docstring
+import pytest
+from django.core.management import call_command
+
+from applications.surveys.local_classifier import (
+    canonicalize_food,
+    classify_locally,
+    extract_foods,
+    food_diet,
+)
+from applications.surveys.models import Conversation
+
+
+@pytest.mark.parametrize("answer, expected", [
+    ("I really love hummus, falafel, and halloumi.", ["hummus", "falafel", "halloumi"]),
+    ("My top 3 favorites are lamb stew, grilled chicken, and mooncake.", ["lamb stew", "grilled chicken", "mooncake"]),
+    ("Tofu, seitan, and kale are definitely my go-tos.", ["tofu", "seitan", "kale"]),
+    ("Honestly, I'd say salmon, potatoes & apple pie!", ["salmon", "potatoes", "apple pie"]),
+    ("Mac and cheese, fish and chips and a banana.", ["mac and cheese", "fish and chips", "banana"]),
+])
+def test_extract_foods(answer, expected):
+    assert extract_foods(answer) == expected
+
+
+@pytest.mark.parametrize("food, expected", [
+    ("Tomatoes", "tomato"),
+    ("roasted chickpeas", "roasted chickpea"),
+    ("hummus", "hummus"),
+    ("cherries", "cherry"),
+])
+def test_canonicalize_food(food, expected):
+    assert canonicalize_food(food) == expected
+
+
+@pytest.mark.parametrize("food, expected", [
+    ("goat cheese", "vegetarian"),   # whole dish wins over its words
+    ("shrimp tacos", "omnivore"),    # meat or fish decides on its own
+    ("grilled tofu", "vegan"),       # preparation words are ignored
+    ("spinach omelette", "vegetarian"),
+    ("sushi", None),                 # unknown dish
+    ("vegan cheese", "vegan"),       # a stated diet overrides the ingredients
+    ("vegetarian sausage", "vegetarian"),
+    ("plant-based chicken", "vegan"),
+    ("black bean burger", None),     # meat imitations are left to the GPT
+    ("Impossible burger", None),
+    ("mock duck", None),
+    ("cauliflower wings", None),
+    ("chicken wings", "omnivore"),
+    ("beef with broccoli", "omnivore"),
+    ("cashew cheese", None),         # dairy and egg imitations too
+    ("coconut milk", None),
+    ("almond butter", None),
+    ("veggie burger", None),
+    ("oat milk", "vegan"),           # unless the whole dish is known
+    ("cheese with spinach", "vegetarian"),
+])
+def test_food_diet(food, expected):
+    assert food_diet(food) == expected
+
+
+@pytest.mark.parametrize("answer, diet, confidence", [
+    ("Tofu, seitan, and kale are definitely my go-tos.", "vegan", 1.0),
+    ("I really love hummus, falafel, and halloumi.", "vegetarian", 1.0),
+    ("Sushi, ramen, and beef pho.", "omnivore", 1.0),
+    ("Sushi, ramen, and kale.", "vegan", pytest.approx(1 / 3)),
+    ("I love everything.", None, 0.0),
+    ("Black bean burger, rice, and kale.", "vegan", pytest.approx(2 / 3)),
+    ("Mock duck, impossible burger, and cauliflower wings.", None, 0.0),
+    ("Vegan cheese, tofu, and kale.", "vegan", 1.0),
+    ("Impossible burger, steak, and rice.", "omnivore", 1.0),
+    ("Tofu, cashew cheese, and kale.", "vegan", pytest.approx(2 / 3)),
+    ("Coconut milk, mango and rice.", "vegan", pytest.approx(2 / 3)),
+    ("Almond butter, banana and oatmeal.", "vegan", pytest.approx(2 / 3)),
+    ("Veggie burger, fries and salad.", "vegan", pytest.approx(2 / 3)),
+])
+def test_classify_locally(answer, diet, confidence):
+    result = classify_locally(answer)
+    assert result.diet == diet
+    assert result.confidence == confidence
+
+
+def test_classify_locally__is_memoized_per_normalized_answer():
+    assert classify_locally("Tofu,  seitan, and KALE.") is classify_locally("tofu, seitan, and kale.")
+
+
+@pytest.mark.django_db
+def test_evaluate_local_classifier_command(capsys):
+    Conversation.objects.create(
+        answer_text="Tofu, seitan, and kale.", favorite_foods=["tofu", "seitan", "kale"], diet_type="vegan",
+    )
+    Conversation.objects.create(
+        answer_text="Eggs, rice, and kale.", favorite_foods=["eggs", "rice", "kale"], diet_type="omnivore",
+    )
+    Conversation.objects.create(
+        answer_text="Sushi, ramen, and gyoza.", favorite_foods=["sushi", "ramen", "gyoza"], diet_type="omnivore",
+    )
+    Conversation.objects.create(answer_text="Unclassified answer.")
+
+    call_command("evaluate_local_classifier")
+
+    output = capsys.readouterr().out
+    assert "Evaluated: 3 conversations" in output
+    assert "Hit rate: 66.7% (2 answers classified locally)" in output
+    assert "Diet agreement with GPT: 50.0%" in output
+    assert "Food agreement with GPT: 100.0%" in output
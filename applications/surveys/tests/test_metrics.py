@@ -0,0 +1,121 @@
+""" Tests for the instrumentation of the surveys hot paths with applications/metrics.py. """
+import json
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from openai import (
+    InternalServerError,
+    OpenAI,
+)
+
+from applications.constants import CLASSIFIER_PROMPT
+from applications.metrics import (
+    DB_ROWS_WRITTEN,
+    DB_WRITES,
+    INVALID_CLASSIFICATIONS,
+    OPENAI_REQUEST_SECONDS,
+    OPENAI_REQUESTS,
+    OPENAI_RETRIES,
+    OPENAI_TOKENS,
+    clear_metrics,
+    counter_value,
+    observation_count,
+)
+from applications.surveys import rate_limiting
+from applications.surveys.fake_openai import (
+    SAMPLE_ANSWERS,
+    FakeOpenAIServer,
+    Faults,
+)
+from applications.surveys.models import Conversation
+from applications.surveys.rate_limiting import reset_rate_limiters
+from applications.surveys.services import (
+    ask_question,
+    classify_diet,
+    save_conversations,
+)
+
+
+@pytest.fixture(name="empty_metrics", autouse=True)
+def fixture_empty_metrics():
+    """ Keeps the metrics recorded by one test out of another test's assertions. """
+    clear_metrics()
+    reset_rate_limiters()
+    yield
+    clear_metrics()
+    reset_rate_limiters()
+
+
+def use_fake_server(monkeypatch, server: FakeOpenAIServer) -> None:
+    """ Points the services at the fake server, and retries without waiting. """
+    client = OpenAI(api_key="fake", base_url=server.base_url, max_retries=0)
+    monkeypatch.setattr("applications.surveys.services.get_client", lambda: client)
+    monkeypatch.setattr(rate_limiting.random, "uniform", lambda low, high: 0.0)
+
+
+def test_openai_calls__latency_outcome_and_tokens(monkeypatch):
+    """ Each call is timed and counted by operation and model, with the tokens its response reports. """
+    with FakeOpenAIServer() as server:
+        use_fake_server(monkeypatch, server)
+        ask_question("respondent-model", "prompt", "What are your top 3 favorite foods?")
+        classify_diet("classifier-model", CLASSIFIER_PROMPT, SAMPLE_ANSWERS[0][0])
+
+    for operation, model in (("ask_question", "respondent-model"), ("classify_diet", "classifier-model")):
+        assert observation_count(OPENAI_REQUEST_SECONDS, operation=operation, model=model) == 1
+        assert counter_value(OPENAI_REQUESTS, operation=operation, model=model, outcome="success") == 1
+        assert counter_value(OPENAI_TOKENS, operation=operation, model=model, kind="prompt") > 0
+        assert counter_value(OPENAI_TOKENS, operation=operation, model=model, kind="completion") > 0
+
+
+def test_openai_calls__retries_counted(monkeypatch):
+    """ Every 429 retried by the rate limiter is counted, while the call itself counts once. """
+    with FakeOpenAIServer(faults=Faults(rate_limit_rate=0.5, retry_after=0.001), seed=3) as server:
+        use_fake_server(monkeypatch, server)
+        for _ in range(5):
+            ask_question("model", "prompt", "What are your top 3 favorite foods?")
+
+    assert server.stats["rate_limited"] > 0
+    assert counter_value(OPENAI_RETRIES, model="model", error="RateLimitError") == server.stats["rate_limited"]
+    assert counter_value(OPENAI_REQUESTS, operation="ask_question", model="model", outcome="success") == 5
+
+
+def test_openai_calls__failures_counted(monkeypatch):
+    """ Calls failing through all retries count as failures, and invalid classifier JSON is counted too. """
+    with FakeOpenAIServer(faults=Faults(server_error_rate=1.0)) as server:
+        use_fake_server(monkeypatch, server)
+        with pytest.raises(InternalServerError):
+            ask_question("model", "prompt", "What are your top 3 favorite foods?")
+
+    with FakeOpenAIServer(faults=Faults(malformed_rate=1.0)) as server:
+        use_fake_server(monkeypatch, server)
+        with pytest.raises(json.JSONDecodeError):
+            classify_diet("model", CLASSIFIER_PROMPT, SAMPLE_ANSWERS[0][0])
+
+    assert counter_value(OPENAI_REQUESTS, operation="ask_question", model="model", outcome="failure") == 1
+    assert counter_value(OPENAI_RETRIES, model="model", error="InternalServerError") == rate_limiting.OPENAI_MAX_RETRIES
+    assert counter_value(OPENAI_REQUESTS, operation="classify_diet", model="model", outcome="success") == 1
+    assert counter_value(INVALID_CLASSIFICATIONS, mode="single") == 1
+
+
+@pytest.mark.django_db
+def test_db_writes__counted_with_rows():
+    """ Conversation writes are timed and counted, with their rows. """
+    save_conversations([Conversation(answer_text="Tofu"), Conversation(answer_text="Steak")])
+
+    assert counter_value(DB_WRITES, operation="save_conversations", outcome="success") == 1
+    assert counter_value(DB_ROWS_WRITTEN, operation="save_conversations") == 2
+
+
+@pytest.mark.django_db
+def test_simulate_command__prints_summary():
+    """ Simulations end with a table of their OpenAI calls and database writes. """
+    with FakeOpenAIServer() as server:
+        stdout = StringIO()
+        call_command("simulate_conversations", "3", "--openai-base-url", server.base_url, stdout=stdout)
+
+    output = stdout.getvalue()
+    assert "p95 (s)" in output
+    for operation in ("ask_question", "save_conversations"):
+        assert operation in output
+    assert "Retries: none" in output
@@ -0,0 +1,69 @@
+"""
+Query plan regression tests for the indexes of surveys/models.py.
+They check that the insights queries are answered from an index instead of a full scan followed by a sort.
+"""
+import pytest
+from django.db import connection
+
+from applications.insights.services import get_conversations_by_diet
+from applications.surveys.models import Conversation
+
+
+PLAN_ROW_COUNT = 1_000_000
+TABLE = "surveys_conversation"
+
+
+@pytest.fixture(name="million_conversations")
+def fixture_million_conversations():
+    """ Fills the table with PLAN_ROW_COUNT conversations spread over the diets, a quarter unclassified. """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {TABLE} (id, question_text, answer_text, favorite_foods, diet_type,
+                                                      created_at)
+            SELECT gen_random_uuid(), '', '', '[]',
+                   (ARRAY['vegan', 'vegetarian', 'omnivore', NULL])[1 + i % 4],
+                   now() - i * interval '1 second'
+            FROM generate_series(1, %s) AS i
+            """,
+            [PLAN_ROW_COUNT],
+        )
+        cursor.execute(f"ANALYZE {TABLE}")
+
+
+@pytest.mark.django_db
+@pytest.mark.skipif(connection.vendor != "sqlite", reason="SQLite query plan")
+def test_diet_filter__uses_composite_index_on_sqlite():
+    """ A diet-filtered page is read from the composite index, already in (created_at, id) order. """
+    plan = get_conversations_by_diet(["vegan"])[:100].explain()
+    assert "USING INDEX conversation_diet_created_idx" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+@pytest.mark.django_db
+@pytest.mark.skipif(connection.vendor != "sqlite", reason="SQLite query plan")
+def test_classified_listing__uses_partial_index_on_sqlite():
+    """ Listing classified conversations scans the partial index instead of the table. """
+    plan = Conversation.objects.filter(diet_type__isnull=False).order_by("-created_at", "-id")[:100].explain()
+    assert "USING INDEX conversation_classified_idx" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+@pytest.mark.django_db
+@pytest.mark.skipif(connection.vendor != "postgresql", reason="PostgreSQL query plan")
+def test_diet_filter__uses_composite_index_on_postgres(million_conversations):  # pylint: disable=unused-argument
+    """ At 1M rows, a diet-filtered page is an index scan with no sort. """
+    plan = get_conversations_by_diet(["vegan"])[:100].explain()
+    assert "conversation_diet_created_idx" in plan
+    assert "Seq Scan" not in plan
+    assert "Sort" not in plan
+
+
+@pytest.mark.django_db
+@pytest.mark.skipif(connection.vendor != "postgresql", reason="PostgreSQL query plan")
+def test_classified_listing__uses_partial_index_on_postgres(million_conversations):  # pylint: disable=unused-argument
+    """ At 1M rows, listing classified conversations scans the partial index backward with no sort. """
+    plan = Conversation.objects.filter(diet_type__isnull=False).order_by("-created_at", "-id")[:100].explain()
+    assert "conversation_classified_idx" in plan
+    assert "Seq Scan" not in plan
+    assert "Sort" not in plan
@@ -0,0 +1,92 @@
+""" Unit tests for surveys/openai_clients.py """
+import asyncio
+import threading
+
+import pytest
+
+from applications.surveys import openai_clients
+from applications.surveys.openai_clients import (
+    get_async_client,
+    get_client,
+    get_http_options,
+    http2_enabled,
+    reset_clients,
+)
+
+
+@pytest.fixture(name="fresh_clients", autouse=True)
+def fixture_fresh_clients():
+    """ Fixture dropping the shared clients around each test, so settings overrides apply. """
+    reset_clients()
+    yield
+    reset_clients()
+
+
+def test_get_client__configured_from_settings(settings):
+    """ The pool limits and timeouts of the client come from the OPENAI_* settings. """
+    settings.OPENAI_MAX_CONNECTIONS = 7
+    settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS = 3
+    settings.OPENAI_KEEPALIVE_EXPIRY = 12.0
+    settings.OPENAI_CONNECT_TIMEOUT = 2.0
+    settings.OPENAI_READ_TIMEOUT = 20.0
+
+    client = get_client()
+
+    pool = client._client._transport._pool  # pylint: disable=protected-access
+    assert (pool._max_connections, pool._max_keepalive_connections) == (7, 3)  # pylint: disable=protected-access
+    assert pool._keepalive_expiry == 12.0  # pylint: disable=protected-access
+    assert (client.timeout.connect, client.timeout.read) == (2.0, 20.0)
+    assert client.max_retries == 0
+
+
+def test_get_client__shared_across_threads():
+    """ Threads share one client, and so its connection pool. """
+    clients = []
+    threads = [threading.Thread(target=lambda: clients.append(get_client())) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len({id(client) for client in clients}) == 1
+    assert clients[0] is get_client()
+
+
+def test_get_client__rebuilt_in_forked_process(monkeypatch):
+    """ A process with another PID, i.e. a forked one, must not reuse its parent's connections. """
+    parent_client = get_client()
+    monkeypatch.setattr(openai_clients.os, "getpid", lambda: -1)
+
+    assert get_client() is not parent_client
+
+
+def test_get_async_client__shared_within_event_loop():
+    """ Tasks of one loop share a client, while another loop gets its own. """
+    async def get_clients():
+        return await asyncio.gather(*(asyncio.sleep(0, get_async_client()) for _ in range(3)))
+
+    first_loop_clients = asyncio.run(get_clients())
+    second_loop_clients = asyncio.run(get_clients())
+
+    assert len({id(client) for client in first_loop_clients}) == 1
+    assert first_loop_clients[0] is not second_loop_clients[0]
+
+
+def test_get_async_client__requires_running_loop():
+    """ The async client is bound to a loop, so it cannot be built outside of one. """
+    with pytest.raises(RuntimeError):
+        get_async_client()
+
+
+def test_http2_enabled__needs_setting_and_h2(settings, monkeypatch):
+    """ HTTP/2 falls back to HTTP/1.1 when the optional h2 package is missing. """
+    settings.OPENAI_HTTP2 = False
+    assert not http2_enabled()
+
+    settings.OPENAI_HTTP2 = True
+    monkeypatch.setattr(openai_clients.importlib.util, "find_spec", lambda name: None)
+    assert not http2_enabled()
+    assert get_http_options()["http2"] is False
+
+    monkeypatch.setattr(openai_clients.importlib.util, "find_spec", lambda name: object())
+    assert http2_enabled()
@@ -0,0 +1,219 @@
+""" Unit tests for surveys/rate_limiting.py """
+# pylint: disable=missing-function-docstring
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import httpx
+import pytest
+from openai import (
+    APIConnectionError,
+    APITimeoutError,
+    BadRequestError,
+    RateLimitError,
+)
+
+from applications.surveys import (
+    openai_clients,
+    rate_limiting,
+)
+from applications.surveys.fake_openai import (
+    FakeOpenAIServer,
+    Faults,
+)
+from applications.surveys.rate_limiting import (
+    ModelRateLimiter,
+    TokenBucket,
+    acall_with_rate_limit,
+    call_with_rate_limit,
+    estimate_tokens,
+    get_rate_limiter,
+    parse_reset_duration,
+    parse_retry_after,
+    update_from_response,
+)
+
+
+class FakeClock:  # pylint: disable=too-few-public-methods
+    """ Manually advanced monotonic clock. """
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(name="sleeps")
+def fixture_sleeps(monkeypatch):
+    """ Records sleeps instead of waiting, and starts every test with fresh limiters. """
+    recorded = []
+    monkeypatch.setattr(rate_limiting.time, "sleep", recorded.append)
+    monkeypatch.setattr(rate_limiting.random, "uniform", lambda low, high: high)
+    rate_limiting.reset_rate_limiters()
+    yield recorded
+    rate_limiting.reset_rate_limiters()
+
+
+def make_rate_limit_error(headers: dict) -> RateLimitError:
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(429, headers=headers, request=request)
+    return RateLimitError("rate limit", response=response, body=None)
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("1s", 1.0),
+    ("20ms", 0.02),
+    ("6m0.5s", 360.5),
+    ("1h2m", 3720.0),
+    ("", None),
+    ("soon", None),
+])
+def test_parse_reset_duration(value, expected):
+    assert parse_reset_duration(value) == expected
+
+
+@pytest.mark.parametrize("headers, expected", [
+    ({"retry-after": "3"}, 3.0),
+    ({"retry-after-ms": "250", "retry-after": "3"}, 0.25),
+    ({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"}, None),
+    ({}, None),
+])
+def test_parse_retry_after(headers, expected):
+    assert parse_retry_after(headers) == expected
+
+
+def test_estimate_tokens__counts_prompt_and_completion_allowance():
+    messages = [{"role": "system", "content": "x" * 400}, {"role": "user", "content": "y" * 40}]
+    assert estimate_tokens(messages) == 110 + rate_limiting.COMPLETION_TOKENS_ALLOWANCE
+
+
+def test_token_bucket__waits_when_exhausted_and_refills():
+    clock = FakeClock()
+    bucket = TokenBucket(per_minute=60, clock=clock)
+
+    assert bucket.reserve(60) == 0.0
+    assert bucket.reserve(1) == pytest.approx(1.0)  # one unit per second
+    clock.now += 2
+    assert bucket.reserve(1) == 0.0
+
+
+def test_token_bucket__sync_with_exhausted_server_quota_waits_for_reset():
+    clock = FakeClock()
+    bucket = TokenBucket(per_minute=600, clock=clock)
+
+    bucket.sync(limit=60, remaining=0, reset_seconds=5)
+    assert bucket.capacity == 60
+    assert bucket.reserve(1) == pytest.approx(6.0)
+
+
+def test_model_rate_limiter__reconciles_usage():
+    limiter = ModelRateLimiter(requests_per_minute=100, tokens_per_minute=1000, clock=FakeClock())
+    limiter.reserve(500)
+    limiter.record_usage(MagicMock(usage=MagicMock(total_tokens=100)), reserved_tokens=500)
+    assert limiter.tokens.available == 900
+
+
+def test_model_rate_limiter__pause_holds_back_callers():
+    clock = FakeClock()
+    limiter = ModelRateLimiter(requests_per_minute=100, tokens_per_minute=1000, clock=clock)
+    limiter.pause(4)
+    assert limiter.reserve(1) == pytest.approx(4.0)
+
+
+def test_call_with_rate_limit__retries_with_retry_after(sleeps):
+    func = MagicMock(side_effect=[make_rate_limit_error({"retry-after": "2"}), "ok"])
+
+    assert call_with_rate_limit("mock model", 10, func, "arg", key="value") == "ok"
+    assert func.call_count == 2
+    func.assert_called_with("arg", key="value")
+    assert 2.0 in sleeps
+
+
+def test_call_with_rate_limit__jittered_exponential_backoff_without_retry_after(sleeps):
+    func = MagicMock(side_effect=[APITimeoutError(request=MagicMock()), make_rate_limit_error({}), "ok"])
+
+    assert call_with_rate_limit("mock model", 10, func) == "ok"
+    assert sleeps == [1.0, 2.0]
+
+
+def test_call_with_rate_limit__gives_up_after_max_retries(sleeps, monkeypatch):
+    monkeypatch.setattr(rate_limiting, "OPENAI_MAX_RETRIES", 2)
+    func = MagicMock(side_effect=make_rate_limit_error({}))
+
+    with pytest.raises(RateLimitError):
+        call_with_rate_limit("mock model", 10, func)
+    assert func.call_count == 3
+    assert len(sleeps) == 2
+
+
+def test_call_with_rate_limit__does_not_retry_client_errors(sleeps):
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    error = BadRequestError("bad", response=httpx.Response(400, request=request), body=None)
+    func = MagicMock(side_effect=error)
+
+    with pytest.raises(BadRequestError):
+        call_with_rate_limit("mock model", 10, func)
+    assert func.call_count == 1
+    assert not sleeps
+
+
+@pytest.mark.parametrize("error, released", [
+    (APIConnectionError(request=MagicMock()), True),
+    (APITimeoutError(request=MagicMock()), False),
+    (make_rate_limit_error({}), False),
+])
+def test_call_with_rate_limit__releases_reservations_never_sent(sleeps, error, released):
+    # pylint: disable=unused-argument
+    limiter = ModelRateLimiter(requests_per_minute=60, tokens_per_minute=1000, clock=FakeClock())
+    rate_limiting._limiters["mock model"] = limiter  # pylint: disable=protected-access
+    func = MagicMock(side_effect=[error, "ok"])
+
+    assert call_with_rate_limit("mock model", 10, func) == "ok"
+    assert (limiter.requests.available, limiter.tokens.available) == ((59, 990) if released else (58, 980))
+
+
+def test_update_from_response__syncs_buckets_from_successful_responses(sleeps):
+    # pylint: disable=unused-argument
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions", json={"model": "mock model"})
+    response = httpx.Response(200, request=request, headers={
+        "x-ratelimit-limit-requests": "50",
+        "x-ratelimit-remaining-requests": "10",
+        "x-ratelimit-limit-tokens": "5000",
+        "x-ratelimit-remaining-tokens": "400",
+    })
+
+    update_from_response(response)
+
+    limiter = get_rate_limiter("mock model")
+    assert (limiter.requests.capacity, limiter.tokens.capacity) == (50, 5000)
+    assert limiter.requests.available <= 10
+    assert limiter.tokens.available <= 400
+
+
+def test_shared_client__syncs_buckets_from_successful_responses(sleeps):
+    # pylint: disable=unused-argument
+    with FakeOpenAIServer(faults=Faults(requests_per_minute=3)) as server:
+        openai_clients.configure_clients(server.base_url)
+        try:
+            openai_clients.get_client().chat.completions.create(
+                model="mock model", messages=[{"role": "user", "content": "What are your top 3 favorite foods?"}],
+            )
+        finally:
+            openai_clients.configure_clients()
+
+    limiter = get_rate_limiter("mock model")
+    assert limiter.requests.capacity == 3
+    assert limiter.requests.available <= 2
+
+
+def test_acall_with_rate_limit__retries(sleeps, monkeypatch):
+    async_sleeps = []
+
+    async def fake_sleep(seconds):
+        async_sleeps.append(seconds)
+
+    monkeypatch.setattr(rate_limiting.asyncio, "sleep", fake_sleep)
+    func = AsyncMock(side_effect=[make_rate_limit_error({"retry-after-ms": "500"}), "ok"])
+
+    assert asyncio.run(acall_with_rate_limit("mock model", 10, func)) == "ok"
+    assert 0.5 in async_sleeps
+    assert not sleeps
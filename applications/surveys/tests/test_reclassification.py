@@ -0,0 +1,179 @@
+""" Tests for surveys/reclassification.py, save_reclassifications and the reclassify_conversations command. """
+# pylint: disable=missing-function-docstring
+import json
+from datetime import date
+from unittest.mock import (
+    AsyncMock,
+    MagicMock,
+)
+
+import pytest
+from django.core.management import call_command
+
+from applications.surveys.jobs import enqueue_classifications
+from applications.surveys.models import (
+    ClassificationJob,
+    Conversation,
+    DietDailyRollup,
+    FoodCount,
+)
+from applications.surveys.reclassification import (
+    fetch_batch,
+    select_conversations,
+)
+from applications.surveys.services import (
+    CLASSIFIER_VERSION,
+    get_classifier_version,
+    save_conversations,
+    save_reclassifications,
+)
+
+
+@pytest.fixture(name="mock_async_openai")
+def fixture_mock_async_openai(monkeypatch):
+    """ Fixture to patch the async OpenAI client used by the classifier. """
+    mock_client = MagicMock()
+    mock_client.chat.completions.create = AsyncMock()
+    monkeypatch.setattr("applications.surveys.services.get_async_client", lambda: mock_client)
+    return mock_client
+
+
+def make_conversation(answer: str, diet_type: str | None = None, version: str = "", created_at: str | None = None):
+    conversation = Conversation.objects.create(
+        answer_text=answer,
+        diet_type=diet_type,
+        favorite_foods=["zorblax"] if diet_type else [],
+        classifier_version=version,
+    )
+    if created_at:
+        Conversation.objects.filter(pk=conversation.pk).update(created_at=created_at)
+    return conversation
+
+
+def test_get_classifier_version__changes_with_model_prompts_and_lexicon():
+    assert CLASSIFIER_VERSION == get_classifier_version()
+    assert get_classifier_version(classifier_gpt_model="other-model") != CLASSIFIER_VERSION
+    assert get_classifier_version(prompts=("another prompt",)) != CLASSIFIER_VERSION
+    assert get_classifier_version(lexicon="another lexicon") != CLASSIFIER_VERSION
+    max_length = Conversation._meta.get_field("classifier_version").max_length  # pylint: disable=protected-access
+    assert len(CLASSIFIER_VERSION) <= max_length
+
+
+@pytest.mark.django_db
+def test_save_conversations__stamps_classified_conversations():
+    classified = Conversation(answer_text="", diet_type="vegan", favorite_foods=["tofu"])
+    unclassified = Conversation(answer_text="")
+    save_conversations([classified, unclassified])
+
+    assert Conversation.objects.get(pk=classified.pk).classifier_version == CLASSIFIER_VERSION
+    assert Conversation.objects.get(pk=unclassified.pk).classifier_version == ""
+
+
+@pytest.mark.django_db
+def test_save_reclassifications__replaces_rollups_links_and_jobs():
+    stored = Conversation(answer_text="", diet_type="vegan", favorite_foods=["tofu", "kale"], classifier_version="old")
+    unclassified = Conversation(answer_text="")
+    save_conversations([stored, unclassified])
+    enqueue_classifications([unclassified])
+
+    save_reclassifications({
+        stored.pk: {"foods": ["cheese", "kale"], "diet": "vegetarian"},
+        unclassified.pk: {"foods": ["steak"], "diet": "omnivore"},
+    })
+
+    stored.refresh_from_db()
+    assert (stored.diet_type, stored.favorite_foods) == ("vegetarian", ["cheese", "kale"])
+    assert stored.classifier_version == CLASSIFIER_VERSION
+    assert sorted(stored.foods.values_list("name", flat=True)) == ["cheese", "kale"]
+    assert sorted(DietDailyRollup.objects.values_list("diet_type", "count")) == [("omnivore", 1), ("vegetarian", 1)]
+    assert sorted(FoodCount.objects.values_list("diet_type", "food")) == [
+        ("omnivore", "steak"), ("vegetarian", "cheese"), ("vegetarian", "kale"),
+    ]
+    assert not ClassificationJob.objects.exists()
+
+
+@pytest.mark.django_db
+def test_save_reclassifications__tolerates_conversations_missing_from_rollups():
+    conversation = make_conversation("", diet_type="vegan")
+
+    save_reclassifications({conversation.pk: {"foods": ["tofu"], "diet": "vegan"}})
+
+    assert list(DietDailyRollup.objects.values_list("diet_type", "count")) == [("vegan", 1)]
+
+
+@pytest.mark.django_db
+def test_select_conversations():
+    unclassified = make_conversation("a", created_at="2025-05-05T10:00:00+00:00")
+    unknown = make_conversation("b", diet_type="vegan", created_at="2025-05-06T10:00:00+00:00")
+    old = make_conversation("c", diet_type="vegan", version="gpt-old:123", created_at="2025-05-07T10:00:00+00:00")
+    make_conversation("d", diet_type="vegan", version=CLASSIFIER_VERSION)
+
+    def selected(**kwargs) -> set:
+        return set(select_conversations(**kwargs).values_list("pk", flat=True))
+
+    assert selected(unclassified=True) == {unclassified.pk}
+    assert selected(stale=True) == {unknown.pk, old.pk}
+    assert selected(version="gpt-old:123") == {old.pk}
+    assert selected(unclassified=True, stale=True, until=date(2025, 5, 6)) == {unclassified.pk, unknown.pk}
+    assert selected(stale=True, since=date(2025, 5, 7)) == {old.pk}
+    with pytest.raises(ValueError, match="Select"):
+        select_conversations()
+
+
+@pytest.mark.django_db
+def test_fetch_batch__walks_keyset_pages():
+    conversations = [make_conversation(str(i), created_at="2025-05-05T10:00:00+00:00") for i in range(3)]
+    conversations += [make_conversation(str(i)) for i in range(2)]
+    selection = select_conversations(unclassified=True)
+
+    seen, after = [], None
+    while batch := fetch_batch(selection, after, batch_size=2):
+        seen.extend(batch)
+        after = batch[-1]
+
+    assert [c.pk for c in seen] == list(selection.order_by("created_at", "id").values_list("pk", flat=True))
+    assert len(seen) == len(conversations)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_reclassify_conversations_command(mock_async_openai, capsys):
+    unclassified = make_conversation("I like zorblax")
+    stale = make_conversation("I like quux", diet_type="vegan", version="gpt-old:123")
+    current = make_conversation("I like flumps", diet_type="vegan", version=CLASSIFIER_VERSION)
+
+    async def classify(**kwargs):
+        answers = json.loads(kwargs["messages"][1]["content"])
+        return MagicMock(choices=[MagicMock(message=MagicMock(content=json.dumps([
+            {"index": answer["index"], "foods": ["a", "b", "c"], "diet": "omnivore"} for answer in answers
+        ])))])
+
+    mock_async_openai.chat.completions.create.side_effect = classify
+
+    call_command("reclassify_conversations", "--dry-run")
+    output = capsys.readouterr().out
+    assert "2 conversations selected" in output
+    assert "(none): 1" in output and "gpt-old:123: 1" in output
+
+    call_command("reclassify_conversations", "--batch-size", "1", "--classify-batch-size", "1", "--concurrency", "2")
+
+    output = capsys.readouterr().out
+    assert "Reclassified 2 conversations (2 changed), 0 failed" in output
+    for conversation in (unclassified, stale):
+        conversation.refresh_from_db()
+        assert (conversation.diet_type, conversation.classifier_version) == ("omnivore", CLASSIFIER_VERSION)
+    current.refresh_from_db()
+    assert current.diet_type == "vegan"
+
+
+@pytest.mark.django_db(transaction=True)
+def test_reclassify_conversations_command__keeps_classification_on_failure(mock_async_openai, capsys):
+    stale = make_conversation("I like quux", diet_type="vegan", version="gpt-old:123")
+    mock_async_openai.chat.completions.create.return_value = MagicMock(
+        choices=[MagicMock(message=MagicMock(content="not JSON"))]
+    )
+
+    call_command("reclassify_conversations", "--stale")
+
+    assert "Reclassified 0 conversations (0 changed), 1 failed" in capsys.readouterr().out
+    stale.refresh_from_db()
+    assert (stale.diet_type, stale.classifier_version) == ("vegan", "gpt-old:123")
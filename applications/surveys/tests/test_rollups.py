@@ -0,0 +1,96 @@
+""" Unit tests for surveys/rollups.py and the rebuild_rollups command. """
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+
+from applications.surveys.models import (
+    Conversation,
+    DietDailyRollup,
+    Food,
+    FoodCount,
+)
+from applications.surveys.rollups import rebuild_rollups
+from applications.surveys.services import (
+    save_classifications,
+    save_conversations,
+)
+
+
+def rollup_rows() -> tuple[set, set]:
+    """ Returns the content of both rollup tables, without their IDs. """
+    diets = set(DietDailyRollup.objects.values_list("day", "diet_type", "count"))
+    foods = set(FoodCount.objects.values_list("day", "diet_type", "food", "count"))
+    return diets, foods
+
+
+@pytest.mark.django_db
+def test_food_counts__use_canonical_food_names():
+    """ Foods are counted under the canonical names of the Food rows, so plurals and case variants count once. """
+    save_conversations([
+        Conversation(answer_text="", diet_type="vegan", favorite_foods=["Tomatoes", "tomato", " Ice  Creams"]),
+    ])
+
+    assert set(FoodCount.objects.values_list("food", "count")) == {("tomato", 1), ("ice cream", 1)}
+    assert set(FoodCount.objects.values_list("food", flat=True)) == set(Food.objects.values_list("name", flat=True))
+
+
+@pytest.mark.django_db
+def test_save_conversations__counts_classified_conversations():
+    """ Stored classified conversations are added to the rollups; unclassified ones are not. """
+    save_conversations([
+        Conversation(answer_text="", diet_type="vegan", favorite_foods=["Tofu", "kale", "tofu"]),
+        Conversation(answer_text="", diet_type="vegan", favorite_foods=["tofu", "seitan", "kale"]),
+        Conversation(answer_text=""),
+    ])
+    save_conversations([Conversation(answer_text="", diet_type="omnivore", favorite_foods=["steak"])])
+
+    diets, foods = rollup_rows()
+    day = Conversation.objects.first().created_at.date()
+    assert diets == {(day, "vegan", 2), (day, "omnivore", 1)}
+    assert foods == {
+        (day, "vegan", "tofu", 2), (day, "vegan", "kale", 2), (day, "vegan", "seitan", 1),
+        (day, "omnivore", "steak", 1),
+    }
+
+
+@pytest.mark.django_db
+def test_save_classifications__counts_newly_classified_conversations():
+    """ Conversations classified after being stored are added when their classification is saved. """
+    conversation = Conversation(answer_text="Cheese, eggs, and tofu.")
+    save_conversations([conversation])
+    assert rollup_rows() == (set(), set())
+
+    conversation.diet_type = "vegetarian"
+    conversation.favorite_foods = ["cheese", "eggs", "tofu"]
+    save_classifications([conversation])
+
+    diets, foods = rollup_rows()
+    assert {(diet, count) for _, diet, count in diets} == {("vegetarian", 1)}
+    assert {food for _, _, food, _ in foods} == {"cheese", "egg", "tofu"}
+
+
+@pytest.mark.django_db
+def test_rebuild_rollups__matches_incremental_rollups():
+    """ Rebuilding from scratch gives the same rollups as the incremental updates. """
+    save_conversations([
+        Conversation(answer_text="", diet_type="vegan", favorite_foods=["tofu", "kale", "lentils"]),
+        Conversation(answer_text="", diet_type="omnivore", favorite_foods=["steak", "tofu", "eggs"]),
+    ])
+    incremental = rollup_rows()
+    FoodCount.objects.update(count=0)
+
+    assert rebuild_rollups(chunk_size=1) == (2, 6)
+    assert rollup_rows() == incremental
+
+
+@pytest.mark.django_db
+def test_rebuild_rollups_command():
+    """ The command rebuilds the rollups and reports the rows written. """
+    Conversation.objects.create(answer_text="", diet_type="vegan", favorite_foods=["tofu", "kale", "lentils"])
+    out = StringIO()
+
+    call_command("rebuild_rollups", stdout=out)
+
+    assert "Rebuilt rollups: 1 diet rows, 3 food rows" in out.getvalue()
+    assert DietDailyRollup.objects.get().count == 1
@@ -0,0 +1,126 @@
+""" Tests for surveys/runs.py and the run checkpoints written by ConversationWriter. """
+# pylint: disable=missing-function-docstring
+import uuid
+
+import pytest
+from django.db import DatabaseError
+
+from applications.surveys.models import (
+    Conversation,
+    SimulationRun,
+)
+from applications.surveys.runs import (
+    GENERATION_CONFIG,
+    finish_run,
+    remaining_count,
+    resume_run,
+    settle_run,
+    start_run,
+)
+from applications.surveys.services import ConversationWriter
+
+
+@pytest.mark.django_db
+def test_start_run__records_config():
+    run = start_run(10, {"concurrency": 4})
+
+    assert run.target_count == 10
+    assert run.status == SimulationRun.Status.RUNNING
+    assert run.config["concurrency"] == 4
+    assert run.config["respondent_model"] == GENERATION_CONFIG["respondent_model"]
+    assert remaining_count(run) == 10
+
+
+@pytest.mark.django_db
+def test_conversation_writer__checkpoints_run():
+    run = start_run(5)
+    writer = ConversationWriter(batch_size=2, run=run)
+
+    for answer in "abc":
+        writer.add(Conversation(question_text="q", answer_text=answer))
+    writer.record_failures(1)
+
+    run.refresh_from_db()
+    assert (run.succeeded, run.failed) == (2, 1)
+    assert run.conversations.count() == 2
+    assert remaining_count(run) == 2
+
+    writer.flush()
+    run.refresh_from_db()
+    assert run.succeeded == 3
+    assert Conversation.objects.filter(run=run).count() == 3
+
+
+@pytest.mark.django_db
+def test_conversation_writer__counts_failed_batches_in_run(monkeypatch):
+    def failing_save(conversations):
+        raise DatabaseError("disk full")
+
+    monkeypatch.setattr("applications.surveys.services.save_conversations", failing_save)
+    run = start_run(2)
+    writer = ConversationWriter(batch_size=2, run=run)
+
+    writer.add(Conversation(question_text="q", answer_text="a"))
+    writer.add(Conversation(question_text="q", answer_text="b"))
+
+    run.refresh_from_db()
+    assert (run.succeeded, run.failed) == (0, 2)
+
+
+@pytest.mark.django_db
+def test_resume_run__resyncs_succeeded_with_stored_conversations():
+    run = start_run(5)
+    writer = ConversationWriter(batch_size=3, run=run)
+    for answer in "abc":
+        writer.add(Conversation(question_text="q", answer_text=answer))
+    Conversation.objects.filter(answer_text="a").delete()
+
+    resumed = resume_run(str(run.id))
+
+    assert resumed.succeeded == 2
+    assert remaining_count(resumed) == 3
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("run_id", ["not-a-uuid", str(uuid.uuid4())])
+def test_resume_run__unknown_run(run_id):
+    with pytest.raises(ValueError, match="No simulation run"):
+        resume_run(run_id)
+
+
+@pytest.mark.django_db
+def test_resume_run__rejects_completed_runs_and_changed_config():
+    completed = finish_run(start_run(0))
+    assert completed.status == SimulationRun.Status.COMPLETED
+    assert completed.finished_at is not None
+    with pytest.raises(ValueError, match="already completed"):
+        resume_run(str(completed.id))
+
+    other_model = SimulationRun.objects.create(target_count=3, config={**GENERATION_CONFIG, "classifier_model": "x"})
+    with pytest.raises(ValueError, match="different classifier_model"):
+        resume_run(str(other_model.id))
+
+    batch_run = start_run(3, {"openai_batch": True})
+    with pytest.raises(ValueError, match="--resume-batch"):
+        resume_run(str(batch_run.id))
+
+
+@pytest.mark.django_db
+def test_finish_run__keeps_unfinished_runs_running():
+    run = start_run(2)
+    SimulationRun.objects.filter(pk=run.pk).update(failed=1)
+
+    run = finish_run(run)
+
+    assert run.failed == 1
+    assert run.status == SimulationRun.Status.RUNNING
+
+
+@pytest.mark.django_db
+def test_settle_run__counts_conversations_not_stored_as_failed():
+    run = start_run(3)
+    Conversation.objects.create(question_text="q", answer_text="a", run=run)
+
+    run = settle_run(run)
+    assert (run.succeeded, run.failed, run.status) == (1, 2, SimulationRun.Status.COMPLETED)
+    assert (settle_run(run).succeeded, settle_run(run).failed) == (1, 2)
@@ -0,0 +1,42 @@
+""" Unit tests for surveys/search.py """
+import pytest
+from django.db import connection
+
+from applications.surveys.models import Conversation
+from applications.surveys.search import search_conversations
+from applications.surveys.services import save_conversations
+
+
+@pytest.fixture(name="answers")
+def fixture_answers():
+    """ Conversations stored through save_conversations, so their search vectors are filled where supported. """
+    conversations = [
+        Conversation(answer_text="Tofu, seitan, and kale are definitely my go-tos."),
+        Conversation(answer_text="I really love hummus, falafel, and halloumi."),
+        Conversation(answer_text="Grilled tofu, ramen, and ice cream."),
+    ]
+    save_conversations(conversations)
+    return conversations
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("query, expected", [
+    ("tofu", [0, 2]),
+    ("TOFU kale", [0]),
+    ("falafel", [1]),
+    ("", [0, 1, 2]),
+])
+def test_search_conversations(answers, query, expected):
+    """ Every word of the query must appear in the answer, ignoring case. """
+    results = search_conversations(Conversation.objects.all(), query)
+    assert set(results) == {answers[index] for index in expected}
+
+
+@pytest.mark.django_db
+@pytest.mark.skipif(connection.vendor != "postgresql", reason="PostgreSQL full-text search")
+def test_search_conversations__uses_gin_index_on_postgres(answers):  # pylint: disable=unused-argument
+    """ On PostgreSQL, stems match ("falafels" finds "falafel") and the search can use the GIN index. """
+    assert search_conversations(Conversation.objects.all(), "falafels").count() == 1
+    with connection.cursor() as cursor:
+        cursor.execute("SET enable_seqscan = off")
+    assert "conversation_search_idx" in search_conversations(Conversation.objects.all(), "tofu").explain()
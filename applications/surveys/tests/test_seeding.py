@@ -0,0 +1,50 @@
+""" Unit tests for surveys/seeding.py and the seed_conversations command. """
+from datetime import timedelta
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.utils import timezone
+
+from applications.insights.services import summarize_conversations
+from applications.surveys.models import (
+    Conversation,
+    ConversationFood,
+)
+from applications.surveys.seeding import (
+    SEED_FOODS,
+    generate_conversations,
+)
+
+
+def test_generate_conversations__plausible_and_reproducible():
+    """ Rows are classified, pick their foods from their diet, and the same seed gives the same rows. """
+    conversations = list(generate_conversations(50, days=7, seed=1))
+
+    assert len(conversations) == 50
+    for conversation in conversations:
+        assert len(set(conversation.favorite_foods)) == 3
+        assert set(conversation.favorite_foods) <= set(SEED_FOODS[conversation.diet_type])
+        assert conversation.created_at >= timezone.now() - timedelta(days=7)
+    again = list(generate_conversations(50, days=7, seed=1))
+    assert [c.answer_text for c in again] == [c.answer_text for c in conversations]
+
+
+@pytest.mark.django_db
+def test_seed_conversations_command(capsys):
+    """ The command stores the rows in batches, keeps their spread created_at, and fills links and rollups. """
+    call_command("seed_conversations", "25", "--batch-size", "10", "--days", "10", "--seed", "3")
+
+    assert "Seeded 25 conversations" in capsys.readouterr().out
+    assert Conversation.objects.count() == 25
+    assert ConversationFood.objects.count() == 75
+    days = {day.date() for day in Conversation.objects.values_list("created_at", flat=True)}
+    assert len(days) > 1
+    assert summarize_conversations([])["total"] == 25
+
+
+@pytest.mark.django_db
+def test_seed_conversations_command__invalid_batch_size():
+    """ A batch size below 1 is rejected. """
+    with pytest.raises(CommandError):
+        call_command("seed_conversations", "5", "--batch-size", "0")
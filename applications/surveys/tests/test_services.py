@@ -1,13 +1,26 @@
 """ Unit tests for surveys/services.py """
+import asyncio
 import json
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock, MagicMock
 
+import httpx
 import pytest
+from django.db import DatabaseError
+from openai import BadRequestError
+
 from applications.surveys.models import Conversation
 from applications.surveys.services import (
+    ConversationWriter,
+    aclassify_diet,
+    aclassify_diets,
+    asimulate_conversation,
+    asimulate_conversation_batch,
     ask_question,
     classify_diet,
+    classify_diet_with_fallback,
+    classify_diets,
     simulate_conversation,
+    simulate_conversation_batch,
 )
 
 
@@ -15,7 +28,7 @@ from applications.surveys.services import (
 def fixture_mock_openai(monkeypatch):
     """ Fixture to patch OpenAI client and return controllable responses. """
     mock_client = MagicMock()
-    monkeypatch.setattr('applications.surveys.services.client', mock_client)
+    monkeypatch.setattr('applications.surveys.services.get_client', lambda: mock_client)
     return mock_client
 
 
@@ -124,7 +137,269 @@ def test_simulate_conversation__handles_bad_json(mock_openai, caplog):
     assert conversation.favorite_foods == []
     assert conversation.diet_type is None
     assert any(
-        "Classification failed for conversation ID" in record.message
+        "Classification failed for answer 'I love everything.'" in record.message
         for record in caplog.records
     )
     assert any(record.levelname == "WARNING" for record in caplog.records)
+
+
+@pytest.fixture(name="mock_async_openai")
+def fixture_mock_async_openai(monkeypatch):
+    """ Fixture to patch the async OpenAI client and return controllable responses. """
+    mock_client = MagicMock()
+    mock_client.chat.completions.create = AsyncMock()
+    monkeypatch.setattr('applications.surveys.services.get_async_client', lambda: mock_client)
+    return mock_client
+
+
+@pytest.mark.django_db
+def test_aclassify_diet__parses_json(mock_async_openai):
+    """ The async classifier shares the parsing and validation of classify_diet. """
+    mock_async_openai.chat.completions.create.return_value = MagicMock(
+        choices=[MagicMock(message=MagicMock(content='{"foods": ["egg", "milk", "rice"], "diet": "vegetarian"}'))]
+    )
+
+    result = asyncio.run(aclassify_diet("mock model", "mock prompt", "mock answer"))
+    assert result == {"foods": ["egg", "milk", "rice"], "diet": Conversation.DietType.VEGETARIAN}
+
+
+@pytest.mark.django_db(transaction=True)
+def test_asimulate_conversation__creates_conversations(mock_async_openai):
+    """ Happy path test for the async pipeline """
+    mock_async_openai.chat.completions.create.side_effect = [
+        MagicMock(choices=[MagicMock(message=MagicMock(content="Tofu, seitan, and kale."))]),
+        MagicMock(choices=[MagicMock(message=MagicMock(
+            content='{"foods": ["tofu", "seitan", "kale"], "diet": "vegan"}'
+        ))]),
+    ]
+
+    asyncio.run(asimulate_conversation())
+
+    conversation = Conversation.objects.get()
+    assert conversation.answer_text == "Tofu, seitan, and kale."
+    assert conversation.favorite_foods == ["tofu", "seitan", "kale"]
+    assert conversation.diet_type == Conversation.DietType.VEGAN
+
+
+@pytest.mark.django_db
+def test_conversation_writer__writes_in_batches(
+    mock_openai,
+    django_assert_num_queries,
+    django_assert_max_num_queries,
+):
+    """ Conversations are buffered and inserted with one bulk INSERT per full batch. """
+    answer = MagicMock(choices=[MagicMock(message=MagicMock(content="Tofu, seitan, and kale."))])
+    classification = MagicMock(choices=[MagicMock(message=MagicMock(
+        content='{"foods": ["tofu", "seitan", "kale"], "diet": "vegan"}'
+    ))])
+    mock_openai.chat.completions.create.side_effect = [answer, classification] * 5
+    writer = ConversationWriter(batch_size=3)
+
+    with django_assert_num_queries(0):
+        simulate_conversation(writer=writer)
+        simulate_conversation(writer=writer)
+    assert Conversation.objects.count() == 0
+
+    # Third conversation fills the batch: a single INSERT, three queries linking the canonical foods, one upsert
+    # per rollup table, one INSERT queueing the unclassified conversations for the workers and one UPDATE of the
+    # conversations version, in a savepoint.
+    with django_assert_max_num_queries(10):
+        simulate_conversation(writer=writer)
+    assert Conversation.objects.count() == 3
+
+    simulate_conversation(writer=writer)
+    simulate_conversation(writer=writer)
+    writer.flush()
+    assert Conversation.objects.count() == 5
+    assert writer.written == 5
+    assert writer.failed == 0
+
+
+@pytest.mark.django_db
+def test_conversation_writer__stores_failed_classifications(mock_openai):
+    """ A conversation whose classification failed is still written, with a null diet. """
+    mock_openai.chat.completions.create.side_effect = [
+        MagicMock(choices=[MagicMock(message=MagicMock(content="I love everything."))]),
+        MagicMock(choices=[MagicMock(message=MagicMock(content="NOT_JSON"))]),
+    ]
+    writer = ConversationWriter(batch_size=10)
+
+    simulate_conversation(writer=writer)
+    writer.flush()
+
+    conversation = Conversation.objects.get()
+    assert conversation.answer_text == "I love everything."
+    assert conversation.diet_type is None
+    assert conversation.favorite_foods == []
+
+
+@pytest.mark.django_db
+def test_conversation_writer__counts_failed_batches(monkeypatch, caplog):
+    """ A batch that cannot be written is logged and counted, not raised. """
+    def failing_save(conversations):
+        raise DatabaseError("disk full")
+
+    monkeypatch.setattr("applications.surveys.services.save_conversations", failing_save)
+    writer = ConversationWriter(batch_size=2)
+
+    writer.add(Conversation(question_text="q", answer_text="a"))
+    writer.add(Conversation(question_text="q", answer_text="b"))
+
+    assert writer.failed == 2
+    assert writer.written == 0
+    assert not writer.pending
+    assert any("Failed to write a batch of 2 conversations" in record.message for record in caplog.records)
+
+
+def make_completion(content: str) -> MagicMock:
+    """ Builds a mocked chat completion response carrying `content`. """
+    return MagicMock(choices=[MagicMock(message=MagicMock(content=content))])
+
+
+@pytest.mark.django_db
+def test_classify_diets__classifies_batch_in_one_request(mock_openai):
+    """ All answers are classified by a single request, in answer order regardless of response order. """
+    mock_openai.chat.completions.create.return_value = make_completion(json.dumps([
+        {"index": 1, "foods": ["steak", "ham", "eggs"], "diet": "omnivore"},
+        {"index": 0, "foods": ["tofu", "kale", "lentils"], "diet": "vegan"},
+    ]))
+
+    results = classify_diets("mock model", "mock batch prompt", ["tofu, kale, lentils", "steak, ham, eggs"])
+
+    assert results == [
+        {"foods": ["tofu", "kale", "lentils"], "diet": "vegan"},
+        {"foods": ["steak", "ham", "eggs"], "diet": "omnivore"},
+    ]
+    assert mock_openai.chat.completions.create.call_count == 1
+    sent_answers = json.loads(mock_openai.chat.completions.create.call_args.kwargs["messages"][1]["content"])
+    assert sent_answers == [{"index": 0, "answer": "tofu, kale, lentils"}, {"index": 1, "answer": "steak, ham, eggs"}]
+
+
+@pytest.mark.django_db
+def test_classify_diets__falls_back_to_single_calls_for_invalid_items(mock_openai):
+    """ Invalid or missing items are retried one by one; items failing that too are None. """
+    mock_openai.chat.completions.create.side_effect = [
+        make_completion(json.dumps([
+            {"index": 0, "foods": ["tofu", "kale", "lentils"], "diet": "vegan"},
+            {"index": 1, "foods": ["cheese"], "diet": "vegetarian"},
+        ])),
+        make_completion('{"foods": ["cheese", "eggs", "bread"], "diet": "vegetarian"}'),
+        make_completion("NOT_JSON"),
+    ]
+
+    results = classify_diets("mock model", "mock batch prompt", ["a", "b", "c"], fallback_prompt="single prompt")
+
+    assert results == [
+        {"foods": ["tofu", "kale", "lentils"], "diet": "vegan"},
+        {"foods": ["cheese", "eggs", "bread"], "diet": "vegetarian"},
+        None,
+    ]
+    fallback_call = mock_openai.chat.completions.create.call_args_list[1]
+    assert fallback_call.kwargs["messages"][0]["content"] == "single prompt"
+    assert fallback_call.kwargs["messages"][1]["content"] == "b"
+
+
+@pytest.mark.django_db
+def test_classify_diets__falls_back_when_response_is_not_an_array(mock_openai):
+    """ A response that is not a JSON array sends every answer to the single-answer classifier. """
+    mock_openai.chat.completions.create.side_effect = [
+        make_completion('{"foods": ["tofu", "kale", "lentils"], "diet": "vegan"}'),
+        make_completion('{"foods": ["tofu", "kale", "lentils"], "diet": "vegan"}'),
+    ]
+
+    assert classify_diets("mock model", "mock batch prompt", ["a"]) == [
+        {"foods": ["tofu", "kale", "lentils"], "diet": "vegan"},
+    ]
+    assert mock_openai.chat.completions.create.call_count == 2
+
+
+def test_aclassify_diets__falls_back_concurrently(mock_async_openai):
+    """ Async batch classification falls back per answer like the sync one. """
+    mock_async_openai.chat.completions.create.side_effect = [
+        make_completion("[]"),
+        make_completion('{"foods": ["tofu", "kale", "lentils"], "diet": "vegan"}'),
+        make_completion('{"foods": ["steak", "ham", "eggs"], "diet": "omnivore"}'),
+    ]
+
+    results = asyncio.run(aclassify_diets("mock model", "mock batch prompt", ["a", "b"]))
+
+    assert [result["diet"] for result in results] == ["vegan", "omnivore"]
+
+
+@pytest.mark.django_db
+def test_simulate_conversation_batch__stores_all_conversations(mock_openai, caplog):
+    """ A batch asks every respondent, classifies once, and stores unclassifiable answers with a null diet. """
+    mock_openai.chat.completions.create.side_effect = [
+        make_completion("Sushi, ramen, and gyoza."),
+        make_completion("I love everything."),
+        make_completion(json.dumps([
+            {"index": 0, "foods": ["sushi", "ramen", "gyoza"], "diet": "omnivore"},
+            {"index": 1, "foods": [], "diet": "omnivore"},
+        ])),
+        make_completion("NOT_JSON"),
+    ]
+
+    simulate_conversation_batch(2)
+
+    conversations = {c.answer_text: c for c in Conversation.objects.all()}
+    assert conversations["Sushi, ramen, and gyoza."].diet_type == Conversation.DietType.OMNIVORE
+    assert conversations["I love everything."].diet_type is None
+    assert any(
+        "Classification failed for answer 'I love everything.'" in record.message for record in caplog.records
+    )
+
+
+def respondent_failing_on_call(failing_call: int):
+    """ Returns a chat completion side effect answering respondents, except for the given call, which fails. """
+    calls = {"count": 0}
+
+    def answer(**kwargs):  # pylint: disable=unused-argument
+        calls["count"] += 1
+        if calls["count"] == failing_call:
+            request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+            raise BadRequestError("bad request", response=httpx.Response(400, request=request), body=None)
+        return make_completion("Tofu, seitan, and kale.")
+    return answer
+
+
+@pytest.mark.django_db
+def test_simulate_conversation_batch__keeps_answers_of_other_respondents(mock_openai, caplog):
+    """ A failed respondent call drops its own conversation only; the answers already paid for are stored. """
+    mock_openai.chat.completions.create.side_effect = respondent_failing_on_call(2)
+
+    assert simulate_conversation_batch(3) == 1
+
+    assert Conversation.objects.filter(diet_type=Conversation.DietType.VEGAN).count() == 2
+    assert "Respondent call failed" in caplog.text
+
+
+@pytest.mark.django_db(transaction=True)
+def test_asimulate_conversation_batch__keeps_answers_of_other_respondents(mock_async_openai):
+    """ The async batch gathers every respondent call, and stores the answers of those that succeeded. """
+    mock_async_openai.chat.completions.create.side_effect = respondent_failing_on_call(2)
+
+    assert asyncio.run(asimulate_conversation_batch(3)) == 1
+
+    assert Conversation.objects.filter(diet_type=Conversation.DietType.VEGAN).count() == 2
+
+
+@pytest.mark.django_db
+def test_classify_diet_with_fallback__skips_gpt_for_confident_answers(mock_openai):
+    """ Answers the local classifier resolves never reach the classifier GPT. """
+    result = classify_diet_with_fallback("mock model", "mock prompt", "Tofu, seitan, and kale.")
+
+    assert result == {"foods": ["tofu", "seitan", "kale"], "diet": "vegan"}
+    mock_openai.chat.completions.create.assert_not_called()
+
+
+@pytest.mark.django_db
+def test_classify_diet_with_fallback__calls_gpt_for_unknown_foods(mock_openai):
+    """ Answers with foods missing from the lexicon fall back to the classifier GPT. """
+    mock_openai.chat.completions.create.return_value = make_completion(
+        '{"foods": ["sushi", "ramen", "gyoza"], "diet": "omnivore"}'
+    )
+
+    result = classify_diet_with_fallback("mock model", "mock prompt", "Sushi, ramen, and gyoza.")
+
+    assert result["diet"] == "omnivore"
+    mock_openai.chat.completions.create.assert_called_once()
@@ -1,10 +1,13 @@
 """ Tests for the simulate_conversations management command. """
-from unittest.mock import patch, MagicMock
+import asyncio
+from unittest.mock import AsyncMock, patch, MagicMock
 
 import pytest
-from django.core.management import call_command
+from django.core.management import CommandError, call_command
 from openai import RateLimitError, APIError, APITimeoutError
 
+from applications.surveys.models import Conversation, SimulationRun
+
 
 @pytest.fixture(name="mock_simulate_conversation")
 def fixture_mock_simulate_conversation():
@@ -59,3 +62,158 @@ def test_simulate_command__generic_failure(mock_simulate_conversation, capsys):
     call_command("simulate_conversations", "1")
     output = capsys.readouterr().out
     assert "Finished simulations: 0 succeeded, 1 failed" in output
+
+
+@pytest.fixture(name="mock_asimulate_conversation")
+def fixture_mock_asimulate_conversation():
+    """ Fixture to patch asimulate_conversation. """
+    with patch(
+        "applications.surveys.management.commands.simulate_conversations.asimulate_conversation",
+        new_callable=AsyncMock,
+    ) as mock:
+        yield mock
+
+
+@pytest.mark.django_db
+def test_simulate_command__concurrent_success(mock_asimulate_conversation, mock_simulate_conversation, capsys):
+    """ With --concurrency above 1, conversations run through the async pipeline. """
+    call_command("simulate_conversations", "5", "--concurrency", "3")
+    assert mock_asimulate_conversation.await_count == 5
+    assert mock_simulate_conversation.call_count == 0
+    output = capsys.readouterr().out
+    assert "Finished simulations: 5 succeeded, 0 failed" in output
+
+
+@pytest.mark.django_db
+def test_simulate_command__concurrency_is_bounded(mock_asimulate_conversation, capsys):
+    """ No more than --concurrency conversations are in flight at the same time. """
+    in_flight = {"current": 0, "peak": 0}
+
+    async def fake_simulation(writer=None):  # pylint: disable=unused-argument
+        in_flight["current"] += 1
+        in_flight["peak"] = max(in_flight["peak"], in_flight["current"])
+        await asyncio.sleep(0.01)
+        in_flight["current"] -= 1
+
+    mock_asimulate_conversation.side_effect = fake_simulation
+    call_command("simulate_conversations", "10", "--concurrency", "4")
+    assert in_flight["peak"] == 4
+    assert "Finished simulations: 10 succeeded, 0 failed" in capsys.readouterr().out
+
+
+@pytest.mark.django_db
+def test_simulate_command__fixed_worker_pool(mock_asimulate_conversation, capsys):
+    """ Conversations are pulled by --concurrency workers, instead of one pending task per conversation. """
+    task_counts = []
+
+    async def fake_simulation(writer=None):  # pylint: disable=unused-argument
+        task_counts.append(len(asyncio.all_tasks()))
+        await asyncio.sleep(0)
+
+    mock_asimulate_conversation.side_effect = fake_simulation
+    call_command("simulate_conversations", "50", "--concurrency", "4")
+    # The workers, plus the task running the whole simulation.
+    assert max(task_counts) == 4 + 1
+    assert "Finished simulations: 50 succeeded, 0 failed" in capsys.readouterr().out
+
+
+@pytest.mark.django_db
+def test_simulate_command__concurrent_failures(mock_asimulate_conversation, capsys):
+    """ Failures in the async pipeline are counted like in the sequential one. """
+    mock_asimulate_conversation.side_effect = [
+        None,
+        APITimeoutError(request=MagicMock()),
+        RuntimeError("oops"),
+    ]
+    call_command("simulate_conversations", "3", "--concurrency", "2")
+    output = capsys.readouterr().out
+    assert "Finished simulations: 1 succeeded, 2 failed" in output
+
+
+@pytest.fixture(name="mock_simulate_conversation_batch")
+def fixture_mock_simulate_conversation_batch():
+    """ Fixture to patch simulate_conversation_batch. """
+    with patch(
+        "applications.surveys.management.commands.simulate_conversations.simulate_conversation_batch",
+        return_value=0,
+    ) as mock:
+        yield mock
+
+
+@pytest.mark.django_db
+def test_simulate_command__classify_batches(mock_simulate_conversation_batch, mock_simulate_conversation, capsys):
+    """ With --classify-batch-size, conversations are simulated in groups, the last one taking the remainder. """
+    call_command("simulate_conversations", "7", "--classify-batch-size", "3")
+    assert [call.args[0] for call in mock_simulate_conversation_batch.call_args_list] == [3, 3]
+    assert mock_simulate_conversation.call_count == 1
+    assert "Finished simulations: 7 succeeded, 0 failed" in capsys.readouterr().out
+
+
+@pytest.mark.django_db
+def test_simulate_command__failed_classify_batch_counts_all_conversations(mock_simulate_conversation_batch, capsys):
+    """ An error in a group counts every conversation of the group as failed. """
+    mock_simulate_conversation_batch.side_effect = [0, APITimeoutError(request=MagicMock())]
+    call_command("simulate_conversations", "8", "--classify-batch-size", "4")
+    assert "Finished simulations: 4 succeeded, 4 failed" in capsys.readouterr().out
+
+
+@pytest.mark.django_db
+def test_simulate_command__dropped_conversations_count_as_failed(mock_simulate_conversation_batch, capsys):
+    """ Conversations a group dropped for their failed respondent calls are the only ones counted as failed. """
+    mock_simulate_conversation_batch.side_effect = [1, 0]
+    call_command("simulate_conversations", "8", "--classify-batch-size", "4")
+    assert "Finished simulations: 7 succeeded, 1 failed" in capsys.readouterr().out
+    assert SimulationRun.objects.get().failed == 1
+
+
+@pytest.mark.django_db
+def test_simulate_command__concurrent_dropped_conversations_count_as_failed(capsys):
+    """ The async pipeline counts the conversations dropped by a group like the sequential one. """
+    with patch(
+        "applications.surveys.management.commands.simulate_conversations.asimulate_conversation_batch",
+        new_callable=AsyncMock,
+        side_effect=[2, 0],
+    ):
+        call_command("simulate_conversations", "8", "--classify-batch-size", "4", "--concurrency", "2")
+    assert "Finished simulations: 6 succeeded, 2 failed" in capsys.readouterr().out
+
+
+@pytest.mark.django_db
+def test_simulate_command__resume_continues_interrupted_run(mock_simulate_conversation, capsys):
+    """ A run killed midway is resumed with --resume, simulating only the conversations it had not stored. """
+    calls = {"count": 0}
+
+    def simulation_dying_after_three(writer=None):
+        calls["count"] += 1
+        if calls["count"] > 3:
+            raise KeyboardInterrupt
+        writer.add(Conversation(question_text="q", answer_text=str(calls["count"])))
+
+    mock_simulate_conversation.side_effect = simulation_dying_after_three
+    with pytest.raises(KeyboardInterrupt):
+        call_command("simulate_conversations", "5", "--batch-size", "1")
+    run = SimulationRun.objects.get()
+    assert (run.succeeded, run.status) == (3, SimulationRun.Status.RUNNING)
+
+    mock_simulate_conversation.reset_mock(side_effect=True)
+    mock_simulate_conversation.side_effect = lambda writer=None: writer.add(Conversation(question_text="q"))
+    call_command("simulate_conversations", "--resume", str(run.id), "--batch-size", "1")
+
+    assert mock_simulate_conversation.call_count == 2
+    run.refresh_from_db()
+    assert (run.succeeded, run.failed, run.status) == (5, 0, SimulationRun.Status.COMPLETED)
+    assert run.conversations.count() == 5
+    output = capsys.readouterr().out
+    assert "Resuming simulation run" in output and "2 of 5 conversations left" in output
+
+
+@pytest.mark.django_db
+def test_simulate_command__resume_records_failures(mock_simulate_conversation):
+    """ Failed conversations count towards the run, so a resumed run does not retry them. """
+    mock_simulate_conversation.side_effect = RuntimeError("oops")
+    call_command("simulate_conversations", "2")
+    run = SimulationRun.objects.get()
+    assert (run.failed, run.status) == (2, SimulationRun.Status.COMPLETED)
+
+    with pytest.raises(CommandError, match="already completed"):
+        call_command("simulate_conversations", "--resume", str(run.id))
@@ -0,0 +1 @@
+""" Benchmarks of the insights API and the simulation pipeline; see benchmarks/conftest.py to run them. """
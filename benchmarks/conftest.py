@@ -0,0 +1,63 @@
+"""
+Shared fixtures of the benchmarks. They need pytest-benchmark, and are left out of the test suite's run; run them
+with results written as JSON, to compare runs and spot regressions:
+
+    poetry install --with bench
+    pytest benchmarks --benchmark-json=benchmarks/results/$(git rev-parse --short HEAD).json
+    pytest-benchmark compare benchmarks/results/*.json
+
+BENCH_CONVERSATIONS sets the number of conversations seeded in the test database (default 10000), and
+BENCH_SIMULATIONS the number simulated per round by the pipeline benchmarks (default 50). For an HTTP load test of
+a running server, see benchmarks/locustfile.py.
+"""
+import os
+
+import pytest
+from django.contrib.auth.models import User
+from rest_framework.test import APIClient
+
+from applications.insights.authentication import credential_cache
+from applications.insights.models import APIKey
+from applications.surveys.fake_openai import FakeOpenAIServer
+from applications.surveys.models import Conversation
+from applications.surveys.openai_clients import configure_clients
+from applications.surveys.rate_limiting import reset_rate_limiters
+from applications.surveys.seeding import seed_conversations
+
+
+BENCH_CONVERSATIONS = int(os.environ.get("BENCH_CONVERSATIONS", "10000"))
+BENCH_SIMULATIONS = int(os.environ.get("BENCH_SIMULATIONS", "50"))
+
+
+@pytest.fixture(name="seeded_conversations", scope="module")
+def fixture_seeded_conversations(django_db_setup, django_db_blocker):  # pylint: disable=unused-argument
+    """
+    Seeds BENCH_CONVERSATIONS conversations, committed, for the benchmarks of a module. The rows are kept across
+    modules and runs (the test database is reused), and only seeded again when their number differs.
+    """
+    with django_db_blocker.unblock():
+        if Conversation.objects.count() != BENCH_CONVERSATIONS:
+            Conversation.objects.all().delete()
+            seed_conversations(BENCH_CONVERSATIONS, seed=0)
+    return BENCH_CONVERSATIONS
+
+
+@pytest.fixture(name="api_client")
+def fixture_api_client():
+    """ Fixture providing an API client authenticated with an API key, as load-tested clients are. """
+    credential_cache.clear()
+    user = User.objects.create_user(username="benchmark")
+    _, key = APIKey.create_key(user, "benchmark")
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Api-Key {key}")
+    return client
+
+
+@pytest.fixture(name="fake_openai")
+def fixture_fake_openai():
+    """ Fixture pointing the OpenAI clients at a local fake server, with fresh rate limiters. """
+    with FakeOpenAIServer() as server:
+        configure_clients(server.base_url)
+        reset_rate_limiters()
+        yield server
+    configure_clients()
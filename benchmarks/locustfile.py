@@ -0,0 +1,73 @@
+"""
+HTTP load scenario of the insights API, for locust (poetry install --with bench), against a running server seeded with
+`python manage.py seed_conversations 100000`:
+
+    python manage.py create_api_key <username> --name load-test
+    INSIGHTS_API_KEY=<key> locust -f benchmarks/locustfile.py --host http://localhost:8000 \\
+        --headless --users 50 --spawn-rate 10 --run-time 1m --json > benchmarks/results/load.json
+
+Each simulated user browses like a dashboard: mostly first pages of filtered conversations, following cursors,
+full-text searches and summaries, with occasional unpaginated streams. Set INSIGHTS_ASYNC=1 to load the async
+endpoints instead, e.g. when the server runs under uvicorn.
+"""
+import os
+import random
+
+from locust import (  # pylint: disable=import-error
+    HttpUser,
+    between,
+    task,
+)
+
+
+DIETS = ("vegan", "vegetarian", "omnivore", "vegan,vegetarian")
+FOODS = ("tofu", "falafel", "hummus", "steak", "sushi", "pizza")
+PREFIX = "/api/insights/async" if os.environ.get("INSIGHTS_ASYNC") == "1" else "/api/insights"
+
+
+class InsightsUser(HttpUser):
+    """ A dashboard client of the insights API, authenticated with an API key. """
+    wait_time = between(0.5, 2)
+
+    def on_start(self):
+        """ Authenticates every request of the user with the API key. """
+        self.client.headers["Authorization"] = f"Api-Key {os.environ['INSIGHTS_API_KEY']}"
+
+    @task(6)
+    def browse_pages(self):
+        """ A first page of conversations of a diet, then the next one. """
+        params = {"diet": random.choice(DIETS), "limit": 100}
+        response = self.client.get(f"{PREFIX}/conversations", params=params, name="conversations?diet&limit")
+        next_cursor = response.json().get("next_cursor") if response.ok else None
+        if next_cursor:
+            self.client.get(
+                f"{PREFIX}/conversations", params={**params, "cursor": next_cursor}, name="conversations?cursor",
+            )
+
+    @task(3)
+    def filter_by_food(self):
+        """ A first page of conversations naming a food. """
+        params = {"food": random.choice(FOODS), "limit": 100}
+        self.client.get(f"{PREFIX}/conversations", params=params, name="conversations?food&limit")
+
+    @task(2)
+    def search(self):
+        """ A full-text search. """
+        params = {"q": random.choice(FOODS), "limit": 50}
+        self.client.get(f"{PREFIX}/conversations", params=params, name="conversations?q&limit")
+
+    @task(3)
+    def summary(self):
+        """ The dashboard's counts and top foods. """
+        params = {"top": 5, "per_diet": "true", "bucket": random.choice(("day", "week"))}
+        self.client.get(f"{PREFIX}/summary", params=params, name="summary")
+
+    @task(1)
+    def stream(self):
+        """ A full export of one diet, as NDJSON. """
+        params = {"diet": random.choice(DIETS[:3]), "stream": "ndjson"}
+        with self.client.get(f"{PREFIX}/conversations", params=params, name="conversations?stream",
+                             stream=True, catch_response=True) as response:
+            for _ in response.iter_lines():
+                pass
+            response.success()
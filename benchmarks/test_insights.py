@@ -0,0 +1,78 @@
+""" Micro-benchmarks of the insights query parsing, queries and serialization, and of the API endpoints. """
+import pytest
+
+from applications.insights.serializers import (
+    ConversationInsightSerializer,
+    fast_rows,
+    serialize_rows,
+)
+from applications.insights.services import (
+    get_conversations_by_diet,
+    paginate_conversations,
+    parse_diet_query_param,
+    summarize_conversations,
+)
+
+pytest.importorskip("pytest_benchmark")
+
+SERIALIZED_ROWS = 1_000
+
+
+def test_parse_diet_query_param(benchmark):
+    """ Parsing runs on every request. """
+    assert benchmark(parse_diet_query_param, " vegan,Vegetarian , omnivore") == ["vegan", "vegetarian", "omnivore"]
+
+
+@pytest.mark.django_db
+def test_serialize_rows__fast_path(benchmark, seeded_conversations):  # pylint: disable=unused-argument
+    """ The values_list fast path used by the conversations endpoint. """
+    rows = list(fast_rows(get_conversations_by_diet([]))[:SERIALIZED_ROWS])
+    assert len(benchmark(serialize_rows, rows)) == len(rows)
+
+
+@pytest.mark.django_db
+def test_serialize_rows__drf_serializer(benchmark, seeded_conversations):  # pylint: disable=unused-argument
+    """ The DRF serializer the fast path replaces, as a baseline. """
+    conversations = list(get_conversations_by_diet([])[:SERIALIZED_ROWS])
+    result = benchmark(lambda: ConversationInsightSerializer(conversations, many=True).data)
+    assert len(result) == len(conversations)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("diets, foods", [
+    ([], []),
+    (["vegan"], []),
+    (["vegan", "vegetarian"], ["tofu", "falafel"]),
+], ids=["all", "diet", "diets-and-foods"])
+def test_get_conversations_by_diet__first_page(benchmark, seeded_conversations, diets, foods):
+    # pylint: disable=unused-argument
+    """ One keyset page of filtered conversations, as read by the conversations endpoint. """
+    page, _ = benchmark(paginate_conversations, fast_rows(get_conversations_by_diet(diets, foods)), None, 100)
+    assert page
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("diets, foods", [([], []), (["vegan"], ["tofu"])], ids=["all", "diet-and-food"])
+def test_get_conversations_by_diet__all_rows(benchmark, seeded_conversations, diets, foods):
+    # pylint: disable=unused-argument
+    """ Every filtered conversation, as read by the unpaginated response and the streams. """
+    assert benchmark(lambda: len(list(fast_rows(get_conversations_by_diet(diets, foods)).iterator())))
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("bucket", [None, "day"])
+def test_summarize_conversations(benchmark, seeded_conversations, bucket):  # pylint: disable=unused-argument
+    """ The summary endpoint's aggregation, from the rollups. """
+    assert benchmark(summarize_conversations, [], bucket=bucket)["total"] == seeded_conversations
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("url", [
+    "/api/insights/conversations?diet=vegan&limit=100",
+    "/api/insights/conversations?food=tofu&limit=100",
+    "/api/insights/async/conversations?diet=vegan&limit=100",
+    "/api/insights/summary?per_diet=true",
+])
+def test_api_request(benchmark, seeded_conversations, api_client, url):  # pylint: disable=unused-argument
+    """ Whole requests through the middleware, authentication and view, in process. """
+    assert benchmark(api_client.get, url).status_code == 200
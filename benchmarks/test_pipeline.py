@@ -0,0 +1,42 @@
+""" Benchmarks of the simulate_conversations pipeline, against the local fake OpenAI server. """
+from io import StringIO
+
+import pytest
+from django.core.cache import caches
+from django.core.management import call_command
+
+from applications.surveys.classification_cache import classification_cache
+from applications.surveys.models import Conversation
+from applications.surveys.rate_limiting import reset_rate_limiters
+from benchmarks.conftest import BENCH_SIMULATIONS
+
+pytest.importorskip("pytest_benchmark")
+
+
+def simulate(**options) -> None:
+    """
+    Runs one round of BENCH_SIMULATIONS simulations, with full rate limiter buckets and empty classification
+    caches, which would otherwise answer the fake server's few sample answers after the first round.
+    """
+    reset_rate_limiters()
+    classification_cache.clear()
+    caches[classification_cache.alias].clear()
+    call_command("simulate_conversations", str(BENCH_SIMULATIONS), stdout=StringIO(), **options)
+
+
+# Concurrent simulations write from the async workers' threads, so the rows must be committed for real.
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.parametrize("options", [
+    {"concurrency": 1},
+    {"concurrency": 1, "classify_batch_size": 10},
+    {"concurrency": 16},
+    {"concurrency": 16, "classify_batch_size": 10},
+], ids=["sequential", "sequential-batched", "concurrent", "concurrent-batched"])
+def test_simulate_conversations(benchmark, fake_openai, options):
+    """ Conversations per second of a simulation round; no time is spent waiting on a real API. """
+    stored = Conversation.objects.count()
+    benchmark.pedantic(simulate, kwargs=options, rounds=3, iterations=1)
+    assert Conversation.objects.count() == stored + 3 * BENCH_SIMULATIONS
+    # Beyond one respondent call per conversation, the answers the local classifier cannot settle went to the
+    # classifier GPT.
+    assert fake_openai.stats["requests"] > 3 * BENCH_SIMULATIONS
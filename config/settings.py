@@ -27,6 +27,8 @@ environ.Env.read_env(Path(BASE_DIR) / '.env')
 
 SECRET_KEY = env('SECRET_KEY')
 OPENAI_API_KEY = env('OPENAI_API_KEY')
+# Base URL of the OpenAI API, e.g. a local fake server (see the run_fake_openai command); the official API if unset
+OPENAI_BASE_URL = env('OPENAI_BASE_URL', default=None)
 
 # False if not in environ because of casting above
 DEBUG = env('DEBUG')
@@ -49,6 +51,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'applications.metrics.metrics_middleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -93,6 +96,42 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# e.g. CACHE_URL=dbcache://django_cache for a table shared by all processes (run `manage.py createcachetable`)
+# Classifier results default to a database cache table, shared by all processes and kept across restarts
+
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+    'classifications': env.cache('CLASSIFICATION_CACHE_URL', default='dbcache://classification_cache'),
+}
+
+# Classifier GPT results cache: in-process LRU tier size, entry lifetime in seconds, and the CACHES alias behind it
+CLASSIFICATION_CACHE_LOCAL_SIZE = env.int('CLASSIFICATION_CACHE_LOCAL_SIZE', default=10_000)
+CLASSIFICATION_CACHE_TTL = env.int('CLASSIFICATION_CACHE_TTL', default=30 * 24 * 60 * 60)
+CLASSIFICATION_CACHE_ALIAS = env('CLASSIFICATION_CACHE_ALIAS', default='classifications')
+
+# Insights response cache: lifetime in seconds of cached response bodies, and the CACHES alias holding them
+INSIGHTS_CACHE_TTL = env.int('INSIGHTS_CACHE_TTL', default=10 * 60)
+INSIGHTS_CACHE_ALIAS = env('INSIGHTS_CACHE_ALIAS', default='default')
+
+# Bearer token Prometheus scrapers send to read /metrics; /metrics refuses every request while it is empty
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
+
+# Insights API authentication: seconds a verified API key or Basic credential is trusted by a process without
+# verifying it again, and the number of credentials each process remembers
+CREDENTIAL_CACHE_TTL = env.int('CREDENTIAL_CACHE_TTL', default=60)
+CREDENTIAL_CACHE_SIZE = env.int('CREDENTIAL_CACHE_SIZE', default=1_000)
+
+# OpenAI HTTP clients, shared process-wide: connection pool size, seconds an idle connection is kept alive, HTTP/2
+# (needs the h2 package), and seconds to wait to connect and then for each response
+OPENAI_MAX_CONNECTIONS = env.int('OPENAI_MAX_CONNECTIONS', default=100)
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = env.int('OPENAI_MAX_KEEPALIVE_CONNECTIONS', default=100)
+OPENAI_KEEPALIVE_EXPIRY = env.float('OPENAI_KEEPALIVE_EXPIRY', default=60.0)
+OPENAI_HTTP2 = env.bool('OPENAI_HTTP2', default=False)
+OPENAI_CONNECT_TIMEOUT = env.float('OPENAI_CONNECT_TIMEOUT', default=5.0)
+OPENAI_READ_TIMEOUT = env.float('OPENAI_READ_TIMEOUT', default=60.0)
+
 # Storage backend (REQUIRED for caching/compression)
 STORAGES = {
     "staticfiles": {
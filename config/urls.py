@@ -20,8 +20,11 @@ from django.urls import (
     path,
 )
 
+from applications.metrics import metrics_view
+
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('applications.insights.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
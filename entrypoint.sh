@@ -10,5 +10,35 @@ python manage.py collectstatic --noinput
 echo "Running migrations..."
 python manage.py migrate
 
+echo "Creating cache table if a database cache is configured..."
+python manage.py createcachetable
+
+# Every server process writes its metrics to files in this directory, which /metrics sums (see applications/metrics.py);
+# it is emptied first, so counters restart with the server like in-memory ones would.
+export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus_multiproc}"
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
+# Uvicorn serves the ASGI application, where the async insights endpoints hold slow clients and long streams without a
+# worker thread each; WEB_CONCURRENCY sets its number of worker processes. It is the default when the asgi extra is
+# installed, since under gunicorn's WSGI application Django consumes their async streams synchronously.
+# SERVER=gunicorn forces the WSGI application.
+if [ -z "${SERVER:-}" ]; then
+    if python -c "import uvicorn" 2>/dev/null; then
+        SERVER=uvicorn
+    else
+        SERVER=gunicorn
+    fi
+fi
+
+if [ "$SERVER" = "uvicorn" ]; then
+    if ! python -c "import uvicorn" 2>/dev/null; then
+        echo "SERVER=uvicorn needs uvicorn: poetry install --extras asgi" >&2
+        exit 1
+    fi
+    echo "Starting Uvicorn..."
+    exec uvicorn config.asgi:application --host 0.0.0.0 --port 8000 --workers "${WEB_CONCURRENCY:-1}"
+fi
+
 echo "Starting Gunicorn..."
 exec gunicorn config.wsgi:application --bind 0.0.0.0:8000